@@ -4,11 +4,24 @@ Package containing all the AST-related modules
 Table of contents:
 	- astPrinter: AST pretty printer
 	- __main__: basic file -> ast -> stdout script
-	- expr: Module with all AST classes
+	- body: Subroutine parameters and lazily parsed bodies
+	- expr: Module with all expression AST classes
+	- stmt: Module with all statement AST classes
 	- genAst: Tool to generate the AST classes
 	- parser: Parses a stream of tokens into an AST
+	- typeChecker: Infers and checks the static types of an AST
 """
+from typing import Optional
+
+from token_ import Token
 
 
 class ParseError(RuntimeError):
-	pass
+	message: str
+	# the token where the error was found
+	token: Optional[Token]
+
+	def __init__( self, message: str, token: Optional[Token] = None ) -> None:
+		super().__init__( message )
+		self.message = message
+		self.token = token
@@ -8,7 +8,7 @@ from sys import argv
 
 from utils import ExitError
 from . import parser, astPrinter
-from tokenizer import parse
+from token_.tokenizer import parse
 
 
 start = time()
@@ -5,7 +5,7 @@ Given an AST, pretty prints it.
 
 from typing import cast
 
-from .expr import Visitor, Binary, Grouping, Literal, Unary, Expr
+from .expr import Visitor, Binary, Grouping, Literal, Unary, Variable, Call, Get, Expr
 
 
 class AstPrinter(Visitor[str]):
@@ -32,6 +32,15 @@ class AstPrinter(Visitor[str]):
 	def visitUnaryExpr( self, unary: Unary ) -> str:
 		return self.parenthesize( cast( str, unary.operator.value ), unary.right )
 
+	def visitVariableExpr( self, variable: Variable ) -> str:
+		return str( variable.name.value )
+
+	def visitCallExpr( self, call: Call ) -> str:
+		return self.parenthesize( f'call {call.callee.accept( self )}', *call.arguments )
+
+	def visitGetExpr( self, get: Get ) -> str:
+		return f'{get.object.accept( self )},{get.name.value}'
+
 
 if __name__ == '__main__':
 	from tokenizer import Token, TokenType, UnaryType
@@ -0,0 +1,67 @@
+"""
+Support classes for subroutine declarations: parameters and lazily parsed bodies
+"""
+from __future__ import annotations
+
+from typing import NamedTuple, Optional, TYPE_CHECKING
+
+from token_ import Token
+
+if TYPE_CHECKING:
+	from . import ParseError
+	from .stmt import Stmt
+
+
+class Parameter(NamedTuple):
+	typ: str
+	name: Token
+
+
+class LazyBody:
+	"""
+	The body of a subroutine.
+	The parser only records the span of tokens between its brackets, the statements are parsed on first access.
+	"""
+	tokens: list[ Token ]
+	_statements: Optional[ list[Stmt] ] = None
+	# the syntax error of the body, raised again without parsing it, and reporting it, again
+	_error: Optional[ ParseError ] = None
+
+	def __init__( self, tokens: list[Token] ) -> None:
+		self.tokens = tokens
+
+	@property
+	def parsed( self ) -> bool:
+		return self._statements is not None
+
+	@property
+	def statements( self ) -> list[Stmt]:
+		"""
+		The statements of the body, parsing them if needed
+		:raises ParseError: if the body contains a syntax error
+		"""
+		return self.parse()
+
+	def parse( self, errors: Optional[ list[ParseError] ] = None ) -> list[Stmt]:
+		"""
+		Parses the statements of the body, if they weren't already
+		:param errors: if given, the parser recovers from syntax errors and collects them in it, instead of raising the first one
+		:raises ParseError: if the body contains a syntax error and no error list was given
+		"""
+		if self._statements is None:
+			if self._error is not None and errors is None:
+				raise self._error.with_traceback( None )
+			from . import ParseError
+			from .parser import Parser
+			parser = Parser( self.tokens, recover=errors is not None )
+			try:
+				self._statements = parser.statements()
+			except ParseError as e:
+				self._error = e
+				raise
+			if errors is not None:
+				errors += parser.errors
+		return self._statements
+
+	def __repr__( self ) -> str:
+		return f'LazyBody({len( self.tokens )} tokens, parsed={self.parsed})'
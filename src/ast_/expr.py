@@ -3,11 +3,14 @@ Contains all the AST classes generated by ast_.genAst.py
 """
 
 from abc import ABCMeta, abstractmethod
-from typing import TypeVar, Generic
+from typing import Any, TypeVar, Generic, Optional, TYPE_CHECKING
 from dataclasses import dataclass
 
 from token_ import Token
 
+if TYPE_CHECKING:
+	from .typeChecker import Type
+
 
 R = TypeVar("R")
 Object = object
@@ -30,9 +33,26 @@ class Visitor(Generic[R], metaclass=ABCMeta):
 	@abstractmethod
 	def visitUnaryExpr( self, unary: 'Unary' ) -> R:
 		pass
+	
+	@abstractmethod
+	def visitVariableExpr( self, variable: 'Variable' ) -> R:
+		pass
+	
+	@abstractmethod
+	def visitCallExpr( self, call: 'Call' ) -> R:
+		pass
+	
+	@abstractmethod
+	def visitGetExpr( self, get: 'Get' ) -> R:
+		pass
 
 
 class Expr(metaclass=ABCMeta):
+	# static type, set by ast_.typeChecker
+	type: Optional['Type'] = None
+	# data attached by the backend running the tree, like the interpreter's inline caches
+	cache: Any = None
+
 	@abstractmethod
 	def accept( self, visitor: Visitor[R] ) -> R:
 		pass
@@ -71,3 +91,30 @@ class Unary(Expr):
 	
 	def accept( self, visitor: Visitor[R] ) -> R:
 		return visitor.visitUnaryExpr(self)
+
+
+@dataclass
+class Variable(Expr):
+	name: Token
+	
+	def accept( self, visitor: Visitor[R] ) -> R:
+		return visitor.visitVariableExpr(self)
+
+
+@dataclass
+class Call(Expr):
+	callee: Expr
+	keyword: Token
+	arguments: list[Expr]
+	
+	def accept( self, visitor: Visitor[R] ) -> R:
+		return visitor.visitCallExpr(self)
+
+
+@dataclass
+class Get(Expr):
+	object: Expr
+	name: Token
+	
+	def accept( self, visitor: Visitor[R] ) -> R:
+		return visitor.visitGetExpr(self)
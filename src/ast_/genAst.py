@@ -3,6 +3,7 @@ Tool to generate the AST classes
 """
 
 from argparse import ArgumentParser
+from keyword import iskeyword
 from pathlib import Path
 from sys import argv
 from typing import Any
@@ -56,14 +57,15 @@ def defineVisitor( writer: PythonWriter, baseName: str, types: list[str] ) -> No
 	with writer:
 		for typ in types:
 			typeName: str = typ.split( ':' )[ 0 ].strip()
+			paramName: str = typeName.lower() + ( '_' if iskeyword( typeName.lower() ) else '' )
 			writer.write('')
 			writer.write('@abstractmethod')
-			writer.write( f'def visit{typeName}{baseName}( self, {typeName.lower()}: \'{typeName}\' ) -> R:' )
+			writer.write( f'def visit{typeName}{baseName}( self, {paramName}: \'{typeName}\' ) -> R:' )
 			with writer:
 				writer.write('pass')
 
 
-def defineAst( outputDir: Path, baseName: str, types: list[str] ) -> None:
+def defineAst( outputDir: Path, baseName: str, types: list[str], imports: list[str] ) -> None:
 	path = outputDir / ( baseName.lower() + '.py' )
 	writer = PythonWriter( path )
 
@@ -73,10 +75,16 @@ def defineAst( outputDir: Path, baseName: str, types: list[str] ) -> None:
 	writer.write('"""')
 	writer.write('')
 	writer.write('from abc import ABCMeta, abstractmethod')
-	writer.write('from typing import TypeVar, Generic')
+	writer.write('from typing import Any, TypeVar, Generic, Optional, TYPE_CHECKING')
 	writer.write('from dataclasses import dataclass')
 	writer.write('')
-	writer.write('from tokenizer import Token')
+	for imp in imports:
+		writer.write( imp )
+	if baseName == 'Expr':
+		writer.write('')
+		writer.write('if TYPE_CHECKING:')
+		with writer:
+			writer.write('from .typeChecker import Type')
 	writer.dup()
 	writer.write('R = TypeVar("R")')
 	writer.write('Object = object')
@@ -87,6 +95,12 @@ def defineAst( outputDir: Path, baseName: str, types: list[str] ) -> None:
 	# base class
 	writer.write(f'class {baseName}(metaclass=ABCMeta):')
 	with writer:
+		if baseName == 'Expr':
+			writer.write('# static type, set by ast_.typeChecker')
+			writer.write('type: Optional[\'Type\'] = None')
+		writer.write('# data attached by the backend running the tree, like the interpreter\'s inline caches')
+		writer.write('cache: Any = None')
+		writer.write('')
 		writer.write('@abstractmethod')
 		writer.write('def accept(self, visitor: Visitor[R]) -> R:')
 		with writer:
@@ -120,6 +134,26 @@ if __name__ == '__main__':
 			'Binary   : Expr left, Token operator, Expr right',
 			'Grouping : Expr expression',
 			'Literal  : Object value',
-			'Unary    : Token operator, Expr right'
-		]
+			'Unary    : Token operator, Expr right',
+			'Variable : Token name',
+			'Call     : Expr callee, Token keyword, list[Expr] arguments',
+			'Get      : Expr object, Token name'
+		],
+		[ 'from token_ import Token' ]
+	)
+	defineAst(
+		outputDir,
+		'Stmt',
+		[
+			'Expression : Expr expression',
+			'Declare    : Token name, str typ, Optional[Expr] initializer, bool constant',
+			'Assign     : Token name, Expr value',
+			'If         : Expr condition, list[Stmt] thenBranch, list[Stmt] elseBranch',
+			'Until      : Expr condition, list[Stmt] body, bool checkFirst',
+			'Return     : Token keyword, Optional[Expr] value',
+			'Subroutine : Token name, list[Parameter] params, str returns, LazyBody body',
+			'Set        : Expr object, Token name, Expr value',
+			'Template   : Token name, list[Declare] fields, Optional[Subroutine] initializer, Optional[Subroutine] deinitializer, list[Subroutine] behaviors'
+		],
+		[ 'from token_ import Token', 'from .expr import Expr', 'from .body import Parameter, LazyBody' ]
 	)
@@ -1,20 +1,19 @@
 """
 Parsers a stream/list of tokens into an abstract binary tree, while doing an intermediate syntax check
+
+Subroutine bodies are only pre-parsed by matching their brackets, see ast_.body.LazyBody
 """
 
-from typing import Final, Union, Optional
+from typing import Final, Union, Optional, cast
 
 from ast_ import ParseError
-from ast_.expr import Expr, Binary, Unary, Literal, Grouping
+from ast_.body import Parameter, LazyBody
+from ast_.expr import Expr, Binary, Unary, Literal, Grouping, Variable, Call, Get
+from ast_.stmt import Stmt, Expression, Declare, Assign, If, Until, Return, Subroutine, Set, Template
 from token_ import Token, Keyword, TokenType, UnaryType, Loc, Symbol
 
-hadError: bool = False
-
-
 def report(line: int, where: str, message: str) -> None:
-	global hadError
 	print( f'[line {line}] Error {where}: {message}' )
-	hadError = True
 
 
 def error(token: Token, message: str) -> None:
@@ -26,10 +25,23 @@ def error(token: Token, message: str) -> None:
 
 class Parser:
 	tokens: Final[ list[Token] ]
-	current: int = 0
-
-	def __init__(self, tokens: list[Token]) -> None:
-		self.tokens = tokens + [ Token(TokenType.EOF, '', Loc('', 0, 0) ) ]
+	current: int
+	recover: bool
+	errors: list[ ParseError ]
+	# whether a syntax error was reported
+	hadError: bool
+
+	def __init__(self, tokens: list[Token], recover: bool = False) -> None:
+		"""
+		:param tokens: the tokens to parse
+		:param recover: whether to collect the syntax errors in `errors` and resume parsing after each one,
+			instead of reporting and raising the first
+		"""
+		self.tokens = tokens + [ Token(TokenType.EOF, '', tokens[-1].loc if tokens else Loc('', 0, 0) ) ]
+		self.current = 0
+		self.recover = recover
+		self.errors = []
+		self.hadError = False
 
 	def parse( self ) -> Optional[Expr]:
 		try:
@@ -37,13 +49,232 @@ class Parser:
 		except ParseError:
 			return None
 
+	def parseProgram( self, eager: bool = False ) -> Optional[list[Stmt]]:
+		"""
+		Parses a whole file
+		:param eager: whether to also parse all subroutine bodies, to find their syntax errors
+		:return: the top level statements, or None if a syntax error was found
+		"""
+		try:
+			statements = self.statements()
+			if eager:
+				self.parseBodies( statements )
+		except ParseError:
+			return None
+		return None if self.errors else statements
+
+	def parseBodies( self, statements: list[Stmt] ) -> None:
+		""" Parses the bodies of all the subroutines declared in the given statements, recursively """
+		for stmt in statements:
+			if isinstance( stmt, Subroutine ):
+				self.parseBodies( stmt.body.parse( self.errors if self.recover else None ) )
+			elif isinstance( stmt, Template ):
+				members = ( stmt.initializer, stmt.deinitializer, *stmt.behaviors )
+				self.parseBodies( [ member for member in members if member is not None ] )
+			elif isinstance( stmt, If ):
+				self.parseBodies( stmt.thenBranch )
+				self.parseBodies( stmt.elseBranch )
+			elif isinstance( stmt, Until ):
+				self.parseBodies( stmt.body )
+
+	# statements
+
+	def statements( self ) -> list[Stmt]:
+		statements: list[ Stmt ] = []
+		while not self.isAtEnd():
+			if ( stmt := self.declaration() ) is not None:
+				statements.append( stmt )
+		return statements
+
+	def declaration( self ) -> Optional[Stmt]:
+		if not self.recover:
+			return self.declarationOrStatement()
+		try:
+			return self.declarationOrStatement()
+		except ParseError as e:
+			self.errors.append( e )
+			self.syncronize()
+			return None
+
+	def declarationOrStatement( self ) -> Optional[Stmt]:
+		if self.match(Keyword.OWN):
+			# already validated by the tokenizer and resolved by the module loader
+			while not self.match(Symbol.SLASH):
+				if self.isAtEnd():
+					raise self.error( self.peek(), 'Expect / after import.' )
+				self.advance()
+			return None
+
+		self.match(Keyword.EXPORT)
+		if self.match(Keyword.DECLARE):
+			if self.match(Keyword.SUBROUTINE):
+				return self.subroutine( self.consume( TokenType.NAME, 'Expect subroutine name.' ) )
+			if self.match(Keyword.TEMPLATE):
+				return self.template()
+			return self.varDeclaration()
+
+		return self.statement()
+
+	def template( self ) -> Template:
+		name: Token = self.consume( TokenType.NAME, 'Expect template name.' )
+		self.consume( Symbol.LBRACK, 'Expect [ after template name.' )
+
+		fields: list[ Declare ] = []
+		behaviors: list[ Subroutine ] = []
+		initializer: Optional[ Subroutine ] = None
+		deinitializer: Optional[ Subroutine ] = None
+		while not self.check(Symbol.RBRACK) and not self.isAtEnd():
+			self.consume( Keyword.DECLARE, 'Expect DCLAR in template body.' )
+			if self.match(Keyword.INITIALIZER):
+				initializer = self.subroutine( self.previous(), returns=False )
+			elif self.match(Keyword.DEINITIALIZER):
+				deinitializer = self.subroutine( self.previous(), returns=False )
+			elif self.checkType(TokenType.NAME) and self.peek().value == Keyword.BEHAVIOR.value:
+				# BHAVIOR is not a reserved word, so it is lexed as a name
+				self.advance()
+				behaviors.append( self.subroutine( self.consume( TokenType.NAME, 'Expect behavior name.' ) ) )
+			else:
+				fields.append( self.varDeclaration() )
+		self.consume( Symbol.RBRACK, 'Expect ] after template body.' )
+
+		return Template( name, fields, initializer, deinitializer, behaviors )
+
+	def subroutine( self, name: Token, returns: bool = True ) -> Subroutine:
+		"""
+		Parses the parameters, return type and body of a subroutine
+		:param name: the already consumed name of the subroutine
+		:param returns: whether it declares a return type, initializers don't
+		"""
+		self.consume( Symbol.LBRACE, 'Expect { after subroutine name.' )
+		params: list[ Parameter ] = []
+		while not self.check(Symbol.RBRACE):
+			typ: str = self.typeName()
+			params.append( Parameter( typ, self.consume( TokenType.NAME, 'Expect parameter name.' ) ) )
+			if not self.match(Symbol.DOT):
+				break
+		self.consume( Symbol.RBRACE, 'Expect } after parameters.' )
+
+		returnType: str = 'NoThInG'
+		if returns:
+			# the tokenizer splits <- into < and -
+			if not self.match(Symbol.ARROW):
+				self.consume( UnaryType.GREATER, 'Expect <- after parameters.' )
+				self.consume( UnaryType.ADD, 'Expect <- after parameters.' )
+			returnType = self.typeName()
+
+		# pre-parse the body, just find the matching bracket
+		self.consume( Symbol.LBRACK, 'Expect [ before subroutine body.' )
+		start: int = self.current
+		depth: int = 1
+		tokens = self.tokens
+		while depth != 0:
+			token = tokens[ self.current ]
+			if token.value is Symbol.LBRACK:
+				depth += 1
+			elif token.value is Symbol.RBRACK:
+				depth -= 1
+			elif token.typ is TokenType.EOF:
+				raise self.error( token, 'Expect ] after subroutine body.' )
+			self.current += 1
+
+		return Subroutine( name, params, returnType, LazyBody( tokens[ start : self.current - 1 ] ) )
+
+	def varDeclaration( self ) -> Declare:
+		constant: bool = self.match(Keyword.CONSTANT)
+		if not constant:
+			self.consume( Keyword.VARIABLE, 'Expect CONSTANT, VARIABL, SUBROUTIN or TMPLAT after DCLAR.' )
+		typ: str = self.typeName()
+		name: Token = self.consume( TokenType.NAME, 'Expect variable name.' )
+
+		initializer: Optional[Expr] = None
+		if self.match(Symbol.EQUAL):
+			initializer = self.expression()
+		elif constant:
+			raise self.error( self.peek(), 'Expect = after constant name.' )
+		self.consume( Symbol.SLASH, 'Expect / after declaration.' )
+		return Declare( name, typ, initializer, constant )
+
+	def statement( self ) -> Stmt:
+		if self.match(Keyword.CHECK):
+			if self.match(Keyword.IF):
+				condition: Expr = self.condition()
+				self.consume( Keyword.DO, 'Expect DO after condition.' )
+				thenBranch: list[ Stmt ] = self.block()
+				elseBranch: list[ Stmt ] = []
+				if self.match(Keyword.ELSE):
+					self.consume( Keyword.DO, 'Expect DO after LS.' )
+					elseBranch = self.block()
+				self.match(Symbol.SLASH)
+				return If( condition, thenBranch, elseBranch )
+			self.consume( Keyword.UNTIL, 'Expect IF or UNTIL after CHCK.' )
+			condition = self.condition()
+			self.consume( Keyword.DO, 'Expect DO after condition.' )
+			body: list[ Stmt ] = self.block()
+			self.match(Symbol.SLASH)
+			return Until( condition, body, True )
+
+		if self.match(Keyword.DO):
+			body = self.block()
+			self.consume( Keyword.UNTIL, 'Expect UNTIL after DO block.' )
+			self.consume( Keyword.WHEN, 'Expect WHN after UNTIL.' )
+			condition = self.condition()
+			self.consume( Symbol.SLASH, 'Expect / after condition.' )
+			return Until( condition, body, False )
+
+		if self.match(Keyword.GIVE):
+			keyword: Token = self.previous()
+			self.consume( Keyword.BACK, 'Expect BACK after GIV.' )
+			value: Optional[Expr] = None
+			if not self.check(Symbol.SLASH):
+				value = self.expression()
+			self.consume( Symbol.SLASH, 'Expect / after return value.' )
+			return Return( keyword, value )
+
+		if self.checkType(TokenType.NAME) and self.peekNext().value is Symbol.EQUAL:
+			target: Expr = self.qualifiedName()
+			self.advance()
+			expr: Expr = self.expression()
+			self.consume( Symbol.SLASH, 'Expect / after assignment.' )
+			if isinstance( target, Get ):
+				return Set( target.object, target.name, expr )
+			return Assign( cast( Variable, target ).name, expr )
+
+		expr = self.expression()
+		self.consume( Symbol.SLASH, 'Expect / after expression.' )
+		return Expression( expr )
+
+	def block( self ) -> list[Stmt]:
+		self.consume( Symbol.LBRACK, 'Expect [ before block.' )
+		statements: list[ Stmt ] = []
+		while not self.check(Symbol.RBRACK) and not self.isAtEnd():
+			if ( stmt := self.declaration() ) is not None:
+				statements.append( stmt )
+		self.consume( Symbol.RBRACK, 'Expect ] after block.' )
+		return statements
+
+	def condition( self ) -> Expr:
+		self.consume( Symbol.LBRACE, 'Expect { before condition.' )
+		expr: Expr = self.expression()
+		self.consume( Symbol.RBRACE, 'Expect } after condition.' )
+		return expr
+
+	def typeName( self ) -> str:
+		typ: str = str( self.consume( TokenType.NAME, 'Expect type name.' ).value )
+		if self.check(Symbol.LPAREN):
+			self.advance()
+			self.consume( Symbol.RPAREN, 'Expect ) after ( in array type.' )
+			typ += '()'
+		return typ
+
+	# expressions
+
 	def expression( self ) -> Expr:
 		return self.equality()
 
 	def equality( self ) -> Expr:
 		expr: Expr = self.comparison()
 
-		while self.match(Keyword.IS):
+		while self.match(Keyword.IS, UnaryType.BANG_IS):
 			operator: Token = self.previous()
 			right: Expr = self.comparison()
 			expr = Binary(expr, operator, right)
@@ -96,6 +327,12 @@ class Parser:
 		if self.matchType(TokenType.FLOAT, TokenType.STR):
 			return Literal(self.previous().value)
 
+		if self.checkType(TokenType.NAME):
+			return self.qualifiedName()
+
+		if self.match(Keyword.CALL):
+			return self.call()
+
 		if self.match(Symbol.LBRACE):
 			expr: Expr = self.expression()
 			self.consume(Symbol.RBRACE, 'Expect } after expression.')
@@ -103,6 +340,51 @@ class Parser:
 
 		raise self.error( self.peek(), 'Expect expression.' )
 
+	def call( self ) -> Expr:
+		keyword: Token = self.previous()
+		if self.check(Keyword.SUBROUTINE):
+			raise self.error( self.peek(), 'Anonymous subroutines are not supported yet.' )
+
+		callee: Expr
+		if self.match(Symbol.LBRACE):
+			# CALL { expr },name{}: call a member of the result of expr
+			receiver: Expr = self.expression()
+			self.consume( Symbol.RBRACE, 'Expect } after expression.' )
+			self.consume( Symbol.COMMA, 'Expect , after }.' )
+			callee = self.qualifiedName( receiver )
+		else:
+			# CALL BUILD Name{} calls the template itself, which builds an instance
+			if self.match(Keyword.BUILD):
+				keyword = self.previous()
+			callee = self.qualifiedName()
+
+		self.consume( Symbol.LBRACE, 'Expect { after subroutine name.' )
+		arguments: list[ Expr ] = []
+		while not self.check(Symbol.RBRACE):
+			arguments.append( self.expression() )
+			if not self.match(Symbol.DOT):
+				break
+		self.consume( Symbol.RBRACE, 'Expect } after arguments.' )
+		return Call( callee, keyword, arguments )
+
+	def qualifiedName( self, receiver: Optional[Expr] = None ) -> Expr:
+		"""
+		Parses a name, splitting `a,b,c` into the member accesses it stands for
+		:param receiver: the expression the name is a member of, if any
+		"""
+		name: Token = self.consume( TokenType.NAME, 'Expect name.' )
+		parts: list[ str ] = str( name.value ).split( ',' )
+
+		expr: Expr
+		if receiver is None:
+			expr = Variable( name if len( parts ) == 1 else Token( TokenType.NAME, parts[0], name.loc ) )
+			parts = parts[ 1 : ]
+		else:
+			expr = receiver
+		for part in parts:
+			expr = Get( expr, Token( TokenType.NAME, part, name.loc ) )
+		return expr
+
 	def consume( self, typ: TokenType | Keyword | UnaryType | Symbol, message: str ) -> Token:
 		if isinstance(typ, TokenType):
 			if self.checkType(typ):
@@ -114,16 +396,37 @@ class Parser:
 		raise self.error( self.peek(), message )
 
 	def error( self, token: Token, message: str ) -> ParseError:
-		error( token, message )
-		return ParseError()
+		# when recovering, the errors are collected instead
+		if not self.recover:
+			error( token, message )
+			self.hadError = True
+		return ParseError( message, token )
 
 	def syncronize( self ) -> None:
+		""" Skips tokens until the likely start of the next statement, after a syntax error """
 		self.advance()
 
 		while not self.isAtEnd():
 			if self.previous().value == Symbol.SLASH:
 				return
 
+			# the end of the enclosing block
+			if self.peek().value == Symbol.RBRACK:
+				return
+
+			# the blocks of the broken statement are skipped whole, errors inside them were already recovered from
+			if self.peek().value == Symbol.LBRACK:
+				depth: int = 0
+				while not self.isAtEnd():
+					token = self.advance()
+					if token.value == Symbol.LBRACK:
+						depth += 1
+					elif token.value == Symbol.RBRACK:
+						depth -= 1
+						if depth == 0:
+							break
+				continue
+
 			if self.peek().value in (
 					Keyword.DECLARE,
 					Keyword.EXPORT,
@@ -150,7 +453,7 @@ class Parser:
 				return True
 		return False
 
-	def check( self, typ: Union[Keyword, UnaryType] ) -> bool:
+	def check( self, typ: Union[Keyword, UnaryType, Symbol] ) -> bool:
 		if self.isAtEnd():
 			return False
 		return self.peek().value == typ
@@ -171,5 +474,10 @@ class Parser:
 	def peek( self ) -> Token:
 		return self.tokens[self.current]
 
+	def peekNext( self ) -> Token:
+		if self.isAtEnd():
+			return self.peek()
+		return self.tokens[self.current + 1]
+
 	def previous( self ) -> Token:
 		return self.tokens[self.current - 1]
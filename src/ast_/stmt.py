@@ -0,0 +1,152 @@
+"""
+Contains all the statement AST classes generated by ast_.genAst.py
+"""
+
+from abc import ABCMeta, abstractmethod
+from typing import Any, TypeVar, Generic, Optional
+from dataclasses import dataclass
+
+from token_ import Token
+from .expr import Expr
+from .body import Parameter, LazyBody
+
+
+R = TypeVar("R")
+
+
+class Visitor(Generic[R], metaclass=ABCMeta):
+	
+	@abstractmethod
+	def visitExpressionStmt( self, expression: 'Expression' ) -> R:
+		pass
+	
+	@abstractmethod
+	def visitDeclareStmt( self, declare: 'Declare' ) -> R:
+		pass
+	
+	@abstractmethod
+	def visitAssignStmt( self, assign: 'Assign' ) -> R:
+		pass
+	
+	@abstractmethod
+	def visitIfStmt( self, if_: 'If' ) -> R:
+		pass
+	
+	@abstractmethod
+	def visitUntilStmt( self, until: 'Until' ) -> R:
+		pass
+	
+	@abstractmethod
+	def visitReturnStmt( self, return_: 'Return' ) -> R:
+		pass
+	
+	@abstractmethod
+	def visitSubroutineStmt( self, subroutine: 'Subroutine' ) -> R:
+		pass
+	
+	@abstractmethod
+	def visitSetStmt( self, set: 'Set' ) -> R:
+		pass
+	
+	@abstractmethod
+	def visitTemplateStmt( self, template: 'Template' ) -> R:
+		pass
+
+
+class Stmt(metaclass=ABCMeta):
+	# data attached by the backend running the tree, like the interpreter's inline caches
+	cache: Any = None
+
+	@abstractmethod
+	def accept( self, visitor: Visitor[R] ) -> R:
+		pass
+
+
+@dataclass
+class Expression(Stmt):
+	expression: Expr
+	
+	def accept( self, visitor: Visitor[R] ) -> R:
+		return visitor.visitExpressionStmt(self)
+
+
+@dataclass
+class Declare(Stmt):
+	name: Token
+	typ: str
+	initializer: Optional[Expr]
+	constant: bool
+	
+	def accept( self, visitor: Visitor[R] ) -> R:
+		return visitor.visitDeclareStmt(self)
+
+
+@dataclass
+class Assign(Stmt):
+	name: Token
+	value: Expr
+	
+	def accept( self, visitor: Visitor[R] ) -> R:
+		return visitor.visitAssignStmt(self)
+
+
+@dataclass
+class If(Stmt):
+	condition: Expr
+	thenBranch: list[Stmt]
+	elseBranch: list[Stmt]
+	
+	def accept( self, visitor: Visitor[R] ) -> R:
+		return visitor.visitIfStmt(self)
+
+
+@dataclass
+class Until(Stmt):
+	condition: Expr
+	body: list[Stmt]
+	checkFirst: bool
+	
+	def accept( self, visitor: Visitor[R] ) -> R:
+		return visitor.visitUntilStmt(self)
+
+
+@dataclass
+class Return(Stmt):
+	keyword: Token
+	value: Optional[Expr]
+	
+	def accept( self, visitor: Visitor[R] ) -> R:
+		return visitor.visitReturnStmt(self)
+
+
+@dataclass
+class Subroutine(Stmt):
+	name: Token
+	params: list[Parameter]
+	returns: str
+	body: LazyBody
+	
+	def accept( self, visitor: Visitor[R] ) -> R:
+		return visitor.visitSubroutineStmt(self)
+
+
+@dataclass
+class Set(Stmt):
+	object: Expr
+	name: Token
+	value: Expr
+	
+	def accept( self, visitor: Visitor[R] ) -> R:
+		return visitor.visitSetStmt(self)
+
+
+@dataclass
+class Template(Stmt):
+	name: Token
+	fields: list[Declare]
+	initializer: Optional[Subroutine]
+	deinitializer: Optional[Subroutine]
+	behaviors: list[Subroutine]
+	
+	def accept( self, visitor: Visitor[R] ) -> R:
+		return visitor.visitTemplateStmt(self)
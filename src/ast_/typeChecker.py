@@ -0,0 +1,282 @@
+"""
+Static type inference and checking pass.
+
+Annotates every node of an expression tree with its static type, so that backends can
+select unchecked operations for nodes whose operand types are proven.
+Variables are resolved through a stack of scopes, like the interpreter's environments. The type a variable is
+declared with is proven only if every value given to it, its initializer and each assignment, was proven to have
+it: a variable which may hold anything else, like the result of a call, stays unproven. As a later assignment may
+take the proof back from the uses before it, the statements are checked again until no variable loses its proof.
+Subroutine bodies which weren't parsed yet are left for the interpreter to check on their first call, without
+parsing them here, the names they assign are never proven.
+"""
+from __future__ import annotations
+
+from enum import Enum
+from typing import Callable, Iterable, Optional, cast
+
+from . import stmt
+from .expr import Visitor, Binary, Grouping, Literal, Unary, Variable, Call, Get, Expr
+from token_ import Token, TokenType, Keyword, Symbol, UnaryType, Loc
+
+
+class Type(Enum):
+	INTEGER = 'InTgR'
+	STRING = 'StRiNg'
+	BOOLEAN = 'BoOlAn'
+	NOTHING = 'NoThInG'
+
+	@classmethod
+	def ofValue( cls, value: object ) -> Optional[Type]:
+		""" Returns the static type of a runtime value, or None if it has no EndC type """
+		if value is None:
+			return Type.NOTHING
+		# bool must be checked before float, as it is a subclass of int
+		if isinstance( value, bool ):
+			return Type.BOOLEAN
+		if isinstance( value, float ):
+			return Type.INTEGER
+		if isinstance( value, str ):
+			return Type.STRING
+		return None
+
+
+_NUMERIC_OPS: dict[ object, Type ] = {
+	UnaryType.ADD: Type.INTEGER,
+	UnaryType.SUBTRACT: Type.INTEGER,
+	UnaryType.DIVIDE: Type.INTEGER,
+	UnaryType.MODULO: Type.INTEGER,
+	UnaryType.GREATER: Type.BOOLEAN,
+	UnaryType.GREATER_EQUAL: Type.BOOLEAN,
+}
+
+
+# the declared types which may be proven
+_TYPES: dict[ str, Type ] = { typ.value: typ for typ in Type }
+
+
+def binaryType( op: object, left: Type, right: Type ) -> Optional[Type]:
+	""" The type of a binary operation on operands of the given types, None if the operation is not supported """
+	if op in ( Keyword.IS, UnaryType.BANG_IS ):
+		return Type.BOOLEAN
+	if op is UnaryType.ADD and left is Type.STRING:
+		return Type.STRING
+	if left is Type.INTEGER and right is Type.INTEGER:
+		return _NUMERIC_OPS.get( op )
+	return None
+
+
+def unaryType( op: object, right: Type ) -> Optional[Type]:
+	""" The type of a unary operation on an operand of the given type, None if the operation is not supported """
+	if op is UnaryType.BANG:
+		return Type.BOOLEAN
+	if op is UnaryType.SUBTRACT and right is Type.INTEGER:
+		return Type.INTEGER
+	return None
+
+
+class TypeChecker(Visitor[Optional[Type]], stmt.Visitor[None]):
+	"""
+	Infers the type of each node, storing it in the node's `type` field.
+	Nodes whose type could not be proven are left with `type = None`.
+	Only the subroutine bodies which were already parsed are checked.
+	"""
+	errors: list[str]
+	# the location and message of each error
+	locatedErrors: list[ tuple[ Loc, str ] ]
+	# the names of each scope, bound to their declaration if they're variables
+	_scopes: list[ dict[ str, Optional[stmt.Declare] ] ]
+	# the ids of the declarations of the variables which may hold values of other types
+	_unproven: set[ int ]
+	# the names assigned before being declared, which are never proven
+	_unresolved: set[ str ]
+
+	def __init__( self ) -> None:
+		self.errors = []
+		self.locatedErrors = []
+		self._scopes = []
+		self._unproven = set()
+		self._unresolved = set()
+
+	def check( self, expr: Expr ) -> bool:
+		"""
+		Type checks the given tree
+		:param expr: root of the tree
+		:return: True if no type errors were found
+		"""
+		return self._checkAll( lambda: expr.accept( self ) )
+
+	def checkStatements( self, statements: list[stmt.Stmt] ) -> bool:
+		"""
+		Type checks the given statements
+		:param statements: statements to check
+		:return: True if no type errors were found
+		"""
+		return self._checkAll( lambda: self._block( statements ) )
+
+	def _checkAll( self, visit: Callable[ [], object ] ) -> bool:
+		""" Visits the tree until the proven variables don't change, the errors are the ones of the last visit """
+		self._unproven = set()
+		self._unresolved = set()
+		while True:
+			before = len( self._unproven ), len( self._unresolved )
+			self.errors = []
+			self.locatedErrors = []
+			self._scopes = [ {} ]
+			visit()
+			if ( len( self._unproven ), len( self._unresolved ) ) == before:
+				return len( self.errors ) == 0
+
+	def _block( self, statements: list[stmt.Stmt], names: Iterable[str] = () ) -> None:
+		""" Checks statements in a new scope, like the environment of a block, which may start with some names """
+		self._scopes.append( dict.fromkeys( names ) )
+		try:
+			for statement in statements:
+				statement.accept( self )
+		finally:
+			self._scopes.pop()
+
+	def _bind( self, name: Token, declaration: Optional[stmt.Declare] ) -> None:
+		scope = self._scopes[ -1 ]
+		key = str( name.value )
+		if ( previous := scope.get( key ) ) is not None:
+			# a redeclaration replaces the variable for the code which resolved the previous one too
+			self._unproven.add( id( previous ) )
+			if declaration is not None:
+				self._unproven.add( id( declaration ) )
+		scope[ key ] = declaration
+
+	def _resolve( self, name: Token ) -> Optional[stmt.Declare]:
+		key = str( name.value )
+		for scope in reversed( self._scopes ):
+			if key in scope:
+				return scope[ key ]
+		return None
+
+	def _give( self, declaration: stmt.Declare, value: Optional[Type], token: Token ) -> None:
+		""" Checks a value given to a variable, which stays proven only if it has the declared type """
+		declared = _TYPES.get( declaration.typ )
+		if declared is None or value is declared:
+			return
+		self._unproven.add( id( declaration ) )
+		# NOTHING may be given to any variable, it's the value of the ones without an initializer
+		if value is not None and value is not Type.NOTHING:
+			self.error( token, f'Cannot give a {value.value} to {declaration.name.value}, declared as {declared.value}' )
+
+	# statements
+
+	def visitExpressionStmt( self, expression: stmt.Expression ) -> None:
+		expression.expression.accept( self )
+
+	def visitDeclareStmt( self, declare: stmt.Declare ) -> None:
+		value = Type.NOTHING if declare.initializer is None else declare.initializer.accept( self )
+		self._bind( declare.name, declare )
+		self._give( declare, value, declare.name )
+
+	def visitAssignStmt( self, assign: stmt.Assign ) -> None:
+		value = assign.value.accept( self )
+		declaration = self._resolve( assign.name )
+		if declaration is not None:
+			self._give( declaration, value, assign.name )
+		else:
+			self._unresolved.add( str( assign.name.value ) )
+
+	def visitIfStmt( self, if_: stmt.If ) -> None:
+		if_.condition.accept( self )
+		self._block( if_.thenBranch )
+		self._block( if_.elseBranch )
+
+	def visitUntilStmt( self, until: stmt.Until ) -> None:
+		until.condition.accept( self )
+		self._block( until.body )
+
+	def visitReturnStmt( self, return_: stmt.Return ) -> None:
+		if return_.value is not None:
+			return_.value.accept( self )
+
+	def visitSubroutineStmt( self, subroutine: stmt.Subroutine ) -> None:
+		self._bind( subroutine.name, None )
+		if not subroutine.body.parsed:
+			# parsing it would defeat the lazy parsing, any name followed by `=` may be assigned by it
+			tokens = subroutine.body.tokens
+			for token, following in zip( tokens, tokens[ 1: ] ):
+				if token.typ is TokenType.NAME and following.value is Symbol.EQUAL:
+					self._unresolved.add( str( token.value ) )
+			return
+		self._block( subroutine.body.statements, [ str( param.name.value ) for param in subroutine.params ] )
+
+	def visitSetStmt( self, set: stmt.Set ) -> None:
+		set.object.accept( self )
+		set.value.accept( self )
+
+	def visitTemplateStmt( self, template: stmt.Template ) -> None:
+		self._bind( template.name, None )
+		# the fields and the behaviors are members of the instances, not names of the scope
+		self._block( cast( list[ stmt.Stmt ], template.fields ) )
+		for member in ( template.initializer, template.deinitializer, *template.behaviors ):
+			if member is not None:
+				self._block( [ member ] )
+
+	# expressions
+
+	def visitBinaryExpr( self, binary: Binary ) -> Optional[Type]:
+		# the tree may be checked many times, a previous proof may not hold anymore
+		binary.type = None
+		left = binary.left.accept( self )
+		right = binary.right.accept( self )
+		op = binary.operator.value
+
+		if left is None or right is None:
+			# either not provable or an error was already reported for the operands
+			return None
+
+		typ = binaryType( op, left, right )
+		if typ is None:
+			self.error( binary.operator, f'Unsupported operand types {left.value} and {right.value}' )
+			return None
+		binary.type = typ
+		return typ
+
+	def visitGroupingExpr( self, grouping: Grouping ) -> Optional[Type]:
+		grouping.type = grouping.expression.accept( self )
+		return grouping.type
+
+	def visitLiteralExpr( self, literal: Literal ) -> Optional[Type]:
+		literal.type = Type.ofValue( literal.value )
+		return literal.type
+
+	def visitUnaryExpr( self, unary: Unary ) -> Optional[Type]:
+		unary.type = None
+		right = unary.right.accept( self )
+
+		if right is None:
+			return None
+
+		typ = unaryType( unary.operator.value, right )
+		if typ is None:
+			self.error( unary.operator, f'Unsupported operand type {right.value}' )
+			return None
+		unary.type = typ
+		return typ
+
+	def visitVariableExpr( self, variable: Variable ) -> Optional[Type]:
+		declaration = self._resolve( variable.name )
+		variable.type = None
+		if declaration is not None and id( declaration ) not in self._unproven and str( variable.name.value ) not in self._unresolved:
+			variable.type = _TYPES.get( declaration.typ )
+		return variable.type
+
+	def visitCallExpr( self, call: Call ) -> Optional[Type]:
+		call.callee.accept( self )
+		for argument in call.arguments:
+			argument.accept( self )
+		return None
+
+	def visitGetExpr( self, get: Get ) -> Optional[Type]:
+		# members are resolved at runtime, so their type is never proven
+		get.object.accept( self )
+		return None
+
+	def error( self, token: Token, message: str ) -> None:
+		self.errors.append( f'Type error at {token.loc}: {message}' )
+		self.locatedErrors.append( ( token.loc, message ) )
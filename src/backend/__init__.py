@@ -1,20 +1,38 @@
 """
 Contains info about the compiler backends and a abstract class representing them.
 """
+from __future__ import annotations
 
 from dataclasses import dataclass
 
-from ast_.expr import Expr
+from typing import Optional, TYPE_CHECKING
+
 from platforms import Platform
 
+if TYPE_CHECKING:
+	from ast_.stmt import Stmt
+	from module import Module
+
 
 class Backend:
 	@staticmethod
-	def backendMain(ast: Expr) -> int:
+	def backendMain(ast: list[Stmt], module: Optional[Module] = None) -> int:
 		"""
 		Main function for a backend
 		\t
 		:param ast:
+		:param module: the module the ast was parsed from, backends use it to place their output and caches
+		:return: exit code
+		"""
+
+	@staticmethod
+	def buildMain(ast: list[Stmt], module: Module) -> int:
+		"""
+		Optional, writes the backend's output for a module without running it, used by `endcc build`.
+		Backends without it only get the front end checks.
+		\t
+		:param ast:
+		:param module: the module the ast was parsed from
 		:return: exit code
 		"""
 
@@ -37,20 +55,20 @@ BACKENDS: dict[ Platform, BackendInfo ] = {
 	Platform.LLVM: BackendInfo(
 		name='LLVM',
 		pkg='backend.llvm',
-		help='Compiles to LLVM IR and then to machine code',
-		available=False
+		help='Compiles to LLVM IR and then to machine code, without imports or arrays',
+		available=True
 	),
 	Platform.WASM: BackendInfo(
 		name='WASM',
 		pkg='backend.wasm',
-		help='Compiles to WASM text format and then to binary',
-		available=False
+		help='Compiles to WASM text format and binary, and runs it on the built-in machine, without imports or joined strings',
+		available=True
 	),
 	Platform.PYTHON: BackendInfo(
-		name='Python 3.9 VM',
-		pkg='backend.py',
+		name='Python VM',
+		pkg='backend.python',
 		help='Compiles to python bytecode (.pyc files)',
-		available=False
+		available=True
 	),
 	Platform.JVM: BackendInfo(
 		name='Java Virtual Machine',
@@ -1,50 +1,245 @@
 """
 Interpreter backend for the endc compiler.
 """
-from typing import Any, cast
+import operator
+import sys
+from pathlib import Path
+from typing import Any, Callable, Final, Optional, Union, cast
 
-from ast_.expr import Visitor, Binary, Grouping, Literal, Unary, Expr
-from backend.interpreter import errorHandler
-from token_ import UnaryType
+from ast_ import ParseError, stmt
+from ast_.parser import Parser
+from ast_.expr import Visitor, Binary, Grouping, Literal, Unary, Variable, Call, Get, Expr
+from ast_.typeChecker import Type, TypeChecker
+from backend.interpreter import arrays, errorHandler
+from backend.interpreter.arrays import Array
+from backend.interpreter.environment import Environment
+from backend.interpreter.eventLoop import Scheduler
+from backend.interpreter.errorHandler import InterpreterError, RUNTIME_ERRORS, RECURSION_MESSAGE
+from backend.interpreter.handles import Handle
+from backend.interpreter.limits import Budget, Limits
+from module import Module
+from backend.interpreter.runtime import EndCCallable, Subroutine, ReturnValue, Template, Instance, BoundBehavior, \
+	InlineCache, createGlobals, getMember
+from backend.interpreter.jit import Jit, JIT_THRESHOLD
+from token_ import Keyword, Token, UnaryType
 from utils import ExitError
+import log
 
 
-class InterpreterError(RuntimeError):
-	pass
+# operations selected when the type checker proved the operand types, these skip all the runtime checks
+_UNCHECKED_BINARY: Final[ dict[ tuple[ object, Optional[Type], Optional[Type] ], Callable[ [ Any, Any ], object ] ] ] = {
+	( UnaryType.ADD, Type.INTEGER, Type.INTEGER ): operator.add,
+	( UnaryType.ADD, Type.STRING, Type.STRING ): operator.add,
+	( UnaryType.SUBTRACT, Type.INTEGER, Type.INTEGER ): operator.sub,
+	( UnaryType.DIVIDE, Type.INTEGER, Type.INTEGER ): operator.truediv,
+	( UnaryType.MODULO, Type.INTEGER, Type.INTEGER ): operator.mod,
+	( UnaryType.GREATER, Type.INTEGER, Type.INTEGER ): operator.gt,
+	( UnaryType.GREATER_EQUAL, Type.INTEGER, Type.INTEGER ): operator.ge,
+	**{ ( Keyword.IS, left, right ): operator.eq for left in Type for right in Type },
+	**{ ( UnaryType.BANG_IS, left, right ): operator.ne for left in Type for right in Type },
+}
+_UNCHECKED_UNARY: Final[ dict[ tuple[ object, Optional[Type] ], Callable[ [ Any ], object ] ] ] = {
+	( UnaryType.SUBTRACT, Type.INTEGER ): operator.neg,
+	( UnaryType.BANG, Type.BOOLEAN ): operator.not_,
+}
 
 
 # noinspection PyMethodMayBeStatic
-class Interpreter(Visitor[object]):
+class Interpreter(Visitor[object], stmt.Visitor[None]):
+	globals: Environment
+	environment: Environment
+	useInlineCaches: bool
+	inlineCaches: list[ InlineCache ]
+	jit: Optional[ Jit ]
+	# runs the calls started with start{}, made when the first one is, see eventLoop.py
+	scheduler: Optional[ Scheduler ]
+	# what the run used of its limits, None if it has none
+	budget: Optional[ Budget ]
+	# whether the program built an array, see `useArrays()`
+	arrays: bool
+	# the operators whose operands' types were proven, see `visitBinaryExpr()`
+	uncheckedBinary: dict[ tuple[ object, Optional[Type], Optional[Type] ], Callable[ [ Any, Any ], object ] ]
+
+	def __init__(
+			self,
+			useInlineCaches: bool = True,
+			jitThreshold: Optional[int] = JIT_THRESHOLD,
+			debug: Optional[Callable[[str], None]] = None,
+			globals: Optional[Environment] = None,
+			limits: Optional[Limits] = None
+	) -> None:
+		"""
+		:param useInlineCaches: whether to cache template member lookups at each access site
+		:param jitThreshold: calls after which a subroutine is compiled to python, None to only tree-walk
+		:param debug: receives the tiering decisions of the JIT
+		:param globals: the global environment, defaults to `createGlobals()`
+		:param limits: the resources the run may use, counted from now, see limits.py
+		"""
+		self.globals = globals or createGlobals()
+		self.environment = self.globals
+		self.useInlineCaches = useInlineCaches
+		self.inlineCaches = []
+		self.scheduler = None
+		self.arrays = False
+		self.budget = None if limits is None else Budget( limits )
+		self.uncheckedBinary = _UNCHECKED_BINARY
+		if limits is not None and limits.allocation is not None:
+			# strings are joined on the checked path, which counts their bytes
+			self.uncheckedBinary = { key: func for key, func in _UNCHECKED_BINARY.items() if key[ : 2 ] != ( UnaryType.ADD, Type.STRING ) }
+		self.jit = None if jitThreshold is None else Jit( self, jitThreshold, debug )
+
+	# statements
+
+	def visitExpressionStmt( self, expression: stmt.Expression ) -> None:
+		self.evaluate( expression.expression )
+
+	def visitDeclareStmt( self, declare: stmt.Declare ) -> None:
+		value = None if declare.initializer is None else self.evaluate( declare.initializer )
+		self.environment.define( str( declare.name.value ), value, declare.constant )
+
+	def visitAssignStmt( self, assign: stmt.Assign ) -> None:
+		self.environment.assign( assign.name, self.evaluate( assign.value ) )
+
+	def visitIfStmt( self, if_: stmt.If ) -> None:
+		if self.isTruthy( self.evaluate( if_.condition ) ):
+			self.executeBlock( if_.thenBranch, Environment( self.environment ) )
+		else:
+			self.executeBlock( if_.elseBranch, Environment( self.environment ) )
+
+	def visitUntilStmt( self, until: stmt.Until ) -> None:
+		if not until.checkFirst:
+			self.executeBlock( until.body, Environment( self.environment ) )
+		while not self.isTruthy( self.evaluate( until.condition ) ):
+			self.executeBlock( until.body, Environment( self.environment ) )
+
+	def visitReturnStmt( self, return_: stmt.Return ) -> None:
+		raise ReturnValue( None if return_.value is None else self.evaluate( return_.value ) )
+
+	def visitSubroutineStmt( self, subroutine: stmt.Subroutine ) -> None:
+		self.environment.define( str( subroutine.name.value ), Subroutine( subroutine, self.environment ), True )
+
+	def visitSetStmt( self, set: stmt.Set ) -> None:
+		receiver = self.evaluate( set.object )
+		self.assignMember( set, receiver, self.evaluate( set.value ) )
+
+	def visitTemplateStmt( self, template: stmt.Template ) -> None:
+		self.environment.define( str( template.name.value ), Template( template, self.environment ), True )
+
+	def execute( self, statements: list[stmt.Stmt] ) -> None:
+		for statement in statements:
+			statement.accept( self )
+
+	def useArrays( self ) -> None:
+		"""
+		Called when the first array is built, by a builtin or a foreign subroutine, the JIT only supports arrays
+		from then on, as it's slower. Code giving the program an array some other way, like defining it in the
+		globals, must call it first
+		"""
+		if not self.arrays:
+			self.arrays = True
+			if self.jit is not None:
+				self.jit.useArrays()
+
+	def flush( self ) -> None:
+		""" Writes what the handles of the program buffered, see handles.py """
+		for value in self.globals.values.values():
+			if isinstance( value, Handle ):
+				value.flush()
+
+	def executeBlock( self, statements: list[stmt.Stmt], environment: Environment ) -> None:
+		if self.budget is not None:
+			# a unit of fuel for the block and one for each statement
+			self.budget.fuel -= len( statements ) + 1
+			if self.budget.fuel < 0:
+				self.budget.refuel( statements )
+		previous = self.environment
+		try:
+			self.environment = environment
+			for statement in statements:
+				statement.accept( self )
+		finally:
+			self.environment = previous
+
+	def link( self, module: Module ) -> None:
+		"""
+		Runs the modules the given one imports, each once and in a scope of its own, which sees only the builtins,
+		and binds the imported names as constants of the globals
+		:raises ParseError: if an imported module fails to parse
+		"""
+		builtins = Environment()
+		builtins.values, builtins.constants = dict( self.globals.values ), set( self.globals.constants )
+		self._bindImports( module, self.globals, builtins, {} )
+
+	def _bindImports( self, module: Module, env: Environment, builtins: Environment, loaded: dict[ Path, Environment ] ) -> None:
+		for imp in module.imports:
+			dep = module.dependencies[ imp.path ]
+			if dep.path not in loaded:
+				depEnv = loaded[ dep.path ] = Environment( builtins )
+				self._bindImports( dep, depEnv, builtins, loaded )
+				ast = Parser( dep.tokens ).parseProgram()
+				if ast is None:
+					raise ParseError( f'Failed to parse module {dep.name}' )
+				# type errors are not fatal here, like in prepareBody()
+				TypeChecker().checkStatements( ast )
+				self.executeBlock( ast, depEnv )
+			for name in imp.names:
+				env.define( name, loaded[ dep.path ].values[ name ], True )
+
+	def prepareBody( self, statements: list[stmt.Stmt] ) -> None:
+		""" Called when a subroutine body has just been parsed, annotates it with the static types """
+		# type errors are not fatal here, the nodes stay unproven and are checked when executed
+		TypeChecker().checkStatements( statements )
+
+	# expressions
 
 	def visitBinaryExpr( self, binary: Binary ) -> object:
-		left: Any = self.evaluate(binary.left)
-		right: Any = self.evaluate(binary.right)
-
-		op: UnaryType = cast( UnaryType, binary.operator.value )
-
-		# math
-		if op is UnaryType.SUBTRACT:
-			self.checkNumberOperand(op, right)
-			return float(left) - float(right)
-		elif op is UnaryType.DIVIDE:
-			return float(left) / float(right)
-		elif op is UnaryType.MODULO:
-			return float(left) % float(right)
-		elif op is UnaryType.ADD:
-			if isinstance( left, str ):
-				return str( left ) + str( right )
-			elif isinstance(left, float):
-				return float(left) + float(right)
-		# comparisons
-		elif op is UnaryType.GREATER:
-			return float(left) > float(right)
-		elif op is UnaryType.GREATER_EQUAL:
-			return float(left) >= float(right)
-		elif op is UnaryType.BANG_IS:
-			return not self.isEqual(left, right)
-
-		# unreachable
-		return None
+		try:
+			op: UnaryType = cast( UnaryType, binary.operator.value )
+
+			# proven types, skip the checks
+			unchecked = self.uncheckedBinary.get( ( op, binary.left.type, binary.right.type ) )
+			if unchecked is not None:
+				return unchecked( binary.left.accept( self ), binary.right.accept( self ) )
+
+			left: Any = self.evaluate(binary.left)
+			right: Any = self.evaluate(binary.right)
+
+			# elementwise, in a single call
+			if ( left.__class__ is Array or right.__class__ is Array ) and op in arrays.OPERATORS:
+				if self.budget is not None:
+					return self.budget.account( arrays.binary( binary.operator, left, right ), binary.operator )
+				return arrays.binary( binary.operator, left, right )
+
+			# math
+			if op is UnaryType.SUBTRACT:
+				self.checkNumberOperand(binary.operator, right)
+				return float(left) - float(right)
+			elif op is UnaryType.DIVIDE:
+				return float(left) / float(right)
+			elif op is UnaryType.MODULO:
+				return float(left) % float(right)
+			elif op is UnaryType.ADD:
+				if isinstance( left, str ):
+					if self.budget is not None:
+						return self.budget.account( str( left ) + str( right ), binary.operator )
+					return str( left ) + str( right )
+				elif isinstance(left, float):
+					return float(left) + float(right)
+			# comparisons
+			elif op is UnaryType.GREATER:
+				return float(left) > float(right)
+			elif op is UnaryType.GREATER_EQUAL:
+				return float(left) >= float(right)
+			elif op is Keyword.IS:
+				return self.isEqual(left, right)
+			elif op is UnaryType.BANG_IS:
+				return not self.isEqual(left, right)
+
+			# unreachable
+			return None
+		except RUNTIME_ERRORS as e:
+			# the operands report their own errors, like `1 - *x*`, this one is the operator's
+			raise InterpreterError( binary.operator, str( e ) ) from None
 
 	def visitGroupingExpr( self, grouping: Grouping ) -> object:
 		return self.evaluate( grouping.expression )
@@ -53,23 +248,136 @@ class Interpreter(Visitor[object]):
 		return literal.value
 
 	def visitUnaryExpr( self, unary: Unary ) -> object:
+		# proven type, skip the checks
+		unchecked = _UNCHECKED_UNARY.get( ( unary.operator.value, unary.right.type ) )
+		if unchecked is not None:
+			return unchecked( unary.right.accept( self ) )
+
 		right: Any = self.evaluate( unary.right )
 
 		if unary.operator.value == UnaryType.SUBTRACT:
-			return -float(right)
+			if right.__class__ is Array:
+				if self.budget is not None:
+					return self.budget.account( arrays.negate( unary.operator, right ), unary.operator )
+				return arrays.negate( unary.operator, right )
+			try:
+				return -float(right)
+			except RUNTIME_ERRORS as e:
+				raise InterpreterError( unary.operator, str( e ) ) from None
 		if unary.operator.value == UnaryType.BANG:
 			return not self.isTruthy(right)
 
 		# Unreachable
 		return None
 
+	def visitVariableExpr( self, variable: Variable ) -> object:
+		return self.environment.get( variable.name, str( variable.name.value ) )
+
+	def visitCallExpr( self, call: Call ) -> object:
+		callee: object
+		if isinstance( call.callee, Get ):
+			# CALL obj,name{}: dispatch a behavior call without binding it first
+			receiver = call.callee.object.accept( self )
+			if isinstance( receiver, Instance ):
+				# monomorphic hit, inlined
+				cache: Optional[ InlineCache ] = call.cache
+				if cache is not None and cache.shape is receiver.shape:
+					cache.hits += 1
+					member = cache.target
+				else:
+					member = self.lookupMember( call, receiver, call.callee.name )
+				if isinstance( member, Subroutine ):
+					arguments = [ self.evaluate( argument ) for argument in call.arguments ]
+					return member.callOn( self, call.keyword, receiver, arguments )
+				callee = receiver.values[ cast( int, member ) ]
+			else:
+				callee = getMember( call.callee.name, receiver, str( call.callee.name.value ) )
+		else:
+			callee = self.evaluate( call.callee )
+		arguments = [ self.evaluate( argument ) for argument in call.arguments ]
+
+		if not isinstance( callee, EndCCallable ):
+			raise InterpreterError( call.keyword, f'{self.stringify( callee )} is not a subroutine' )
+		return callee.call( self, call.keyword, arguments )
+
+	def visitGetExpr( self, get: Get ) -> object:
+		return self.memberOf( get, get.object.accept( self ) )
+
+	def memberOf( self, get: Get, receiver: object ) -> object:
+		""" Evaluates `receiver,name` at the given site """
+		name = get.name
+		if isinstance( receiver, Instance ):
+			# monomorphic hit, inlined
+			cache: Optional[ InlineCache ] = get.cache
+			if cache is not None and cache.shape is receiver.shape:
+				cache.hits += 1
+				member = cache.target
+			else:
+				member = self.lookupMember( get, receiver, name )
+			if isinstance( member, Subroutine ):
+				return BoundBehavior( member, receiver )
+			return receiver.values[ cast( int, member ) ]
+		return getMember( name, receiver, str( name.value ) )
+
+	def assignMember( self, set: stmt.Set, receiver: object, value: object ) -> None:
+		""" Executes `receiver,name = value` at the given site """
+		name = set.name
+		if not isinstance( receiver, Instance ):
+			raise InterpreterError( name, f'{self.stringify( receiver )} has no fields' )
+
+		slot = self.lookupMember( set, receiver, name )
+		if not isinstance( slot, int ):
+			raise InterpreterError( name, f'Cannot assign to behavior "{name.value}"' )
+		if name.value in receiver.shape.constants:
+			raise InterpreterError( name, f'Cannot assign to constant "{name.value}"' )
+		receiver.values[ slot ] = value
+
 	def evaluate( self, expr: Expr ) -> object:
 		if isinstance(expr, Expr):
 			return expr.accept(self)
 		return expr
 
+	def evaluateIn( self, expr: Expr, environment: Environment ) -> object:
+		""" Evaluates an expression in the given scope """
+		previous = self.environment
+		try:
+			self.environment = environment
+			return self.evaluate( expr )
+		finally:
+			self.environment = previous
+
 	# helper methods
 
+	def lookupMember( self, site: Union[Expr, stmt.Stmt], receiver: Instance, name: Token ) -> object:
+		"""
+		Finds a member of an instance, through the inline cache of the site accessing it
+		:return: the slot index of a field or the behavior
+		"""
+		if self.useInlineCaches:
+			cache: Optional[ InlineCache ] = site.cache
+			if cache is None:
+				cache = site.cache = InlineCache( str( name.value ) )
+				self.inlineCaches.append( cache )
+			member = cache.lookup( receiver.template )
+		else:
+			member = receiver.template.findMember( str( name.value ) )
+
+		if member is None:
+			raise InterpreterError( name, f'{receiver} has no member "{name.value}"' )
+		return member
+
+	def inlineCacheReport( self ) -> str:
+		""" Summarizes the state and hit rate of the inline caches created by this interpreter """
+		hits = sum( cache.hits for cache in self.inlineCaches )
+		misses = sum( cache.misses for cache in self.inlineCaches )
+		states: dict[ str, int ] = {}
+		for cache in self.inlineCaches:
+			states[ cache.state ] = states.get( cache.state, 0 ) + 1
+
+		rate = 100 * hits / ( hits + misses ) if hits + misses else 0
+		kinds = ', '.join( f'{count} {state}' for state, count in sorted( states.items() ) )
+		return f'Inline caches: {len( self.inlineCaches )} sites ({kinds}), {hits} hits, {misses} misses, {rate:.1f}% hit rate'
+
 	def isTruthy( self, obj: object ) -> bool:
 		if obj is None:
 			return False
@@ -86,10 +394,10 @@ class Interpreter(Visitor[object]):
 			return False
 		return left == right
 
-	def checkNumberOperand( self, op: UnaryType, right: Any ) -> None:
+	def checkNumberOperand( self, operator: Token, right: Any ) -> None:
 		if isinstance(right, float):
 			return
-		raise InterpreterError(op, 'Operand must be a number')
+		raise InterpreterError(operator, 'Operand must be a number')
 
 	def stringify( self, obj: Any ) -> str:
 		if obj is None:
@@ -114,11 +422,42 @@ class Interpreter(Visitor[object]):
 			)
 
 
-def backendMain(ast: Expr) -> int:
+def backendMain(ast: list[stmt.Stmt], module: Optional[Module] = None, intpr: Optional[Interpreter] = None) -> int:
+	if intpr is None:
+		# the tiering decisions go to the debug log, if the log settings enable it
+		intpr = Interpreter( debug=log.debug )
 	try:
-		Interpreter().evaluate(ast)
+		exitCode = None
+		try:
+			if module is not None:
+				intpr.link(module)
+			intpr.execute(ast)
+			# run the main subroutine, if there is one
+			main = intpr.globals.values.get('main')
+			if isinstance(main, Subroutine):
+				# argv is passed only if main declares it
+				exitCode = main.call(intpr, main.declaration.name, [ [] ] if main.declaration.params else [])
+		finally:
+			# the program ends when all the calls it started do
+			if intpr.scheduler is not None:
+				intpr.scheduler.close()
+		if isinstance(exitCode, float):
+			return int(exitCode)
 	except InterpreterError as e:
-		print(e)
+		# the output printed before the error goes first
+		intpr.flush()
+		print(errorHandler.getErrorText(e), file=sys.stderr)
+		return 1
+	except RecursionError:
+		# outside of any subroutine, which would have reported it at its call
+		intpr.flush()
+		print(errorHandler.getErrorText(InterpreterError('the program', RECURSION_MESSAGE)), file=sys.stderr)
+		return 1
+	except ParseError:
+		# already reported by the parser
 		return 1
+	finally:
+		# on returning from main, or at the end of a program without one
+		intpr.flush()
 	return 0
 
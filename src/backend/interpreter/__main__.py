@@ -1,31 +1,32 @@
 """
-Interprets a given file
+Interprets a given file, `-dg` logs the tiering decisions of the JIT and the state of the inline caches
 """
 
 import sys
 from time import time
 from pathlib import Path
-from pprint import pprint
 from sys import argv
 
+import log
 from ast_.parser import Parser
-from backend.interpreter import Interpreter
-from tokenizer import parse, TokenizerError
+from backend.interpreter import Interpreter, backendMain
+from log import LogSettings
+from token_.tokenizer import parse, TokenizerError
 from utils import ExitError
 
 start = time()
 exitCode = 0
+if '-dg' in argv:
+	argv.remove( '-dg' )
+	log.configure( LogSettings( 0, True ) )
 try:
-	pprint(
-		Interpreter().evaluate(
-			Parser(
-				parse(
-					Path( argv[1] ).read_text(),
-					argv[1]
-				)
-			).parse()  # type: ignore
-		)
-	)
+	ast = Parser( parse( Path( argv[1] ).read_text(), argv[1] ) ).parseProgram()
+	if ast is None:
+		exitCode = 1
+	else:
+		intpr = Interpreter( debug=lambda message: log.debug( message, sys.stderr ) )
+		exitCode = backendMain( ast, intpr=intpr )
+		log.debug( intpr.inlineCacheReport(), sys.stderr )
 except ExitError as e:
 	exitCode = e.code
 except TokenizerError as e:
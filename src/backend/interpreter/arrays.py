@@ -0,0 +1,208 @@
+"""
+Numeric arrays of the interpreter.
+
+An array keeps its elements in a contiguous `array.array`, of doubles for numbers, or of bytes for the booleans
+the comparisons give. When an operand of `-`, `+`, `;`, `\\`, `<` or `=<` is an array, the operator applies to
+each element in a single call, which runs over the whole buffer without going back to the interpreter;
+a number operand is broadcast to all the elements.
+Arrays are built by the `arry{ size. value }` and `count{ size }` builtins, and their elements are read and
+written with the `git{ index }` and `put{ index. value }` members.
+An interpreter supports arrays once one was built by a builtin it ran, see `Interpreter.useArrays()`.
+"""
+from __future__ import annotations
+
+import operator
+from array import array
+from itertools import repeat
+from typing import Any, Callable, Final, Iterable, Iterator, Optional
+
+from token_ import Token, UnaryType
+from .errorHandler import InterpreterError
+
+
+__all__ = [ 'Array', 'OPERATORS', 'MEMBERS', 'apply', 'binary', 'negate', 'number', 'arry', 'count' ]
+# the function each operator applies to the elements
+OPERATORS: Final[ dict[ object, Callable[ [ Any, Any ], Any ] ] ] = {
+	UnaryType.ADD: operator.add,
+	UnaryType.SUBTRACT: operator.sub,
+	UnaryType.DIVIDE: operator.truediv,
+	UnaryType.MODULO: operator.mod,
+	UnaryType.GREATER: operator.gt,
+	UnaryType.GREATER_EQUAL: operator.ge,
+}
+# the members scripts may call on an array
+MEMBERS: Final[ frozenset[ str ] ] = frozenset( { 'siz', 'git', 'put', 'sum', 'min', 'max' } )
+_COMPARISONS: Final[ frozenset[ Callable[ [ Any, Any ], Any ] ] ] = frozenset( { operator.gt, operator.ge, operator.lt, operator.le } )
+
+
+class Array:
+	""" An array of numbers, or of booleans """
+	__slots__ = ( 'data', )
+	# typecode 'd' for numbers, 'B' for booleans
+	data: array
+
+	def __init__( self, data: array ) -> None:
+		self.data = data
+
+	@classmethod
+	def of( cls, values: Iterable[Any], typecode: str = 'd' ) -> Array:
+		""" An array of the given values, numbers by default, or booleans if `typecode` is 'B' """
+		return cls( array( typecode, values ) )
+
+	@classmethod
+	def wrap( cls, data: array ) -> Array:
+		""" An array using the given buffer, without copying it """
+		return cls( data )
+
+	@property
+	def boolean( self ) -> bool:
+		return self.data.typecode == 'B'
+
+	# members
+
+	def siz( self ) -> float:
+		return float( len( self.data ) )
+
+	def git( self, index: float ) -> object:
+		value = self.data[ _index( index ) ]
+		return bool( value ) if self.boolean else value
+
+	def put( self, index: float, value: object ) -> None:
+		self.data[ _index( index ) ] = value  # type: ignore
+
+	def sum( self ) -> float:
+		return float( sum( self.data ) )
+
+	def min( self ) -> float:
+		return float( min( self.data ) )
+
+	def max( self ) -> float:
+		return float( max( self.data ) )
+
+	# python operators, the code compiled by the JIT uses them
+
+	def __add__( self, other: object ) -> Array:
+		return apply( operator.add, self, other )
+
+	def __radd__( self, other: object ) -> Array:
+		return apply( operator.add, other, self )
+
+	def __sub__( self, other: object ) -> Array:
+		return apply( operator.sub, self, other )
+
+	def __rsub__( self, other: object ) -> Array:
+		return apply( operator.sub, other, self )
+
+	def __truediv__( self, other: object ) -> Array:
+		return apply( operator.truediv, self, other )
+
+	def __rtruediv__( self, other: object ) -> Array:
+		return apply( operator.truediv, other, self )
+
+	def __mod__( self, other: object ) -> Array:
+		return apply( operator.mod, self, other )
+
+	def __rmod__( self, other: object ) -> Array:
+		return apply( operator.mod, other, self )
+
+	def __gt__( self, other: object ) -> Array:  # type: ignore[override]
+		return apply( operator.gt, self, other )
+
+	def __ge__( self, other: object ) -> Array:  # type: ignore[override]
+		return apply( operator.ge, self, other )
+
+	# `number > array` is asked to the array as `array < number`, and the same for `>=`
+	def __lt__( self, other: object ) -> Array:  # type: ignore[override]
+		return apply( operator.lt, self, other )
+
+	def __le__( self, other: object ) -> Array:  # type: ignore[override]
+		return apply( operator.le, self, other )
+
+	def __neg__( self ) -> Array:
+		return Array( array( 'd', map( operator.neg, self.data ) ) )
+
+	def __eq__( self, other: object ) -> bool:
+		return isinstance( other, Array ) and self.data == other.data and self.boolean == other.boolean
+
+	__hash__ = None  # type: ignore
+
+	def __len__( self ) -> int:
+		return len( self.data )
+
+	def __iter__( self ) -> Iterator[object]:
+		return map( bool, self.data ) if self.boolean else iter( self.data )
+
+	def __str__( self ) -> str:
+		values = map( _text, self )
+		return f'( {", ".join( values )} )'
+
+	def __repr__( self ) -> str:
+		return f'<array of {len( self.data )} {"booleans" if self.boolean else "numbers"}>'
+
+
+def apply( function: Callable[ [ Any, Any ], Any ], left: object, right: object ) -> Array:
+	"""
+	Applies a function to each pair of elements, or to each element and a number
+	:raises ValueError: if the arrays have different sizes, or the other operand is not a number
+	"""
+	if isinstance( left, Array ):
+		if isinstance( right, Array ):
+			if len( left.data ) != len( right.data ):
+				raise ValueError( f'arrays of different sizes, {len( left.data )} and {len( right.data )}' )
+			values = map( function, left.data, right.data )
+		else:
+			values = map( function, left.data, repeat( _scalar( right ) ) )
+	else:
+		assert isinstance( right, Array )
+		values = map( function, repeat( _scalar( left ) ), right.data )
+	return Array( array( 'B' if function in _COMPARISONS else 'd', values ) )
+
+
+def binary( token: Token, left: object, right: object ) -> Array:
+	""" Evaluates a binary operator, one of `OPERATORS`, with at least one array operand """
+	try:
+		return apply( OPERATORS[ token.value ], left, right )
+	except ZeroDivisionError:
+		raise InterpreterError( token, 'Division by zero in an array' ) from None
+	except ( TypeError, ValueError ) as e:
+		raise InterpreterError( token, f'Invalid operands for {token.value}: {e}' ) from None
+
+
+def negate( token: Token, right: Array ) -> Array:
+	if right.boolean:
+		raise InterpreterError( token, 'Operand must be a number' )
+	return -right
+
+
+def number( value: Any ) -> float | Array:
+	""" `float()`, which leaves arrays as they are, for the code compiled by the JIT """
+	return value if value.__class__ is Array else float( value )
+
+
+# builtins
+
+def arry( size: float, value: Optional[float] = None ) -> Array:
+	""" An array of `size` elements, all set to `value`, or to 0 """
+	return Array( array( 'd', [ 0.0 if value is None else float( value ) ] ) * _index( size ) )
+
+
+def count( size: float ) -> Array:
+	""" The numbers from 0 to `size`, excluded """
+	return Array( array( 'd', map( float, range( _index( size ) ) ) ) )
+
+
+def _index( value: float ) -> int:
+	if not isinstance( value, float ) or not value.is_integer() or value < 0:
+		raise ValueError( f'{_text( value )} is not a whole, positive number' )
+	return int( value )
+
+
+def _scalar( value: object ) -> float:
+	if not isinstance( value, float ):
+		raise ValueError( f'{value!r} is not a number' )
+	return value
+
+
+def _text( value: object ) -> str:
+	txt = str( value )
+	return txt[ : -2 ] if txt.endswith( '.0' ) else txt
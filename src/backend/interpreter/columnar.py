@@ -0,0 +1,213 @@
+"""
+Batch evaluation of an expression over many rows, for rules checked against a lot of records.
+
+The free names of the expression are bound to the columns of a table, and the expression is evaluated once for
+each batch of rows instead of once per row: the value of each node is a whole column, computed by a single call
+over the batch, see arrays.py. Numeric columns are arrays, boolean ones, like the results of `<`, `IS` and `!`,
+are masks: arrays of bytes; other columns, like strings, are lists.
+Tables are dicts of equally long columns, they may be read from CSV files a batch at a time with `readCsv()`.
+Subroutine calls and members can't be evaluated in batch.
+"""
+from __future__ import annotations
+
+import csv
+import operator
+from itertools import islice, repeat
+from typing import Any, Callable, Final, Iterable, Iterator, Optional, TextIO, Union
+
+from ast_.expr import Visitor, Binary, Grouping, Literal, Unary, Variable, Call, Get, Expr
+from backend.python.runtime import add, truthy
+from token_ import Keyword, UnaryType
+from .arrays import Array, OPERATORS, apply, negate
+from .errorHandler import InterpreterError
+
+
+__all__ = [ 'Column', 'Table', 'BATCH_SIZE', 'BatchEvaluator', 'evaluate', 'evaluateBatches', 'split', 'readCsv' ]
+Column = Union[ Array, list[ object ] ]
+Table = dict[ str, Column ]
+# rows evaluated at once
+BATCH_SIZE: Final[ int ] = 64 * 1024
+# maps each byte of a mask to its negation
+_NOT: Final[ bytes ] = bytes( [ 1 ] ) + bytes( 255 )
+# the values a binary operator may get, booleans are ints
+_OPERANDS: Final = ( Array, float, int, str )
+
+
+class BatchEvaluator(Visitor[object]):
+	"""
+	Evaluates expressions over a batch of rows.
+	The value of a node is a column, or a single value if it's the same for all the rows, like a literal.
+	"""
+	columns: Table
+	rows: int
+	# values of the free names which aren't columns
+	constants: dict[ str, object ]
+
+	def __init__( self, columns: Table, constants: Optional[dict[str, object]] = None ) -> None:
+		"""
+		:param columns: the batch, the free names of the expressions are bound to these columns
+		:param constants: values of the other free names
+		:raises ValueError: if the columns have different sizes
+		"""
+		sizes = { len( column ) for column in columns.values() }
+		if len( sizes ) > 1:
+			raise ValueError( f'Columns of different sizes: {", ".join( map( str, sorted( sizes ) ) )}' )
+		self.columns = columns
+		self.rows = sizes.pop() if sizes else 0
+		self.constants = constants or {}
+
+	def evaluate( self, expr: Expr ) -> Column:
+		"""
+		Evaluates an expression for each row
+		:raises InterpreterError: if the expression fails for any of the rows
+		"""
+		return _broadcast( expr.accept( self ), self.rows )
+
+	def visitBinaryExpr( self, binary: Binary ) -> object:
+		op = binary.operator.value
+		# the parser only makes binary expressions of operators
+		assert isinstance( op, ( Keyword, UnaryType ) )
+		left, right = binary.left.accept( self ), binary.right.accept( self )
+
+		if op is Keyword.IS or op is UnaryType.BANG_IS:
+			return _map( operator.eq if op is Keyword.IS else operator.ne, left, right, 'B' )
+		if op is UnaryType.ADD and isinstance( left, ( str, list ) ):
+			# strings are joined, like the interpreter does
+			return _map( add, left, right, None )
+		# columns of strings, and NOTHING, are not numbers
+		if not isinstance( left, _OPERANDS ) or not isinstance( right, _OPERANDS ):
+			raise InterpreterError( binary.operator, 'Operand must be a number' )
+		try:
+			if isinstance( left, Array ) or isinstance( right, Array ):
+				return apply( OPERATORS[ op ], left, right )
+			return OPERATORS[ op ]( float( left ), float( right ) )
+		except ZeroDivisionError:
+			raise InterpreterError( binary.operator, 'Division by zero' ) from None
+		except ( TypeError, ValueError ) as e:
+			raise InterpreterError( binary.operator, f'Invalid operands for {op.value}: {e}' ) from None
+
+	def visitGroupingExpr( self, grouping: Grouping ) -> object:
+		return grouping.expression.accept( self )
+
+	def visitLiteralExpr( self, literal: Literal ) -> object:
+		return literal.value
+
+	def visitUnaryExpr( self, unary: Unary ) -> object:
+		right = unary.right.accept( self )
+		if unary.operator.value is UnaryType.BANG:
+			if isinstance( right, Array ):
+				# numbers are all true
+				return Array.of( right.data.tobytes().translate( _NOT ) if right.boolean else bytes( len( right ) ), 'B' )
+			if isinstance( right, list ):
+				return Array.of( map( operator.not_, map( truthy, right ) ), 'B' )
+			return not truthy( right )
+
+		if isinstance( right, Array ):
+			return negate( unary.operator, right )
+		if not isinstance( right, float ):
+			raise InterpreterError( unary.operator, 'Operand must be a number' )
+		return -right
+
+	def visitVariableExpr( self, variable: Variable ) -> object:
+		name = str( variable.name.value )
+		if name in self.columns:
+			return self.columns[ name ]
+		if name in self.constants:
+			return self.constants[ name ]
+		raise InterpreterError( variable.name, f'Undefined name "{name}"' )
+
+	def visitCallExpr( self, call: Call ) -> object:
+		raise InterpreterError( call.keyword, 'Subroutine calls can\'t be evaluated in batch' )
+
+	def visitGetExpr( self, get: Get ) -> object:
+		raise InterpreterError( get.name, 'Members can\'t be evaluated in batch' )
+
+
+def evaluate( expr: Expr, table: Table, batchSize: int = BATCH_SIZE, constants: Optional[dict[str, object]] = None ) -> Column:
+	""" Evaluates an expression for each row of a table, a batch of rows at a time, see `BatchEvaluator` """
+	return evaluateBatches( expr, split( table, batchSize ), constants )
+
+
+def evaluateBatches( expr: Expr, batches: Iterable[Table], constants: Optional[dict[str, object]] = None ) -> Column:
+	"""
+	Evaluates an expression for each row of some batches, like the ones of `readCsv()`
+	:return: the value for each row, of all the batches
+	"""
+	return _join( [ BatchEvaluator( batch, constants ).evaluate( expr ) for batch in batches ] )
+
+
+def split( table: Table, batchSize: int = BATCH_SIZE ) -> Iterator[Table]:
+	""" Splits a table in batches of rows """
+	rows = max( map( len, table.values() ), default=0 )
+	for start in range( 0, rows, batchSize ):
+		yield { name: _slice( column, start, start + batchSize ) for name, column in table.items() }
+
+
+def readCsv( file: TextIO, batchSize: int = BATCH_SIZE, delimiter: str = ',' ) -> Iterator[Table]:
+	"""
+	Reads a CSV file with a header, a batch of rows at a time.
+	The columns are named after the header, and are numbers if all the values of the batch are
+	:raises ValueError: if a row hasn't as many fields as the header
+	"""
+	reader = csv.reader( file, delimiter=delimiter )
+	header = next( reader, None )
+	if header is None:
+		return
+	read = 0
+	while rows := list( islice( reader, batchSize ) ):
+		for i, row in enumerate( rows ):
+			if len( row ) != len( header ):
+				raise ValueError( f'Row {read + i + 1} has {len( row )} fields instead of {len( header )}' )
+		read += len( rows )
+		yield { name: _parse( values ) for name, values in zip( header, zip( *rows ) ) }
+
+
+def _map( function: Callable[ [ Any, Any ], Any ], left: object, right: object, typecode: Optional[str] ) -> object:
+	""" Applies a function to each row, making an array of the results if `typecode` is given, a list otherwise """
+	if not isinstance( left, ( Array, list ) ) and not isinstance( right, ( Array, list ) ):
+		return function( left, right )
+	values = map( function, _iterate( left ), _iterate( right ) )
+	return Array.of( values, typecode ) if typecode else list( values )
+
+
+def _iterate( value: object ) -> Iterable[Any]:
+	if isinstance( value, Array ):
+		return value.data
+	return value if isinstance( value, list ) else repeat( value )
+
+
+def _broadcast( value: object, rows: int ) -> Column:
+	""" The column of a value which is the same for all the rows """
+	if isinstance( value, ( Array, list ) ):
+		return value
+	if isinstance( value, bool ):
+		return Array.of( bytes( [ value ] ) * rows, 'B' )
+	if isinstance( value, float ):
+		column = Array.of( [ value ] )
+		column.data *= rows
+		return column
+	return [ value ] * rows
+
+
+def _slice( column: Column, start: int, stop: int ) -> Column:
+	return Array( column.data[ start : stop ] ) if isinstance( column, Array ) else column[ start : stop ]
+
+
+def _join( columns: list[Column] ) -> Column:
+	""" Joins the columns of many batches """
+	if columns and all( isinstance( column, Array ) and column.data.typecode == columns[ 0 ].data.typecode for column in columns ):  # type: ignore
+		joined = Array.of( [], columns[ 0 ].data.typecode )  # type: ignore
+		for column in columns:
+			joined.data.extend( column.data )  # type: ignore
+		return joined
+	values: list[ object ] = []
+	for column in columns:
+		values += column
+	return values
+
+
+def _parse( values: tuple[str, ...] ) -> Column:
+	try:
+		return Array.of( map( float, values ) )
+	except ValueError:
+		return list( values )
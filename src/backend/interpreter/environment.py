@@ -0,0 +1,48 @@
+"""
+Variable scopes of the interpreter
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+from token_ import Token
+from .errorHandler import InterpreterError
+
+
+class Environment:
+	""" A scope, mapping names to values """
+	values: dict[ str, object ]
+	constants: set[ str ]
+	enclosing: Optional[Environment]
+
+	def __init__( self, enclosing: Optional[Environment] = None ) -> None:
+		self.values = {}
+		self.constants = set()
+		self.enclosing = enclosing
+
+	def define( self, name: str, value: object, constant: bool = False ) -> None:
+		self.values[ name ] = value
+		if constant:
+			self.constants.add( name )
+
+	def get( self, name: Token, key: str ) -> object:
+		env: Optional[ Environment ] = self
+		while env is not None:
+			if key in env.values:
+				return env.values[ key ]
+			env = env.enclosing
+
+		raise InterpreterError( name, f'Undefined name "{key}"' )
+
+	def assign( self, name: Token, value: object ) -> None:
+		key = str( name.value )
+		env: Optional[ Environment ] = self
+		while env is not None:
+			if key in env.values:
+				if key in env.constants:
+					raise InterpreterError( name, f'Cannot assign to constant "{key}"' )
+				env.values[ key ] = value
+				return
+			env = env.enclosing
+
+		raise InterpreterError( name, f'Undefined name "{key}"' )
@@ -3,6 +3,18 @@ Interpreter error handler
 """
 
 import traceback
+from typing import Final
+
+from token_ import Token
+
+
+# the python errors of the operations, reported at the EndC code which caused them, like the python backend reports them
+RUNTIME_ERRORS: Final[ tuple[ type[ Exception ], ... ] ] = ( TypeError, ValueError, ZeroDivisionError, AttributeError )
+RECURSION_MESSAGE: Final[ str ] = 'Maximum recursion depth exceeded'
+
+
+class InterpreterError(RuntimeError):
+	pass
 
 
 def getTracebackText(e: Exception) -> str:
@@ -13,3 +25,11 @@ def getTracebackText(e: Exception) -> str:
 			e.__traceback__
 		)
 	)
+
+
+def getErrorText(e: InterpreterError) -> str:
+	""" Formats an InterpreterError, raised as InterpreterError( tokenOrOperator, message ) """
+	where, message = e.args
+	if isinstance( where, Token ):
+		return f'Error at {where.loc}: {message}'
+	return f'Error at {where}: {message}'
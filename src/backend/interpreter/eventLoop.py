@@ -0,0 +1,345 @@
+"""
+Asynchronous calls of the interpreter, and their event loop.
+
+`CALL start{ subroutine. arguments }` starts a call and gives back a task right away, `CALL wait{ task }` waits for
+it to return and gives back its result, `CALL waitall{ tasks }` waits for all of them. The started calls are
+coroutines: they run one at a time, and another one runs only while they wait, for a task or for I/O, so
+they never see each other halfway through a statement. The I/O builtins, `slp{ seconds }`, `rad{ path }`,
+`writ{ path. text }` and the ones of connections, `connct{ host. port }`, `snd{ connection. text }`,
+`rciv{ connection }` and `clos{ connection }`, run on an asyncio event loop, so the waits of many calls overlap.
+
+The tree-walking interpreter can't stop in the middle of a subroutine, so each call keeps its stack on a thread
+of its own; a single baton is passed between them, in the order they asked for it, like the ready queue of an
+event loop, and the current environment of the interpreter is saved when a call waits and restored when it
+goes on. The event loop and the baton are made on the first call of
+one of these builtins, the thread running the program until then holds the baton, and keeps it until it waits.
+At the end of the program the started calls are waited for, see `Scheduler.close()`. In the runs with a time
+limit, the waits stop at the deadline, see limits.py.
+"""
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Coroutine, Final, Optional, TypeVar, TYPE_CHECKING
+
+from token_ import Token
+from .errorHandler import InterpreterError
+
+if TYPE_CHECKING:
+	from . import Interpreter
+	from .environment import Environment
+
+
+__all__ = [ 'Scheduler', 'Task', 'Connection', 'BUILTINS' ]
+T = TypeVar( 'T' )
+
+
+class Task:
+	""" A call started with `start{}` """
+	name: str
+	thread: threading.Thread
+	result: object
+	error: Optional[ BaseException ]
+	# whether its error was given to a caller of wait{}
+	retrieved: bool
+	done: threading.Event
+
+	def __init__( self, name: str ) -> None:
+		self.name = name
+		self.result = None
+		self.error = None
+		self.retrieved = False
+		self.done = threading.Event()
+
+	def __repr__( self ) -> str:
+		return f'<task {self.name}{" done" if self.done.is_set() else ""}>'
+
+
+class Connection:
+	""" A TCP connection, its streams belong to the event loop """
+	address: str
+	reader: asyncio.StreamReader
+	writer: asyncio.StreamWriter
+
+	def __init__( self, address: str, reader: asyncio.StreamReader, writer: asyncio.StreamWriter ) -> None:
+		self.address = address
+		self.reader = reader
+		self.writer = writer
+
+	def __repr__( self ) -> str:
+		return f'<connection {self.address}{" closed" if self.writer.is_closing() else ""}>'
+
+
+class Scheduler:
+	""" Runs the started calls of an interpreter, one at a time, and their I/O on an event loop """
+	interpreter: Interpreter
+	loop: asyncio.AbstractEventLoop
+	# whether a call holds the baton, and the turns of the ones waiting for it, guarded by `_lock`
+	_running: bool
+	_queue: deque[ threading.Event ]
+	_lock: threading.Lock
+	_thread: threading.Thread
+	# the tasks still running, and the failed ones nobody waited for
+	_tasks: set[ Task ]
+	_connections: set[ Connection ]
+
+	def __init__( self, interpreter: Interpreter ) -> None:
+		""" The calling thread is the one running, it holds the baton """
+		self.interpreter = interpreter
+		self._running = True
+		self._queue = deque()
+		self._lock = threading.Lock()
+		self._tasks = set()
+		self._connections = set()
+		self.loop = asyncio.new_event_loop()
+		self._thread = threading.Thread( target=self.loop.run_forever, name='endc-event-loop', daemon=True )
+		self._thread.start()
+
+	@classmethod
+	def of( cls, interpreter: Interpreter ) -> Scheduler:
+		""" The scheduler of an interpreter, made on its first use """
+		if interpreter.scheduler is None:
+			interpreter.scheduler = cls( interpreter )
+		return interpreter.scheduler
+
+	def start( self, name: str, call: Callable[ [], object ] ) -> Task:
+		""" Starts a call, it runs when the running one waits """
+		task = Task( name )
+		# the calls run in the order they were started
+		task.thread = threading.Thread( target=self._run, args=( task, call, self._ask() ), name=f'endc-{name}', daemon=True )
+		self._tasks.add( task )
+		task.thread.start()
+		return task
+
+	def wait( self, tasks: list[Task], token: Optional[Token] = None ) -> object:
+		"""
+		Lets the other calls run until some tasks are done
+		:param token: the call waiting, which a time limit error points at
+		:return: the result of the last task
+		:raises: the error of the first task which failed, the errors of the others are dropped
+		"""
+		for task in tasks:
+			if task.thread is threading.current_thread():
+				raise ValueError( f'{task.name} can\'t wait for itself' )
+			if not task.done.is_set() and not self.suspend( lambda: task.done.wait( self._timeout() ) ):
+				raise self.interpreter.budget.expired( token )  # type: ignore
+		failed = [ task for task in tasks if task.error is not None ]
+		for task in failed:
+			task.retrieved = True
+			self._tasks.discard( task )
+		if failed:
+			raise failed[ 0 ].error  # type: ignore
+		return tasks[ -1 ].result if tasks else None
+
+	def await_( self, coroutine: Coroutine[ Any, Any, T ], token: Optional[Token] = None ) -> T:
+		""" Runs a coroutine on the event loop, letting the other calls run until it's done """
+		future = asyncio.run_coroutine_threadsafe( coroutine, self.loop )
+		try:
+			return self.suspend( lambda: future.result( self._timeout() ) )
+		except concurrent.futures.TimeoutError:
+			if future.done():
+				# raised by the coroutine
+				raise
+			future.cancel()
+			raise self.interpreter.budget.expired( token ) from None  # type: ignore
+
+	def suspend( self, wait: Callable[ [], T ] ) -> T:
+		""" Passes the baton to the other calls while blocking on `wait()`, the caller must hold it """
+		environment: Environment = self.interpreter.environment
+		self._release()
+		try:
+			return wait()
+		finally:
+			self._ask().wait()
+			self.interpreter.environment = environment
+
+	def close( self ) -> None:
+		"""
+		Waits for all the started calls, closes the connections left open and stops the event loop
+		:raises InterpreterError: the first error of a call nobody waited for
+		"""
+		while pending := [ task for task in self._tasks if not task.done.is_set() ]:
+			self.suspend( pending[ 0 ].done.wait )
+		asyncio.run_coroutine_threadsafe( _shutdown( list( self._connections ) ), self.loop ).result()
+		self.loop.call_soon_threadsafe( self.loop.stop )
+		self._thread.join()
+		self.loop.close()
+		self.interpreter.scheduler = None
+
+		failed = [ task for task in self._tasks if not task.retrieved ]
+		if failed:
+			raise failed[ 0 ].error  # type: ignore
+
+	def _timeout( self ) -> Optional[float]:
+		""" Seconds a wait may last, until the deadline of the run """
+		return None if self.interpreter.budget is None else self.interpreter.budget.remaining()
+
+	def _run( self, task: Task, call: Callable[ [], object ], turn: threading.Event ) -> None:
+		turn.wait()
+		try:
+			task.result = call()
+			self._tasks.discard( task )
+		except BaseException as e:
+			task.error = e
+		finally:
+			task.done.set()
+			self._release()
+
+	def _ask( self ) -> threading.Event:
+		""" Asks for the baton, it's given when the returned event is set """
+		turn = threading.Event()
+		with self._lock:
+			if self._running:
+				self._queue.append( turn )
+			else:
+				self._running = True
+				turn.set()
+		return turn
+
+	def _release( self ) -> None:
+		""" Gives the baton to the call which asked for it first """
+		with self._lock:
+			if self._queue:
+				self._queue.popleft().set()
+			else:
+				self._running = False
+
+	def __repr__( self ) -> str:
+		return f'<scheduler of {len( self._tasks )} tasks>'
+
+
+# builtins, they receive the interpreter running them and the token of the call
+
+def start( interpreter: Interpreter, token: Token, callee: object, *arguments: object ) -> Task:
+	""" Starts calling a subroutine, see `Scheduler.start()` """
+	from .runtime import EndCCallable
+	if not isinstance( callee, EndCCallable ):
+		raise TypeError( f'{callee!r} is not a subroutine' )
+	values = list( arguments )
+	return Scheduler.of( interpreter ).start( _name( callee ), lambda: callee.call( interpreter, token, values ) )
+
+
+def wait( interpreter: Interpreter, token: Token, task: Task ) -> object:
+	""" Waits for a task, and gives back its result """
+	return Scheduler.of( interpreter ).wait( [ _task( task ) ], token )
+
+
+def waitall( interpreter: Interpreter, token: Token, *tasks: Task ) -> None:
+	""" Waits for all the tasks, then raises the error of the first one which failed """
+	Scheduler.of( interpreter ).wait( list( map( _task, tasks ) ), token )
+
+
+def slp( interpreter: Interpreter, token: Token, seconds: float ) -> None:
+	""" Lets the other calls run for some seconds """
+	if not isinstance( seconds, float ):
+		raise TypeError( f'{seconds!r} is not a number' )
+	Scheduler.of( interpreter ).await_( asyncio.sleep( seconds ), token )
+
+
+def rad( interpreter: Interpreter, token: Token, path: str ) -> str:
+	""" Reads a whole text file """
+	return _io( interpreter, token, asyncio.to_thread( Path( _text( path ) ).read_text ) )
+
+
+def writ( interpreter: Interpreter, token: Token, path: str, text: str ) -> None:
+	""" Writes a whole text file, replacing its content """
+	_io( interpreter, token, asyncio.to_thread( Path( _text( path ) ).write_text, _text( text ) ) )
+
+
+def connct( interpreter: Interpreter, token: Token, host: str, port: float ) -> Connection:
+	""" Opens a TCP connection """
+	if not isinstance( port, float ) or not port.is_integer():
+		raise ValueError( f'{port!r} is not a port' )
+	reader, writer = _io( interpreter, token, asyncio.open_connection( _text( host ), int( port ) ) )
+	connection = Connection( f'{host}:{int( port )}', reader, writer )
+	Scheduler.of( interpreter )._connections.add( connection )
+	return connection
+
+
+def snd( interpreter: Interpreter, token: Token, connection: Connection, text: str ) -> None:
+	""" Sends some text, once it's handed to the OS """
+	data = _text( text ).encode()
+	writer = _open( connection ).writer
+
+	async def send() -> None:
+		writer.write( data )
+		await writer.drain()
+
+	_io( interpreter, token, send() )
+
+
+def rciv( interpreter: Interpreter, token: Token, connection: Connection ) -> Optional[str]:
+	""" Receives a line, without its newline, or NOTHING once the other side closed the connection """
+	line: bytes = _io( interpreter, token, _open( connection ).reader.readline() )
+	return line.decode().removesuffix( '\n' ) if line else None
+
+
+def clos( interpreter: Interpreter, token: Token, connection: Connection ) -> None:
+	""" Closes a connection, closing it again does nothing """
+	if not isinstance( connection, Connection ):
+		raise TypeError( f'{connection!r} is not a connection' )
+	Scheduler.of( interpreter )._connections.discard( connection )
+	_io( interpreter, token, _closeAll( [ connection ] ) )
+
+
+BUILTINS: Final[ dict[ str, Callable[ ..., object ] ] ] = {
+	builtin.__name__: builtin for builtin in ( start, wait, waitall, slp, rad, writ, connct, snd, rciv, clos )
+}
+
+
+def _io( interpreter: Interpreter, token: Token, coroutine: Coroutine[ Any, Any, T ] ) -> T:
+	try:
+		return Scheduler.of( interpreter ).await_( coroutine, token )
+	except ( OSError, EOFError, asyncio.LimitOverrunError ) as e:
+		raise InterpreterError( token, f'I/O failed: {e}' ) from None
+
+
+async def _closeAll( connections: list[Connection] ) -> None:
+	for connection in connections:
+		if not connection.writer.is_closing():
+			connection.writer.close()
+		try:
+			await connection.writer.wait_closed()
+		except OSError:
+			pass
+
+
+async def _shutdown( connections: list[Connection] ) -> None:
+	""" Closes the connections left open, and cancels the I/O the calls stopped waiting for, at their deadline """
+	await _closeAll( connections )
+	pending = asyncio.all_tasks() - { asyncio.current_task() }
+	for task in pending:
+		task.cancel()
+	await asyncio.gather( *pending, return_exceptions=True )
+	await asyncio.get_running_loop().shutdown_default_executor()
+
+
+def _open( connection: Connection ) -> Connection:
+	if not isinstance( connection, Connection ):
+		raise TypeError( f'{connection!r} is not a connection' )
+	if connection.writer.is_closing():
+		raise ValueError( f'{connection.address} is closed' )
+	return connection
+
+
+def _name( callee: object ) -> str:
+	name = getattr( callee, 'name', None )
+	if name is None:
+		# subroutines are named by their declaration
+		name = getattr( getattr( callee, 'declaration', None ), 'name', None )
+	return str( getattr( name, 'value', name ) )
+
+
+def _task( value: object ) -> Task:
+	if not isinstance( value, Task ):
+		raise TypeError( f'{value!r} is not a task' )
+	return value
+
+
+def _text( value: object ) -> str:
+	if not isinstance( value, str ):
+		raise TypeError( f'{value!r} is not a string' )
+	return value
@@ -0,0 +1,181 @@
+"""
+Foreign subroutines: python callables called from EndC like any other subroutine.
+
+A foreign subroutine is declared with the EndC types of its parameters and of its return value, which are
+checked at each call. Values are passed without copies where possible: numbers, booleans and strings are the
+same objects on both sides, as they're immutable, and arrays (`InTgR()`, `BoOlAn()`) are passed as a
+`memoryview` of their buffer, which a kernel may read with `numpy.frombuffer()` or write to in place.
+The view is released when the call returns, a kernel must not keep it. An array may be returned as an
+`Array`, or as an `array.array` which is then used as it is, other objects supporting the buffer protocol with
+the right format are copied once.
+
+	def dot( xs: memoryview, ys: memoryview ) -> float:
+		return sum( map( operator.mul, xs, ys ) )
+
+	ffi.define( interpreter.globals, 'dot', dot, [ 'InTgR()', 'InTgR()' ], 'InTgR' )
+"""
+from __future__ import annotations
+
+from array import array
+from numbers import Real
+from typing import Any, Callable, Final, Sequence, TYPE_CHECKING
+
+from ast_.typeChecker import Type
+from token_ import Token
+from .arrays import Array
+from .environment import Environment
+from .errorHandler import InterpreterError
+from .runtime import EndCCallable
+
+if TYPE_CHECKING:
+	from . import Interpreter
+
+
+__all__ = [ 'Foreign', 'define' ]
+# buffer formats of the arrays of each type
+_FORMATS: Final[ dict[ str, str ] ] = { f'{Type.INTEGER.value}()': 'd', f'{Type.BOOLEAN.value}()': 'B' }
+
+
+class Foreign(EndCCallable):
+	""" A python callable with an EndC signature """
+	name: str
+	func: Callable[ ..., object ]
+	params: list[ str ]
+	returns: str
+	# check and convert the arguments and the return value
+	_arguments: list[ Callable[ [object], object ] ]
+	_result: Callable[ [object], object ]
+	# whether arrays are passed, whose views are released after the call
+	_views: bool
+
+	def __init__( self, name: str, func: Callable[ ..., object ], params: Sequence[str], returns: str = Type.NOTHING.value ) -> None:
+		"""
+		:param params: the EndC type of each parameter, like `InTgR` or `InTgR()`
+		:param returns: the EndC type of the return value
+		:raises ValueError: if a type isn't supported
+		"""
+		self.name = name
+		self.func = func
+		self.params = list( params )
+		self.returns = returns
+		self._arguments = [ _argument( typ ) for typ in self.params ]
+		self._result = _result( returns )
+		self._views = any( typ in _FORMATS for typ in self.params )
+
+	def call( self, interpreter: Interpreter, token: Token, arguments: list[object] ) -> object:
+		if len( arguments ) != len( self._arguments ):
+			raise InterpreterError( token, f'Expected {len( self._arguments )} arguments but got {len( arguments )}' )
+		values: list[ object ] = []
+		try:
+			# the views of the arguments converted before an invalid one are released too
+			try:
+				for convert, argument in zip( self._arguments, arguments ):
+					values.append( convert( argument ) )
+			except TypeError:
+				raise InterpreterError( token, f'Invalid arguments for {self.name}, expected {{{". ".join( self.params )}}}' ) from None
+			try:
+				result = self.func( *values )
+			except InterpreterError:
+				raise
+			except Exception as e:
+				raise InterpreterError( token, f'Foreign subroutine {self.name} failed: {type( e ).__name__}: {e}' ) from e
+			try:
+				result = self._result( result )
+			except ( TypeError, ValueError ) as e:
+				raise InterpreterError( token, f'Foreign subroutine {self.name} returned an invalid {self.returns}: {e}' ) from None
+			if result.__class__ is Array and not interpreter.arrays:
+				interpreter.useArrays()
+			return result if interpreter.budget is None else interpreter.budget.account( result, token )
+		finally:
+			if self._views:
+				_release( values )
+
+	def __repr__( self ) -> str:
+		return f'<foreign subroutine {self.name}>'
+
+
+def define( env: Environment, name: str, func: Callable[ ..., object ], params: Sequence[str], returns: str = Type.NOTHING.value ) -> Foreign:
+	"""
+	Defines a foreign subroutine as a constant of a scope, usually the interpreter's globals
+	:raises ValueError: if a type isn't supported
+	"""
+	foreign = Foreign( name, func, params, returns )
+	env.define( name, foreign, True )
+	return foreign
+
+
+def _argument( typ: str ) -> Callable[ [object], object ]:
+	""" The function checking an argument of the given type, and converting it to what the callable receives """
+	if typ in _FORMATS:
+		format = _FORMATS[ typ ]
+
+		def view( value: object ) -> object:
+			if not isinstance( value, Array ) or value.data.typecode != format:
+				raise TypeError()
+			return memoryview( value.data )
+		return view
+
+	cls = _class( typ )
+
+	def check( value: object ) -> object:
+		if value.__class__ is not cls:
+			raise TypeError()
+		return value
+	return check
+
+
+def _result( typ: str ) -> Callable[ [object], object ]:
+	""" The function checking a return value of the given type, and converting it to an EndC value """
+	if typ == Type.NOTHING.value:
+		return lambda value: None
+	if typ in _FORMATS:
+		format = _FORMATS[ typ ]
+
+		def toArray( value: object ) -> object:
+			if isinstance( value, Array ) and value.data.typecode == format:
+				return value
+			if isinstance( value, array ) and value.typecode == format:
+				return Array.wrap( value )
+			with memoryview( value ) as view:  # type: ignore
+				if view.format != format:
+					raise ValueError( f'buffer of format "{view.format}" instead of "{format}"' )
+				# a view of a whole array, like the one of an argument
+				if isinstance( view.obj, array ) and view.obj.typecode == format and view.c_contiguous and len( view ) == len( view.obj ):
+					return Array.wrap( view.obj )
+				data = array( format )
+				data.frombytes( view.tobytes() )
+				return Array.wrap( data )
+		return toArray
+
+	cls = _class( typ )
+	if cls is float:
+		def toNumber( value: object ) -> object:
+			# any real number, like the scalars of numpy, but booleans aren't numbers in EndC
+			if isinstance( value, bool ) or not isinstance( value, Real ):
+				raise TypeError( f'{type( value ).__name__} is not a number' )
+			return float( value )
+		return toNumber
+
+	def check( value: object ) -> object:
+		if not isinstance( value, cls ):
+			raise TypeError( f'{type( value ).__name__} is not a {typ}' )
+		return value
+	return check
+
+
+def _class( typ: str ) -> type:
+	""" The python class of the values of a type """
+	classes: dict[ str, type ] = { Type.INTEGER.value: float, Type.STRING.value: str, Type.BOOLEAN.value: bool }
+	if typ not in classes:
+		raise ValueError( f'Unsupported type for a foreign subroutine: {typ}' )
+	return classes[ typ ]
+
+
+def _release( values: list[Any] ) -> None:
+	""" Releases the views of the arrays, unless the callable kept exporting them, like in a numpy array """
+	for value in values:
+		if isinstance( value, memoryview ):
+			try:
+				value.release()
+			except BufferError:
+				pass
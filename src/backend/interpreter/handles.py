@@ -0,0 +1,157 @@
+"""
+Buffered file handles of the interpreter, like STDOUT.
+
+Writes are kept in a buffer, as a list of chunks, and written to the file when it's flushed: with a single
+`os.writev()` call if the file has a file descriptor, with a single `write()` otherwise.
+A handle is flushed when its buffer is full, at each newline if it's line buffered, before a line is read from
+the handle tied to it, when the program returns from `main`, and when the process exits.
+"""
+from __future__ import annotations
+
+import atexit
+import os
+import weakref
+from enum import Enum
+from typing import Final, Optional, TextIO
+
+
+__all__ = [ 'BufferMode', 'BUFFER_SIZE', 'Handle', 'flushAll' ]
+# characters a handle buffers before it's flushed
+BUFFER_SIZE: Final[ int ] = 64 * 1024
+# chunks at least this long are written as they are, smaller ones are joined together first
+_LARGE_CHUNK: Final[ int ] = 4096
+# most buffers a single writev() call takes
+_IOV_MAX: Final[ int ] = os.sysconf( 'SC_IOV_MAX' ) if hasattr( os, 'sysconf' ) else 1024
+
+
+class BufferMode(Enum):
+	# each write goes to the file right away
+	NONE = 'none'
+	# flushed at each newline, and when the buffer is full
+	LINE = 'line'
+	# flushed when the buffer is full
+	FULL = 'full'
+
+
+class Handle:
+	""" A file handle, like STDOUT, its buffering is chosen when it's created """
+	__slots__ = ( 'name', 'file', 'mode', 'size', 'tied', '_chunks', '_buffered', '_limit', '_lines', '_fd', '__weakref__' )
+	name: str
+	file: TextIO
+	mode: BufferMode
+	size: int
+	# flushed before reading from this handle, like STDOUT is for STDIN
+	tied: Optional[ Handle ]
+	_chunks: list[ str ]
+	_buffered: int
+	# flush when this many characters are buffered, or on newlines
+	_limit: int
+	_lines: bool
+	# None if the file isn't backed by a file descriptor, like a StringIO
+	_fd: Optional[ int ]
+
+	def __init__( self, name: str, file: TextIO, mode: Optional[BufferMode] = None, size: int = BUFFER_SIZE ) -> None:
+		"""
+		:param name: name of the handle, shown by its repr
+		:param file: the file written to and read from
+		:param mode: how writes are buffered, defaults to line buffering for terminals and full buffering otherwise
+		:param size: characters buffered before a flush
+		"""
+		self.name = name
+		self.file = file
+		self.size = size
+		self.tied = None
+		self._chunks = []
+		self._buffered = 0
+		try:
+			self._fd = file.fileno() if hasattr( os, 'writev' ) else None
+		except ( AttributeError, OSError, ValueError ):
+			self._fd = None
+		if mode is None:
+			mode = BufferMode.LINE if _isatty( file ) else BufferMode.FULL
+		self.mode = mode
+		self._limit = 0 if mode is BufferMode.NONE else size
+		self._lines = mode is BufferMode.LINE
+		_handles.add( self )
+
+	def write( self, text: str ) -> None:
+		self._chunks.append( text )
+		self._buffered += len( text )
+		if self._buffered >= self._limit or self._lines and '\n' in text:
+			self.flush()
+
+	def flush( self ) -> None:
+		""" Writes the buffered text to the file """
+		if not self._chunks:
+			return
+		chunks, self._chunks, self._buffered = self._chunks, [], 0
+		if self._fd is None:
+			self.file.write( ''.join( chunks ) )
+			self.file.flush()
+			return
+		# what was written to the file object itself goes first
+		self.file.flush()
+		encoding = getattr( self.file, 'encoding', None ) or 'utf-8'
+		errors = getattr( self.file, 'errors', None ) or 'strict'
+		_writev( self._fd, _coalesce( chunks, encoding, errors ) )
+
+	def givm( self ) -> str:
+		""" Reads a line """
+		if self.tied is not None:
+			self.tied.flush()
+		return self.file.readline().removesuffix( '\n' )
+
+	def __repr__( self ) -> str:
+		return f'<handle {self.name}>'
+
+
+# the handles not yet collected, flushed at exit
+_handles: weakref.WeakSet[ Handle ] = weakref.WeakSet()
+
+
+def flushAll() -> None:
+	""" Flushes all the handles, the ones whose file was closed are skipped """
+	for handle in list( _handles ):
+		try:
+			handle.flush()
+		except ( OSError, ValueError ):
+			pass
+
+
+atexit.register( flushAll )
+
+
+def _isatty( file: TextIO ) -> bool:
+	try:
+		return file.isatty()
+	except ( AttributeError, OSError, ValueError ):
+		return False
+
+
+def _coalesce( chunks: list[str], encoding: str, errors: str ) -> list[bytes]:
+	""" Encodes the chunks, joining the small ones which are next to each other """
+	buffers: list[ bytes ] = []
+	small: list[ str ] = []
+	for chunk in chunks:
+		if len( chunk ) < _LARGE_CHUNK:
+			small.append( chunk )
+			continue
+		if small:
+			buffers.append( ''.join( small ).encode( encoding, errors ) )
+			small = []
+		buffers.append( chunk.encode( encoding, errors ) )
+	if small:
+		buffers.append( ''.join( small ).encode( encoding, errors ) )
+	return buffers
+
+
+def _writev( fd: int, buffers: list[bytes] ) -> None:
+	""" Writes all the buffers, in as few calls as the OS allows """
+	views = [ memoryview( buffer ) for buffer in buffers if buffer ]
+	while views:
+		written = os.writev( fd, views[ : _IOV_MAX ] )
+		# skip what was written, the call may stop in the middle of a buffer
+		while views and written >= len( views[ 0 ] ):
+			written -= len( views.pop( 0 ) )
+		if written:
+			views[ 0 ] = views[ 0 ][ written : ]
@@ -1,58 +1,221 @@
 """
 Interactive intepreter implementation.
-"""
 
-from sys import stderr
+Inputs are memoized in an `InputCache`, keyed by their normalized text: an input seen before skips the
+tokenizer and the parser, and if it's a pure expression, like `1 - 2`, its value is reused too.
+"""
+import sys
+from collections import OrderedDict
+from contextlib import redirect_stdout
+from dataclasses import dataclass
+from io import StringIO
+from typing import Callable, Optional, TextIO
 
 import ast_.parser
-import tokenizer
-from cli import args
-from log import error
+from ast_.expr import Expr, Binary, Grouping, Literal, Unary
+from ast_.typeChecker import TypeChecker
+from token_ import Token, tokenizer
 from . import Interpreter, InterpreterError, errorHandler
+from .runtime import createGlobals
 
+# inputs remembered by the cache of a session, or of a server
+CACHE_SIZE: int = 4096
 
-def interactiveMain() -> int:
-	intpr = Interpreter()
-	while True:
-		inp: str
-		try:
-			inp = input('>>> ')
-		except EOFError:
-			return 0
-		# as we're in the interactive interpreter, we can be a little more forgiving
-		if not inp.endswith('/'):
-			inp += '/'
+
+@dataclass(eq=False)
+class CachedInput:
+	tokens: list[ Token ]
+	ast: Expr
+	pure: bool
+	# the value of a pure expression, once it was evaluated
+	evaluated: bool = False
+	value: object = None
+
+
+class InputCache:
+	""" LRU cache of parsed inputs and of the values of pure expressions, may be shared by many sessions """
+	size: int
+	entries: OrderedDict[ str, CachedInput ]
+	hits: int
+	misses: int
+	# inputs whose value was reused, they're also counted as hits
+	valueHits: int
+	evictions: int
+
+	def __init__( self, size: int = CACHE_SIZE ) -> None:
+		"""
+		:param size: number of inputs to remember, 0 disables the cache
+		"""
+		self.size = size
+		self.entries = OrderedDict()
+		self.hits = self.misses = self.valueHits = self.evictions = 0
+
+	def get( self, inp: str ) -> CachedInput:
+		"""
+		Gets a normalized input, parsing it if it isn't cached
+		:raises TokenizerError: if the input fails to tokenize
+		:raises ParseError: if the input isn't an expression
+		"""
+		if ( entry := self.entries.get( inp ) ) is not None:
+			self.entries.move_to_end( inp )
+			self.hits += 1
+			return entry
+
+		self.misses += 1
+		tokens = tokenizer.parse( inp, '<stdin>' )
+		# recovering only keeps the parser from printing, the error is still raised
+		ast = ast_.parser.Parser( tokens, recover=True ).expression()
+		entry = CachedInput( tokens, ast, isPure( ast ) )
+		if self.size > 0:
+			self.entries[ inp ] = entry
+			if len( self.entries ) > self.size:
+				self.entries.popitem( last=False )
+				self.evictions += 1
+		return entry
+
+	def stats( self ) -> str:
+		total = self.hits + self.misses
+		return (
+			f'{len( self.entries )}/{self.size} inputs cached, {self.hits} hits, {self.misses} misses'
+			f' ({self.hits / total if total else 0:.0%} hit rate), {self.valueHits} values reused, {self.evictions} evictions'
+		)
+
+
+def normalize( inp: str ) -> str:
+	""" The text of an input as the REPL runs it: stripped, ending with `/`, with runs of spaces outside of strings collapsed """
+	inp = inp.strip()
+	# as we're in the interactive interpreter, we can be a little more forgiving
+	if not inp.endswith('/'):
+		inp += '/'
+	if '|*' in inp:
+		# comments make strings too hard to tell apart
+		return inp
+	chars: list[ str ] = []
+	inString = False
+	for char in inp:
+		if char == '*' and not ( inString and chars[ -1 ] == '\\' ):
+			inString = not inString
+		elif char == ' ' and not inString and chars and chars[ -1 ] == ' ':
+			continue
+		chars.append( char )
+	return ''.join( chars )
+
+
+def isPure( expr: Expr ) -> bool:
+	""" Whether an expression only depends on its literals, so its value can be reused: no calls, names or members """
+	if isinstance( expr, Literal ):
+		return True
+	if isinstance( expr, Grouping ):
+		return isPure( expr.expression )
+	if isinstance( expr, Unary ):
+		return isPure( expr.right )
+	if isinstance( expr, Binary ):
+		return isPure( expr.left ) and isPure( expr.right )
+	return False
+
+
+class Session:
+	""" The state of an interactive session, which is fed one input at a time """
+	interpreter: Interpreter
+	checker: TypeChecker
+	out: TextIO
+	error: Callable[ [str], None ]
+	exitOnImplementationError: bool
+	cache: InputCache
+
+	def __init__(
+			self,
+			out: Optional[TextIO] = None,
+			error: Optional[Callable[[str], None]] = None,
+			exitOnImplementationError: bool = False,
+			cache: Optional[InputCache] = None
+	) -> None:
+		"""
+		:param out: where results and the STDOUT handle write, defaults to the standard output
+		:param error: reports the errors, defaults to the compiler's log
+		:param exitOnImplementationError: whether to exit when the interpreter itself crashes
+		:param cache: cache of the inputs, may be shared by many sessions
+		"""
+		if error is None:
+			import log
+			error = log.error
+		self.out = out or sys.stdout
+		self.error = error
+		self.exitOnImplementationError = exitOnImplementationError
+		self.cache = InputCache() if cache is None else cache
+		self.interpreter = Interpreter( globals=createGlobals( StringIO(), self.out, self.out ) if out else None )
+		self.checker = TypeChecker()
+
+	def feed( self, inp: str ) -> Optional[int]:
+		"""
+		Runs an input
+		:param inp: a line of input
+		:return: the exit code, if the input asked to exit
+		"""
+		if inp.strip() == ':stats':
+			self.out.write( f'{self.cache.stats()}\n' )
+			return None
+		inp = normalize( inp )
 		# is it a exit call?
 		if inp.startswith('CALL xit{'):
 			if inp.endswith('}/'):
 				# parse exit code
-				exitCode = inp.removeprefix('CALL xit{').removesuffix('}/')
+				exitCode = inp.removeprefix('CALL xit{').removesuffix('}/').strip()
 				if exitCode == '':
 					exitCode = '0'
 				if exitCode.isdigit():
 					return int(exitCode)
 				else:
-					print( 'function xit takes an InTgR or VoId', file=stderr )
+					self.error( 'function xit takes an InTgR or VoId' )
+			else:
+				self.error( 'missing / at end of input' )
+			return None
+
+		# its not, interpret it
+		try:
+			entry = self.cache.get( inp )
+			if entry.evaluated:
+				value = entry.value
+				self.cache.valueHits += 1
 			else:
-				print( 'missing / at end of input', file=stderr )
-		else:
-			# its not, interpret it
-			try:
-				intpr.interpret(
-					ast_.parser.Parser(
-						tokenizer.parse(
-							inp,
-							'<stdin>'
-						)
-					).parse()  # type: ignore
-				)
-			except tokenizer.TokenizerError as e:
-				error( f'Failed to tokenize expression: {e.args[0]}' )
-			except ast_.parser.ParseError as e:
-				error( f'Failed to parse expression: "{e.args[0]}"' )
-			except InterpreterError as e:
-				error( f'Interpreter error: {e.args[0]}: {e.args[1]}' )
-			except Exception as e:
-				error( f'Implementation error: {errorHandler.getTracebackText(e)}' )
-				if args.exitOnImplementationError:
-					return -1
+				if not self.checker.check( entry.ast ):
+					for message in self.checker.errors:
+						self.error( message )
+					return None
+				with redirect_stdout( self.out ):
+					try:
+						value = self.interpreter.evaluate( entry.ast )
+					finally:
+						# what the input printed goes before its result, or its error
+						self.interpreter.flush()
+				if entry.pure:
+					entry.value, entry.evaluated = value, True
+			self.out.write( f'{self.interpreter.stringify( value )}\n' )
+		except tokenizer.TokenizerError as e:
+			self.error( f'Failed to tokenize expression: {e.args[0]}' )
+		except ast_.parser.ParseError as e:
+			self.error( f'Failed to parse expression: "{e.args[0]}"' )
+		except InterpreterError as e:
+			self.error( f'Interpreter error: {e.args[0]}: {e.args[1]}' )
+		except Exception as e:
+			self.error( f'Implementation error: {errorHandler.getTracebackText(e)}' )
+			if self.exitOnImplementationError:
+				return -1
+		return None
+
+
+def interactiveMain( exitOnImplementationError: bool = False ) -> int:
+	"""
+	Runs the read-eval-print loop on the standard input
+	:param exitOnImplementationError: whether to exit when the interpreter itself crashes
+	:return: exit code
+	"""
+	session = Session( exitOnImplementationError=exitOnImplementationError )
+	while True:
+		inp: str
+		try:
+			inp = input('>>> ')
+		except EOFError:
+			return 0
+		if ( exitCode := session.feed( inp ) ) is not None:
+			return exitCode
@@ -0,0 +1,400 @@
+"""
+Tiered execution for the interpreter.
+
+Subroutines start in the tree-walking tier, which counts their calls and profiles the types of
+their arguments. Once a subroutine is hot, its body is lowered to python source specialized
+to the argument types seen so far, compiled and swapped in. The compiled code checks the
+specialized types on entry: when a check fails the subroutine is deoptimized back to the
+tree-walker, and may be compiled again later, without specializing the offending parameters.
+"""
+from __future__ import annotations
+
+import ast as py
+from typing import Any, Callable, Final, Optional, TYPE_CHECKING, cast
+
+from ast_ import stmt
+from ast_.expr import Expr, Binary, Grouping, Unary, Variable, Call, Get
+from ast_.typeChecker import Type, binaryType, unaryType
+from backend.python import runtime as pyruntime
+from backend.python.generator import Generator, Scope, Function, pyName
+from token_ import Keyword, Token, UnaryType
+from . import arrays
+from .environment import Environment
+from .errorHandler import InterpreterError
+from .limits import Budget, OBJECT_SIZE
+from .runtime import Subroutine, EndCCallable, Deoptimize
+
+if TYPE_CHECKING:
+	from . import Interpreter
+
+
+# calls after which a subroutine is compiled
+JIT_THRESHOLD: Final[ int ] = 100
+# deoptimizations after which a subroutine stays in the tree-walking tier
+MAX_DEOPTS: Final[ int ] = 3
+# iterations of a loop the fuel is taken for at once, in the runs with limits
+FUEL_BATCH: Final[ int ] = 32
+# python classes of the values of the types parameters can be specialized to
+_SPECIALIZABLE: Final[ dict[ Type, type ] ] = { Type.INTEGER: float, Type.STRING: str, Type.BOOLEAN: bool }
+
+
+class NotCompilable(Exception):
+	""" The subroutine uses something the JIT doesn't support, it stays in the tree-walking tier """
+
+
+def assignedNames( statements: list[stmt.Stmt] ) -> set[str]:
+	""" Names assigned to anywhere in the given statements """
+	names: set[ str ] = set()
+	for statement in statements:
+		if isinstance( statement, stmt.Assign ):
+			names.add( str( statement.name.value ) )
+		elif isinstance( statement, stmt.If ):
+			names |= assignedNames( statement.thenBranch ) | assignedNames( statement.elseBranch )
+		elif isinstance( statement, stmt.Until ):
+			names |= assignedNames( statement.body )
+	return names
+
+
+def _add( left: Any, right: Any ) -> object:
+	""" The `-` operator, for operands whose types were not proven, like `pyruntime.add()` but supporting arrays """
+	if isinstance( left, str ):
+		return left + str( right )
+	if isinstance( left, float ) and right.__class__ is not arrays.Array:
+		return left + float( right )
+	if left.__class__ is arrays.Array or right.__class__ is arrays.Array:
+		return arrays.number( left ) + arrays.number( right )
+	return None
+
+
+def _countedAdd( budget: Budget ) -> Callable[ [ Any, Any, Token ], object ]:
+	"""
+	`_add()` counting the bytes of the strings and arrays it builds, for the runs with an allocation limit.
+	Strings are counted inline, joining them in a loop is common enough to be worth skipping `Budget.account()`
+	"""
+	account = budget.account
+	allocation = budget.limits.allocation
+	size = OBJECT_SIZE
+	assert allocation is not None
+
+	def add( left: Any, right: Any, token: Token ) -> object:
+		if left.__class__ is str:
+			value = left + str( right )
+			budget.allocated += size + len( value )
+			if budget.allocated > allocation:
+				raise budget.exhausted( token )
+			return value
+		if isinstance( left, float ) and right.__class__ is not arrays.Array:
+			return left + float( right )
+		if left.__class__ is arrays.Array or right.__class__ is arrays.Array:
+			return account( arrays.number( left ) + arrays.number( right ), token )
+		return None
+	return add
+
+
+class JitGenerator(Generator):
+	"""
+	Lowers a single subroutine to python source.
+	Names the subroutine doesn't declare are resolved through the interpreter's environments,
+	except for constants, whose values are embedded in the compiled code.
+	"""
+	closure: Environment
+	# python name of each specialized parameter -> its type
+	specialized: dict[ str, Type ]
+	# globals of the generated code
+	constants: dict[ str, object ]
+	source: str
+	# globals of the compiled code
+	namespace: dict[ str, object ]
+	# the limits of the run, which the compiled code checks too
+	budget: Optional[ Budget ]
+	# whether the operands which were not proven to be numbers may be arrays, see `Interpreter.useArrays()`
+	arrays: bool
+	_types: dict[ int, Optional[Type] ]
+	# loops taking fuel, which name their iteration counters
+	_loops: int
+
+	def __init__( self, interpreter: Interpreter, subroutine: Subroutine ) -> None:
+		super().__init__( f'<jit {subroutine.declaration.name.value}>' )
+		self.closure = subroutine.closure
+		self.specialized = {}
+		self.source = ''
+		self.namespace = {}
+		self.budget = interpreter.budget
+		self.arrays = interpreter.arrays
+		self._types = {}
+		self._loops = 0
+
+		def call( callee: object, token: Token, arguments: list[object] ) -> object:
+			if not isinstance( callee, EndCCallable ):
+				raise InterpreterError( token, f'{interpreter.stringify( callee )} is not a subroutine' )
+			return callee.call( interpreter, token, arguments )
+
+		self.constants = {
+			'_interp': interpreter,
+			'_env': self.closure,
+			'_call': call,
+			'_memberOf': interpreter.memberOf,
+			'_assignMember': interpreter.assignMember,
+			'_truthy': pyruntime.truthy,
+			'_add': _add,
+			'_Deoptimize': Deoptimize,
+			'_InterpreterError': InterpreterError,
+		}
+		if self.arrays:
+			self.constants[ 'float' ] = arrays.number
+		if self.budget is not None:
+			self.constants[ '_budget' ] = self.budget
+			self.constants[ '_account' ] = self.budget.account
+			if self.budget.limits.allocation is not None:
+				self.constants[ '_addCounted' ] = _countedAdd( self.budget )
+
+	def compileSubroutine( self, subroutine: Subroutine, argTypes: list[Optional[Type]] ) -> Callable[ ..., object ]:
+		"""
+		Compiles a subroutine, specializing the parameters which are never assigned to the given types
+		:raises NotCompilable: if the subroutine's body can't be compiled
+		"""
+		declaration = subroutine.declaration
+		statements = declaration.body.statements
+		assigned = assignedNames( statements )
+
+		scope = Scope( self.scope, Function( self.function ) )
+		params = self.enter( scope, [ ( param.name, param.typ ) for param in declaration.params ] )
+		guards: list[ py.stmt ] = self.fuel( len( statements ) + 1, declaration )
+		for param, name, typ in zip( declaration.params, params, argTypes ):
+			if typ in _SPECIALIZABLE and str( param.name.value ) not in assigned:
+				self.specialized[ name ] = typ
+				check = py.Compare( py.Attribute( py.Name( name, py.Load() ), '__class__', py.Load() ), [ py.IsNot() ], [ self.constant( _SPECIALIZABLE[ typ ] ) ] )
+				guards.append( self.located( py.If( test=check, body=[ py.Raise( exc=py.Name( '_Deoptimize', py.Load() ), cause=None ) ], orelse=[] ) ) )
+
+		function = self.function_( pyName( str( declaration.name.value ) ), params, statements, scope, guards )
+		self.source = py.unparse( py.fix_missing_locations( py.Module( body=[ function ], type_ignores=[] ) ) )
+		self.namespace = dict( self.constants )
+		exec( compile( self.source, self.filename, 'exec', dont_inherit=True ), self.namespace )
+		return self.namespace[ function.name ]  # type: ignore
+
+	def constant( self, value: object ) -> py.expr:
+		""" Embeds a value in the generated code """
+		name = f'_k{len( self.constants )}'
+		self.constants[ name ] = value
+		return py.Name( name, py.Load() )
+
+	def isLocal( self, name: Token ) -> bool:
+		return self.scope.resolve( str( name.value ) ) is not None
+
+	# statements
+
+	def visitAssignStmt( self, assign: stmt.Assign ) -> list[py.stmt]:
+		if self.isLocal( assign.name ):
+			return super().visitAssignStmt( assign )
+		setter = py.Attribute( py.Name( '_env', py.Load() ), 'assign', py.Load() )
+		return [ self.located( py.Expr( py.Call( setter, [ self.constant( assign.name ), assign.value.accept( self ) ], [] ) ) ) ]
+
+	def visitUntilStmt( self, until: stmt.Until ) -> list[py.stmt]:
+		nodes = super().visitUntilStmt( until )
+		if self.budget is None:
+			return nodes
+		# the fuel of `FUEL_BATCH` iterations is taken at once, each iteration only pays for counting itself in a
+		# `for` loop, and the fuel of the iterations the last batch didn't run is given back when the loop ends
+		loop = cast( py.While, nodes[ 0 ] )
+		tick = f'_tick{self._loops}'
+		self._loops += 1
+		cost = len( until.body ) + 1
+		body = loop.body
+		# the iterations of the batch which ran, when the loop ends at `tick`
+		ran = 1
+		if not isinstance( loop.test, py.Constant ):
+			stop = loop.test.operand if isinstance( loop.test, py.UnaryOp ) and isinstance( loop.test.op, py.Not ) else py.UnaryOp( py.Not(), loop.test )
+			body = [ self.located( py.If( test=stop, body=[ py.Break() ], orelse=[] ) ), *body ]
+			# before running the body
+			ran = 0
+		# a break of the body, like the one of a DO UNTIL loop, leaves the batch without running `orelse`, and the loop
+		batch = py.For( target=py.Name( tick, py.Store() ), iter=self.constant( range( FUEL_BATCH ) ), body=body, orelse=[ py.Continue() ] )
+		batches = py.While( test=py.Constant( True ), body=[ *self.fuel( FUEL_BATCH * cost, until ), self.located( batch ), py.Break() ], orelse=[] )
+		unused = py.BinOp( py.BinOp( py.Constant( FUEL_BATCH - ran ), py.Sub(), py.Name( tick, py.Load() ) ), py.Mult(), py.Constant( cost ) )
+		giveBack = py.AugAssign( py.Attribute( py.Name( '_budget', py.Load() ), 'fuel', py.Store() ), py.Add(), unused )
+		return [
+			self.located( py.Assign( targets=[ py.Name( tick, py.Store() ) ], value=py.Constant( FUEL_BATCH - ran ) ) ),
+			self.located( py.Try( body=[ self.located( batches ) ], handlers=[], orelse=[], finalbody=[ self.located( giveBack ) ] ) ),
+		]
+
+	def visitSubroutineStmt( self, subroutine: stmt.Subroutine ) -> list[py.stmt]:
+		raise NotCompilable( 'declares a subroutine' )
+
+	def visitSetStmt( self, set: stmt.Set ) -> list[py.stmt]:
+		arguments = [ self.constant( set ), set.object.accept( self ), set.value.accept( self ) ]
+		return [ self.located( py.Expr( self.helper( '_assignMember', *arguments ) ) ) ]
+
+	def visitTemplateStmt( self, template: stmt.Template ) -> list[py.stmt]:
+		raise NotCompilable( 'declares a template' )
+
+	# expressions
+
+	def visitBinaryExpr( self, binary: Binary ) -> py.expr:
+		return self.accounted( super().visitBinaryExpr( binary ), binary, binary.operator )
+
+	def visitUnaryExpr( self, unary: Unary ) -> py.expr:
+		if unary.operator.value is UnaryType.BANG:
+			return super().visitUnaryExpr( unary )
+		return self.accounted( super().visitUnaryExpr( unary ), unary, unary.operator )
+
+	def visitVariableExpr( self, variable: Variable ) -> py.expr:
+		if self.isLocal( variable.name ):
+			return super().visitVariableExpr( variable )
+
+		key = str( variable.name.value )
+		env: Optional[ Environment ] = self.closure
+		while env is not None and key not in env.values:
+			env = env.enclosing
+		if env is not None and key in env.constants:
+			return self.constant( env.values[ key ] )
+		getter = py.Attribute( py.Name( '_env', py.Load() ), 'get', py.Load() )
+		return py.Call( getter, [ self.constant( variable.name ), py.Constant( key ) ], [] )
+
+	def visitCallExpr( self, call: Call ) -> py.expr:
+		callee = call.callee.accept( self )
+		arguments = py.List( [ argument.accept( self ) for argument in call.arguments ], py.Load() )
+		if isinstance( callee, py.Name ) and isinstance( self.constants.get( callee.id ), EndCCallable ):
+			# a constant subroutine, builtin or template, no need to check it's callable
+			method = py.Attribute( callee, 'call', py.Load() )
+			return py.Call( method, [ py.Name( '_interp', py.Load() ), self.constant( call.keyword ), arguments ], [] )
+		return self.helper( '_call', callee, self.constant( call.keyword ), arguments )
+
+	def visitGetExpr( self, get: Get ) -> py.expr:
+		return self.helper( '_memberOf', self.constant( get ), get.object.accept( self ) )
+
+	# helper methods
+
+	def typeOf( self, expr: Expr ) -> Optional[Type]:
+		""" The static type of an expression, taking the specialized parameters into account """
+		if expr.type is not None:
+			return expr.type
+		key = id( expr )
+		if key not in self._types:
+			self._types[ key ] = self.infer( expr )
+		return self._types[ key ]
+
+	def infer( self, expr: Expr ) -> Optional[Type]:
+		if isinstance( expr, Variable ):
+			binding = self.scope.resolve( str( expr.name.value ) )
+			return None if binding is None else self.specialized.get( binding.name )
+		if isinstance( expr, Grouping ):
+			return self.typeOf( expr.expression )
+		if isinstance( expr, Binary ):
+			left, right = self.typeOf( expr.left ), self.typeOf( expr.right )
+			return None if left is None or right is None else binaryType( expr.operator.value, left, right )
+		if isinstance( expr, Unary ):
+			right = self.typeOf( expr.right )
+			return None if right is None else unaryType( expr.operator.value, right )
+		return None
+
+	def fuel( self, units: int, node: stmt.Stmt ) -> list[py.stmt]:
+		"""
+		Takes fuel, like the interpreter does for a block, in the runs with limits, see limits.py
+		:param node: the statement the fuel is taken for, which errors point at
+		"""
+		if self.budget is None:
+			return []
+		budget = py.Name( '_budget', py.Load() )
+		take = py.AugAssign( py.Attribute( budget, 'fuel', py.Store() ), py.Sub(), py.Constant( units ) )
+		test = py.Compare( py.Attribute( budget, 'fuel', py.Load() ), [ py.Lt() ], [ py.Constant( 0 ) ] )
+		refuel = py.Expr( py.Call( py.Attribute( budget, 'refuel', py.Load() ), [ self.constant( node ) ], [] ) )
+		return [ self.located( take ), self.located( py.If( test=test, body=[ refuel ], orelse=[] ) ) ]
+
+	def accounted( self, node: py.expr, expr: Expr, token: Token ) -> py.expr:
+		"""
+		Counts the bytes of the strings and arrays an operator builds, in the runs with an allocation limit.
+		Only the results which may be strings are counted, and the ones which may be arrays once the first one was built.
+		"""
+		if self.budget is None or self.budget.limits.allocation is None or token.value in ( Keyword.IS, UnaryType.BANG_IS ):
+			return node
+		if isinstance( node, py.Call ) and isinstance( node.func, py.Name ) and node.func.id == '_add':
+			# counted by the helper itself, without another call
+			node.func.id = '_addCounted'
+			node.args.append( self.constant( token ) )
+			return node
+		typ = self.typeOf( expr )
+		if typ is Type.STRING or typ is None and self.arrays:
+			return self.helper( '_account', node, self.constant( token ) )
+		return node
+
+	def raise_( self, token: Token, message: str ) -> py.stmt:
+		return self.located( py.Raise( exc=self.helper( '_InterpreterError', self.constant( token ), py.Constant( message ) ), cause=None ) )
+
+
+class Jit:
+	""" The tiering policy of an interpreter """
+	interpreter: Interpreter
+	threshold: int
+	log: Callable[ [str], None ]
+	compiled: int
+	deoptimized: int
+	# globals of the code compiled before the first array was built, see `useArrays()`
+	namespaces: list[ dict[ str, object ] ]
+
+	def __init__( self, interpreter: Interpreter, threshold: int = JIT_THRESHOLD, log: Optional[Callable[[str], None]] = None ) -> None:
+		"""
+		:param threshold: calls after which a subroutine is compiled
+		:param log: receives the tiering decisions
+		"""
+		self.interpreter = interpreter
+		self.threshold = threshold
+		self.log = log or ( lambda message: None )
+		self.compiled = 0
+		self.deoptimized = 0
+		self.namespaces = []
+
+	def profile( self, subroutine: Subroutine, arguments: list[object] ) -> None:
+		""" Records a call of a subroutine in the tree-walking tier, compiling it if it became hot """
+		types = [ Type.ofValue( argument ) for argument in arguments ]
+		if subroutine.argTypes is None:
+			subroutine.argTypes = types
+		else:
+			subroutine.argTypes = [ old if old is new else None for old, new in zip( subroutine.argTypes, types ) ]
+
+		subroutine.calls += 1
+		if subroutine.calls >= self.threshold:
+			self.promote( subroutine )
+
+	def promote( self, subroutine: Subroutine ) -> None:
+		name = subroutine.declaration.name.value
+		argTypes = subroutine.argTypes or []
+		generator = JitGenerator( self.interpreter, subroutine )
+		try:
+			subroutine.compiled = generator.compileSubroutine( subroutine, argTypes )
+		except NotCompilable as e:
+			subroutine.jittable = False
+			self.log( f'JIT: {name} stays interpreted, it {e}' )
+			return
+
+		self.compiled += 1
+		if not generator.arrays:
+			self.namespaces.append( generator.namespace )
+		specialized = ', '.join(
+			f'{param.name.value}: {typ.value}' for param, typ in zip( subroutine.declaration.params, argTypes ) if typ is not None
+		)
+		self.log( f'JIT: compiled {name} after {subroutine.calls} calls, specialized to ({specialized})\n{generator.source}' )
+
+	def useArrays( self ) -> None:
+		"""
+		Called when the first array is built, the code compiled until then converts the operands which were not
+		proven to be numbers with `float()`, which now has to leave arrays alone
+		"""
+		for namespace in self.namespaces:
+			namespace[ 'float' ] = arrays.number
+		self.namespaces.clear()
+
+	def deoptimize( self, subroutine: Subroutine, arguments: list[object] ) -> None:
+		""" Called when the guards of a compiled subroutine failed, sends it back to the tree-walking tier """
+		self.deoptimized += 1
+		subroutine.compiled = None
+		subroutine.deopts += 1
+		subroutine.calls = 0
+
+		name = subroutine.declaration.name.value
+		if subroutine.deopts >= MAX_DEOPTS:
+			subroutine.jittable = False
+			self.log( f'JIT: deoptimized {name} {subroutine.deopts} times, it stays interpreted' )
+		else:
+			self.log( f'JIT: deoptimized {name}, argument types changed' )
+		# the parameters whose type changed won't be specialized again
+		self.profile( subroutine, arguments )
@@ -0,0 +1,139 @@
+"""
+Resource limits of a run of the interpreter, for scripts which can't be trusted.
+
+A run may be limited in the statements it executes, in the bytes of all the strings and arrays it builds, and
+in wall-clock time; going over a limit raises an `InterpreterError`, like any other runtime error.
+Statements are counted a block at a time: entering a block takes as much fuel as it has statements, a
+single subtraction, and only when the fuel runs out, every `CHECK_INTERVAL` statements, the limits are checked
+and a new slice of fuel is given, so the clock is read once per slice. The code compiled by the JIT takes fuel
+on entry and for batches of iterations of its loops.
+The allocation limit is a budget of bytes for the whole run, not a bound of its live memory: a value is counted
+when it's built, estimated from its length, and never given back, as the interpreter can't tell when a value is
+collected. A loop building a new string at each iteration uses it up even if it holds one string at a time; it
+bounds what a run may hold at once only as it bounds everything the run builds. The JIT only counts the values
+which may be strings, or arrays once one was built.
+Waiting, for I/O or for a started call, stops at the deadline.
+"""
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Final, Optional
+
+from token_ import Token
+from .arrays import Array
+from .errorHandler import InterpreterError
+
+
+__all__ = [ 'CHECK_INTERVAL', 'OBJECT_SIZE', 'Limits', 'Budget', 'locate' ]
+# statements executed between two checks of the limits
+CHECK_INTERVAL: Final[ int ] = 1000
+# bytes counted for each string or array on top of its content, about what python needs for the object
+OBJECT_SIZE: Final[ int ] = 64
+
+
+@dataclass(frozen=True)
+class Limits:
+	# statements executed, None for no limit
+	instructions: Optional[ int ] = None
+	# bytes of all the strings and arrays built during the run, values which were collected included
+	allocation: Optional[ int ] = None
+	# wall-clock seconds from the start of the run
+	seconds: Optional[ float ] = None
+
+
+class Budget:
+	""" What a run used of its limits """
+	__slots__ = ( 'limits', 'fuel', 'executed', 'allocated', 'deadline', '_slice' )
+	limits: Limits
+	# statements left before the next check, below 0 when it's due
+	fuel: int
+	# statements executed before the current slice
+	executed: int
+	allocated: int
+	# in `time.monotonic()` seconds
+	deadline: Optional[ float ]
+	# fuel given by the last check
+	_slice: int
+
+	def __init__( self, limits: Limits ) -> None:
+		""" The run starts now, the deadline is counted from here """
+		self.limits = limits
+		self.executed = 0
+		self.allocated = 0
+		self.deadline = None if limits.seconds is None else time.monotonic() + limits.seconds
+		self._slice = self.fuel = self._nextSlice()
+
+	def refuel( self, node: object ) -> None:
+		"""
+		Checks the limits once the fuel ran out, and gives a new slice of it
+		:param node: the statement being executed, which errors point at
+		:raises InterpreterError: if a limit was exceeded
+		"""
+		self.executed += self._slice - self.fuel
+		if self.limits.instructions is not None and self.executed > self.limits.instructions:
+			raise InterpreterError( locate( node ), f'Instruction limit of {self.limits.instructions} exceeded' )
+		self.checkDeadline( node )
+		self._slice = self.fuel = self._nextSlice()
+
+	def checkDeadline( self, node: object ) -> None:
+		""" :raises InterpreterError: if the deadline passed """
+		if self.deadline is not None and time.monotonic() >= self.deadline:
+			raise self.expired( node )
+
+	def expired( self, node: object ) -> InterpreterError:
+		""" The error of a run which went past its deadline """
+		return InterpreterError( locate( node ), f'Time limit of {self.limits.seconds} seconds exceeded' )
+
+	def remaining( self ) -> Optional[float]:
+		""" Seconds left until the deadline, None if there is none """
+		return None if self.deadline is None else max( self.deadline - time.monotonic(), 0.0 )
+
+	def account( self, value: object, node: object ) -> object:
+		"""
+		Counts the bytes of a value which was just built, if it's a string or an array
+		:return: the value
+		:raises InterpreterError: if the allocation limit was exceeded
+		"""
+		if isinstance( value, str ):
+			self.allocated += OBJECT_SIZE + len( value )
+		elif isinstance( value, Array ):
+			self.allocated += OBJECT_SIZE + len( value.data ) * value.data.itemsize
+		else:
+			return value
+		if self.limits.allocation is not None and self.allocated > self.limits.allocation:
+			raise self.exhausted( node )
+		return value
+
+	def exhausted( self, node: object ) -> InterpreterError:
+		""" The error of a run which built more than its allocation limit """
+		return InterpreterError( locate( node ), f'Allocation limit of {self.limits.allocation} bytes exceeded' )
+
+	@property
+	def instructions( self ) -> int:
+		""" Statements executed so far """
+		return self.executed + self._slice - self.fuel
+
+	def _nextSlice( self ) -> int:
+		if self.limits.instructions is None:
+			return CHECK_INTERVAL
+		return max( min( CHECK_INTERVAL, self.limits.instructions - self.executed ), 0 )
+
+	def __repr__( self ) -> str:
+		return f'<budget {self.instructions} instructions, {self.allocated} bytes>'
+
+
+def locate( node: object ) -> object:
+	""" The first token of a statement or expression, to point an error at it """
+	if isinstance( node, Token ) or node is None:
+		return node
+	pending = [ node ]
+	while pending:
+		current = pending.pop( 0 )
+		if isinstance( current, Token ):
+			return current
+		if isinstance( current, list ):
+			pending += current
+		elif hasattr( current, '__dataclass_fields__' ):
+			pending += [ getattr( current, name ) for name in current.__dataclass_fields__ ]
+	return 'the program'
@@ -0,0 +1,150 @@
+"""
+Serves interactive sessions over TCP or a Unix socket (`endcc --interactive --listen ADDRESS`).
+
+Each connection is a session of the interactive interpreter, with its own interpreter state, talking
+the same line-based protocol as the console: the server sends the `>>> ` prompt, reads a line, and sends
+back its output and the next prompt. The input cache is shared by all the sessions.
+Sessions are served by a single asyncio event loop, not by a thread each, so an input runs to completion
+before the next one, of any session, is read.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import socket
+import stat
+import sys
+from io import StringIO
+from pathlib import Path
+from typing import Optional, Union
+
+import log
+from .interactive import InputCache, Session
+
+PROMPT: str = '>>> '
+# longest input line accepted, a session sending a longer one is closed
+MAX_LINE: int = 64 * 1024
+
+
+class ReplServer:
+	""" Accepts connections and runs a session for each one """
+	exitOnImplementationError: bool
+	# shared by the sessions
+	cache: InputCache
+	# number of open sessions
+	sessions: int
+	server: Optional[ asyncio.AbstractServer ]
+	path: Optional[ Path ]
+
+	def __init__( self, exitOnImplementationError: bool = False ) -> None:
+		self.exitOnImplementationError = exitOnImplementationError
+		self.cache = InputCache()
+		self.sessions = 0
+		self.server = None
+		self.path = None
+
+	async def start( self, address: str ) -> str:
+		"""
+		Starts listening
+		:param address: `port` or `host:port` for TCP, on localhost by default, or the path of a Unix socket
+		:return: the address listened on, with the port the OS picked if it was 0
+		"""
+		if '/' in address:
+			self.path = Path( address )
+			_removeStale( self.path )
+			# only the user may connect, as sessions run arbitrary code
+			umask = os.umask( 0o177 )
+			try:
+				self.server = await asyncio.start_unix_server( self.handle, str( self.path ), limit=MAX_LINE )
+			finally:
+				os.umask( umask )
+			return address
+
+		host, _, port = address.rpartition( ':' )
+		self.server = await asyncio.start_server( self.handle, host or '127.0.0.1', int( port ), limit=MAX_LINE )
+		host, port = self.server.sockets[0].getsockname()[ : 2 ]
+		return f'{host}:{port}'
+
+	async def close( self ) -> None:
+		if self.server is not None:
+			self.server.close()
+			await self.server.wait_closed()
+		if self.path is not None:
+			self.path.unlink( missing_ok=True )
+
+	async def handle( self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter ) -> None:
+		""" Runs a session """
+		out = StringIO()
+
+		def error( message: str ) -> None:
+			out.write( f'[ERROR] {message}\n' )
+
+		session = Session(
+			out,
+			error=error,
+			exitOnImplementationError=self.exitOnImplementationError,
+			cache=self.cache
+		)
+		self.sessions += 1
+		try:
+			writer.write( PROMPT.encode() )
+			await writer.drain()
+			while line := await reader.readline():
+				exitCode = session.feed( line.decode( errors='replace' ).rstrip( '\r\n' ) )
+				output = out.getvalue()
+				out.seek( 0 )
+				out.truncate()
+				writer.write( ( output if exitCode is not None else output + PROMPT ).encode() )
+				await writer.drain()
+				if exitCode is not None:
+					break
+		except ( ValueError, ConnectionError ):
+			# a line over the limit, or the client went away
+			pass
+		finally:
+			self.sessions -= 1
+			writer.close()
+
+
+def _removeStale( path: Path ) -> None:
+	""" Removes a socket left by a server which didn't stop cleanly, anything else at the path is left alone """
+	if not path.exists():
+		return
+	if not stat.S_ISSOCK( path.stat().st_mode ):
+		raise OSError( f'{path} exists and is not a socket' )
+	with socket.socket( socket.AF_UNIX, socket.SOCK_STREAM ) as sock:
+		try:
+			sock.connect( str( path ) )
+		except OSError:
+			path.unlink()
+			return
+	raise OSError( f'A server is already listening on {path}' )
+
+
+def serveMain( address: Union[str, int], exitOnImplementationError: bool = False ) -> int:
+	"""
+	Serves sessions until interrupted
+	:param address: see `ReplServer.start()`
+	:param exitOnImplementationError: whether to end a session when the interpreter itself crashes
+	:return: exit code
+	"""
+	server = ReplServer( exitOnImplementationError )
+
+	async def serve() -> None:
+		log.info( f'Serving sessions on {await server.start( str( address ) )}', sys.stdout )
+		# with port 0 the address is how clients find the server
+		sys.stdout.flush()
+		try:
+			assert server.server is not None
+			await server.server.serve_forever()
+		finally:
+			await server.close()
+
+	try:
+		asyncio.run( serve() )
+	except KeyboardInterrupt:
+		pass
+	except OSError as e:
+		log.error( str( e ), sys.stderr )
+		return 1
+	return 0
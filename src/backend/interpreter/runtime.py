@@ -0,0 +1,346 @@
+"""
+Runtime values and builtins of the interpreter
+"""
+from __future__ import annotations
+
+import sys
+from abc import ABCMeta, abstractmethod
+from typing import Any, Callable, Final, Optional, TextIO, TYPE_CHECKING
+
+from ast_ import stmt
+from ast_.typeChecker import Type
+from token_ import Token
+from . import arrays, eventLoop
+from .environment import Environment
+from .errorHandler import InterpreterError, RUNTIME_ERRORS, RECURSION_MESSAGE
+from .handles import BUFFER_SIZE, BufferMode, Handle
+
+if TYPE_CHECKING:
+	from . import Interpreter
+
+
+class ReturnValue(Exception):
+	""" Unwinds the stack of a subroutine on `GIV BACK` """
+	value: object
+
+	def __init__( self, value: object ) -> None:
+		super().__init__()
+		self.value = value
+
+
+class Deoptimize(Exception):
+	""" Raised on entry by compiled subroutines called with arguments of other types than the ones they were specialized to """
+
+
+class EndCCallable(metaclass=ABCMeta):
+	@abstractmethod
+	def call( self, interpreter: Interpreter, token: Token, arguments: list[object] ) -> object:
+		pass
+
+
+class Subroutine(EndCCallable):
+	declaration: stmt.Subroutine
+	closure: Environment
+	# tiering state, see jit.py
+	calls: int
+	argTypes: Optional[ list[ Optional[Type] ] ]
+	compiled: Optional[ Callable[ ..., object ] ]
+	deopts: int
+	jittable: bool
+
+	def __init__( self, declaration: stmt.Subroutine, closure: Environment ) -> None:
+		self.declaration = declaration
+		self.closure = closure
+		self.calls = 0
+		self.argTypes = None
+		self.compiled = None
+		self.deopts = 0
+		self.jittable = True
+
+	def call( self, interpreter: Interpreter, token: Token, arguments: list[object] ) -> object:
+		if self.compiled is not None and len( arguments ) == len( self.declaration.params ):
+			try:
+				return self.compiled( *arguments )
+			except Deoptimize:
+				interpreter.jit.deoptimize( self, arguments )  # type: ignore
+			except RUNTIME_ERRORS as e:
+				# the compiled code doesn't know the tokens of its operators
+				raise InterpreterError( token, str( e ) ) from None
+		elif self.jittable and interpreter.jit is not None:
+			interpreter.jit.profile( self, arguments )
+		return self.invoke( interpreter, token, arguments, Environment( self.closure ) )
+
+	def callOn( self, interpreter: Interpreter, token: Token, receiver: Instance, arguments: list[object] ) -> object:
+		""" Calls this subroutine as a behavior of the given instance, which is bound to `M` """
+		env = Environment( self.closure )
+		env.define( 'M', receiver, True )
+		return self.invoke( interpreter, token, arguments, env )
+
+	def invoke( self, interpreter: Interpreter, token: Token, arguments: list[object], env: Environment ) -> object:
+		params = self.declaration.params
+		if len( arguments ) != len( params ):
+			raise InterpreterError( token, f'Expected {len( params )} arguments but got {len( arguments )}' )
+
+		# the body is fully parsed only on the first call
+		body = self.declaration.body
+		if not body.parsed:
+			interpreter.prepareBody( body.statements )
+
+		for param, argument in zip( params, arguments ):
+			env.define( str( param.name.value ), argument )
+		try:
+			interpreter.executeBlock( body.statements, env )
+		except ReturnValue as ret:
+			return ret.value
+		except RecursionError:
+			# reported at the deepest call which has the stack to do it
+			raise InterpreterError( token, RECURSION_MESSAGE ) from None
+		return None
+
+	def __repr__( self ) -> str:
+		return f'<subroutine {self.declaration.name.value}>'
+
+
+class Shape:
+	"""
+	The layout shared by all the instances of a template, mapping each field to its slot.
+	The first slot always holds the `tmplatnam` metaconstant.
+	"""
+	name: str
+	slots: dict[ str, int ]
+	constants: frozenset[ str ]
+
+	def __init__( self, name: str, fields: list[stmt.Declare] ) -> None:
+		self.name = name
+		self.slots = { 'tmplatnam': 0 }
+		for field in fields:
+			self.slots[ str( field.name.value ) ] = len( self.slots )
+		self.constants = frozenset( [ 'tmplatnam', *( str( field.name.value ) for field in fields if field.constant ) ] )
+
+	def __repr__( self ) -> str:
+		return f'<shape {self.name} {list( self.slots )}>'
+
+
+class Instance:
+	""" An instance of a template, its fields are stored in a list indexed by its shape """
+	__slots__ = ( 'template', 'shape', 'values' )
+	template: Template
+	shape: Shape
+	values: list[ object ]
+
+	def __init__( self, template: Template ) -> None:
+		self.template = template
+		self.shape = template.shape
+		self.values = [ template.name ] + [ None ] * len( template.declaration.fields )
+
+	def __repr__( self ) -> str:
+		return f'<{self.template.name} instance>'
+
+
+class Template(EndCCallable):
+	""" A template, calling it builds an instance """
+	declaration: stmt.Template
+	closure: Environment
+	name: str
+	shape: Shape
+	behaviors: dict[ str, Subroutine ]
+	initializer: Optional[ Subroutine ]
+
+	def __init__( self, declaration: stmt.Template, closure: Environment ) -> None:
+		self.declaration = declaration
+		self.closure = closure
+		self.name = str( declaration.name.value )
+		self.shape = Shape( self.name, declaration.fields )
+		self.behaviors = { str( behavior.name.value ): Subroutine( behavior, closure ) for behavior in declaration.behaviors }
+		self.initializer = None if declaration.initializer is None else Subroutine( declaration.initializer, closure )
+
+	def call( self, interpreter: Interpreter, token: Token, arguments: list[object] ) -> object:
+		instance = Instance( self )
+		for slot, field in enumerate( self.declaration.fields, 1 ):
+			if field.initializer is not None:
+				instance.values[ slot ] = interpreter.evaluateIn( field.initializer, self.closure )
+
+		if self.initializer is not None:
+			self.initializer.callOn( interpreter, token, instance, arguments )
+		elif arguments:
+			raise InterpreterError( token, f'Expected 0 arguments but got {len( arguments )}' )
+		return instance
+
+	def findMember( self, name: str ) -> object:
+		"""
+		Looks up a member, the slow path of member access
+		:return: the slot index of a field, the behavior or None if there is no such member
+		"""
+		slot = self.shape.slots.get( name )
+		if slot is not None:
+			return slot
+		return self.behaviors.get( name )
+
+	def __repr__( self ) -> str:
+		return f'<template {self.name}>'
+
+
+class BoundBehavior(EndCCallable):
+	""" A behavior read from an instance without calling it, like `obj,name` """
+	behavior: Subroutine
+	receiver: Instance
+
+	def __init__( self, behavior: Subroutine, receiver: Instance ) -> None:
+		self.behavior = behavior
+		self.receiver = receiver
+
+	def call( self, interpreter: Interpreter, token: Token, arguments: list[object] ) -> object:
+		return self.behavior.callOn( interpreter, token, self.receiver, arguments )
+
+	def __repr__( self ) -> str:
+		return f'<behavior {self.behavior.declaration.name.value} of {self.receiver}>'
+
+
+class InlineCache:
+	"""
+	Caches the lookup of a member at a `obj,name` or `CALL obj,name{}` site, keyed by the shape of the receiver.
+	A site starts monomorphic, caching a single shape, becomes polymorphic when it sees a few different shapes
+	and megamorphic when it sees more than MAX_SHAPES, at which point new shapes are not cached anymore.
+	"""
+	MAX_SHAPES: Final[ int ] = 4
+	name: str
+	shape: Optional[ Shape ]
+	target: object
+	polymorphic: dict[ Shape, object ]
+	megamorphic: bool
+	hits: int
+	misses: int
+
+	def __init__( self, name: str ) -> None:
+		self.name = name
+		self.shape = None
+		self.target = None
+		self.polymorphic = {}
+		self.megamorphic = False
+		self.hits = 0
+		self.misses = 0
+
+	def lookup( self, template: Template ) -> object:
+		"""
+		Finds a member of the given template
+		:return: the slot index of a field, the behavior or None if there is no such member
+		"""
+		shape = template.shape
+		if shape is self.shape:
+			self.hits += 1
+			return self.target
+		if shape in self.polymorphic:
+			self.hits += 1
+			return self.polymorphic[ shape ]
+
+		self.misses += 1
+		target = template.findMember( self.name )
+		if target is None:
+			return None
+		if self.shape is None:
+			self.shape, self.target = shape, target
+		elif len( self.polymorphic ) < self.MAX_SHAPES - 1:
+			self.polymorphic[ shape ] = target
+		else:
+			self.megamorphic = True
+		return target
+
+	@property
+	def state( self ) -> str:
+		if self.megamorphic:
+			return 'megamorphic'
+		if self.polymorphic:
+			return 'polymorphic'
+		return 'monomorphic' if self.shape is not None else 'uninitialized'
+
+	def __repr__( self ) -> str:
+		return f'<inline cache {self.name} {self.state} hits={self.hits} misses={self.misses}>'
+
+
+class Builtin(EndCCallable):
+	name: str
+	func: Callable[ ..., object ]
+
+	def __init__( self, name: str, func: Callable[ ..., object ] ) -> None:
+		self.name = name
+		self.func = func
+
+	def call( self, interpreter: Interpreter, token: Token, arguments: list[object] ) -> object:
+		try:
+			result = self.func( *arguments )
+		except ( TypeError, ValueError, IndexError ) as e:
+			raise InterpreterError( token, f'Invalid arguments for builtin {self.name}: {e}' )
+		if result.__class__ is arrays.Array and not interpreter.arrays:
+			interpreter.useArrays()
+		# strings and arrays built by builtins count against the allocation limit
+		return result if interpreter.budget is None else interpreter.budget.account( result, token )
+
+	def __repr__( self ) -> str:
+		return f'<builtin {self.name}>'
+
+
+class InterpreterBuiltin(Builtin):
+	""" A builtin receiving the interpreter running it and the token of the call, before the arguments """
+
+	def call( self, interpreter: Interpreter, token: Token, arguments: list[object] ) -> object:
+		try:
+			result = self.func( interpreter, token, *arguments )
+		except ( TypeError, ValueError, IndexError ) as e:
+			raise InterpreterError( token, f'Invalid arguments for builtin {self.name}: {e}' )
+		if result.__class__ is arrays.Array and not interpreter.arrays:
+			interpreter.useArrays()
+		return result if interpreter.budget is None else interpreter.budget.account( result, token )
+
+
+def toText( obj: Any ) -> str:
+	""" Converts a value to the text printed by printto """
+	if obj is None:
+		return 'NOTHING'
+	if isinstance( obj, float ):
+		txt: str = str( obj )
+		return txt[ : -2 ] if txt.endswith( '.0' ) else txt
+	return str( obj )
+
+
+def printto( handle: Handle, *values: object ) -> None:
+	for value in values:
+		handle.write( toText( value ) )
+
+
+def getMember( token: Token, obj: object, name: str ) -> object:
+	""" Resolves `obj,name` """
+	if isinstance( obj, Handle ) and name == 'givm':
+		return Builtin( f'{obj.name},givm', obj.givm )
+	if isinstance( obj, arrays.Array ) and name in arrays.MEMBERS:
+		return Builtin( name, getattr( obj, name ) )
+	if isinstance( obj, str ) and name == 'siz':
+		return Builtin( 'siz', lambda: float( len( obj ) ) )  # type: ignore
+	raise InterpreterError( token, f'{toText( obj )} has no member "{name}"' )
+
+
+def createGlobals(
+		stdin: Optional[TextIO] = None,
+		stdout: Optional[TextIO] = None,
+		stderr: Optional[TextIO] = None,
+		bufferMode: Optional[BufferMode] = None,
+		bufferSize: int = BUFFER_SIZE
+) -> Environment:
+	"""
+	The builtins, with the standard handles bound to the given files, or to the process' ones
+	:param bufferMode: how STDOUT is buffered, see `Handle`; STDERR is always line buffered
+	:param bufferSize: characters STDOUT and STDERR buffer before they're flushed
+	"""
+	env = Environment()
+	stdoutHandle = Handle( 'STDOUT', stdout or sys.stdout, bufferMode, bufferSize )
+	stdinHandle = Handle( 'STDIN', stdin or sys.stdin )
+	# a prompt is shown before reading the answer
+	stdinHandle.tied = stdoutHandle
+	env.define( 'STDIN', stdinHandle, True )
+	env.define( 'STDOUT', stdoutHandle, True )
+	env.define( 'STDERR', Handle( 'STDERR', stderr or sys.stderr, BufferMode.LINE, bufferSize ), True )
+	env.define( 'printto', Builtin( 'printto', printto ), True )
+	env.define( 'arry', Builtin( 'arry', arrays.arry ), True )
+	env.define( 'count', Builtin( 'count', arrays.count ), True )
+	for name, func in eventLoop.BUILTINS.items():
+		env.define( name, InterpreterBuiltin( name, func ), True )
+	return env
@@ -1,4 +1,91 @@
 """
 LLVM/native backend for the endc compiler
+
+Lowers the AST to textual LLVM IR, written next to the source as a .ll file.
+When clang is installed the IR is built to a native executable and run, otherwise it's run by lli, if installed.
+Programs importing other modules are not supported, nor are arrays.
 """
-# https://llvm.org/docs/LangRef.html#abstract
\ No newline at end of file
+# https://llvm.org/docs/LangRef.html#abstract
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Optional
+
+import log
+from ast_ import ParseError
+from ast_.stmt import Stmt
+from module import Module
+from .generator import Generator, LlvmError
+
+
+def compileProgram( ast: list[Stmt], filename: str = '<endc>', module: Optional[Module] = None ) -> str:
+	"""
+	Lowers a program to a module in the IR text format
+	:param module: the module the ast was parsed from, if any
+	:raises LlvmError: if the program uses something the backend doesn't support
+	:raises ParseError: if a subroutine body contains a syntax error
+	"""
+	if module is not None and module.imports:
+		raise LlvmError( None, 'imports are not supported by the LLVM backend', module.imports[0].loc )
+	return Generator( filename ).generate( ast )
+
+
+def toolchain() -> Optional[str]:
+	""" The tool used to run IR, either clang or lli, None if neither is installed """
+	for tool in ( 'clang', 'lli' ):
+		if shutil.which( tool ):
+			return tool
+	return None
+
+
+def run( path: Path, capture: bool = False ) -> subprocess.CompletedProcess[str]:
+	"""
+	Runs a module, building it with clang or running it with lli
+	:param path: the .ll file of the module
+	:param capture: whether to capture the output instead of inheriting it
+	:raises FileNotFoundError: if neither clang nor lli is installed
+	:raises CalledProcessError: if clang fails to build the module, with its output
+	"""
+	tool = toolchain()
+	if tool is None:
+		raise FileNotFoundError( 'neither clang nor lli is installed' )
+	if tool == 'lli':
+		return subprocess.run( [ 'lli', str( path ) ], capture_output=capture, text=True )
+
+	with TemporaryDirectory() as tmp:
+		executable = Path( tmp ) / path.stem
+		subprocess.run( [ 'clang', '-O2', '-Wno-override-module', str( path ), '-o', str( executable ) ], capture_output=True, text=True, check=True )
+		return subprocess.run( [ str( executable ) ], capture_output=capture, text=True )
+
+
+def buildMain( ast: list[Stmt], module: Optional[Module] = None ) -> int:
+	""" Writes the .ll file of a program, next to its module or as out.ll """
+	output = Path( 'out.ll' ) if module is None else module.path.with_suffix( '.ll' )
+	try:
+		ir = compileProgram( ast, str( module.path ) if module else '<endc>', module )
+	except ParseError:
+		# already reported by the parser
+		return 1
+	except LlvmError as e:
+		print( e, file=sys.stderr )
+		return 1
+
+	output.write_text( ir )
+	return 0
+
+
+def backendMain( ast: list[Stmt], module: Optional[Module] = None ) -> int:
+	if ( exitCode := buildMain( ast, module ) ) != 0:
+		return exitCode
+
+	output = Path( 'out.ll' ) if module is None else module.path.with_suffix( '.ll' )
+	if toolchain() is None:
+		print( f'Wrote {output}, install clang or lli to run it', file=sys.stderr )
+		return 0
+	try:
+		return run( output ).returncode
+	except subprocess.CalledProcessError as e:
+		log.error( f'clang failed to build {output}: {e.stderr.strip()}', sys.stderr )
+		return 1
@@ -0,0 +1,489 @@
+"""
+Lowers the AST to textual LLVM IR.
+
+INTEGER values are doubles, BOOLEAN ones are i1s and STRING ones are pointers to NUL-terminated
+strings, NOTHING has no value. Variables live in stack slots, which LLVM promotes to registers.
+Top level declarations become globals, initialized by `@endc.init`, which the C `main` calls
+before the `main` subroutine, if there is one.
+
+Symbols and temporaries contain a `.`, which EndC names can't, so they never clash with the
+names of the program nor with the C library.
+"""
+from __future__ import annotations
+
+import struct
+from typing import Final, NamedTuple, Optional
+
+from ast_ import stmt
+from ast_.expr import Visitor, Binary, Grouping, Literal, Unary, Variable, Call, Get, Expr
+from ast_.typeChecker import Type
+from token_ import Keyword, Loc, Token, UnaryType
+from .runtime import RUNTIME
+
+# handles which can be printed to, as file descriptors
+HANDLES: Final[ dict[ str, int ] ] = { 'STDOUT': 1, 'STDERR': 2 }
+
+_IRTYPES: Final[ dict[ Type, str ] ] = { Type.INTEGER: 'double', Type.BOOLEAN: 'i1', Type.STRING: 'i8*', Type.NOTHING: 'void' }
+_ZERO: Final[ dict[ Type, str ] ] = { Type.INTEGER: '0.0', Type.BOOLEAN: 'false', Type.STRING: 'null' }
+_PRINTERS: Final[ dict[ Type, str ] ] = { Type.INTEGER: 'printNumber', Type.BOOLEAN: 'printBoolean', Type.STRING: 'printString' }
+_ARITHMETIC: Final[ dict[ object, str ] ] = {
+	UnaryType.ADD: 'fadd',
+	UnaryType.SUBTRACT: 'fsub',
+	UnaryType.DIVIDE: 'fdiv',
+}
+_COMPARISON: Final[ dict[ object, str ] ] = {
+	UnaryType.GREATER: 'fcmp ogt',
+	UnaryType.GREATER_EQUAL: 'fcmp oge',
+}
+
+
+class LlvmError(Exception):
+	""" The program uses something the LLVM backend doesn't support """
+	token: Optional[ Token ]
+	loc: Optional[ Loc ]
+	message: str
+
+	def __init__( self, token: Optional[Token], message: str, loc: Optional[Loc] = None ) -> None:
+		""" :param loc: where the error is, for the errors without a token, defaults to the token's location """
+		self.loc = token.loc if loc is None and token is not None else loc
+		super().__init__( f'Error: {message}' if self.loc is None else f'Error at {self.loc}: {message}' )
+		self.token = token
+		self.message = message
+
+
+class Value(NamedTuple):
+	type: Type
+	# a register or a constant, empty for NOTHING
+	ref: str
+
+	@property
+	def typed( self ) -> str:
+		return f'{_IRTYPES[ self.type ]} {self.ref}'
+
+
+class Binding(NamedTuple):
+	# pointer to the variable's slot or global
+	pointer: str
+	type: Type
+	constant: bool
+
+
+class Signature(NamedTuple):
+	symbol: str
+	params: list[ Type ]
+	returns: Type
+
+
+def typeOf( token: Token, name: str, what: str ) -> Type:
+	""" The type named by a type name, if values of it can be lowered """
+	try:
+		typ = Type( name )
+	except ValueError:
+		raise LlvmError( token, f'{what} of type {name} are not supported by the LLVM backend' ) from None
+	if typ is Type.NOTHING:
+		raise LlvmError( token, f'{what} of type {name} are not supported by the LLVM backend' )
+	return typ
+
+
+def double( value: float ) -> str:
+	""" A double constant, LLVM requires the hexadecimal form for values without an exact decimal one """
+	if value.is_integer() and abs( value ) < 2 ** 53:
+		return f'{value:.1f}'
+	return f'0x{struct.unpack( ">Q", struct.pack( ">d", value ) )[0]:016X}'
+
+
+def cString( text: str ) -> tuple[ str, int ]:
+	""" A NUL-terminated string constant and its length in bytes """
+	data = text.encode( 'utf8' ) + b'\0'
+	chars = ''.join( chr( byte ) if 0x20 <= byte < 0x7F and byte not in b'"\\' else f'\\{byte:02X}' for byte in data )
+	return f'c"{chars}"', len( data )
+
+
+class Generator(Visitor[Value], stmt.Visitor[None]):
+	filename: str
+	globals: dict[ str, Binding ]
+	subroutines: dict[ str, Signature ]
+	strings: dict[ str, str ]
+	header: list[ str ]
+	# state of the function being generated
+	lines: list[ str ]
+	allocas: list[ str ]
+	scopes: list[ dict[ str, Binding ] ]
+	returns: Type
+	terminated: bool
+	counter: int
+	_names: dict[ str, int ]
+
+	def __init__( self, filename: str = '<endc>' ) -> None:
+		self.filename = filename
+		self.globals = {}
+		self.subroutines = {}
+		self.strings = {}
+		self.header = []
+		self.lines = []
+		self.allocas = []
+		self.scopes = []
+		self.returns = Type.NOTHING
+		self.terminated = False
+		self.counter = 0
+		self._names = {}
+
+	def generate( self, ast: list[stmt.Stmt] ) -> str:
+		"""
+		Lowers a program to a module
+		:raises LlvmError: if the program uses something that can't be lowered
+		"""
+		for statement in ast:
+			if isinstance( statement, stmt.Subroutine ):
+				self.declareSubroutine( statement )
+
+		functions: list[ str ] = []
+		# top level statements, in order
+		self.begin( Type.NOTHING, [] )
+		for statement in ast:
+			if isinstance( statement, stmt.Declare ):
+				self.declareGlobal( statement )
+			elif not isinstance( statement, stmt.Subroutine ):
+				statement.accept( self )
+		functions.append( self.end( 'define void @endc.init()' ) )
+
+		for statement in ast:
+			if isinstance( statement, stmt.Subroutine ):
+				functions.append( self.subroutine( statement ) )
+		functions.append( self.entryPoint() )
+
+		return '\n'.join( [
+			f'; ModuleID = \'{self.filename}\'',
+			f'source_filename = "{self.filename}"',
+			'',
+			*self.header,
+			'',
+			'\n\n'.join( functions ),
+			RUNTIME,
+		] )
+
+	# declarations
+
+	def declareGlobal( self, declare: stmt.Declare ) -> None:
+		typ = typeOf( declare.name, declare.typ, 'variables' )
+		name = str( declare.name.value )
+		pointer = f'@var.{name}'
+		self.header.append( f'{pointer} = internal global {_IRTYPES[ typ ]} {_ZERO[ typ ]}' )
+		if declare.initializer is not None:
+			value = self.expect( declare.initializer, typ, declare.name )
+			self.emit( f'store {value.typed}, {_IRTYPES[ typ ]}* {pointer}' )
+		self.globals[ name ] = Binding( pointer, typ, declare.constant )
+
+	def declareSubroutine( self, declaration: stmt.Subroutine ) -> None:
+		name = str( declaration.name.value )
+		returns = Type.NOTHING if declaration.returns == Type.NOTHING.value else typeOf( declaration.name, declaration.returns, 'results' )
+		params = [ typ for _, typ in self.parameters( declaration ) ]
+		# prefixed, so that they don't clash with the C library
+		self.subroutines[ name ] = Signature( f'@endc.{name}', params, returns )
+
+	def parameters( self, declaration: stmt.Subroutine ) -> list[ tuple[ str, Type ] ]:
+		params = declaration.params
+		if declaration.name.value == 'main' and len( params ) == 1 and params[0].typ == f'{Type.STRING.value}()':
+			# argv is not available
+			params = []
+		return [ ( str( param.name.value ), typeOf( param.name, param.typ, 'parameters' ) ) for param in params ]
+
+	def subroutine( self, declaration: stmt.Subroutine ) -> str:
+		signature = self.subroutines[ str( declaration.name.value ) ]
+		params = self.parameters( declaration )
+		self.begin( signature.returns, [] )
+		scope: dict[ str, Binding ] = {}
+		for name, typ in params:
+			scope[ name ] = self.slot( name, typ, False, f'%{name}' )
+		self.scopes.append( scope )
+		self.block( declaration.body.statements )
+
+		arguments = ', '.join( f'{_IRTYPES[ typ ]} %{name}' for name, typ in params )
+		return self.end( f'define internal {_IRTYPES[ signature.returns ]} {signature.symbol}({arguments})', declaration.name.value == 'main' )
+
+	def entryPoint( self ) -> str:
+		main = self.subroutines.get( 'main' )
+		lines = [ 'define i32 @main() {', 'entry:', '  call void @endc.init()' ]
+		if main is None or main.params:
+			lines.append( '  ret i32 0' )
+		elif main.returns is Type.INTEGER:
+			lines += [ f'  %exitCode = call double {main.symbol}()', '  %code = fptosi double %exitCode to i32', '  ret i32 %code' ]
+		else:
+			lines += [ f'  call {_IRTYPES[ main.returns ]} {main.symbol}()', '  ret i32 0' ]
+		return '\n'.join( lines + [ '}' ] )
+
+	# statements
+
+	def visitExpressionStmt( self, expression: stmt.Expression ) -> None:
+		expression.expression.accept( self )
+
+	def visitDeclareStmt( self, declare: stmt.Declare ) -> None:
+		typ = typeOf( declare.name, declare.typ, 'variables' )
+		value = None if declare.initializer is None else self.expect( declare.initializer, typ, declare.name )
+		# the name is bound after the initializer, which may refer to an outer variable of the same name
+		self.scopes[-1][ str( declare.name.value ) ] = self.slot( str( declare.name.value ), typ, declare.constant, value.ref if value else _ZERO[ typ ] )
+
+	def visitAssignStmt( self, assign: stmt.Assign ) -> None:
+		binding = self.resolve( assign.name )
+		if binding.constant:
+			raise LlvmError( assign.name, f'Cannot assign to constant "{assign.name.value}"' )
+		value = self.expect( assign.value, binding.type, assign.name )
+		self.emit( f'store {value.typed}, {_IRTYPES[ binding.type ]}* {binding.pointer}' )
+
+	def visitIfStmt( self, if_: stmt.If ) -> None:
+		label = self.unique( 'if' )
+		condition = self.condition( if_.condition )
+		self.branch( condition, f'{label}.then', f'{label}.else' if if_.elseBranch else f'{label}.end' )
+		self.label( f'{label}.then' )
+		self.block( if_.thenBranch )
+		self.jump( f'{label}.end' )
+		if if_.elseBranch:
+			self.label( f'{label}.else' )
+			self.block( if_.elseBranch )
+			self.jump( f'{label}.end' )
+		self.label( f'{label}.end' )
+
+	def visitUntilStmt( self, until: stmt.Until ) -> None:
+		label = self.unique( 'loop' )
+		self.jump( f'{label}.cond' if until.checkFirst else f'{label}.body' )
+		self.label( f'{label}.cond' )
+		self.branch( self.condition( until.condition ), f'{label}.end', f'{label}.body' )
+		self.label( f'{label}.body' )
+		self.block( until.body )
+		self.jump( f'{label}.cond' )
+		self.label( f'{label}.end' )
+
+	def visitReturnStmt( self, return_: stmt.Return ) -> None:
+		if return_.value is None:
+			if self.returns is not Type.NOTHING:
+				raise LlvmError( return_.keyword, f'Expected a {self.returns.value} value to return' )
+			self.terminate( 'ret void' )
+			return
+		if self.returns is Type.NOTHING:
+			raise LlvmError( return_.keyword, 'Cannot return a value from a subroutine returning NoThInG' )
+		self.terminate( f'ret {self.expect( return_.value, self.returns, return_.keyword ).typed}' )
+
+	def visitSubroutineStmt( self, subroutine: stmt.Subroutine ) -> None:
+		raise LlvmError( subroutine.name, 'nested subroutines are not supported by the LLVM backend' )
+
+	def visitSetStmt( self, set: stmt.Set ) -> None:
+		raise LlvmError( set.name, 'templates are not supported by the LLVM backend' )
+
+	def visitTemplateStmt( self, template: stmt.Template ) -> None:
+		raise LlvmError( template.name, 'templates are not supported by the LLVM backend' )
+
+	# expressions
+
+	def visitBinaryExpr( self, binary: Binary ) -> Value:
+		op = binary.operator.value
+		left = binary.left.accept( self )
+		right = binary.right.accept( self )
+
+		if op in ( Keyword.IS, UnaryType.BANG_IS ):
+			equal = self.equals( left, right )
+			return equal if op is Keyword.IS else self.negate( equal )
+		if op is UnaryType.ADD and left.type is Type.STRING:
+			return self.call( Type.STRING, '@endc.concat', [ left, self.toString( right, binary.operator ) ] )
+
+		if left.type is not Type.INTEGER or right.type is not Type.INTEGER:
+			raise LlvmError( binary.operator, f'Operands must be two numbers, got {left.type.value} and {right.type.value}' )
+		if op in _ARITHMETIC:
+			return self.instruction( Type.INTEGER, f'{_ARITHMETIC[ op ]} double {left.ref}, {right.ref}' )
+		if op in _COMPARISON:
+			return self.instruction( Type.BOOLEAN, f'{_COMPARISON[ op ]} double {left.ref}, {right.ref}' )
+		if op is UnaryType.MODULO:
+			return self.call( Type.INTEGER, '@endc.modulo', [ left, right ] )
+		raise LlvmError( binary.operator, f'Unsupported operator {op}' )
+
+	def visitGroupingExpr( self, grouping: Grouping ) -> Value:
+		return grouping.expression.accept( self )
+
+	def visitLiteralExpr( self, literal: Literal ) -> Value:
+		value = literal.value
+		if value is None:
+			return Value( Type.NOTHING, '' )
+		if isinstance( value, bool ):
+			return Value( Type.BOOLEAN, 'true' if value else 'false' )
+		if isinstance( value, float ):
+			return Value( Type.INTEGER, double( value ) )
+		return Value( Type.STRING, self.string( str( value ) ) )
+
+	def visitUnaryExpr( self, unary: Unary ) -> Value:
+		right = unary.right.accept( self )
+		if unary.operator.value is UnaryType.SUBTRACT:
+			if right.type is not Type.INTEGER:
+				raise LlvmError( unary.operator, 'Operand must be a number' )
+			return self.instruction( Type.INTEGER, f'fneg double {right.ref}' )
+		if unary.operator.value is UnaryType.BANG:
+			return self.negate( self.truthy( right ) )
+		raise LlvmError( unary.operator, f'Unsupported operator {unary.operator.value}' )
+
+	def visitVariableExpr( self, variable: Variable ) -> Value:
+		binding = self.resolve( variable.name )
+		irType = _IRTYPES[ binding.type ]
+		return self.instruction( binding.type, f'load {irType}, {irType}* {binding.pointer}' )
+
+	def visitCallExpr( self, call: Call ) -> Value:
+		if not isinstance( call.callee, Variable ) or call.keyword.value is Keyword.BUILD:
+			raise LlvmError( call.keyword, 'only calls of subroutines by name are supported by the LLVM backend' )
+		name = str( call.callee.name.value )
+		if name == 'printto' and name not in self.subroutines:
+			return self.printto( call )
+		if name not in self.subroutines:
+			raise LlvmError( call.callee.name, f'Undefined subroutine "{name}"' )
+
+		signature = self.subroutines[ name ]
+		if len( call.arguments ) != len( signature.params ):
+			raise LlvmError( call.keyword, f'Expected {len( signature.params )} arguments but got {len( call.arguments )}' )
+		arguments = [ self.expect( argument, typ, call.keyword ) for argument, typ in zip( call.arguments, signature.params ) ]
+		return self.call( signature.returns, signature.symbol, arguments )
+
+	def visitGetExpr( self, get: Get ) -> Value:
+		raise LlvmError( get.name, 'templates are not supported by the LLVM backend' )
+
+	# helper methods
+
+	def begin( self, returns: Type, lines: list[str] ) -> None:
+		""" Starts a function """
+		self.lines = lines
+		self.allocas = []
+		self.scopes = []
+		self.returns = returns
+		self.terminated = False
+		self.counter = 0
+		self._names = {}
+
+	def end( self, header: str, isMain: bool = False ) -> str:
+		""" Ends a function, returning its definition """
+		if not self.terminated:
+			if self.returns is Type.NOTHING:
+				self.emit( 'ret void' )
+			elif isMain and self.returns is Type.INTEGER:
+				# exit code 0, like the interpreter
+				self.emit( 'ret double 0.0' )
+			else:
+				# falling off the end of a subroutine which returns a value, it would return NOTHING
+				self.emit( 'unreachable' )
+		return '\n'.join( [ f'{header} {{', 'entry:', *self.allocas, *self.lines, '}' ] )
+
+	def emit( self, line: str ) -> None:
+		self.lines.append( f'  {line}' )
+
+	def unique( self, name: str ) -> str:
+		""" A name for registers and labels, unique in the function """
+		count = self._names.get( name, 0 )
+		self._names[ name ] = count + 1
+		return name if count == 0 else f'{name}.{count}'
+
+	def instruction( self, typ: Type, instruction: str ) -> Value:
+		self.counter += 1
+		self.emit( f'%.t{self.counter} = {instruction}' )
+		return Value( typ, f'%.t{self.counter}' )
+
+	def call( self, returns: Type, symbol: str, arguments: list[Value] ) -> Value:
+		instruction = f'call {_IRTYPES[ returns ]} {symbol}({", ".join( argument.typed for argument in arguments )})'
+		if returns is Type.NOTHING:
+			self.emit( instruction )
+			return Value( Type.NOTHING, '' )
+		return self.instruction( returns, instruction )
+
+	def label( self, name: str ) -> None:
+		self.lines.append( f'{name}:' )
+		self.terminated = False
+
+	def terminate( self, line: str ) -> None:
+		""" Emits a terminator, code following it goes in an unreachable block """
+		self.emit( line )
+		self.label( self.unique( 'dead' ) )
+
+	def jump( self, label: str ) -> None:
+		self.emit( f'br label %{label}' )
+		self.terminated = True
+
+	def branch( self, condition: Value, then: str, else_: str ) -> None:
+		self.emit( f'br i1 {condition.ref}, label %{then}, label %{else_}' )
+		self.terminated = True
+
+	def slot( self, name: str, typ: Type, constant: bool, initial: str ) -> Binding:
+		""" Allocates a stack slot for a variable, in the entry block so that LLVM promotes it to a register """
+		pointer = f'%{self.unique( f"{name}.addr" )}'
+		self.allocas.append( f'  {pointer} = alloca {_IRTYPES[ typ ]}' )
+		self.emit( f'store {_IRTYPES[ typ ]} {initial}, {_IRTYPES[ typ ]}* {pointer}' )
+		return Binding( pointer, typ, constant )
+
+	def block( self, statements: list[stmt.Stmt] ) -> None:
+		self.scopes.append( {} )
+		for statement in statements:
+			statement.accept( self )
+		self.scopes.pop()
+
+	def resolve( self, name: Token ) -> Binding:
+		key = str( name.value )
+		for scope in reversed( self.scopes ):
+			if key in scope:
+				return scope[ key ]
+		if key in self.globals:
+			return self.globals[ key ]
+		raise LlvmError( name, f'Undefined variable "{key}"' )
+
+	def expect( self, expr: Expr, typ: Type, token: Token ) -> Value:
+		""" Lowers an expression which must be of the given type """
+		value = expr.accept( self )
+		if value.type is not typ:
+			raise LlvmError( token, f'Expected a {typ.value} value, got {value.type.value}' )
+		return value
+
+	def condition( self, expr: Expr ) -> Value:
+		return self.truthy( expr.accept( self ) )
+
+	def truthy( self, value: Value ) -> Value:
+		""" Converts a value to a boolean, only booleans and NOTHING can be falsy """
+		if value.type is Type.BOOLEAN:
+			return value
+		return Value( Type.BOOLEAN, 'false' if value.type is Type.NOTHING else 'true' )
+
+	def negate( self, value: Value ) -> Value:
+		return self.instruction( Type.BOOLEAN, f'xor i1 {value.ref}, true' )
+
+	def equals( self, left: Value, right: Value ) -> Value:
+		if left.type is not right.type or left.type is Type.NOTHING:
+			# values of different types are never equal, and NOTHING is always equal to itself
+			return Value( Type.BOOLEAN, 'true' if left.type is right.type else 'false' )
+		if left.type is Type.INTEGER:
+			return self.instruction( Type.BOOLEAN, f'fcmp oeq double {left.ref}, {right.ref}' )
+		if left.type is Type.BOOLEAN:
+			return self.instruction( Type.BOOLEAN, f'icmp eq i1 {left.ref}, {right.ref}' )
+		return self.call( Type.BOOLEAN, '@endc.stringEquals', [ left, right ] )
+
+	def toString( self, value: Value, token: Token ) -> Value:
+		""" Converts a value to a string, like python's str() """
+		if value.type is Type.STRING:
+			return value
+		if value.type is Type.INTEGER:
+			return self.call( Type.STRING, '@endc.formatNumber', [ value, Value( Type.BOOLEAN, 'true' ) ] )
+		if value.type is Type.BOOLEAN:
+			return self.call( Type.STRING, '@endc.formatBoolean', [ value ] )
+		raise LlvmError( token, f'Cannot convert a {value.type.value} value to a string' )
+
+	def printto( self, call: Call ) -> Value:
+		handle = call.arguments[0] if call.arguments else None
+		if not isinstance( handle, Variable ) or handle.name.value not in HANDLES or self.isDeclared( str( handle.name.value ) ):
+			raise LlvmError( call.keyword, 'printto must be called with STDOUT or STDERR by the LLVM backend' )
+		for argument in call.arguments[ 1: ]:
+			value = argument.accept( self )
+			if value.type not in _PRINTERS:
+				raise LlvmError( call.keyword, f'Cannot print a {value.type.value} value' )
+			self.emit( f'call void @endc.{_PRINTERS[ value.type ]}(i32 {HANDLES[ str( handle.name.value ) ]}, {value.typed})' )
+		return Value( Type.NOTHING, '' )
+
+	def isDeclared( self, name: str ) -> bool:
+		return name in self.globals or any( name in scope for scope in self.scopes )
+
+	def string( self, text: str ) -> str:
+		""" A pointer to a string constant """
+		if text not in self.strings:
+			constant, length = cString( text )
+			name = f'@.str.{len( self.strings )}'
+			self.header.append( f'{name} = private unnamed_addr constant [{length} x i8] {constant}' )
+			self.strings[ text ] = f'getelementptr inbounds ([{length} x i8], [{length} x i8]* {name}, i64 0, i64 0)'
+		return self.strings[ text ]
@@ -1,5 +1,107 @@
-from ast_.expr import Expr
+"""
+Python backend for the endc compiler.
 
+Lowers the AST to a python code object, which runs directly on the CPython VM.
+When compiling a module, the code object is cached next to it, see backend.python.cache.
+"""
+import sys
+from pathlib import Path
+from types import CodeType, FunctionType
+from typing import Optional
 
-def backendMain(ast: Expr) -> int:
-	pass
+from ast_ import ParseError
+from ast_.parser import Parser
+from ast_.stmt import Stmt
+from ast_.typeChecker import TypeChecker
+from module import Module
+from . import cache, runtime
+from .generator import Generator, pyName
+from .runtime import EndCError
+
+
+# errors generated code can raise, the others are reported as crashes
+_RUNTIME_ERRORS = ( EndCError, NameError, TypeError, AttributeError, ValueError, ZeroDivisionError, RecursionError )
+
+
+def compileProgram( ast: list[Stmt], module: Optional[Module] = None ) -> CodeType:
+	"""
+	Compiles a program to a code object, using the cached one when it's up-to-date
+	:param ast: the program
+	:param module: the module the program was parsed from, needed to cache the code object
+	:raises ParseError: if a subroutine body contains a syntax error
+	"""
+	if module is None:
+		return Generator( '<endc>' ).compile( ast )
+
+	code = cache.read( module.path, module.hash )
+	if code is None:
+		code = Generator( str( module.path ) ).compile( ast )
+		cache.write( module.path, module.hash, code )
+	return code
+
+
+def link( namespace: dict[ str, object ], module: Module ) -> None:
+	"""
+	Runs the modules the given one imports, each once and in a namespace of its own, which sees only the builtins,
+	and binds the imported names in the namespace of the program
+	:raises ParseError: if an imported module fails to parse
+	"""
+	_bindImports( namespace, module, dict( namespace ), {} )
+
+
+def _bindImports( namespace: dict[ str, object ], module: Module, builtins: dict[ str, object ], loaded: dict[ Path, dict[ str, object ] ] ) -> None:
+	for imp in module.imports:
+		dep = module.dependencies[ imp.path ]
+		if dep.path not in loaded:
+			depNamespace = loaded[ dep.path ] = dict( builtins )
+			_bindImports( depNamespace, dep, builtins, loaded )
+			exec( _compileModule( dep ), depNamespace )
+		for name in imp.names:
+			namespace[ pyName( name ) ] = loaded[ dep.path ][ pyName( name ) ]
+
+
+def _compileModule( module: Module ) -> CodeType:
+	""" Compiles an imported module, which is only parsed if its code object isn't cached """
+	code = cache.read( module.path, module.hash )
+	if code is None:
+		ast = Parser( module.tokens ).parseProgram()
+		if ast is None:
+			raise ParseError( f'Failed to parse module {module.name}' )
+		# annotated like the program, type errors are not fatal here
+		TypeChecker().checkStatements( ast )
+		code = compileProgram( ast, module )
+	return code
+
+
+def buildMain( ast: list[Stmt], module: Module ) -> int:
+	try:
+		compileProgram( ast, module )
+	except ParseError:
+		# already reported by the parser
+		return 1
+	return 0
+
+
+def backendMain( ast: list[Stmt], module: Optional[Module] = None ) -> int:
+	try:
+		code = compileProgram( ast, module )
+	except ParseError:
+		# already reported by the parser
+		return 1
+
+	namespace = runtime.createGlobals()
+	try:
+		if module is not None:
+			link( namespace, module )
+		exec( code, namespace )
+		# run the main subroutine, if there is one
+		main = namespace.get( 'e_main' )
+		if isinstance( main, FunctionType ):
+			# argv is passed only if main declares it
+			exitCode = main( [] ) if main.__code__.co_argcount else main()
+			if isinstance( exitCode, float ):
+				return int( exitCode )
+	except _RUNTIME_ERRORS as e:
+		print( runtime.getErrorText( e, code.co_filename ), file=sys.stderr )
+		return 1
+	return 0
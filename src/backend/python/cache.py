@@ -0,0 +1,73 @@
+"""
+On-disk cache of the code objects compiled by the python backend.
+
+They are stored like CPython's own hash-based .pyc files (see PEP 552), in the `__endcache__`
+directory next to their source, as `<source file name>.<python cache tag>.pyc`, like `foo.ec.cpython-310.pyc`.
+The header's source hash covers the module's hash and the generator version.
+"""
+from __future__ import annotations
+
+import marshal
+import os
+import sys
+import threading
+from hashlib import sha256
+from importlib.util import MAGIC_NUMBER
+from pathlib import Path
+from types import CodeType
+from typing import Final, Optional
+
+from module.cache import CACHE_DIR
+from .generator import GENERATOR_VERSION
+
+
+# hash-based and checked, as CPython would write with `--invalidation-mode checked-hash`
+_FLAGS: Final[ bytes ] = ( 0b11 ).to_bytes( 4, 'little' )
+
+
+def _cacheFile( path: Path ) -> Path:
+	return path.parent / CACHE_DIR / f'{path.name}.{sys.implementation.cache_tag}.pyc'
+
+
+def _sourceHash( hash: str ) -> bytes:
+	return sha256( f'{GENERATOR_VERSION}:{hash}'.encode() ).digest()[ : 8 ]
+
+
+def read( path: Path, hash: str ) -> Optional[CodeType]:
+	"""
+	Reads the code object compiled from the given source, if there is an up-to-date one
+	:param path: path of the source file
+	:param hash: hash of the current source, see module.cache.hashSource
+	:return: the code object or None
+	"""
+	try:
+		data = _cacheFile( path ).read_bytes()
+	except OSError:
+		return None
+	if data[ : 4 ] != MAGIC_NUMBER or data[ 4 : 8 ] != _FLAGS or data[ 8 : 16 ] != _sourceHash( hash ):
+		return None
+	try:
+		code = marshal.loads( data[ 16 : ] )
+	except ( ValueError, EOFError, TypeError ):
+		return None
+	return code if isinstance( code, CodeType ) else None
+
+
+def write( path: Path, hash: str, code: CodeType ) -> None:
+	"""
+	Stores the code object compiled from the given source.
+	Failing to write the cache is not an error, the module will just be compiled again next time.
+	:param path: path of the source file
+	:param hash: hash of the current source, see module.cache.hashSource
+	:param code: compiled code object
+	"""
+	file = _cacheFile( path )
+	try:
+		file.parent.mkdir( exist_ok=True )
+		# write then rename, so concurrent readers never see a partial file
+		# per thread too, like module.cache.write
+		tmp = file.with_suffix( f'.{os.getpid()}.{threading.get_ident()}.tmp' )
+		tmp.write_bytes( MAGIC_NUMBER + _FLAGS + _sourceHash( hash ) + marshal.dumps( code ) )
+		os.replace( tmp, file )
+	except OSError:
+		pass
@@ -0,0 +1,405 @@
+"""
+Lowers the EndC AST to a python AST, which CPython compiles to a code object.
+
+EndC names are prefixed with `e_`: as EndC names can't contain an `e`, these never clash with the
+runtime helpers (prefixed with `_`) or with the names of renamed declarations. Python only has
+function scopes, so declarations in nested blocks are renamed to `e_<name>e<n>`.
+"""
+from __future__ import annotations
+
+import ast as py
+import sys
+from types import CodeType
+from typing import Any, Final, NamedTuple, Optional, TypeVar
+
+from ast_ import stmt
+from ast_.expr import Visitor, Expr, Binary, Grouping, Literal, Unary, Variable, Call, Get
+from ast_.typeChecker import Type, TypeChecker
+from token_ import Keyword, Token, UnaryType
+
+
+# bump when the generated code changes, invalidates the cached code objects
+GENERATOR_VERSION: Final[ int ] = 1
+
+_ARITHMETIC: Final[ dict[ object, type[py.operator] ] ] = {
+	UnaryType.ADD: py.Add,
+	UnaryType.SUBTRACT: py.Sub,
+	UnaryType.DIVIDE: py.Div,
+	UnaryType.MODULO: py.Mod,
+}
+_COMPARISON: Final[ dict[ object, type[py.cmpop] ] ] = {
+	UnaryType.GREATER: py.Gt,
+	UnaryType.GREATER_EQUAL: py.GtE,
+	Keyword.IS: py.Eq,
+	UnaryType.BANG_IS: py.NotEq,
+}
+
+
+# python 3.12 added type parameters to functions and classes
+_TYPE_PARAMS: Final[ dict[ str, Any ] ] = { 'type_params': [] } if sys.version_info >= ( 3, 12 ) else {}
+
+S = TypeVar( 'S', bound=py.stmt )
+
+
+def pyName( name: str ) -> str:
+	return f'e_{name}'
+
+
+class Function:
+	""" A python function being generated, or the module itself """
+	enclosing: Optional[ Function ]
+	# python names referenced or bound in this function
+	names: set[ str ]
+	nonlocals: set[ str ]
+	globals: set[ str ]
+	renamed: int
+
+	def __init__( self, enclosing: Optional[Function] ) -> None:
+		self.enclosing = enclosing
+		self.names = set()
+		self.nonlocals = set()
+		self.globals = set()
+		self.renamed = 0
+
+	@property
+	def isModule( self ) -> bool:
+		return self.enclosing is None
+
+
+class Binding(NamedTuple):
+	name: str
+	typ: str
+	constant: bool
+	function: Function
+
+
+class Scope:
+	""" An EndC block, mapping its names to their python bindings """
+	bindings: dict[ str, Binding ]
+	enclosing: Optional[ Scope ]
+	function: Function
+
+	def __init__( self, enclosing: Optional[Scope], function: Function ) -> None:
+		self.bindings = {}
+		self.enclosing = enclosing
+		self.function = function
+
+	def resolve( self, name: str ) -> Optional[Binding]:
+		scope: Optional[ Scope ] = self
+		while scope is not None:
+			if name in scope.bindings:
+				return scope.bindings[ name ]
+			scope = scope.enclosing
+		return None
+
+
+# noinspection PyMethodMayBeStatic
+class Generator(Visitor[py.expr], stmt.Visitor[list[py.stmt]]):
+	filename: str
+	# names of the declared templates, receivers declared with these types use direct attribute access
+	templates: set[ str ]
+	function: Function
+	scope: Scope
+	line: int
+
+	def __init__( self, filename: str ) -> None:
+		self.filename = filename
+		self.templates = set()
+		self.function = Function( None )
+		self.scope = Scope( None, self.function )
+		self.line = 1
+
+	def generate( self, statements: list[stmt.Stmt] ) -> py.Module:
+		"""
+		Lowers a whole program, parsing all of its subroutine bodies
+		:raises ParseError: if a subroutine body contains a syntax error
+		"""
+		self.templates = { str( statement.name.value ) for statement in statements if isinstance( statement, stmt.Template ) }
+		module = py.Module( body=self.block( statements, self.scope ), type_ignores=[] )
+		return py.fix_missing_locations( module )
+
+	def compile( self, statements: list[stmt.Stmt] ) -> CodeType:
+		return compile( self.generate( statements ), self.filename, 'exec', dont_inherit=True )
+
+	# scopes
+
+	def declare( self, name: Token, typ: str, constant: bool ) -> str:
+		""" Binds a new name in the current scope, returning its python name """
+		key = str( name.value )
+		if key in self.scope.bindings:
+			# redeclaration in the same block
+			pyname = self.scope.bindings[ key ].name
+		elif self.scope is self.functionScope and pyName( key ) not in self.function.names:
+			pyname = pyName( key )
+		else:
+			self.function.renamed += 1
+			pyname = f'{pyName( key )}e{self.function.renamed}'
+		self.function.names.add( pyname )
+		self.scope.bindings[ key ] = Binding( pyname, typ, constant, self.function )
+		return pyname
+
+	@property
+	def functionScope( self ) -> Scope:
+		""" The outermost scope of the current function """
+		scope = self.scope
+		while scope.enclosing is not None and scope.enclosing.function is self.function:
+			scope = scope.enclosing
+		return scope
+
+	def reference( self, name: Token, store: bool = False ) -> Optional[Binding]:
+		""" Resolves a name used by the current function, marking it nonlocal or global if it's assigned to """
+		binding = self.scope.resolve( str( name.value ) )
+		pyname = binding.name if binding is not None else pyName( str( name.value ) )
+		self.function.names.add( pyname )
+		if store and not self.function.isModule and ( binding is None or binding.function is not self.function ):
+			if binding is None or binding.function.isModule:
+				self.function.globals.add( pyname )
+			else:
+				self.function.nonlocals.add( pyname )
+		return binding
+
+	def block( self, statements: list[stmt.Stmt], scope: Scope ) -> list[py.stmt]:
+		previous = self.scope
+		try:
+			self.scope, self.function = scope, scope.function
+			body: list[ py.stmt ] = []
+			for statement in statements:
+				# the type picks the statement visitor of the generator
+				generated: list[ py.stmt ] = statement.accept( self )
+				body += generated
+			return body or [ self.located( py.Pass() ) ]
+		finally:
+			self.scope, self.function = previous, previous.function
+
+	def nested( self, statements: list[stmt.Stmt] ) -> list[py.stmt]:
+		return self.block( statements, Scope( self.scope, self.function ) )
+
+	def function_( self, name: str, params: list[str], statements: list[stmt.Stmt], scope: Scope, prologue: list[py.stmt] ) -> py.FunctionDef:
+		""" Generates a function, `scope` must be a new scope of a new Function with the parameters already declared """
+		body = prologue + self.block( statements, scope )
+		if scope.function.globals:
+			body.insert( 0, self.located( py.Global( sorted( scope.function.globals ) ) ) )
+		if scope.function.nonlocals:
+			body.insert( 0, self.located( py.Nonlocal( sorted( scope.function.nonlocals ) ) ) )
+		arguments = py.arguments( posonlyargs=[], args=[ py.arg( param ) for param in params ], kwonlyargs=[], kw_defaults=[], defaults=[] )
+		return self.located( py.FunctionDef( name=name, args=arguments, body=body, decorator_list=[], returns=None, **_TYPE_PARAMS ) )
+
+	def subroutineBody( self, declaration: stmt.Subroutine ) -> list[stmt.Stmt]:
+		# parsed on first access, and then annotated like the interpreter does
+		if not declaration.body.parsed:
+			TypeChecker().checkStatements( declaration.body.statements )
+		return declaration.body.statements
+
+	# statements
+
+	def visitExpressionStmt( self, expression: stmt.Expression ) -> list[py.stmt]:
+		return [ self.located( py.Expr( expression.expression.accept( self ) ) ) ]
+
+	def visitDeclareStmt( self, declare: stmt.Declare ) -> list[py.stmt]:
+		self.line = declare.name.loc.line
+		value = py.Constant( None ) if declare.initializer is None else declare.initializer.accept( self )
+		name = self.declare( declare.name, declare.typ, declare.constant )
+		return [ self.located( py.Assign( targets=[ py.Name( name, py.Store() ) ], value=value ) ) ]
+
+	def visitAssignStmt( self, assign: stmt.Assign ) -> list[py.stmt]:
+		self.line = assign.name.loc.line
+		value = assign.value.accept( self )
+		binding = self.reference( assign.name, store=True )
+		if binding is not None and binding.constant:
+			return [
+				self.located( py.Expr( value ) ),
+				self.raise_( assign.name, f'Cannot assign to constant "{assign.name.value}"' )
+			]
+		name = binding.name if binding is not None else pyName( str( assign.name.value ) )
+		return [ self.located( py.Assign( targets=[ py.Name( name, py.Store() ) ], value=value ) ) ]
+
+	def visitIfStmt( self, if_: stmt.If ) -> list[py.stmt]:
+		test = self.condition( if_.condition )
+		node = self.located( py.If( test=test, body=[], orelse=[] ) )
+		node.body = self.nested( if_.thenBranch )
+		node.orelse = self.nested( if_.elseBranch ) if if_.elseBranch else []
+		return [ node ]
+
+	def visitUntilStmt( self, until: stmt.Until ) -> list[py.stmt]:
+		test = self.condition( until.condition )
+		if until.checkFirst:
+			node = self.located( py.While( test=py.UnaryOp( py.Not(), test ), body=[], orelse=[] ) )
+			node.body = self.nested( until.body )
+		else:
+			node = self.located( py.While( test=py.Constant( True ), body=[], orelse=[] ) )
+			node.body = self.nested( until.body ) + [ self.located( py.If( test=test, body=[ py.Break() ], orelse=[] ) ) ]
+		return [ node ]
+
+	def visitReturnStmt( self, return_: stmt.Return ) -> list[py.stmt]:
+		self.line = return_.keyword.loc.line
+		if self.function.isModule:
+			return [ self.raise_( return_.keyword, 'GIV BACK outside of a subroutine' ) ]
+		value = None if return_.value is None else return_.value.accept( self )
+		return [ self.located( py.Return( value ) ) ]
+
+	def visitSubroutineStmt( self, subroutine: stmt.Subroutine ) -> list[py.stmt]:
+		self.line = subroutine.name.loc.line
+		name = self.declare( subroutine.name, 'SUBROUTIN', True )
+
+		scope = Scope( self.scope, Function( self.function ) )
+		params = self.enter( scope, [ ( param.name, param.typ ) for param in subroutine.params ] )
+		return [ self.function_( name, params, self.subroutineBody( subroutine ), scope, [] ) ]
+
+	def visitSetStmt( self, set: stmt.Set ) -> list[py.stmt]:
+		self.line = set.name.loc.line
+		receiver = set.object.accept( self )
+		value = set.value.accept( self )
+		if self.isInstance( set.object ):
+			target = py.Attribute( receiver, pyName( str( set.name.value ) ), py.Store() )
+			return [ self.located( py.Assign( targets=[ target ], value=value ) ) ]
+		return [ self.located( py.Expr( self.helper( '_setMember', receiver, py.Constant( str( set.name.value ) ), value ) ) ) ]
+
+	def visitTemplateStmt( self, template: stmt.Template ) -> list[py.stmt]:
+		self.line = template.name.loc.line
+		typ = str( template.name.value )
+		name = self.declare( template.name, 'TMPLAT', True )
+		me = Token( template.name.typ, 'M', template.name.loc )
+
+		slots = [ pyName( str( field.name.value ) ) for field in template.fields ]
+		body: list[ py.stmt ] = [
+			self.located( py.Assign( targets=[ py.Name( '__slots__', py.Store() ) ], value=py.Tuple( [ py.Constant( slot ) for slot in slots ], py.Load() ) ) ),
+			self.located( py.Assign( targets=[ py.Name( 'e_tmplatnam', py.Store() ) ], value=py.Constant( typ ) ) ),
+		]
+
+		# __init__ sets the fields, then runs the initializer's body
+		initializer = template.initializer
+		scope = Scope( self.scope, Function( self.function ) )
+		defaults: list[ py.stmt ] = []
+		for field, slot in zip( template.fields, slots ):
+			# field initializers run in __init__, but can't see M nor the initializer's parameters
+			previous, self.scope, self.function = self.scope, Scope( self.scope, scope.function ), scope.function
+			value = py.Constant( None ) if field.initializer is None else field.initializer.accept( self )
+			self.scope, self.function = previous, previous.function
+			target = py.Attribute( py.Name( pyName( 'M' ), py.Load() ), slot, py.Store() )
+			defaults.append( self.located( py.Assign( targets=[ target ], value=value ) ) )
+		params = [ ( param.name, param.typ ) for param in ( initializer.params if initializer is not None else [] ) ]
+		params = self.enter( scope, [ ( me, typ ), *params ] )
+		statements = [] if initializer is None else self.subroutineBody( initializer )
+		body.append( self.function_( '__init__', params, statements, scope, defaults ) )
+
+		for behavior in template.behaviors:
+			scope = Scope( self.scope, Function( self.function ) )
+			params = self.enter( scope, [ ( me, typ ), *( ( param.name, param.typ ) for param in behavior.params ) ] )
+			body.append( self.function_( pyName( str( behavior.name.value ) ), params, self.subroutineBody( behavior ), scope, [] ) )
+
+		bases: list[ py.expr ] = [ py.Name( '_Instance', py.Load() ) ]
+		return [ self.located( py.ClassDef( name=name, bases=bases, keywords=[], body=body, decorator_list=[], **_TYPE_PARAMS ) ) ]
+
+	def enter( self, scope: Scope, params: list[tuple[Token, str]] ) -> list[str]:
+		""" Declares the parameters of a function in its scope """
+		previous, self.scope, self.function = self.scope, scope, scope.function
+		try:
+			return [ self.declare( name, typ, False ) for name, typ in params ]
+		finally:
+			self.scope, self.function = previous, previous.function
+
+	# expressions
+
+	def visitBinaryExpr( self, binary: Binary ) -> py.expr:
+		self.line = binary.operator.loc.line
+		op = binary.operator.value
+		left = binary.left.accept( self )
+		right = binary.right.accept( self )
+		leftType, rightType = self.typeOf( binary.left ), self.typeOf( binary.right )
+
+		if op in ( Keyword.IS, UnaryType.BANG_IS ):
+			return py.Compare( left, [ _COMPARISON[ op ]() ], [ right ] )
+		if op is UnaryType.ADD:
+			if leftType is Type.STRING and rightType is Type.STRING:
+				return py.BinOp( left, py.Add(), right )
+			if not ( leftType is Type.INTEGER and rightType is Type.INTEGER ):
+				return self.helper( '_add', left, right )
+
+		# numbers, the operands are converted unless they were proven
+		if not ( leftType is Type.INTEGER and rightType is Type.INTEGER ):
+			left, right = self.builtin( 'float', left ), self.builtin( 'float', right )
+		if op in _COMPARISON:
+			return py.Compare( left, [ _COMPARISON[ op ]() ], [ right ] )
+		return py.BinOp( left, _ARITHMETIC[ op ](), right )
+
+	def visitGroupingExpr( self, grouping: Grouping ) -> py.expr:
+		return grouping.expression.accept( self )
+
+	def visitLiteralExpr( self, literal: Literal ) -> py.expr:
+		# the parser only makes literals of numbers, strings, FALSE and NOTHING
+		assert literal.value is None or isinstance( literal.value, ( bool, float, str ) )
+		return py.Constant( literal.value )
+
+	def visitUnaryExpr( self, unary: Unary ) -> py.expr:
+		self.line = unary.operator.loc.line
+		right = unary.right.accept( self )
+		if unary.operator.value is UnaryType.BANG:
+			return py.UnaryOp( py.Not(), right if self.isBoolean( unary.right ) else self.helper( '_truthy', right ) )
+		return py.UnaryOp( py.USub(), right if self.typeOf( unary.right ) is Type.INTEGER else self.builtin( 'float', right ) )
+
+	def visitVariableExpr( self, variable: Variable ) -> py.expr:
+		self.line = variable.name.loc.line
+		binding = self.reference( variable.name )
+		return py.Name( binding.name if binding is not None else pyName( str( variable.name.value ) ), py.Load() )
+
+	def visitCallExpr( self, call: Call ) -> py.expr:
+		self.line = call.keyword.loc.line
+		callee = call.callee.accept( self )
+		return py.Call( callee, [ argument.accept( self ) for argument in call.arguments ], [] )
+
+	def visitGetExpr( self, get: Get ) -> py.expr:
+		self.line = get.name.loc.line
+		receiver = get.object.accept( self )
+		if self.isInstance( get.object ):
+			# direct attribute access, specialized by CPython's own inline caches
+			return py.Attribute( receiver, pyName( str( get.name.value ) ), py.Load() )
+		return self.helper( '_member', receiver, py.Constant( str( get.name.value ) ) )
+
+	# helper methods
+
+	def isInstance( self, expr: Expr ) -> bool:
+		""" Whether the expression is statically known to be a template instance """
+		if isinstance( expr, Variable ):
+			binding = self.scope.resolve( str( expr.name.value ) )
+			return binding is not None and binding.typ in self.templates
+		if isinstance( expr, Call ):
+			return expr.keyword.value is Keyword.BUILD
+		if isinstance( expr, Grouping ):
+			return self.isInstance( expr.expression )
+		return False
+
+	def isBoolean( self, expr: Expr ) -> bool:
+		""" Whether the expression always evaluates to a boolean, so it can be tested directly """
+		if self.typeOf( expr ) is Type.BOOLEAN:
+			return True
+		if isinstance( expr, Binary ):
+			return expr.operator.value in _COMPARISON
+		if isinstance( expr, Unary ):
+			return expr.operator.value is UnaryType.BANG
+		if isinstance( expr, Grouping ):
+			return self.isBoolean( expr.expression )
+		return False
+
+	def condition( self, expr: Expr ) -> py.expr:
+		test = expr.accept( self )
+		return test if self.isBoolean( expr ) else self.helper( '_truthy', test )
+
+	def helper( self, name: str, *arguments: py.expr ) -> py.expr:
+		return py.Call( py.Name( name, py.Load() ), list( arguments ), [] )
+
+	def builtin( self, name: str, argument: py.expr ) -> py.expr:
+		if isinstance( argument, py.Constant ) and isinstance( argument.value, float ):
+			return argument
+		return py.Call( py.Name( name, py.Load() ), [ argument ], [] )
+
+	def typeOf( self, expr: Expr ) -> Optional[Type]:
+		""" The static type of an expression, as proven by the type checker """
+		return expr.type
+
+	def raise_( self, token: Token, message: str ) -> py.stmt:
+		return self.located( py.Raise( exc=self.helper( '_EndCError', py.Constant( message ) ), cause=None ) )
+
+	def located( self, node: S ) -> S:
+		node.lineno = node.end_lineno = self.line
+		node.col_offset = node.end_col_offset = 0
+		return node
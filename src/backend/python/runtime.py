@@ -0,0 +1,125 @@
+"""
+Runtime support of the code generated by the python backend.
+
+Generated code finds these helpers in its globals under `_`-prefixed names, see createGlobals().
+"""
+from __future__ import annotations
+
+import sys
+from types import TracebackType
+from typing import Any, Optional, TextIO
+
+from backend.interpreter.runtime import toText
+
+
+class EndCError(RuntimeError):
+	""" A runtime error raised by generated code """
+	pass
+
+
+class Instance:
+	""" Base class of the classes generated for templates, their fields are __slots__ """
+	__slots__ = ()
+	e_tmplatnam: str
+
+	def __repr__( self ) -> str:
+		return f'<{self.e_tmplatnam} instance>'
+
+
+class Handle:
+	""" A file handle, like STDOUT """
+	name: str
+	file: TextIO
+
+	def __init__( self, name: str, file: TextIO ) -> None:
+		self.name = name
+		self.file = file
+
+	def write( self, text: str ) -> None:
+		self.file.write( text )
+
+	def e_givm( self ) -> str:
+		""" Reads a line """
+		return self.file.readline().removesuffix( '\n' )
+
+	def __repr__( self ) -> str:
+		return f'<handle {self.name}>'
+
+
+def printto( handle: Handle, *values: object ) -> None:
+	for value in values:
+		handle.write( toText( value ) )
+
+
+def truthy( obj: object ) -> bool:
+	if obj is None:
+		return False
+	if isinstance( obj, bool ):
+		return obj
+	return True
+
+
+def add( left: Any, right: Any ) -> object:
+	""" The `-` operator, for operands whose types were not proven """
+	if isinstance( left, str ):
+		return left + str( right )
+	if isinstance( left, float ):
+		return left + float( right )
+	return None
+
+
+def member( obj: object, name: str ) -> object:
+	""" Resolves `obj,name` for a receiver whose type is not known statically """
+	if isinstance( obj, str ) and name == 'siz':
+		return lambda: float( len( obj ) )  # type: ignore
+	if isinstance( obj, ( Instance, Handle ) ) and hasattr( obj, f'e_{name}' ):
+		return getattr( obj, f'e_{name}' )
+	raise EndCError( f'{toText( obj )} has no member "{name}"' )
+
+
+def setMember( obj: object, name: str, value: object ) -> None:
+	""" Executes `obj,name = value` for a receiver whose type is not known statically """
+	if not isinstance( obj, Instance ):
+		raise EndCError( f'{toText( obj )} has no fields' )
+	if name == 'tmplatnam':
+		raise EndCError( f'Cannot assign to constant "{name}"' )
+	if f'e_{name}' not in type( obj ).__slots__:
+		raise EndCError( f'{obj} has no field "{name}"' )
+	setattr( obj, f'e_{name}', value )
+
+
+def createGlobals() -> dict[ str, object ]:
+	""" Creates the globals of a generated module """
+	return {
+		'_Instance': Instance,
+		'_EndCError': EndCError,
+		'_truthy': truthy,
+		'_add': add,
+		'_member': member,
+		'_setMember': setMember,
+		'e_STDIN': Handle( 'STDIN', sys.stdin ),
+		'e_STDOUT': Handle( 'STDOUT', sys.stdout ),
+		'e_STDERR': Handle( 'STDERR', sys.stderr ),
+		'e_printto': printto,
+	}
+
+
+def getErrorText( e: BaseException, filename: str ) -> str:
+	""" Formats an error raised by generated code, pointing to the line of the EndC source that caused it """
+	line: Optional[ int ] = None
+	tb: Optional[ TracebackType ] = e.__traceback__
+	while tb is not None:
+		if tb.tb_frame.f_code.co_filename == filename:
+			line = tb.tb_lineno
+		tb = tb.tb_next
+
+	if isinstance( e, NameError ) and e.name is not None:
+		message = f'Undefined name "{e.name.removeprefix( "e_" )}"'
+	elif isinstance( e, EndCError ):
+		message = e.args[0]
+	elif isinstance( e, RecursionError ):
+		# worded like the interpreter's
+		message = 'Maximum recursion depth exceeded'
+	else:
+		message = str( e )
+	return f'Error at line {line} in file {filename}: {message}'
@@ -1,5 +1,84 @@
 """
 WASM backend for the endc compiler
+
+Lowers the AST to a WebAssembly module, written next to the source in both the text (.wat) and the binary (.wasm) formats,
+and runs it on the built-in stack machine, `endcc build` only writes it.
+The modules import their I/O from the host, see backend.wasm.generator, and can be checked and run without an external
+runtime by the built-in validator and stack machine. Programs importing other modules are not supported.
 """
+# https://webassembly.github.io/spec/core/exec/index.html
+import sys
+from pathlib import Path
+from typing import Optional
+
+from ast_ import ParseError
+from ast_.stmt import Stmt
+from module import Module
+from . import binary, runtime
+from .generator import Generator, WasmError
+from .structure import WasmModule
+from .validator import validate
+from .vm import Machine, Trap
+from .wat import toWat
+
+
+def compileProgram( ast: list[Stmt], module: Optional[Module] = None ) -> WasmModule:
+	"""
+	Lowers a program to a validated module
+	:param module: the module the ast was parsed from, if any
+	:raises WasmError: if the program uses something the backend doesn't support
+	:raises ParseError: if a subroutine body contains a syntax error
+	"""
+	if module is not None and module.imports:
+		raise WasmError( None, 'imports are not supported by the WASM backend', module.imports[0].loc )
+	wasm = Generator().generate( ast )
+	validate( wasm )
+	return wasm
+
+
+def run( data: bytes ) -> int:
+	"""
+	Runs the main subroutine of a module in the binary format on the built-in machine
+	:return: exit code
+	"""
+	module = binary.decode( data )
+	validate( module )
+	machine = Machine( module, runtime.createImports() )
+	try:
+		exitCode = machine.invoke( 'main' ) if any( export.name == 'main' for export in module.exports ) else []
+	except Trap as e:
+		print( f'Error: {e}', file=sys.stderr )
+		return 1
+	return int( exitCode[0] ) if exitCode else 0  # type: ignore
+
+
+def write( ast: list[Stmt], module: Optional[Module] = None ) -> Optional[bytes]:
+	"""
+	Writes the .wat and .wasm files of a program, next to its module or as out.wat and out.wasm
+	:return: the binary module, None if the program couldn't be compiled, the error was reported
+	"""
+	try:
+		wasm = compileProgram( ast, module )
+	except ParseError:
+		# already reported by the parser
+		return None
+	except WasmError as e:
+		print( e, file=sys.stderr )
+		return None
+
+	output = Path( 'out.endc' ) if module is None else module.path
+	data = binary.encode( wasm )
+	output.with_suffix( '.wat' ).write_text( toWat( wasm ) )
+	output.with_suffix( '.wasm' ).write_bytes( data )
+	return data
+
+
+def buildMain( ast: list[Stmt], module: Optional[Module] = None ) -> int:
+	""" Writes the module of a program without running it, see `write()` """
+	return 0 if write( ast, module ) is not None else 1
+
 
-# https://webassembly.github.io/spec/core/exec/index.html
\ No newline at end of file
+def backendMain( ast: list[Stmt], module: Optional[Module] = None ) -> int:
+	""" Writes the module of a program, see `write()`, and runs it on the built-in machine """
+	data = write( ast, module )
+	return 1 if data is None else run( data )
@@ -0,0 +1,310 @@
+"""
+Encoding and decoding of the WebAssembly binary format.
+
+https://webassembly.github.io/spec/core/binary/index.html
+"""
+from __future__ import annotations
+
+import struct
+from typing import Callable, Final, TypeVar
+
+from .structure import ValType, ExternalKind, EMPTY, OPCODES, OPNAMES, BlockType, Instruction, FuncType, Import, \
+	Function, Global, Export, Data, WasmModule
+
+T = TypeVar( 'T' )
+
+MAGIC: Final[ bytes ] = b'\0asm'
+VERSION: Final[ bytes ] = b'\1\0\0\0'
+FUNCTYPE: Final[ int ] = 0x60
+
+
+class SectionId:
+	CUSTOM: Final[ int ] = 0
+	TYPE: Final[ int ] = 1
+	IMPORT: Final[ int ] = 2
+	FUNCTION: Final[ int ] = 3
+	MEMORY: Final[ int ] = 5
+	GLOBAL: Final[ int ] = 6
+	EXPORT: Final[ int ] = 7
+	CODE: Final[ int ] = 10
+	DATA: Final[ int ] = 11
+
+
+class DecodeError(Exception):
+	pass
+
+
+# encoding
+
+def unsigned( value: int ) -> bytes:
+	""" Encodes an unsigned LEB128 integer """
+	out = bytearray()
+	while True:
+		byte = value & 0x7F
+		value >>= 7
+		if value == 0:
+			out.append( byte )
+			return bytes( out )
+		out.append( byte | 0x80 )
+
+
+def signed( value: int ) -> bytes:
+	""" Encodes a signed LEB128 integer """
+	out = bytearray()
+	while True:
+		byte = value & 0x7F
+		value >>= 7
+		if ( value == 0 and not byte & 0x40 ) or ( value == -1 and byte & 0x40 ):
+			out.append( byte )
+			return bytes( out )
+		out.append( byte | 0x80 )
+
+
+def name( text: str ) -> bytes:
+	data = text.encode( 'utf8' )
+	return unsigned( len( data ) ) + data
+
+
+def vector( items: list[bytes] ) -> bytes:
+	return unsigned( len( items ) ) + b''.join( items )
+
+
+def section( id: int, content: bytes ) -> bytes:
+	return bytes( [ id ] ) + unsigned( len( content ) ) + content
+
+
+def instruction( instr: Instruction ) -> bytes:
+	op = OPCODES[ str( instr[0] ) ]
+	out = bytes( [ op.code ] )
+	if op.immediate == 'blocktype':
+		return out + bytes( [ instr[1] ] )  # type: ignore
+	if op.immediate == 'index':
+		return out + unsigned( instr[1] )  # type: ignore
+	if op.immediate == 'i32':
+		return out + signed( instr[1] )  # type: ignore
+	if op.immediate == 'f64':
+		return out + struct.pack( '<d', instr[1] )
+	return out
+
+
+def expression( body: list[Instruction] ) -> bytes:
+	""" Encodes a sequence of instructions, with the `end` closing it """
+	return b''.join( map( instruction, body ) ) + bytes( [ OPCODES[ 'end' ].code ] )
+
+
+def functionType( typ: FuncType ) -> bytes:
+	return bytes( [ FUNCTYPE ] ) + vector( [ bytes( [ t ] ) for t in typ.params ] ) + vector( [ bytes( [ t ] ) for t in typ.results ] )
+
+
+def code( function: Function ) -> bytes:
+	# runs of locals of the same type are compressed
+	runs: list[ list[ int ] ] = []
+	for typ in function.locals:
+		if runs and runs[-1][1] == typ:
+			runs[-1][0] += 1
+		else:
+			runs.append( [ 1, typ ] )
+	body = vector( [ unsigned( count ) + bytes( [ typ ] ) for count, typ in runs ] ) + expression( function.body )
+	return unsigned( len( body ) ) + body
+
+
+def encode( module: WasmModule ) -> bytes:
+	""" Encodes a module in the binary format """
+	sections: list[ tuple[ int, list[bytes] ] ] = [
+		( SectionId.TYPE, [ functionType( typ ) for typ in module.types ] ),
+		( SectionId.IMPORT, [ name( imp.module ) + name( imp.name ) + bytes( [ ExternalKind.FUNC ] ) + unsigned( imp.type ) for imp in module.imports ] ),
+		( SectionId.FUNCTION, [ unsigned( function.type ) for function in module.functions ] ),
+		( SectionId.MEMORY, [ b'\0' + unsigned( pages ) for pages in module.memories ] ),
+		( SectionId.GLOBAL, [ bytes( [ glob.type, glob.mutable ] ) + expression( [ glob.init ] ) for glob in module.globals ] ),
+		( SectionId.EXPORT, [ name( export.name ) + bytes( [ export.kind ] ) + unsigned( export.index ) for export in module.exports ] ),
+		( SectionId.CODE, [ code( function ) for function in module.functions ] ),
+		( SectionId.DATA, [ b'\0' + expression( [ ( 'i32.const', data.offset ) ] ) + unsigned( len( data.data ) ) + data.data for data in module.data ] ),
+	]
+	# empty sections are omitted
+	return MAGIC + VERSION + b''.join( section( id, vector( items ) ) for id, items in sections if items )
+
+
+# decoding
+
+class Reader:
+	data: bytes
+	pos: int
+
+	def __init__( self, data: bytes ) -> None:
+		self.data = data
+		self.pos = 0
+
+	@property
+	def done( self ) -> bool:
+		return self.pos >= len( self.data )
+
+	def bytes( self, count: int ) -> bytes:
+		if self.pos + count > len( self.data ):
+			raise DecodeError( f'unexpected end at byte {self.pos}' )
+		self.pos += count
+		return self.data[ self.pos - count : self.pos ]
+
+	def byte( self ) -> int:
+		return self.bytes( 1 )[0]
+
+	def unsigned( self ) -> int:
+		result = shift = 0
+		while True:
+			byte = self.byte()
+			result |= ( byte & 0x7F ) << shift
+			shift += 7
+			if not byte & 0x80:
+				return result
+
+	def signed( self ) -> int:
+		result = shift = 0
+		while True:
+			byte = self.byte()
+			result |= ( byte & 0x7F ) << shift
+			shift += 7
+			if not byte & 0x80:
+				if byte & 0x40:
+					result -= 1 << shift
+				return result
+
+	def f64( self ) -> float:
+		return struct.unpack( '<d', self.bytes( 8 ) )[0]
+
+	def name( self ) -> str:
+		return self.bytes( self.unsigned() ).decode( 'utf8' )
+
+	def vector( self, item: Callable[ [], T ] ) -> list[T]:
+		return [ item() for _ in range( self.unsigned() ) ]
+
+	def valType( self ) -> ValType:
+		byte = self.byte()
+		try:
+			return ValType( byte )
+		except ValueError:
+			raise DecodeError( f'invalid value type 0x{byte:02x} at byte {self.pos - 1}' ) from None
+
+	def blockType( self ) -> BlockType:
+		if self.data[ self.pos : self.pos + 1 ] == bytes( [ EMPTY ] ):
+			return self.byte()
+		return self.valType()
+
+	def instruction( self ) -> Instruction:
+		code = self.byte()
+		if code not in OPNAMES:
+			raise DecodeError( f'unknown opcode 0x{code:02x} at byte {self.pos - 1}' )
+		op = OPNAMES[ code ]
+		immediate = OPCODES[ op ].immediate
+		if immediate == 'blocktype':
+			return op, self.blockType()
+		if immediate == 'index':
+			return op, self.unsigned()
+		if immediate == 'i32':
+			return op, self.signed()
+		if immediate == 'f64':
+			return op, self.f64()
+		return op,
+
+	def expression( self ) -> list[Instruction]:
+		""" Reads instructions up to the `end` closing the expression, which is not included """
+		body: list[ Instruction ] = []
+		depth = 0
+		while True:
+			instr = self.instruction()
+			if instr[0] in ( 'block', 'loop', 'if' ):
+				depth += 1
+			elif instr[0] == 'end':
+				if depth == 0:
+					return body
+				depth -= 1
+			body.append( instr )
+
+	def functionType( self ) -> FuncType:
+		if self.byte() != FUNCTYPE:
+			raise DecodeError( f'expected a function type at byte {self.pos - 1}' )
+		return FuncType( tuple( self.vector( self.valType ) ), tuple( self.vector( self.valType ) ) )
+
+	def import_( self ) -> Import:
+		module, name = self.name(), self.name()
+		if self.byte() != ExternalKind.FUNC:
+			raise DecodeError( f'only function imports are supported, at byte {self.pos - 1}' )
+		return Import( module, name, self.unsigned() )
+
+	def memory( self ) -> int:
+		if self.byte() != 0:
+			raise DecodeError( f'memories with a maximum size are not supported, at byte {self.pos - 1}' )
+		return self.unsigned()
+
+	def global_( self ) -> Global:
+		typ, mutable = self.valType(), bool( self.byte() )
+		init = self.expression()
+		if len( init ) != 1:
+			raise DecodeError( f'expected a constant instruction at byte {self.pos}' )
+		return Global( typ, mutable, init[0] )
+
+	def export( self ) -> Export:
+		return Export( self.name(), ExternalKind( self.byte() ), self.unsigned() )
+
+	def code( self ) -> tuple[ list[ValType], list[Instruction] ]:
+		end = self.unsigned() + self.pos
+		locals: list[ ValType ] = []
+		for count, typ in self.vector( lambda: ( self.unsigned(), self.valType() ) ):
+			locals += [ typ ] * count
+		body = self.expression()
+		if self.pos != end:
+			raise DecodeError( f'function body size mismatch at byte {self.pos}' )
+		return locals, body
+
+	def data_( self ) -> Data:
+		if self.unsigned() != 0:
+			raise DecodeError( f'only active segments of memory 0 are supported, at byte {self.pos - 1}' )
+		offset = self.expression()
+		if len( offset ) != 1 or offset[0][0] != 'i32.const':
+			raise DecodeError( f'expected a constant offset at byte {self.pos}' )
+		return Data( offset[0][1], self.bytes( self.unsigned() ) )  # type: ignore
+
+
+def decode( data: bytes ) -> WasmModule:
+	""" Decodes a module in the binary format """
+	reader = Reader( data )
+	if reader.bytes( 4 ) != MAGIC or reader.bytes( 4 ) != VERSION:
+		raise DecodeError( 'not a version 1 wasm module' )
+
+	module = WasmModule()
+	functionTypes: list[ int ] = []
+	lastId = 0
+	while not reader.done:
+		id, size = reader.byte(), reader.unsigned()
+		content = Reader( reader.bytes( size ) )
+		if id == SectionId.CUSTOM:
+			continue
+		if id <= lastId:
+			raise DecodeError( f'section {id} out of order' )
+		lastId = id
+
+		if id == SectionId.TYPE:
+			module.types = content.vector( content.functionType )
+		elif id == SectionId.IMPORT:
+			module.imports = content.vector( content.import_ )
+		elif id == SectionId.FUNCTION:
+			functionTypes = content.vector( content.unsigned )
+		elif id == SectionId.MEMORY:
+			module.memories = content.vector( content.memory )
+		elif id == SectionId.GLOBAL:
+			module.globals = content.vector( content.global_ )
+		elif id == SectionId.EXPORT:
+			module.exports = content.vector( content.export )
+		elif id == SectionId.CODE:
+			codes = content.vector( content.code )
+			if len( codes ) != len( functionTypes ):
+				raise DecodeError( 'function and code sections have different lengths' )
+			module.functions = [ Function( typ, locals, body ) for typ, ( locals, body ) in zip( functionTypes, codes ) ]
+		elif id == SectionId.DATA:
+			module.data = content.vector( content.data_ )
+		else:
+			raise DecodeError( f'unsupported section {id}' )
+		if not content.done:
+			raise DecodeError( f'section {id} size mismatch' )
+
+	if functionTypes and not module.functions:
+		raise DecodeError( 'function section without a code section' )
+	return module
@@ -0,0 +1,423 @@
+"""
+Lowers the AST to a WebAssembly module.
+
+INTEGER values are f64s, BOOLEAN ones are i32s, and STRING ones are i32 addresses of their data in
+the module's memory, prefixed by their length as a little endian u32. All the strings are literals,
+and equal literals share their address, so strings can be compared by address. Joining strings isn't supported,
+as it would need to allocate them at runtime.
+
+Top level subroutines become exported functions, and top level declarations with literal initializers
+become globals. `printto` calls are lowered to calls of the host functions imported from `endc`.
+"""
+from __future__ import annotations
+
+from typing import Final, NamedTuple, Optional
+
+from ast_ import stmt
+from ast_.expr import Visitor, Binary, Grouping, Literal, Unary, Variable, Call, Get, Expr
+from ast_.typeChecker import Type
+from token_ import Keyword, Token, UnaryType, Loc
+from .structure import ValType, ExternalKind, EMPTY, PAGE_SIZE, Instruction, FuncType, Import, Function, Global, \
+	Export, Data, WasmModule
+
+# module of the host functions
+HOST_MODULE: Final[ str ] = 'endc'
+# host function printing a value of each type, they take the handle and the value
+PRINTERS: Final[ dict[ Type, str ] ] = { Type.INTEGER: 'printNumber', Type.BOOLEAN: 'printBoolean', Type.STRING: 'printString' }
+# handles which can be printed to, as passed to the host functions
+HANDLES: Final[ dict[ str, int ] ] = { 'STDIN': 0, 'STDOUT': 1, 'STDERR': 2 }
+# strings are placed after this address, so that no string is at 0
+DATA_START: Final[ int ] = 8
+
+_VALTYPES: Final[ dict[ Type, ValType ] ] = { Type.INTEGER: ValType.F64, Type.BOOLEAN: ValType.I32, Type.STRING: ValType.I32 }
+_ARITHMETIC: Final[ dict[ object, str ] ] = {
+	UnaryType.ADD: 'f64.add',
+	UnaryType.SUBTRACT: 'f64.sub',
+	UnaryType.DIVIDE: 'f64.div',
+}
+_COMPARISON: Final[ dict[ object, str ] ] = {
+	UnaryType.GREATER: 'f64.gt',
+	UnaryType.GREATER_EQUAL: 'f64.ge',
+}
+
+
+class WasmError(Exception):
+	""" The program uses something the WASM backend doesn't support """
+	token: Optional[ Token ]
+	loc: Optional[ Loc ]
+	message: str
+
+	def __init__( self, token: Optional[Token], message: str, loc: Optional[Loc] = None ) -> None:
+		""" :param loc: where the error is, for the errors without a token, defaults to the token's location """
+		self.loc = token.loc if loc is None and token is not None else loc
+		super().__init__( f'Error: {message}' if self.loc is None else f'Error at {self.loc}: {message}' )
+		self.token = token
+		self.message = message
+
+
+class Binding(NamedTuple):
+	slot: int
+	type: Type
+	constant: bool
+	# whether slot is the index of a global or of a local
+	isGlobal: bool
+
+
+class Signature(NamedTuple):
+	slot: int
+	params: list[ Type ]
+	returns: Optional[ Type ]
+
+
+def typeOf( token: Token, name: str, what: str ) -> Type:
+	""" The type named by a type name, if values of it can be lowered """
+	try:
+		typ = Type( name )
+	except ValueError:
+		raise WasmError( token, f'{what} of type {name} are not supported by the WASM backend' ) from None
+	if typ not in _VALTYPES:
+		raise WasmError( token, f'{what} of type {name} are not supported by the WASM backend' )
+	return typ
+
+
+class Generator(Visitor[Type], stmt.Visitor[None]):
+	module: WasmModule
+	globals: dict[ str, Binding ]
+	subroutines: dict[ str, Signature ]
+	strings: dict[ str, int ]
+	data: bytearray
+	# state of the function being generated
+	function: Function
+	scopes: list[ dict[ str, Binding ] ]
+	returns: Optional[ Type ]
+	# locals used to compute modulos, allocated on first use
+	scratch: Optional[ tuple[ int, int ] ]
+
+	def __init__( self ) -> None:
+		self.module = WasmModule()
+		self.globals = {}
+		self.subroutines = {}
+		self.strings = {}
+		self.data = bytearray()
+		self.scopes = []
+		self.returns = None
+		self.scratch = None
+
+	def generate( self, ast: list[stmt.Stmt] ) -> WasmModule:
+		"""
+		Lowers a program
+		:raises WasmError: if the program uses something that can't be lowered
+		"""
+		for typ, printer in PRINTERS.items():
+			index = self.module.addType( FuncType( ( ValType.I32, _VALTYPES[ typ ] ), () ) )
+			self.module.imports.append( Import( HOST_MODULE, printer, index ) )
+
+		declarations: list[ stmt.Subroutine ] = []
+		for statement in ast:
+			if isinstance( statement, stmt.Subroutine ):
+				self.declareSubroutine( statement )
+				declarations.append( statement )
+			elif isinstance( statement, stmt.Declare ):
+				self.declareGlobal( statement )
+			else:
+				raise WasmError( self.tokenOf( statement ), 'only declarations are supported at the top level by the WASM backend' )
+
+		for declaration in declarations:
+			self.module.functions.append( self.subroutine( declaration ) )
+			name = str( declaration.name.value )
+			self.module.exports.append( Export( name, ExternalKind.FUNC, self.subroutines[ name ].slot ) )
+
+		if self.data:
+			self.module.data.append( Data( DATA_START, bytes( self.data ) ) )
+		self.module.memories.append( max( 1, -( -( DATA_START + len( self.data ) ) // PAGE_SIZE ) ) )
+		self.module.exports.append( Export( 'memory', ExternalKind.MEMORY, 0 ) )
+		return self.module
+
+	# declarations
+
+	def declareGlobal( self, declare: stmt.Declare ) -> None:
+		typ = typeOf( declare.name, declare.typ, 'variables' )
+		if not isinstance( declare.initializer, Literal ) or Type.ofValue( declare.initializer.value ) is not typ:
+			raise WasmError( declare.name, f'top level variables must be initialized with a {typ.value} literal by the WASM backend' )
+		name = str( declare.name.value )
+		self.globals[ name ] = Binding( len( self.module.globals ), typ, declare.constant, True )
+		self.module.globals.append( Global( _VALTYPES[ typ ], not declare.constant, self.constant( declare.initializer.value ), name ) )
+
+	def declareSubroutine( self, declaration: stmt.Subroutine ) -> None:
+		params = self.parameters( declaration )
+		returns = None if declaration.returns == Type.NOTHING.value else typeOf( declaration.name, declaration.returns, 'results' )
+		index = len( self.module.imports ) + len( self.subroutines )
+		self.subroutines[ str( declaration.name.value ) ] = Signature( index, [ typ for _, typ in params ], returns )
+
+	def parameters( self, declaration: stmt.Subroutine ) -> list[ tuple[ str, Type ] ]:
+		params = declaration.params
+		if declaration.name.value == 'main' and len( params ) == 1 and params[0].typ == f'{Type.STRING.value}()':
+			# argv is not available
+			params = []
+		return [ ( str( param.name.value ), typeOf( param.name, param.typ, 'parameters' ) ) for param in params ]
+
+	def subroutine( self, declaration: stmt.Subroutine ) -> Function:
+		signature = self.subroutines[ str( declaration.name.value ) ]
+		params = self.parameters( declaration )
+		typ = FuncType( tuple( _VALTYPES[ param ] for param in signature.params ), () if signature.returns is None else ( _VALTYPES[ signature.returns ], ) )
+		self.function = Function( self.module.addType( typ ), [], [], str( declaration.name.value ), [ name for name, _ in params ] )
+		self.scopes = [ { name: Binding( i, param, False, False ) for i, ( name, param ) in enumerate( params ) } ]
+		self.returns = signature.returns
+		self.scratch = None
+
+		statements = declaration.body.statements
+		self.block( statements )
+		if signature.returns is not None and not ( statements and isinstance( statements[-1], stmt.Return ) ):
+			if declaration.name.value == 'main' and signature.returns is Type.INTEGER:
+				# exit code 0, like the interpreter
+				self.emit( 'f64.const', 0.0 )
+			else:
+				# falling off the end of a subroutine which returns a value, it would return NOTHING
+				self.emit( 'unreachable' )
+		return self.function
+
+	# statements
+
+	def visitExpressionStmt( self, expression: stmt.Expression ) -> None:
+		self.discard( expression.expression.accept( self ) )
+
+	def visitDeclareStmt( self, declare: stmt.Declare ) -> None:
+		typ = typeOf( declare.name, declare.typ, 'variables' )
+		name = str( declare.name.value )
+		binding = Binding( len( self.function.localNames ), typ, declare.constant, False )
+		# nested blocks may declare a name again, each declaration gets its own local
+		count = sum( 1 for local in self.function.localNames if local == name or local.startswith( f'{name}.' ) )
+		self.function.localNames.append( name if count == 0 else f'{name}.{count}' )
+		self.function.locals.append( _VALTYPES[ typ ] )
+		if declare.initializer is not None:
+			self.expect( declare.initializer, typ, declare.name )
+			self.emit( 'local.set', binding.slot )
+		self.scopes[-1][ name ] = binding
+
+	def visitAssignStmt( self, assign: stmt.Assign ) -> None:
+		binding = self.resolve( assign.name )
+		if binding.constant:
+			raise WasmError( assign.name, f'Cannot assign to constant "{assign.name.value}"' )
+		self.expect( assign.value, binding.type, assign.name )
+		self.emit( 'global.set' if binding.isGlobal else 'local.set', binding.slot )
+
+	def visitIfStmt( self, if_: stmt.If ) -> None:
+		self.condition( if_.condition )
+		self.emit( 'if', EMPTY )
+		self.block( if_.thenBranch )
+		if if_.elseBranch:
+			self.emit( 'else' )
+			self.block( if_.elseBranch )
+		self.emit( 'end' )
+
+	def visitUntilStmt( self, until: stmt.Until ) -> None:
+		# the loop is exited by branching to the block around it
+		self.emit( 'block', EMPTY )
+		self.emit( 'loop', EMPTY )
+		if until.checkFirst:
+			self.condition( until.condition )
+			self.emit( 'br_if', 1 )
+			self.block( until.body )
+		else:
+			self.block( until.body )
+			self.condition( until.condition )
+			self.emit( 'br_if', 1 )
+		self.emit( 'br', 0 )
+		self.emit( 'end' )
+		self.emit( 'end' )
+
+	def visitReturnStmt( self, return_: stmt.Return ) -> None:
+		if return_.value is not None:
+			if self.returns is None:
+				raise WasmError( return_.keyword, 'Cannot return a value from a subroutine returning NoThInG' )
+			self.expect( return_.value, self.returns, return_.keyword )
+		elif self.returns is not None:
+			raise WasmError( return_.keyword, f'Expected a {self.returns.value} value to return' )
+		self.emit( 'return' )
+
+	def visitSubroutineStmt( self, subroutine: stmt.Subroutine ) -> None:
+		raise WasmError( subroutine.name, 'nested subroutines are not supported by the WASM backend' )
+
+	def visitSetStmt( self, set: stmt.Set ) -> None:
+		raise WasmError( set.name, 'templates are not supported by the WASM backend' )
+
+	def visitTemplateStmt( self, template: stmt.Template ) -> None:
+		raise WasmError( template.name, 'templates are not supported by the WASM backend' )
+
+	# expressions
+
+	def visitBinaryExpr( self, binary: Binary ) -> Type:
+		op = binary.operator.value
+		left = binary.left.accept( self )
+		right = binary.right.accept( self )
+
+		if op in ( Keyword.IS, UnaryType.BANG_IS ):
+			if left is not right or left is Type.NOTHING:
+				# values of different types are never equal, and NOTHING is always equal to itself
+				self.discard( right )
+				self.discard( left )
+				self.emit( 'i32.const', int( ( op is Keyword.IS ) == ( left is right ) ) )
+			else:
+				prefix = 'f64' if left is Type.INTEGER else 'i32'
+				self.emit( f'{prefix}.eq' if op is Keyword.IS else f'{prefix}.ne' )
+			return Type.BOOLEAN
+
+		if op is UnaryType.ADD and left is Type.STRING:
+			raise WasmError( binary.operator, 'joining strings is not supported by the WASM backend, strings can only be literals' )
+		if left is not Type.INTEGER or right is not Type.INTEGER:
+			raise WasmError( binary.operator, f'Operands must be two numbers, got {left.value} and {right.value}' )
+		if op in _ARITHMETIC:
+			self.emit( _ARITHMETIC[ op ] )
+			return Type.INTEGER
+		if op in _COMPARISON:
+			self.emit( _COMPARISON[ op ] )
+			return Type.BOOLEAN
+		if op is UnaryType.MODULO:
+			self.modulo()
+			return Type.INTEGER
+		raise WasmError( binary.operator, f'Unsupported operator {op}' )
+
+	def visitGroupingExpr( self, grouping: Grouping ) -> Type:
+		return grouping.expression.accept( self )
+
+	def visitLiteralExpr( self, literal: Literal ) -> Type:
+		# NOTHING has no value on the stack
+		if literal.value is not None:
+			self.emit( *self.constant( literal.value ) )
+		return Type.ofValue( literal.value )  # type: ignore
+
+	def visitUnaryExpr( self, unary: Unary ) -> Type:
+		typ = unary.right.accept( self )
+		if unary.operator.value is UnaryType.SUBTRACT:
+			if typ is not Type.INTEGER:
+				raise WasmError( unary.operator, 'Operand must be a number' )
+			self.emit( 'f64.neg' )
+			return Type.INTEGER
+		if unary.operator.value is UnaryType.BANG:
+			self.truthy( typ )
+			self.emit( 'i32.eqz' )
+			return Type.BOOLEAN
+		raise WasmError( unary.operator, f'Unsupported operator {unary.operator.value}' )
+
+	def visitVariableExpr( self, variable: Variable ) -> Type:
+		binding = self.resolve( variable.name )
+		self.emit( 'global.get' if binding.isGlobal else 'local.get', binding.slot )
+		return binding.type
+
+	def visitCallExpr( self, call: Call ) -> Type:
+		if not isinstance( call.callee, Variable ) or call.keyword.value is Keyword.BUILD:
+			raise WasmError( call.keyword, 'only calls of subroutines by name are supported by the WASM backend' )
+		name = str( call.callee.name.value )
+		if name == 'printto' and name not in self.subroutines:
+			return self.printto( call )
+		if name not in self.subroutines:
+			raise WasmError( call.callee.name, f'Undefined subroutine "{name}"' )
+
+		signature = self.subroutines[ name ]
+		if len( call.arguments ) != len( signature.params ):
+			raise WasmError( call.keyword, f'Expected {len( signature.params )} arguments but got {len( call.arguments )}' )
+		for argument, typ in zip( call.arguments, signature.params ):
+			self.expect( argument, typ, call.keyword )
+		self.emit( 'call', signature.slot )
+		return Type.NOTHING if signature.returns is None else signature.returns
+
+	def visitGetExpr( self, get: Get ) -> Type:
+		raise WasmError( get.name, 'templates are not supported by the WASM backend' )
+
+	# helper methods
+
+	def emit( self, *instr: object ) -> None:
+		self.function.body.append( instr )
+
+	def block( self, statements: list[stmt.Stmt] ) -> None:
+		self.scopes.append( {} )
+		for statement in statements:
+			statement.accept( self )
+		self.scopes.pop()
+
+	def resolve( self, name: Token ) -> Binding:
+		key = str( name.value )
+		for scope in reversed( self.scopes ):
+			if key in scope:
+				return scope[ key ]
+		if key in self.globals:
+			return self.globals[ key ]
+		raise WasmError( name, f'Undefined variable "{key}"' )
+
+	def expect( self, expr: Expr, typ: Type, token: Token ) -> None:
+		""" Lowers an expression which must be of the given type """
+		actual = expr.accept( self )
+		if actual is not typ:
+			raise WasmError( token, f'Expected a {typ.value} value, got {actual.value}' )
+
+	def condition( self, expr: Expr ) -> None:
+		self.truthy( expr.accept( self ) )
+
+	def truthy( self, typ: Type ) -> None:
+		""" Converts the value on the stack to a boolean """
+		if typ is not Type.BOOLEAN:
+			# only booleans and NOTHING can be falsy
+			self.discard( typ )
+			self.emit( 'i32.const', int( typ is not Type.NOTHING ) )
+
+	def discard( self, typ: Type ) -> None:
+		""" Drops the value of the given type on the stack """
+		if typ is not Type.NOTHING:
+			self.emit( 'drop' )
+
+	def modulo( self ) -> None:
+		""" Floored modulo of the two numbers on the stack: `left - floor( left / right ) * right` """
+		if self.scratch is None:
+			start = len( self.function.localNames )
+			self.function.locals += [ ValType.F64, ValType.F64 ]
+			self.function.localNames += [ 'left.', 'right.' ]
+			self.scratch = ( start, start + 1 )
+		left, right = self.scratch
+		for instr in (
+			( 'local.set', right ), ( 'local.tee', left ), ( 'local.get', left ), ( 'local.get', right ),
+			( 'f64.div', ), ( 'f64.floor', ), ( 'local.get', right ), ( 'f64.mul', ), ( 'f64.sub', )
+		):
+			self.emit( *instr )
+
+	def printto( self, call: Call ) -> Type:
+		handle = call.arguments[0] if call.arguments else None
+		if not isinstance( handle, Variable ) or handle.name.value not in HANDLES or self.isDeclared( str( handle.name.value ) ):
+			raise WasmError( call.keyword, 'printto must be called with STDOUT or STDERR by the WASM backend' )
+		for argument in call.arguments[ 1: ]:
+			self.emit( 'i32.const', HANDLES[ str( handle.name.value ) ] )
+			typ = argument.accept( self )
+			if typ not in PRINTERS:
+				raise WasmError( call.keyword, f'Cannot print a {typ.value} value' )
+			self.emit( 'call', list( PRINTERS ).index( typ ) )
+		return Type.NOTHING
+
+	def isDeclared( self, name: str ) -> bool:
+		return name in self.globals or any( name in scope for scope in self.scopes )
+
+	def constant( self, value: object ) -> Instruction:
+		""" The instruction pushing a literal value """
+		if isinstance( value, bool ):
+			return 'i32.const', int( value )
+		if isinstance( value, float ):
+			return 'f64.const', value
+		return 'i32.const', self.string( str( value ) )
+
+	def string( self, text: str ) -> int:
+		""" The address of a string literal, placing it in the data segment if needed """
+		if text not in self.strings:
+			data = text.encode( 'utf8' )
+			self.strings[ text ] = DATA_START + len( self.data )
+			self.data += len( data ).to_bytes( 4, 'little' ) + data
+			# keep the lengths aligned
+			self.data += bytes( -len( self.data ) % 4 )
+		return self.strings[ text ]
+
+	def tokenOf( self, node: object ) -> Optional[Token]:
+		""" A token to report errors at for a node without one """
+		for field in vars( node ).values():
+			for child in field if isinstance( field, list ) else [ field ]:
+				if isinstance( child, Token ):
+					return child
+				if isinstance( child, ( Expr, stmt.Stmt ) ) and ( token := self.tokenOf( child ) ) is not None:
+					return token
+		return None
@@ -0,0 +1,46 @@
+"""
+Host functions imported by the modules generated by the WASM backend, for the built-in machine.
+"""
+from __future__ import annotations
+
+import sys
+from typing import TextIO
+
+from backend.interpreter.runtime import toText
+from .generator import HOST_MODULE
+from .vm import HostFunction, Machine, Trap
+
+
+def handle( index: int ) -> TextIO:
+	if index == 1:
+		return sys.stdout
+	if index == 2:
+		return sys.stderr
+	raise Trap( f'cannot print to handle {index}' )
+
+
+def readString( machine: Machine, address: int ) -> str:
+	""" Reads a string placed in the memory by the generator, prefixed by its length """
+	length = int.from_bytes( machine.memory[ address : address + 4 ], 'little' )
+	return machine.memory[ address + 4 : address + 4 + length ].decode( 'utf8' )
+
+
+def printNumber( machine: Machine, index: int, value: float ) -> None:
+	handle( index ).write( toText( value ) )
+
+
+def printBoolean( machine: Machine, index: int, value: int ) -> None:
+	handle( index ).write( toText( bool( value ) ) )
+
+
+def printString( machine: Machine, index: int, address: int ) -> None:
+	handle( index ).write( readString( machine, address ) )
+
+
+def createImports() -> dict[ tuple[str, str], HostFunction ]:
+	""" Creates the imports of a generated module """
+	return {
+		( HOST_MODULE, 'printNumber' ): printNumber,
+		( HOST_MODULE, 'printBoolean' ): printBoolean,
+		( HOST_MODULE, 'printString' ): printString,
+	}
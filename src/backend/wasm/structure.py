@@ -0,0 +1,185 @@
+"""
+In-memory representation of a WebAssembly module.
+
+Instructions are tuples of their name and immediates, like `( 'local.get', 0 )`.
+The `end` closing a function body or a constant expression is implicit, it's added by the encoder.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Final, NamedTuple, Optional, Union
+
+
+class ValType(IntEnum):
+	I32 = 0x7F
+	I64 = 0x7E
+	F32 = 0x7D
+	F64 = 0x7C
+
+	@property
+	def text( self ) -> str:
+		return self.name.lower()
+
+
+class ExternalKind(IntEnum):
+	FUNC = 0x00
+	TABLE = 0x01
+	MEMORY = 0x02
+	GLOBAL = 0x03
+
+	@property
+	def text( self ) -> str:
+		return self.name.lower()
+
+
+# block type of blocks without results, blocks with a result use the result's ValType
+EMPTY: Final[ int ] = 0x40
+# bytes in a page of linear memory
+PAGE_SIZE: Final[ int ] = 65536
+
+BlockType = Union[ ValType, int ]
+Instruction = tuple[ object, ... ]
+
+
+class Op(NamedTuple):
+	code: int
+	# kind of the immediate: 'blocktype', 'index', 'i32', 'f64' or None
+	immediate: Optional[ str ] = None
+
+
+OPCODES: Final[ dict[ str, Op ] ] = {
+	'unreachable': Op( 0x00 ),
+	'nop': Op( 0x01 ),
+	'block': Op( 0x02, 'blocktype' ),
+	'loop': Op( 0x03, 'blocktype' ),
+	'if': Op( 0x04, 'blocktype' ),
+	'else': Op( 0x05 ),
+	'end': Op( 0x0B ),
+	'br': Op( 0x0C, 'index' ),
+	'br_if': Op( 0x0D, 'index' ),
+	'return': Op( 0x0F ),
+	'call': Op( 0x10, 'index' ),
+	'drop': Op( 0x1A ),
+	'select': Op( 0x1B ),
+	'local.get': Op( 0x20, 'index' ),
+	'local.set': Op( 0x21, 'index' ),
+	'local.tee': Op( 0x22, 'index' ),
+	'global.get': Op( 0x23, 'index' ),
+	'global.set': Op( 0x24, 'index' ),
+	'i32.const': Op( 0x41, 'i32' ),
+	'f64.const': Op( 0x44, 'f64' ),
+	'i32.eqz': Op( 0x45 ),
+	'i32.eq': Op( 0x46 ),
+	'i32.ne': Op( 0x47 ),
+	'f64.eq': Op( 0x61 ),
+	'f64.ne': Op( 0x62 ),
+	'f64.lt': Op( 0x63 ),
+	'f64.gt': Op( 0x64 ),
+	'f64.le': Op( 0x65 ),
+	'f64.ge': Op( 0x66 ),
+	'i32.add': Op( 0x6A ),
+	'i32.sub': Op( 0x6B ),
+	'i32.mul': Op( 0x6C ),
+	'i32.and': Op( 0x71 ),
+	'i32.or': Op( 0x72 ),
+	'i32.xor': Op( 0x73 ),
+	'f64.abs': Op( 0x99 ),
+	'f64.neg': Op( 0x9A ),
+	'f64.ceil': Op( 0x9B ),
+	'f64.floor': Op( 0x9C ),
+	'f64.trunc': Op( 0x9D ),
+	'f64.nearest': Op( 0x9E ),
+	'f64.sqrt': Op( 0x9F ),
+	'f64.add': Op( 0xA0 ),
+	'f64.sub': Op( 0xA1 ),
+	'f64.mul': Op( 0xA2 ),
+	'f64.div': Op( 0xA3 ),
+	'f64.min': Op( 0xA4 ),
+	'f64.max': Op( 0xA5 ),
+	'i32.trunc_f64_s': Op( 0xAA ),
+	'f64.convert_i32_s': Op( 0xB7 ),
+}
+OPNAMES: Final[ dict[ int, str ] ] = { op.code: name for name, op in OPCODES.items() }
+
+
+@dataclass( frozen=True )
+class FuncType:
+	params: tuple[ ValType, ... ]
+	results: tuple[ ValType, ... ]
+
+
+@dataclass
+class Import:
+	""" An imported function """
+	module: str
+	name: str
+	type: int
+
+
+@dataclass
+class Function:
+	type: int
+	locals: list[ ValType ]
+	body: list[ Instruction ]
+	# names of the function and of its params and locals, for the text format
+	name: str = field( default='', compare=False )
+	localNames: list[ str ] = field( default_factory=list, compare=False )
+
+
+@dataclass
+class Global:
+	type: ValType
+	mutable: bool
+	# a single constant instruction
+	init: Instruction
+	name: str = field( default='', compare=False )
+
+
+@dataclass
+class Export:
+	name: str
+	kind: ExternalKind
+	index: int
+
+
+@dataclass
+class Data:
+	""" A segment of bytes copied into the memory at instantiation """
+	offset: int
+	data: bytes
+
+
+@dataclass
+class WasmModule:
+	types: list[ FuncType ] = field( default_factory=list )
+	imports: list[ Import ] = field( default_factory=list )
+	functions: list[ Function ] = field( default_factory=list )
+	# minimum size of each memory, in pages
+	memories: list[ int ] = field( default_factory=list )
+	globals: list[ Global ] = field( default_factory=list )
+	exports: list[ Export ] = field( default_factory=list )
+	data: list[ Data ] = field( default_factory=list )
+
+	def addType( self, typ: FuncType ) -> int:
+		""" Returns the index of a function type, adding it if needed """
+		if typ not in self.types:
+			self.types.append( typ )
+		return self.types.index( typ )
+
+	def functionType( self, index: int ) -> FuncType:
+		""" The type of a function, imported functions come first in the index space """
+		if index < len( self.imports ):
+			return self.types[ self.imports[ index ].type ]
+		return self.types[ self.functions[ index - len( self.imports ) ].type ]
+
+	def functionName( self, index: int ) -> str:
+		if index < len( self.imports ):
+			return self.imports[ index ].name
+		return self.functions[ index - len( self.imports ) ].name
+
+	def export( self, name: str ) -> Export:
+		for export in self.exports:
+			if export.name == name:
+				return export
+		raise KeyError( name )
@@ -0,0 +1,254 @@
+"""
+Validation of modules, following the algorithm in the appendix of the spec.
+
+https://webassembly.github.io/spec/core/appendix/algorithm.html
+"""
+from __future__ import annotations
+
+from typing import Final, Optional
+
+from .structure import ValType, ExternalKind, EMPTY, PAGE_SIZE, OPCODES, BlockType, Instruction, Function, WasmModule
+
+I32, F64 = ValType.I32, ValType.F64
+
+# operand and result types of the instructions without immediates that only operate on the stack
+_SIGNATURES: Final[ dict[ str, tuple[ tuple[ValType, ...], tuple[ValType, ...] ] ] ] = {
+	'nop': ( (), () ),
+	'i32.eqz': ( ( I32, ), ( I32, ) ),
+	**{ f'i32.{op}': ( ( I32, I32 ), ( I32, ) ) for op in ( 'eq', 'ne', 'add', 'sub', 'mul', 'and', 'or', 'xor' ) },
+	**{ f'f64.{op}': ( ( F64, F64 ), ( I32, ) ) for op in ( 'eq', 'ne', 'lt', 'gt', 'le', 'ge' ) },
+	**{ f'f64.{op}': ( ( F64, F64 ), ( F64, ) ) for op in ( 'add', 'sub', 'mul', 'div', 'min', 'max' ) },
+	**{ f'f64.{op}': ( ( F64, ), ( F64, ) ) for op in ( 'abs', 'neg', 'ceil', 'floor', 'trunc', 'nearest', 'sqrt' ) },
+	'i32.trunc_f64_s': ( ( F64, ), ( I32, ) ),
+	'f64.convert_i32_s': ( ( I32, ), ( F64, ) ),
+}
+
+
+class ValidationError(Exception):
+	pass
+
+
+class Frame:
+	""" A control frame, one for the function body and one for each block, loop and if """
+	opcode: str
+	results: tuple[ ValType, ... ]
+	height: int
+	unreachable: bool
+
+	def __init__( self, opcode: str, results: tuple[ValType, ...], height: int ) -> None:
+		self.opcode = opcode
+		self.results = results
+		self.height = height
+		self.unreachable = False
+
+	@property
+	def labelTypes( self ) -> tuple[ ValType, ... ]:
+		# branching to a loop jumps to its start, which takes no values as block types have no params
+		return () if self.opcode == 'loop' else self.results
+
+
+class FunctionValidator:
+	module: WasmModule
+	locals: list[ ValType ]
+	results: tuple[ ValType, ... ]
+	# None is an unknown type, produced in unreachable code
+	operands: list[ Optional[ValType] ]
+	frames: list[ Frame ]
+	where: str
+
+	def __init__( self, module: WasmModule, function: Function, index: int ) -> None:
+		typ = module.types[ function.type ]
+		self.module = module
+		self.locals = list( typ.params ) + function.locals
+		self.results = typ.results
+		self.operands = []
+		self.frames = []
+		self.where = f'function {function.name or index}'
+
+	def error( self, message: str ) -> ValidationError:
+		return ValidationError( f'{self.where}: {message}' )
+
+	def push( self, typ: Optional[ValType] ) -> None:
+		self.operands.append( typ )
+
+	def pop( self, expected: Optional[ValType] = None ) -> Optional[ValType]:
+		frame = self.frames[-1]
+		if len( self.operands ) == frame.height:
+			if frame.unreachable:
+				return expected
+			raise self.error( f'expected {expected.text if expected else "a value"} but the stack is empty' )
+		actual = self.operands.pop()
+		if actual is not None and expected is not None and actual != expected:
+			raise self.error( f'expected {expected.text} but got {actual.text}' )
+		return actual if actual is not None else expected
+
+	def popAll( self, types: tuple[ValType, ...] ) -> None:
+		for typ in reversed( types ):
+			self.pop( typ )
+
+	def pushFrame( self, opcode: str, results: tuple[ValType, ...] ) -> None:
+		self.frames.append( Frame( opcode, results, len( self.operands ) ) )
+
+	def popFrame( self ) -> Frame:
+		if not self.frames:
+			raise self.error( 'unbalanced end' )
+		frame = self.frames[-1]
+		self.popAll( frame.results )
+		if len( self.operands ) != frame.height:
+			raise self.error( f'{len( self.operands ) - frame.height} values left on the stack at the end of a {frame.opcode}' )
+		return self.frames.pop()
+
+	def unreachable( self ) -> None:
+		del self.operands[ self.frames[-1].height : ]
+		self.frames[-1].unreachable = True
+
+	def label( self, depth: int ) -> Frame:
+		if depth >= len( self.frames ):
+			raise self.error( f'branch depth {depth} out of range' )
+		return self.frames[ -1 - depth ]
+
+	def blockResults( self, blockType: BlockType ) -> tuple[ ValType, ... ]:
+		if blockType == EMPTY:
+			return ()
+		try:
+			return ValType( blockType ),
+		except ValueError:
+			raise self.error( f'invalid block type {blockType}' ) from None
+
+	def local( self, index: int ) -> ValType:
+		if index >= len( self.locals ):
+			raise self.error( f'local {index} out of range' )
+		return self.locals[ index ]
+
+	def global_( self, index: int ) -> ValType:
+		if index >= len( self.module.globals ):
+			raise self.error( f'global {index} out of range' )
+		return self.module.globals[ index ].type
+
+	def validate( self, body: list[Instruction] ) -> None:
+		self.pushFrame( 'function', self.results )
+		for instr in body:
+			self.instruction( instr )
+		if len( self.frames ) > 1:
+			raise self.error( f'{len( self.frames ) - 1} blocks are not closed' )
+		self.popFrame()
+
+	def instruction( self, instr: Instruction ) -> None:
+		op = str( instr[0] )
+		if op not in OPCODES:
+			raise self.error( f'unknown instruction {op}' )
+		if op in _SIGNATURES:
+			params, results = _SIGNATURES[ op ]
+			self.popAll( params )
+			for typ in results:
+				self.push( typ )
+		elif op == 'unreachable':
+			self.unreachable()
+		elif op in ( 'block', 'loop', 'if' ):
+			if op == 'if':
+				self.pop( I32 )
+			self.pushFrame( op, self.blockResults( instr[1] ) )  # type: ignore
+		elif op == 'else':
+			frame = self.popFrame()
+			if frame.opcode != 'if':
+				raise self.error( 'else without if' )
+			self.pushFrame( 'else', frame.results )
+		elif op == 'end':
+			frame = self.popFrame()
+			if not self.frames:
+				raise self.error( 'end closes the function body' )
+			if frame.opcode == 'if' and frame.results:
+				raise self.error( 'if with a result must have an else' )
+			for typ in frame.results:
+				self.push( typ )
+		elif op == 'br':
+			self.popAll( self.label( instr[1] ).labelTypes )  # type: ignore
+			self.unreachable()
+		elif op == 'br_if':
+			self.pop( I32 )
+			types = self.label( instr[1] ).labelTypes  # type: ignore
+			self.popAll( types )
+			for typ in types:
+				self.push( typ )
+		elif op == 'return':
+			self.popAll( self.results )
+			self.unreachable()
+		elif op == 'call':
+			index: int = instr[1]  # type: ignore
+			if index >= len( self.module.imports ) + len( self.module.functions ):
+				raise self.error( f'function {index} out of range' )
+			typ = self.module.functionType( index )
+			self.popAll( typ.params )
+			for result in typ.results:
+				self.push( result )
+		elif op == 'drop':
+			self.pop()
+		elif op == 'select':
+			self.pop( I32 )
+			first = self.pop()
+			second = self.pop( first )
+			self.push( first or second )
+		elif op == 'local.get':
+			self.push( self.local( instr[1] ) )  # type: ignore
+		elif op in ( 'local.set', 'local.tee' ):
+			typ = self.local( instr[1] )  # type: ignore
+			self.pop( typ )
+			if op == 'local.tee':
+				self.push( typ )
+		elif op == 'global.get':
+			self.push( self.global_( instr[1] ) )  # type: ignore
+		elif op == 'global.set':
+			typ = self.global_( instr[1] )  # type: ignore
+			if not self.module.globals[ instr[1] ].mutable:  # type: ignore
+				raise self.error( f'global {instr[1]} is immutable' )
+			self.pop( typ )
+		elif op == 'i32.const':
+			if not -2 ** 31 <= instr[1] < 2 ** 32:  # type: ignore
+				raise self.error( f'i32 constant {instr[1]} out of range' )
+			self.push( I32 )
+		elif op == 'f64.const':
+			self.push( F64 )
+		else:
+			raise self.error( f'unsupported instruction {op}' )
+
+
+def validate( module: WasmModule ) -> None:
+	"""
+	Checks that a module is well-formed and its functions are well-typed
+	:raises ValidationError: describing the first problem found
+	"""
+	for imp in module.imports:
+		if imp.type >= len( module.types ):
+			raise ValidationError( f'import {imp.module}.{imp.name}: type {imp.type} out of range' )
+	for i, function in enumerate( module.functions ):
+		if function.type >= len( module.types ):
+			raise ValidationError( f'function {function.name or i}: type {function.type} out of range' )
+	if len( module.memories ) > 1:
+		raise ValidationError( 'multiple memories' )
+	for glob in module.globals:
+		op = f'{glob.type.text}.const'
+		if glob.init[0] != op:
+			raise ValidationError( f'global {glob.name}: the initializer must be a {op} instruction' )
+
+	counts = {
+		ExternalKind.FUNC: len( module.imports ) + len( module.functions ),
+		ExternalKind.TABLE: 0,
+		ExternalKind.MEMORY: len( module.memories ),
+		ExternalKind.GLOBAL: len( module.globals ),
+	}
+	names: set[ str ] = set()
+	for export in module.exports:
+		if export.name in names:
+			raise ValidationError( f'duplicate export "{export.name}"' )
+		names.add( export.name )
+		if export.index >= counts[ export.kind ]:
+			raise ValidationError( f'export "{export.name}": {export.kind.text} {export.index} out of range' )
+
+	for data in module.data:
+		if not module.memories:
+			raise ValidationError( 'data segment without a memory' )
+		if data.offset + len( data.data ) > module.memories[0] * PAGE_SIZE:
+			raise ValidationError( f'data segment at {data.offset} does not fit in the memory' )
+
+	for i, function in enumerate( module.functions ):
+		FunctionValidator( module, function, len( module.imports ) + i ).validate( function.body )
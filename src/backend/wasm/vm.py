@@ -0,0 +1,237 @@
+"""
+A small stack machine running validated modules, so that tests don't need an external runtime.
+
+https://webassembly.github.io/spec/core/exec/index.html
+"""
+from __future__ import annotations
+
+import math
+import operator
+from typing import Any, Callable, Final
+
+from .structure import ValType, ExternalKind, EMPTY, PAGE_SIZE, Instruction, Function, WasmModule
+
+# host functions get the machine, to access its memory, and the arguments of the call
+HostFunction = Callable[ ..., Any ]
+
+
+class Trap(Exception):
+	""" A runtime error of the executed code """
+	pass
+
+
+def i32( value: int ) -> int:
+	""" Wraps an integer to a signed 32 bits one """
+	value &= 0xFFFFFFFF
+	return value - 0x100000000 if value & 0x80000000 else value
+
+
+def fdiv( left: float, right: float ) -> float:
+	if right != 0.0:
+		return left / right
+	if left == 0.0 or math.isnan( left ):
+		return math.nan
+	return math.copysign( math.inf, left ) * math.copysign( 1.0, right )
+
+
+def fmin( left: float, right: float ) -> float:
+	return math.nan if math.isnan( left ) or math.isnan( right ) else min( left, right )
+
+
+def fmax( left: float, right: float ) -> float:
+	return math.nan if math.isnan( left ) or math.isnan( right ) else max( left, right )
+
+
+def truncate( value: float ) -> int:
+	if math.isnan( value ) or math.isinf( value ) or not -2 ** 31 <= math.trunc( value ) < 2 ** 31:
+		raise Trap( 'integer overflow' )
+	return math.trunc( value )
+
+
+_UNARY: Final[ dict[ str, Callable[ [Any], Any ] ] ] = {
+	'i32.eqz': lambda x: int( x == 0 ),
+	'f64.abs': abs,
+	'f64.neg': operator.neg,
+	'f64.ceil': lambda x: float( math.ceil( x ) ) if math.isfinite( x ) else x,
+	'f64.floor': lambda x: float( math.floor( x ) ) if math.isfinite( x ) else x,
+	'f64.trunc': lambda x: float( math.trunc( x ) ) if math.isfinite( x ) else x,
+	'f64.nearest': lambda x: float( round( x ) ) if math.isfinite( x ) else x,
+	'f64.sqrt': lambda x: math.sqrt( x ) if x >= 0 else math.nan,
+	'i32.trunc_f64_s': truncate,
+	'f64.convert_i32_s': float,
+}
+_BINARY: Final[ dict[ str, Callable[ [Any, Any], Any ] ] ] = {
+	'i32.eq': lambda x, y: int( x == y ),
+	'i32.ne': lambda x, y: int( x != y ),
+	'i32.add': lambda x, y: i32( x + y ),
+	'i32.sub': lambda x, y: i32( x - y ),
+	'i32.mul': lambda x, y: i32( x * y ),
+	'i32.and': operator.and_,
+	'i32.or': operator.or_,
+	'i32.xor': operator.xor,
+	'f64.eq': lambda x, y: int( x == y ),
+	'f64.ne': lambda x, y: int( x != y ),
+	'f64.lt': lambda x, y: int( x < y ),
+	'f64.gt': lambda x, y: int( x > y ),
+	'f64.le': lambda x, y: int( x <= y ),
+	'f64.ge': lambda x, y: int( x >= y ),
+	'f64.add': operator.add,
+	'f64.sub': operator.sub,
+	'f64.mul': operator.mul,
+	'f64.div': fdiv,
+	'f64.min': fmin,
+	'f64.max': fmax,
+}
+_ZERO: Final[ dict[ ValType, object ] ] = { ValType.I32: 0, ValType.I64: 0, ValType.F32: 0.0, ValType.F64: 0.0 }
+
+
+class Code:
+	""" A function prepared for execution, with the targets of its structured instructions resolved """
+	function: Function
+	arity: int
+	# position of each block, loop and if -> position of its end
+	ends: dict[ int, int ]
+	# position of each if with an else -> position of the else
+	elses: dict[ int, int ]
+
+	def __init__( self, function: Function, arity: int ) -> None:
+		self.function = function
+		self.arity = arity
+		self.ends = {}
+		self.elses = {}
+		opened: list[ int ] = []
+		for pc, instr in enumerate( function.body ):
+			if instr[0] in ( 'block', 'loop', 'if' ):
+				opened.append( pc )
+			elif instr[0] == 'else':
+				self.elses[ opened[-1] ] = pc
+				self.ends[ pc ] = -1  # patched below, else jumps to the end of its if
+			elif instr[0] == 'end':
+				start = opened.pop()
+				self.ends[ start ] = pc
+				if start in self.elses:
+					self.ends[ self.elses[ start ] ] = pc
+
+
+class Machine:
+	""" An instance of a module """
+	module: WasmModule
+	memory: bytearray
+	globals: list[ object ]
+	depth: int
+	_hosts: list[ HostFunction ]
+	_codes: list[ Code ]
+
+	# maximum nesting of calls, deeper calls trap like a stack overflow would
+	MAX_DEPTH: Final[ int ] = 200
+
+	def __init__( self, module: WasmModule, imports: dict[ tuple[str, str], HostFunction ] ) -> None:
+		"""
+		:param module: a validated module
+		:param imports: the host function for each (module, name) imported by the module
+		"""
+		self.module = module
+		self._hosts = []
+		for imp in module.imports:
+			if ( imp.module, imp.name ) not in imports:
+				raise Trap( f'unresolved import {imp.module}.{imp.name}' )
+			self._hosts.append( imports[ ( imp.module, imp.name ) ] )
+		self._codes = [ Code( function, len( module.types[ function.type ].results ) ) for function in module.functions ]
+		self.globals = [ glob.init[1] for glob in module.globals ]
+		self.memory = bytearray( module.memories[0] * PAGE_SIZE if module.memories else 0 )
+		for data in module.data:
+			self.memory[ data.offset : data.offset + len( data.data ) ] = data.data
+		self.depth = 0
+
+	def invoke( self, name: str, *arguments: object ) -> list[object]:
+		""" Calls an exported function """
+		export = self.module.export( name )
+		if export.kind is not ExternalKind.FUNC:
+			raise KeyError( f'"{name}" is not a function' )
+		return self.call( export.index, list( arguments ) )
+
+	def call( self, index: int, arguments: list[object] ) -> list[object]:
+		if index < len( self._hosts ):
+			result = self._hosts[ index ]( self, *arguments )
+			return [] if result is None else [ result ]
+
+		if self.depth == self.MAX_DEPTH:
+			raise Trap( 'call stack exhausted' )
+		self.depth += 1
+		try:
+			return self.execute( self._codes[ index - len( self._hosts ) ], arguments )
+		finally:
+			self.depth -= 1
+
+	def execute( self, code: Code, arguments: list[object] ) -> list[object]:
+		body = code.function.body
+		locals = arguments + [ _ZERO[ typ ] for typ in code.function.locals ]
+		stack: list[ Any ] = []
+		# branch target, stack height and arity of each entered block
+		labels: list[ tuple[ int, int, int ] ] = []
+		pc = 0
+		while pc < len( body ):
+			instr: Instruction = body[ pc ]
+			op = instr[0]
+			if op in _BINARY:
+				right = stack.pop()
+				stack[-1] = _BINARY[ op ]( stack[-1], right )  # type: ignore
+			elif op in _UNARY:
+				stack[-1] = _UNARY[ op ]( stack[-1] )  # type: ignore
+			elif op == 'local.get':
+				stack.append( locals[ instr[1] ] )  # type: ignore
+			elif op == 'local.set':
+				locals[ instr[1] ] = stack.pop()  # type: ignore
+			elif op == 'local.tee':
+				locals[ instr[1] ] = stack[-1]  # type: ignore
+			elif op == 'global.get':
+				stack.append( self.globals[ instr[1] ] )  # type: ignore
+			elif op == 'global.set':
+				self.globals[ instr[1] ] = stack.pop()  # type: ignore
+			elif op in ( 'i32.const', 'f64.const' ):
+				stack.append( instr[1] )
+			elif op == 'block':
+				labels.append( ( code.ends[ pc ] + 1, len( stack ), 0 if instr[1] == EMPTY else 1 ) )
+			elif op == 'loop':
+				# branching to a loop re-enters it
+				labels.append( ( pc, len( stack ), 0 ) )
+			elif op == 'if':
+				labels.append( ( code.ends[ pc ] + 1, len( stack ) - 1, 0 if instr[1] == EMPTY else 1 ) )
+				if not stack.pop():
+					# to the else branch, or to the end popping the label
+					pc = code.elses[ pc ] if pc in code.elses else code.ends[ pc ] - 1
+			elif op == 'else':
+				# end of the then branch
+				pc = code.ends[ pc ] - 1
+			elif op == 'end':
+				labels.pop()
+			elif op in ( 'br', 'br_if' ):
+				if op == 'br' or stack.pop():
+					if instr[1] == len( labels ):
+						# the label of the function body
+						return stack[ len( stack ) - code.arity : ] if code.arity else []
+					target, height, arity = labels[ -1 - instr[1] ]  # type: ignore
+					del labels[ len( labels ) - 1 - instr[1] : ]  # type: ignore
+					stack[ height : ] = stack[ len( stack ) - arity : ] if arity else []
+					pc = target
+					continue
+			elif op == 'call':
+				index: int = instr[1]  # type: ignore
+				count = len( self.module.functionType( index ).params )
+				arguments = stack[ len( stack ) - count : ]
+				del stack[ len( stack ) - count : ]
+				stack += self.call( index, arguments )
+			elif op == 'return':
+				return stack[ len( stack ) - code.arity : ] if code.arity else []
+			elif op == 'drop':
+				stack.pop()
+			elif op == 'select':
+				condition, second = stack.pop(), stack.pop()
+				if not condition:
+					stack[-1] = second
+			elif op == 'unreachable':
+				raise Trap( 'unreachable executed' )
+			elif op != 'nop':
+				raise Trap( f'unsupported instruction {op}' )
+			pc += 1
+		return stack[ len( stack ) - code.arity : ] if code.arity else []
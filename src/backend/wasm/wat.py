@@ -0,0 +1,117 @@
+"""
+Prints modules in the WebAssembly text format.
+
+https://webassembly.github.io/spec/core/text/index.html
+"""
+from __future__ import annotations
+
+import math
+
+from .structure import ValType, ExternalKind, EMPTY, OPCODES, Instruction, FuncType, Function, Global, WasmModule
+
+
+def identifier( name: str, index: int ) -> str:
+	""" The symbolic name of an index, or the index itself for unnamed items """
+	return f'${name}' if name else str( index )
+
+
+def string( data: bytes ) -> str:
+	return '"' + ''.join( chr( byte ) if 0x20 <= byte < 0x7F and byte not in b'"\\' else f'\\{byte:02x}' for byte in data ) + '"'
+
+
+def number( value: float ) -> str:
+	if math.isnan( value ):
+		return 'nan'
+	if math.isinf( value ):
+		return 'inf' if value > 0 else '-inf'
+	return repr( value )
+
+
+def signature( typ: FuncType, paramNames: list[str] = [] ) -> str:
+	parts = [
+		f'(param ${paramNames[ i ]} {param.text})' if i < len( paramNames ) and paramNames[ i ] else f'(param {param.text})'
+		for i, param in enumerate( typ.params )
+	]
+	parts += [ f'(result {result.text})' for result in typ.results ]
+	# with a leading space, to follow the keyword it's printed after
+	return ''.join( f' {part}' for part in parts )
+
+
+class Printer:
+	module: WasmModule
+	lines: list[ str ]
+
+	def __init__( self, module: WasmModule ) -> None:
+		self.module = module
+		self.lines = []
+
+	def print( self ) -> str:
+		module = self.module
+		self.lines = [ '(module' ]
+		for i, typ in enumerate( module.types ):
+			self.lines.append( f'  (type (;{i};) (func{signature( typ )}))' )
+		for i, imp in enumerate( module.imports ):
+			self.lines.append( f'  (import "{imp.module}" "{imp.name}" (func {identifier( imp.name, i )} (type {imp.type})))' )
+		for i, pages in enumerate( module.memories ):
+			self.lines.append( f'  (memory (;{i};) {pages})' )
+		for i, glob in enumerate( module.globals ):
+			self.lines.append( self.global_( glob, i ) )
+		for export in module.exports:
+			self.lines.append( f'  (export "{export.name}" ({export.kind.text} {self.reference( export.kind, export.index )}))' )
+		for i, function in enumerate( module.functions ):
+			self.function( function, len( module.imports ) + i )
+		for data in module.data:
+			self.lines.append( f'  (data (i32.const {data.offset}) {string( data.data )})' )
+		self.lines.append( ')' )
+		return '\n'.join( self.lines ) + '\n'
+
+	def reference( self, kind: ExternalKind, index: int ) -> str:
+		if kind is ExternalKind.FUNC:
+			return identifier( self.module.functionName( index ), index )
+		if kind is ExternalKind.GLOBAL:
+			return identifier( self.module.globals[ index ].name, index )
+		return str( index )
+
+	def global_( self, glob: Global, index: int ) -> str:
+		typ = f'(mut {glob.type.text})' if glob.mutable else glob.type.text
+		return f'  (global {identifier( glob.name, index )} {typ} ({self.instruction( glob.init, [] )}))'
+
+	def function( self, function: Function, index: int ) -> None:
+		typ = self.module.types[ function.type ]
+		self.lines.append( f'  (func {identifier( function.name, index )} (type {function.type}){signature( typ, function.localNames )}' )
+
+		names = function.localNames + [ '' ] * ( len( typ.params ) + len( function.locals ) - len( function.localNames ) )
+		for i, local in enumerate( function.locals, len( typ.params ) ):
+			self.lines.append( f'    (local {identifier( names[ i ], i )} {local.text})' if names[ i ] else f'    (local {local.text})' )
+
+		indent = 2
+		for instr in function.body:
+			if instr[0] in ( 'end', 'else' ):
+				indent -= 1
+			self.lines.append( '  ' * indent + self.instruction( instr, names ) )
+			if instr[0] in ( 'block', 'loop', 'if', 'else' ):
+				indent += 1
+		self.lines.append( '  )' )
+
+	def instruction( self, instr: Instruction, localNames: list[str] ) -> str:
+		op = str( instr[0] )
+		immediate = OPCODES[ op ].immediate
+		if immediate is None:
+			return op
+		value = instr[1]
+		if immediate == 'blocktype':
+			return op if value == EMPTY else f'{op} (result {ValType( value ).text})'  # type: ignore
+		if immediate == 'f64':
+			return f'{op} {number( value )}'  # type: ignore
+		if op.startswith( 'local.' ):
+			return f'{op} {identifier( localNames[ value ], value )}'  # type: ignore
+		if op.startswith( 'global.' ):
+			return f'{op} {identifier( self.module.globals[ value ].name, value )}'  # type: ignore
+		if op == 'call':
+			return f'{op} {identifier( self.module.functionName( value ), value )}'  # type: ignore
+		return f'{op} {value}'
+
+
+def toWat( module: WasmModule ) -> str:
+	""" Prints a module in the text format """
+	return Printer( module ).print()
@@ -0,0 +1,386 @@
+"""
+Parallel incremental builds of a whole project (`endcc build`).
+
+The project directory is scanned for modules, their `OWN ... FROM` imports form a dependency graph,
+and the modules are compiled by a process pool in topological order: a module is submitted as soon
+as all of its dependencies are built, so independent modules are compiled in parallel.
+
+Each built module gets a stamp, a hash of its source, of the backend and of the exported interfaces
+of its dependencies. The next build skips the modules whose stamp didn't change, so editing a module
+only rebuilds its dependents if its exports changed. Stamps are stored in `__endcache__/build.json`
+in the project directory.
+"""
+from __future__ import annotations
+
+import sys
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import redirect_stdout, redirect_stderr
+from dataclasses import dataclass, field
+from enum import Enum
+from hashlib import sha256
+from importlib import import_module
+from io import StringIO
+from json import dumps, loads
+from os import replace, getpid
+from pathlib import Path
+from time import perf_counter
+from typing import Final, Optional, TextIO
+
+from ast_ import parser
+from ast_.typeChecker import TypeChecker
+from backend import BACKENDS
+from module import Module, ModuleError, Import, Signature, findSources, findImports, findExports, resolve, cache, interface
+from platforms import Platform
+from token_ import tokenizer
+from token_.tokenizer import TokenizerError
+
+
+# bump when the layout of the stamps or what they cover changes
+STAMPS_VERSION: Final[ int ] = 1
+STAMPS_FILE: Final[ str ] = 'build.json'
+# number of modules listed in the slowest modules summary
+SLOWEST_SHOWN: Final[ int ] = 10
+
+class Status(Enum):
+	BUILT = 'built'
+	FRESH = 'up to date'
+	FAILED = 'failed'
+	# a dependency failed
+	BLOCKED = 'blocked'
+
+
+@dataclass(eq=False)
+class Unit:
+	""" A module of the project and its build state """
+	path: Path
+	hash: str
+	imports: list[ Import ]
+	exports: dict[ str, Signature ]
+	dependencies: list[ Unit ] = field( default_factory=list )
+	# import path -> module, like `Module.dependencies`
+	imported: dict[ str, Unit ] = field( default_factory=dict )
+	dependents: list[ Unit ] = field( default_factory=list )
+	status: Optional[Status] = None
+	# seconds spent scanning and compiling the module
+	time: float = 0.0
+	# the output of a failed scan or compilation
+	errors: str = ''
+
+	@property
+	def interfaceHash( self ) -> str:
+		""" Hash of the exported declarations, which is all the dependents of a module see of it """
+		signatures = [ [ sig.name, sig.kind, sig.params, sig.returns ] for sig in self.exports.values() ]
+		return sha256( dumps( signatures ).encode() ).hexdigest()
+
+	def stamp( self, platform: Optional[Platform] ) -> str:
+		""" Key of the module's build, the build is up-to-date if it didn't change """
+		deps = sorted( ( str( dep.path ), dep.interfaceHash ) for dep in self.dependencies )
+		return sha256( dumps( [ STAMPS_VERSION, self.hash, platform.value if platform else None, deps ] ).encode() ).hexdigest()
+
+	def module( self ) -> Module:
+		"""
+		The module, with the modules it imports as its dependencies. Their own dependencies are left out: the backends
+		build a module at a time and only look at what it imports, while sending all the modules a chain of imports
+		reaches to the workers would take longer than compiling them
+		"""
+		module = Module( self.path.stem, self.path, self.hash, self.imports, self.exports )
+		for imp, dep in self.imported.items():
+			module.dependencies[ imp ] = Module( dep.path.stem, dep.path, dep.hash, dep.imports, dep.exports )
+		return module
+
+
+def scanModule( path: Path ) -> tuple[ list[Import], dict[str, Signature], str, float ]:
+	"""
+	Tokenizes a module, caching its tokens and interface summary. Runs in the worker processes.
+	:return: the module's imports, exports, the tokenizer error if there was one and the time it took
+	"""
+	start = perf_counter()
+	source = path.read_bytes()
+	hash = cache.hashSource( source )
+	try:
+		tokens = tokenizer.parse( source.decode(), str( path ) )
+	except TokenizerError as e:
+		return [], {}, str( e ), perf_counter() - start
+	cache.write( path, hash, tokens )
+	imports, exports = findImports( tokens ), findExports( tokens )
+	interface.write( path, hash, imports, exports )
+	return imports, exports, '', perf_counter() - start
+
+
+def compileModule( module: Module, platform: Optional[Platform] ) -> tuple[ str, float ]:
+	"""
+	Parses and type checks a module, then writes the selected backend's output for it. Runs in the worker processes.
+	:param module: the module, see `Unit.module()`
+	:return: the errors reported while compiling, empty if it succeeded, and the time it took
+	"""
+	start = perf_counter()
+	output = StringIO()
+	with redirect_stdout( output ), redirect_stderr( output ):
+		succeeded = _compile( module, platform )
+	errors = '' if succeeded else output.getvalue().strip() or 'compilation failed'
+	return errors, perf_counter() - start
+
+
+def _compile( module: Module, platform: Optional[Platform] ) -> bool:
+	tokens = cache.read( module.path, module.hash )
+	if tokens is None:
+		try:
+			tokens = tokenizer.parse( module.path.read_text(), str( module.path ) )
+		except TokenizerError as e:
+			print( e )
+			return False
+
+	ast = parser.Parser( tokens ).parseProgram( eager=True )
+	if ast is None:
+		return False
+
+	checker = TypeChecker()
+	if not checker.checkStatements( ast ):
+		print( '\n'.join( checker.errors ) )
+		return False
+
+	if platform is None:
+		return True
+	buildMain = getattr( import_module( BACKENDS[ platform ].pkg ), 'buildMain', None )
+	if buildMain is None:
+		return True
+	return buildMain( ast, module ) == 0  # type: ignore
+
+
+class Builder:
+	""" Builds the modules of a project directory """
+	root: Path
+	platform: Optional[Platform]
+	workers: Optional[int]
+	output: TextIO
+	units: dict[ Path, Unit ]
+	# the modules in topological order, dependencies first
+	order: list[ Unit ]
+	_stamps: dict[ str, str ]
+	_finished: int
+
+	def __init__( self, root: Path, platform: Optional[Platform] = None, workers: Optional[int] = None, output: TextIO = sys.stdout ) -> None:
+		"""
+		:param root: the project directory
+		:param platform: the backend whose output is written, None to only run the front end checks
+		:param workers: number of worker processes, defaults to the number of CPUs
+		:param output: where progress and the summary are printed
+		"""
+		self.root = root.resolve()
+		self.platform = platform
+		self.workers = workers
+		self.output = output
+		self.units = {}
+		self.order = []
+		self._stamps = {}
+		self._finished = 0
+
+	def build( self ) -> bool:
+		"""
+		Builds the stale modules of the project
+		:return: True if all modules are built
+		:raises ModuleError: if there is an import cycle
+		"""
+		start = perf_counter()
+		self._stamps = self._readStamps()
+		with ProcessPoolExecutor( self.workers ) as pool:
+			self._scan( pool )
+			self.order = self._link()
+			self._compile( pool )
+		self._writeStamps()
+		self._summary( perf_counter() - start )
+		return all( unit.status in ( Status.BUILT, Status.FRESH ) for unit in self.order )
+
+	def count( self, status: Status ) -> int:
+		return sum( unit.status is status for unit in self.units.values() )
+
+	def criticalPath( self ) -> tuple[ float, list[Unit] ]:
+		"""
+		Finds the chain of dependent modules taking the most time, which bounds the build time whatever the number of workers
+		:return: the time taken by the chain and its modules, dependencies first
+		"""
+		finish: dict[ Unit, float ] = {}
+		previous: dict[ Unit, Optional[Unit] ] = {}
+		for unit in self.order:
+			slowest = max( unit.dependencies, key=finish.__getitem__, default=None )
+			previous[ unit ] = slowest
+			finish[ unit ] = unit.time + ( finish[ slowest ] if slowest else 0.0 )
+		last = max( self.order, key=finish.__getitem__, default=None )
+		if last is None:
+			return 0.0, []
+		path: list[ Unit ] = []
+		step: Optional[Unit] = last
+		while step is not None:
+			path.append( step )
+			step = previous[ step ]
+		return finish[ last ], path[ :: -1 ]
+
+	# PRIVATE METHODS
+
+	def _name( self, unit: Unit ) -> str:
+		return str( unit.path.relative_to( self.root ) ) if unit.path.is_relative_to( self.root ) else str( unit.path )
+
+	def _scan( self, pool: Executor ) -> None:
+		""" Finds the imports and exports of the project's modules and of the ones they import, tokenizing the changed ones """
+		pending = findSources( self.root )
+		while pending:
+			scans: dict[ Path, Future[ tuple[ list[Import], dict[str, Signature], str, float ] ] ] = {}
+			for path in pending:
+				hash = cache.hashSource( path.read_bytes() )
+				if ( summary := interface.read( path, hash ) ) is not None:
+					self.units[ path ] = Unit( path, hash, *summary )
+				else:
+					self.units[ path ] = Unit( path, hash, [], {} )
+					scans[ path ] = pool.submit( scanModule, path )
+			for path, future in scans.items():
+				unit = self.units[ path ]
+				unit.imports, unit.exports, unit.errors, unit.time = future.result()
+				if unit.errors:
+					unit.status = Status.FAILED
+
+			# modules imported from outside the project directory
+			wave, pending = pending, []
+			for path in wave:
+				for imp in self.units[ path ].imports:
+					try:
+						dep = resolve( path, imp )
+					except ModuleError:
+						continue
+					if dep not in self.units and dep not in pending:
+						pending.append( dep )
+
+	def _link( self ) -> list[ Unit ]:
+		"""
+		Resolves the dependencies of the modules, marking the ones with a broken import as failed
+		:return: the modules in topological order
+		:raises ModuleError: if there is an import cycle
+		"""
+		for unit in self.units.values():
+			for imp in unit.imports:
+				try:
+					dep = self.units[ resolve( unit.path, imp ) ]
+					for name in imp.names:
+						if name not in dep.exports and dep.status is not Status.FAILED:
+							raise ModuleError( f'Module "{dep.path.stem}" does not export "{name}", imported at {imp.loc}' )
+				except ModuleError as e:
+					unit.status = Status.FAILED
+					unit.errors = str( e )
+					continue
+				unit.imported[ imp.path ] = dep
+				if dep not in unit.dependencies:
+					unit.dependencies.append( dep )
+					dep.dependents.append( unit )
+
+		order: list[ Unit ] = []
+		visited: set[ Unit ] = set()
+
+		def visit( unit: Unit, stack: list[Unit] ) -> None:
+			if unit in stack:
+				cycle = stack[ stack.index( unit ) : ] + [ unit ]
+				raise ModuleError( f'Import cycle detected: {" -> ".join( self._name( mod ) for mod in cycle )}' )
+			if unit in visited:
+				return
+			stack.append( unit )
+			for dep in unit.dependencies:
+				visit( dep, stack )
+			stack.pop()
+			visited.add( unit )
+			order.append( unit )
+
+		for unit in self.units.values():
+			visit( unit, [] )
+		return order
+
+	def _compile( self, pool: Executor ) -> None:
+		""" Compiles the stale modules, submitting each one once its dependencies are done """
+		waiting: dict[ Unit, int ] = { unit: len( unit.dependencies ) for unit in self.order }
+		ready: list[ Unit ] = [ unit for unit in self.order if not unit.dependencies ]
+		running: dict[ Future[ tuple[ str, float ] ], Unit ] = {}
+
+		def done( unit: Unit ) -> None:
+			self._progress( unit )
+			for dependent in unit.dependents:
+				waiting[ dependent ] -= 1
+				if not waiting[ dependent ]:
+					ready.append( dependent )
+
+		while ready or running:
+			while ready:
+				unit = ready.pop( 0 )
+				if unit.status is not Status.FAILED:
+					if any( dep.status in ( Status.FAILED, Status.BLOCKED ) for dep in unit.dependencies ):
+						unit.status = Status.BLOCKED
+					elif self._stamps.get( str( unit.path ) ) == unit.stamp( self.platform ):
+						unit.status = Status.FRESH
+					else:
+						running[ pool.submit( compileModule, unit.module(), self.platform ) ] = unit
+						continue
+				done( unit )
+
+			if running:
+				finished, _ = wait( running, return_when=FIRST_COMPLETED )
+				for future in finished:
+					unit = running.pop( future )
+					unit.errors, time = future.result()
+					unit.time += time
+					unit.status = Status.FAILED if unit.errors else Status.BUILT
+					done( unit )
+
+	def _progress( self, unit: Unit ) -> None:
+		self._finished += 1
+		if unit.status is Status.FRESH:
+			return
+		line = f'[{self._finished}/{len( self.order )}] {unit.status.value if unit.status else "?"} {self._name( unit )}'
+		if unit.status is Status.BUILT:
+			line += f' in {unit.time * 1000:.1f} ms'
+		elif unit.status is Status.BLOCKED:
+			line += ', a dependency failed'
+		print( line, file=self.output )
+		if unit.errors:
+			print( '\t' + unit.errors.replace( '\n', '\n\t' ), file=self.output )
+
+	def _summary( self, elapsed: float ) -> None:
+		built = sorted( ( unit for unit in self.order if unit.status is Status.BUILT ), key=lambda unit: unit.time, reverse=True )
+		if built:
+			print( 'Slowest modules:', file=self.output )
+			for unit in built[ : SLOWEST_SHOWN ]:
+				print( f'\t{unit.time * 1000:>8.1f} ms  {self._name( unit )}', file=self.output )
+			total, path = self.criticalPath()
+			print( f'Critical path: {total * 1000:.1f} ms, {" -> ".join( self._name( unit ) for unit in path )}', file=self.output )
+			work = sum( unit.time for unit in self.order )
+			print( f'Parallelism: {work / elapsed:.2f}x ({work * 1000:.1f} ms of work in {elapsed * 1000:.1f} ms)', file=self.output )
+		print(
+			f'Built {self.count( Status.BUILT )} modules, {self.count( Status.FRESH )} up to date, '
+			f'{self.count( Status.FAILED )} failed, {self.count( Status.BLOCKED )} blocked in {elapsed:.2f}s',
+			file=self.output
+		)
+
+	def _stampsFile( self ) -> Path:
+		return self.root / cache.CACHE_DIR / STAMPS_FILE
+
+	def _readStamps( self ) -> dict[ str, str ]:
+		try:
+			data = loads( self._stampsFile().read_text() )
+			return data[ 'stamps' ] if data[ 'version' ] == STAMPS_VERSION else {}  # type: ignore
+		except ( OSError, ValueError, KeyError, TypeError ):
+			return {}
+
+	def _writeStamps( self ) -> None:
+		"""
+		Writes the stamps of the built and up-to-date modules, keeping the old ones of the blocked modules.
+		Failing to write them is not an error, the modules will just be built again next time.
+		"""
+		stamps = {
+			str( unit.path ): unit.stamp( self.platform ) if unit.status in ( Status.BUILT, Status.FRESH ) else self._stamps[ str( unit.path ) ]
+			for unit in self.units.values()
+			if unit.status in ( Status.BUILT, Status.FRESH ) or ( unit.status is Status.BLOCKED and str( unit.path ) in self._stamps )
+		}
+		file = self._stampsFile()
+		try:
+			file.parent.mkdir( exist_ok=True )
+			# write then rename, so concurrent builds never see a partial file
+			tmp = file.with_suffix( f'.{getpid()}.tmp' )
+			tmp.write_text( dumps( { 'version': STAMPS_VERSION, 'stamps': stamps }, indent='\t' ) )
+			replace( tmp, file )
+		except OSError:
+			pass
@@ -0,0 +1,156 @@
+"""
+Checks whole source trees without running them (`endcc check`).
+
+Files are tokenized and parsed with error recovery, so that all of their syntax errors are found in
+a single run, then their imports are resolved and, if they have no syntax errors, they are type checked.
+Files are checked concurrently by a process pool, and the results can be printed as JSON for tools.
+"""
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from json import dumps
+from pathlib import Path
+from time import perf_counter
+from typing import Final, Optional
+
+from ast_ import parser
+from ast_.typeChecker import TypeChecker
+from module import ModuleError, Signature, EXTENSIONS, findSources, findImports, findExports, resolve, cache, interface
+from token_.tokenizer import Tokenizer
+
+
+# bump when the layout of the JSON output changes
+JSON_VERSION: Final[ int ] = 1
+
+# ( path, hash ) -> exports, of the modules imported by the files checked by this process
+_exports: dict[ tuple[ Path, str ], dict[ str, Signature ] ] = {}
+
+
+@dataclass
+class Diagnostic:
+	# the pass which found the problem: tokenizer, parser, module, types or internal
+	source: str
+	# 1-based line of the problem, 0 if it has no location
+	line: int
+	char: int
+	message: str
+	severity: str = 'error'
+
+
+@dataclass
+class FileReport:
+	path: Path
+	diagnostics: list[ Diagnostic ]
+	# seconds spent checking the file
+	time: float
+
+
+def checkFile( path: Path ) -> FileReport:
+	""" Collects all the problems of a file. Runs in the worker processes. """
+	start = perf_counter()
+	try:
+		diagnostics = _check( path )
+	except Exception as e:
+		# a crash of the compiler is still a result for the file, not the end of the check
+		diagnostics = [ Diagnostic( 'internal', 0, 0, f'{type( e ).__name__}: {e}' ) ]
+	diagnostics.sort( key=lambda diagnostic: ( diagnostic.line, diagnostic.char ) )
+	return FileReport( path, diagnostics, perf_counter() - start )
+
+
+def _check( path: Path ) -> list[Diagnostic]:
+	tokenizer = Tokenizer( path.read_text(), str( path ), recover=True ).tokenize()
+	diagnostics = [ Diagnostic( 'tokenizer', error.line, error.char, error.description ) for error in tokenizer.errors ]
+
+	for imp in findImports( tokenizer.code ):
+		try:
+			exports = _exportsOf( resolve( path, imp ) )
+		except ModuleError:
+			diagnostics.append( Diagnostic( 'module', imp.loc.line + 1, imp.loc.char, f'Module "{imp.path}" not found' ) )
+			continue
+		for name in imp.names:
+			if name not in exports:
+				diagnostics.append( Diagnostic( 'module', imp.loc.line + 1, imp.loc.char, f'Module "{imp.path}" does not export "{name}"' ) )
+
+	parse = parser.Parser( tokenizer.code, recover=True )
+	ast = parse.parseProgram( eager=True )
+	# the parser often trips on the tokens of a line with a tokenizer error, which would only repeat it
+	broken = { diagnostic.line for diagnostic in diagnostics if diagnostic.source == 'tokenizer' }
+	for error in parse.errors:
+		line = error.token.loc.line + 1 if error.token else 0
+		if line not in broken:
+			diagnostics.append( Diagnostic( 'parser', line, error.token.loc.char if error.token else 0, error.message ) )
+
+	if ast is not None and not tokenizer.errors:
+		checker = TypeChecker()
+		checker.checkStatements( ast )
+		diagnostics += [ Diagnostic( 'types', loc.line + 1, loc.char, message ) for loc, message in checker.locatedErrors ]
+	return diagnostics
+
+
+def _exportsOf( path: Path ) -> dict[ str, Signature ]:
+	""" The exports of an imported module, from its interface summary if it's up-to-date """
+	source = path.read_bytes()
+	hash = cache.hashSource( source )
+	if ( path, hash ) not in _exports:
+		if ( summary := interface.read( path, hash ) ) is not None:
+			_exports[ ( path, hash ) ] = summary[1]
+		else:
+			_exports[ ( path, hash ) ] = findExports( Tokenizer( source.decode(), str( path ), recover=True ).tokenize().code )
+	return _exports[ ( path, hash ) ]
+
+
+def findFiles( targets: list[Path] ) -> list[Path]:
+	""" Lists the files to check: the given files, and the modules in the given directories """
+	files: list[ Path ] = []
+	for target in targets:
+		if target.is_dir():
+			files += findSources( target )
+		elif target.suffix in EXTENSIONS:
+			files.append( target.resolve() )
+	return sorted( set( files ) )
+
+
+def checkFiles( files: list[Path], workers: Optional[int] = None ) -> list[FileReport]:
+	"""
+	Checks the given files concurrently
+	:param files: the files to check
+	:param workers: number of worker processes, defaults to the number of CPUs
+	:return: a report for each file, in the same order
+	"""
+	if len( files ) < 2:
+		# not worth starting a pool
+		return [ checkFile( file ) for file in files ]
+	workers = workers or os.cpu_count() or 1
+	with ProcessPoolExecutor( workers ) as pool:
+		# batch small files, to not pay a round-trip for each one
+		return list( pool.map( checkFile, files, chunksize=max( 1, len( files ) // ( 4 * workers ) ) ) )
+
+
+def toJson( reports: list[FileReport], elapsed: float ) -> str:
+	return dumps( {
+		'version': JSON_VERSION,
+		'files': [
+			{ 'path': str( report.path ), 'time': report.time, 'diagnostics': [ asdict( diagnostic ) for diagnostic in report.diagnostics ] }
+			for report in reports
+		],
+		'summary': {
+			'files': len( reports ),
+			'filesWithErrors': sum( bool( report.diagnostics ) for report in reports ),
+			'errors': sum( len( report.diagnostics ) for report in reports ),
+			'time': elapsed
+		}
+	}, indent='\t' )
+
+
+def toText( reports: list[FileReport], elapsed: float ) -> str:
+	lines = [
+		f'{report.path}:{diagnostic.line}:{diagnostic.char}: {diagnostic.severity}: {diagnostic.message} [{diagnostic.source}]'
+		for report in reports
+		for diagnostic in report.diagnostics
+	]
+	errors = sum( len( report.diagnostics ) for report in reports )
+	failed = sum( bool( report.diagnostics ) for report in reports )
+	lines.append( f'Checked {len( reports )} files in {elapsed:.2f}s, found {errors} errors in {failed} files' )
+	return '\n'.join( lines )
@@ -13,6 +13,27 @@ parser = ArgumentParser(
 	prog='compiler.py' if getattr(sys, 'frozen', False) else 'endcc',
 	description='End C Compiler'
 )
+parser.add_argument(
+	'command',
+	help=(
+		'Optional command, "build" builds all the modules of the targets, "check" reports all the problems of the targets '
+		'without running them, "serve" starts a compile server, see client.py, "run-many" runs all the scripts of '
+		'the targets on a pool of workers, "lsp" starts a language server on the standard input and output'
+	),
+	nargs='?',
+	choices=( 'build', 'check', 'serve', 'run-many', 'lsp' ),
+	default=None
+)
+parser.add_argument(
+	'targets',
+	help=(
+		'Project directories (or files, for check, or scripts and glob patterns, for run-many) the command works on, '
+		'defaults to the current directory'
+	),
+	nargs='*',
+	type=Path,
+	default=[]
+)
 parser.add_argument(
 	'-f',
 	'--file',
@@ -69,6 +90,13 @@ parser.add_argument(
 	default=False,
 	dest='interactiveMode'
 )
+parser.add_argument(
+	'--listen',
+	help='Makes the interactive interpreter serve a session to each connection, on "port", "host:port" or a Unix socket path',
+	action='store',
+	default=None,
+	dest='listen'
+)
 parser.add_argument(
 	'--exit-on-error',
 	help='Makes the interpreter exits when a implementation error occurs',
@@ -76,6 +104,53 @@ parser.add_argument(
 	default=False,
 	dest='exitOnImplementationError'
 )
+parser.add_argument(
+	'--eager',
+	help='Parses all subroutine bodies ahead of time, instead of on their first call, to find all syntax errors',
+	action='store_true',
+	default=False,
+	dest='eagerParse'
+)
+parser.add_argument(
+	'-j',
+	'--jobs',
+	help='Number of worker processes used by build, check and run-many, defaults to the number of CPUs',
+	action='store',
+	type=int,
+	default=None,
+	dest='jobs'
+)
+parser.add_argument(
+	'--json',
+	help='Makes check and run-many print their results as JSON',
+	action='store_true',
+	default=False,
+	dest='json'
+)
+parser.add_argument(
+	'--manifest',
+	help='File listing the scripts run-many runs, one per line, relative to the file',
+	action='store',
+	type=Path,
+	default=None,
+	dest='manifest'
+)
+parser.add_argument(
+	'--timeout',
+	help='Seconds a run-many job may run for before its worker is killed',
+	action='store',
+	type=float,
+	default=None,
+	dest='timeout'
+)
+parser.add_argument(
+	'--socket',
+	help='Unix socket the compile server listens on, defaults to $ENDCC_SOCKET or a per-user socket in the temp directory',
+	action='store',
+	type=Path,
+	default=None,
+	dest='socket'
+)
 parser.add_argument(
 	'-dg',
 	'--debug',
@@ -101,13 +176,22 @@ parser.add_argument(
 
 
 class Arguments:
+	command: Optional[str]
+	targets: list[Path]
+	jobs: Optional[int]
+	json: bool
+	manifest: Optional[Path]
+	timeout: Optional[float]
+	socket: Optional[Path]
 	file: Path
 	backend: Platform
 	showBackendHelp: bool
 	configFile: Path
 	postCompileScript: Optional[Path]
 	interactiveMode: bool
+	listen: Optional[str]
 	exitOnImplementationError: bool
+	eagerParse: bool
 	# 0: everything 1: warns up 2: only errors
 	verboseLevel: int
 	# debug mode, enable debug logging
@@ -117,5 +201,15 @@ class Arguments:
 	execPyArgs: list[str]
 
 
-# cli arguments
-args: Arguments = parser.parse_args( sys.argv[ 1: ] )  # type: ignore
+# cli arguments, the defaults until the entry point parses its command line with `parseArguments()`,
+# so that importing the compiler's modules never looks at the arguments of the process embedding them
+args: Arguments = parser.parse_args( [], namespace=Arguments() )  # type: ignore
+
+
+def parseArguments( argv: list[str] ) -> Arguments:
+	"""
+	Parses the given arguments into `args`, in place, so that the modules which already imported it see them
+	:raises SystemExit: if the arguments are invalid, after printing the usage
+	"""
+	vars( args ).clear()
+	return parser.parse_args( argv, namespace=args )  # type: ignore
@@ -0,0 +1,64 @@
+"""
+Thin client of the compile server, a drop-in replacement of `python compiler.py`.
+
+Sends its arguments to the server started by `compiler.py serve`, and prints the output of the compiler
+as it arrives. It only imports the server's protocol, so it starts much faster than the compiler itself.
+If no server is listening, the compiler is run in-process instead.
+"""
+import os
+import runpy
+import socket
+import sys
+from pathlib import Path
+from typing import TextIO
+
+import log
+import server
+
+
+def request( sock: socket.socket, argv: list[str], cwd: str, stdout: TextIO = sys.stdout, stderr: TextIO = sys.stderr ) -> int:
+	"""
+	Runs the compiler on the server
+	:param sock: a connection to the server
+	:param argv: the arguments of the compiler
+	:param cwd: the directory to run the compiler in
+	:return: the exit code of the compiler
+	:raises ProtocolError: if the server sent an invalid frame or went away
+	"""
+	server.send( sock, { 'type': 'run', 'argv': argv, 'cwd': cwd } )
+	while ( frame := server.receive( sock ) ) is not None:
+		if frame[ 'type' ] == 'stdout':
+			stdout.write( frame[ 'data' ] )
+			stdout.flush()
+		elif frame[ 'type' ] == 'stderr':
+			stderr.write( frame[ 'data' ] )
+			stderr.flush()
+		elif frame[ 'type' ] == 'exit':
+			return int( frame[ 'code' ] )
+		elif frame[ 'type' ] == 'error':
+			raise server.ProtocolError( frame[ 'message' ] )
+	raise server.ProtocolError( 'the server closed the connection' )
+
+
+def main() -> int:
+	try:
+		sock = server.connect()
+	except OSError as e:
+		if isinstance( e, PermissionError ):
+			# someone else's, the sources are not sent to it
+			log.warn( f'Not using the compile server: {e}' )
+		# no server, do its job
+		sys.argv[0] = str( Path( __file__ ).with_name( 'compiler.py' ) )
+		runpy.run_path( sys.argv[0], run_name='__main__' )
+		return 0
+
+	with sock:
+		try:
+			return request( sock, sys.argv[ 1: ], os.getcwd() )
+		except server.ProtocolError as e:
+			log.error( f'Compile server error: {e}' )
+			return 1
+
+
+if __name__ == '__main__':
+	sys.exit( main() )
@@ -17,9 +17,11 @@ from importlib import import_module
 
 from backend import BACKENDS
 import ast_.parser
-import tokenizer
-from cli import args
-from log import warn, info, error
+from ast_.typeChecker import TypeChecker
+from cli import args, parseArguments
+from log import LogSettings, configure, warn, info, error
+from module import ModuleError
+from module.loader import ModuleLoader
 from utils import ExitError
 from platforms import Platform
 
@@ -41,10 +43,20 @@ def main() -> int:
 		print(txt)
 		exit(0)
 
+	# from the arguments until the config is read, which may change the verbosity
+	configure( LogSettings( 1 if args.verboseLevel is None else args.verboseLevel, args.debug ) )
+	if args.command == 'serve':
+		return import_module( 'server.daemon' ).serveMain( args.socket )  # type: ignore
+	if args.command == 'lsp':
+		# before reading the config, which would print to the output the protocol uses
+		return import_module( 'lsp.server' ).serveMain()  # type: ignore
+
 	# config file defaults
 	cfgFile = Path(args.configFile)
 	if cfgFile.exists():
-		print( f'[INFO] Using config at {cfgFile}' )
+		if not args.json:
+			# keep the output of --json parseable
+			info( f'Using config at {cfgFile}' )
 		cfg: dict[ str, Union[ str, int ] ] = loads( cfgFile.read_text() )
 		args.file = args.file or Path( cast( str, cfg['defaultFile'] ) )
 		args.backend = args.backend or Platform.findAdeguate( cfg.get('defaultBackend', 'inter') )
@@ -54,27 +66,50 @@ def main() -> int:
 			Path( cast( str, cfg.get('postCompileScript') ) ) if cfg.get('postCompileScript') else None
 		)
 
+	configure( LogSettings( 1 if args.verboseLevel is None else args.verboseLevel, args.debug ) )
+
+	if args.command == 'build':
+		return buildMain()
+	if args.command == 'check':
+		return checkMain()
+	if args.command == 'run-many':
+		return runManyMain()
+
 	exitCode: int = 0
 	# execute build
 	try:
 		# interactive mode
 		if args.interactiveMode:
-			return import_module( 'backend.interpreter.interactive' ).interactiveMain()  # type: ignore
+			if args.listen:
+				return import_module( 'backend.interpreter.replServer' ).serveMain( args.listen, args.exitOnImplementationError )  # type: ignore
+			return import_module( 'backend.interpreter.interactive' ).interactiveMain( args.exitOnImplementationError )  # type: ignore
 
 		if not args.file.exists():
 			error( f'File {args.file} not found.')
 			return 1
 		info( f'Compiling {args.file}')
 
-		info( f'Tokenizing..')
-		tokens = tokenizer.parse( args.file.read_text(), str( args.file ) )
+		info( f'Loading modules..')
+		try:
+			module = ModuleLoader().load( args.file )
+		except ModuleError as e:
+			error( f'{e.args[0]}, aborting.' )
+			return 1
 
 		info( f'Generating AST..')
-		ast = ast_.parser.Parser( tokens ).parse()
+		ast = ast_.parser.Parser( module.tokens ).parseProgram( eager=args.eagerParse )
 		if ast is None:
 			error( f'Failed to generate AST, aborting.' )
 			return 1
 
+		info( f'Type checking..')
+		checker = TypeChecker()
+		if not checker.checkStatements( ast ):
+			for message in checker.errors:
+				error( message )
+			error( f'Found {len( checker.errors )} type errors, aborting.' )
+			return 1
+
 		info( f'Selecting backend..')
 		try:
 			args.backend = Platform.findAdeguate( args.backend )
@@ -87,7 +122,7 @@ def main() -> int:
 			return 1
 
 		info( f'Executing backend "{backend.name}"..')
-		exitCode: int = import_module( backend.pkg ).backendMain(ast)  # type: ignore
+		exitCode: int = import_module( backend.pkg ).backendMain( ast, module )  # type: ignore
 
 		if args.postCompileScript:
 			if not args.postCompileScript.exists():
@@ -101,8 +136,63 @@ def main() -> int:
 	return exitCode
 
 
-if __name__ == '__main__':
+def buildMain() -> int:
+	""" Builds the project directories given as targets, see the build module """
+	from build import Builder
+
+	platform = Platform.findAdeguate( args.backend ) if args.backend else None
+	exitCode = 0
+	for target in args.targets or [ Path( '.' ) ]:
+		if not target.is_dir():
+			error( f'Directory {target} not found.' )
+			return 1
+		info( f'Building {target}' )
+		try:
+			if not Builder( target, platform, args.jobs ).build():
+				exitCode = 1
+		except ModuleError as e:
+			error( f'{e.args[0]}, aborting.' )
+			return 1
+	return exitCode
+
+
+def checkMain() -> int:
+	""" Checks the files and directories given as targets, see the check module """
+	import check
+
 	start = time()
-	_exitCode = main()
-	print( f'Done in {time() - start}' )
-	exit( _exitCode )
+	files = check.findFiles( args.targets or [ Path( '.' ) ] )
+	reports = check.checkFiles( files, args.jobs )
+	elapsed = time() - start
+	print( check.toJson( reports, elapsed ) if args.json else check.toText( reports, elapsed ) )
+	return 1 if any( report.diagnostics for report in reports ) else 0
+
+
+def runManyMain() -> int:
+	""" Runs the scripts given as targets or listed in the manifest on a pool of workers, see the runMany module """
+	import runMany
+
+	scripts = runMany.findScripts( args.targets if args.targets or args.manifest else [ Path( '.' ) ], args.manifest )
+	if not scripts:
+		error( 'No scripts to run.' )
+		return 1
+	start = time()
+	runner = runMany.Runner( Platform.findAdeguate( args.backend or Platform.INTERPRETER ), args.jobs, args.timeout )
+	results = runner.run( scripts )
+	elapsed = time() - start
+	print( runMany.toJson( results, elapsed ) if args.json else runMany.toText( results, elapsed ) )
+	return 0 if all( result.status is runMany.Status.OK for result in results ) else 1
+
+
+def run( argv: list[str] ) -> int:
+	""" Runs the compiler with the given arguments, like the command line does, telling how long it took """
+	start = time()
+	parseArguments( argv )
+	exitCode = main()
+	if not args.json and args.command != 'lsp':
+		print( f'Done in {time() - start}' )
+	return exitCode
+
+
+if __name__ == '__main__':
+	exit( run( sys.argv[ 1: ] ) )
@@ -0,0 +1,191 @@
+"""
+Library interface of the EndC compiler, for programs embedding it.
+
+Unlike `compiler.py`, importing this module has no side effects: it doesn't parse the command line,
+doesn't print and doesn't load any backend. All the settings come from an `Options` object, and the
+module loader and backends are only imported when a program needs them.
+All the state of a compilation lives in its own objects, so any number of them can run concurrently
+on different threads, see `compileBatch()`.
+
+	>>> import endc
+	>>> endc.run( 'DCLAR SUBROUTIN main{} <- InTgR [ GIV BACK 3/ ]' )
+	3
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from importlib import import_module
+from pathlib import Path
+from typing import Iterable, Optional, Union, TYPE_CHECKING
+
+from ast_.parser import Parser
+from ast_.stmt import Stmt
+from ast_.typeChecker import TypeChecker
+from backend import BACKENDS, BackendInfo
+from platforms import Platform
+from token_ import Token, Loc
+from token_.tokenizer import Tokenizer, TokenizerError
+
+if TYPE_CHECKING:
+	from module import Module
+
+
+__all__ = [ 'Options', 'Program', 'CompileError', 'tokenize', 'parse', 'compile', 'compileBatch', 'run' ]
+
+
+@dataclass
+class Options:
+	backend: Union[ Platform, str ] = Platform.INTERPRETER
+	# parse all subroutine bodies ahead of time, so that all syntax errors are found before running, and all the
+	# bodies are type checked. Unlike the command line's `--eager`, it's the default: callers of the library, like
+	# builds and editors, want every error of a program, the command line wants to start running it quickly
+	eagerParse: bool = True
+	typeCheck: bool = True
+	# read and write compiled modules from/to the `__endcache__` directories
+	useCache: bool = True
+
+
+@dataclass
+class Program:
+	""" A program which went through the front end """
+	ast: list[ Stmt ]
+	# the module the program was loaded from, None if it was compiled from a string
+	module: Optional[ Module ] = None
+
+
+class CompileError(Exception):
+	""" A program failed to compile, `errors` has all the problems found, as `file:line:char: message` """
+	errors: list[ str ]
+
+	def __init__( self, errors: list[str] ) -> None:
+		super().__init__( errors[0] if len( errors ) == 1 else f'{len( errors )} errors, first: {errors[0]}' )
+		self.errors = errors
+
+
+def tokenize( source: str, file: str = '<string>' ) -> list[Token]:
+	"""
+	Tokenizes a string of code
+	:param source: the code
+	:param file: the file name used in locations
+	:raises CompileError: with all the tokenizer errors
+	"""
+	tokenizer = Tokenizer( source, file, recover=True ).tokenize()
+	if tokenizer.errors:
+		raise CompileError( [ _located( file, error.line, error.char, error.description ) for error in tokenizer.errors ] )
+	return tokenizer.code
+
+
+def parse( source: Union[ str, list[Token] ], file: str = '<string>', options: Optional[Options] = None ) -> list[Stmt]:
+	"""
+	Parses a string of code, or its tokens, into an AST
+	:param source: the code, or its tokens
+	:param file: the file name used in locations, if source is code
+	:param options: only `eagerParse` is used
+	:raises CompileError: with all the syntax errors
+	"""
+	options = options or Options()
+	parser = Parser( tokenize( source, file ) if isinstance( source, str ) else source, recover=True )
+	ast = parser.parseProgram( eager=options.eagerParse )
+	if ast is None:
+		raise CompileError( [
+			_locatedAt( error.token.loc, error.message ) if error.token else error.message
+			for error in parser.errors
+		] )
+	return ast
+
+
+def compile( source: Union[ str, Path ], options: Optional[Options] = None ) -> Program:
+	"""
+	Runs the front end on a program, and writes the backend's output if it has any
+	:param source: the code, or the path of the program's main module, whose imports are loaded too
+	:param options: the compilation options, defaults to `Options()`
+	:raises CompileError: with all the problems found
+	"""
+	options = options or Options()
+	program = _frontEnd( source, options )
+	backend = import_module( _backend( options ).pkg )
+	if program.module is not None and hasattr( backend, 'buildMain' ):
+		if backend.buildMain( program.ast, program.module ) != 0:
+			raise CompileError( [ f'backend {options.backend} failed to build {program.module.path}' ] )
+	return program
+
+
+def compileBatch( sources: Iterable[ Union[ str, Path ] ], options: Optional[Options] = None, workers: Optional[int] = None ) -> list[ Union[ Program, CompileError ] ]:
+	"""
+	Compiles many programs concurrently, on a pool of threads of this process
+	:param sources: the programs, as code or paths of their main module
+	:param options: the compilation options of all the programs, defaults to `Options()`
+	:param workers: number of threads, defaults to the executor's default
+	:return: for each program, in order, the compiled program or the error which stopped it
+	"""
+	from concurrent.futures import ThreadPoolExecutor
+
+	options = options or Options()
+
+	def compileOne( source: Union[ str, Path ] ) -> Union[ Program, CompileError ]:
+		try:
+			return compile( source, options )
+		except CompileError as e:
+			return e
+
+	with ThreadPoolExecutor( workers ) as pool:
+		return list( pool.map( compileOne, sources ) )
+
+
+def run( source: Union[ str, Path, Program ], options: Optional[Options] = None ) -> int:
+	"""
+	Runs a program with the selected backend, the program's output goes to the standard output and error
+	:param source: the code, the path of the program's main module, or an already compiled program
+	:param options: the compilation options, defaults to `Options()`
+	:return: the program's exit code
+	:raises CompileError: with all the problems found
+	"""
+	options = options or Options()
+	program = source if isinstance( source, Program ) else _frontEnd( source, options )
+	return import_module( _backend( options ).pkg ).backendMain( program.ast, program.module )  # type: ignore
+
+
+def _frontEnd( source: Union[ str, Path ], options: Options ) -> Program:
+	""" Loads, parses and type checks a program """
+	module: Optional[ Module ] = None
+	if isinstance( source, Path ):
+		# the loader loads modules in parallel and caches them, which is only worth importing for files
+		from module import ModuleError
+		from module.loader import ModuleLoader
+		try:
+			module = ModuleLoader( useCache=options.useCache ).load( source )
+		except ModuleError as e:
+			raise CompileError( [ e.args[0] ] ) from None
+		except OSError as e:
+			raise CompileError( [ f'{e.filename}: {e.strerror}' ] ) from None
+		except TokenizerError as e:
+			# in any of the modules, the message says which
+			raise CompileError( [ e.message or e.description ] ) from None
+		ast = parse( module.tokens, options=options )
+	else:
+		ast = parse( source, options=options )
+
+	if options.typeCheck:
+		checker = TypeChecker()
+		if not checker.checkStatements( ast ):
+			raise CompileError( [ _locatedAt( loc, message ) for loc, message in checker.locatedErrors ] )
+	return Program( ast, module )
+
+
+def _backend( options: Options ) -> BackendInfo:
+	try:
+		info = BACKENDS[ Platform.findAdeguate( options.backend ) ]
+	except ValueError as e:
+		raise CompileError( [ e.args[0] ] ) from None
+	if not info.available:
+		raise CompileError( [ f'backend {info.name} is not available' ] )
+	return info
+
+
+def _located( file: str, line: int, char: int, message: str ) -> str:
+	return f'{file}:{line}:{char}: {message}'
+
+
+def _locatedAt( loc: Loc, message: str ) -> str:
+	# locations count lines from 0
+	return _located( loc.file, loc.line + 1, loc.char, message )
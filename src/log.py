@@ -1,16 +1,33 @@
 import sys
+from contextvars import ContextVar
+from dataclasses import dataclass
 from typing import TextIO
 
-from cli import args
+
+@dataclass(frozen=True)
+class LogSettings:
+	# 0: everything 1: warns up 2: only errors
+	verboseLevel: int = 1
+	# enable debug logging
+	debug: bool = False
+
+
+# per context, so that compilations running concurrently on different threads can log differently
+_settings: ContextVar[ LogSettings ] = ContextVar( 'logSettings', default=LogSettings() )
+
+
+def configure( settings: LogSettings ) -> None:
+	""" Sets how much is logged, for the current thread/context """
+	_settings.set( settings )
 
 
 def _log(level: int, msg: str, file: TextIO) -> None:
-	if args.verboseLevel <= level:
+	if _settings.get().verboseLevel <= level:
 		print(msg, file=file)
 
 
 def debug(msg: str, file: TextIO = sys.stdout) -> None:
-	if args.debug:
+	if _settings.get().debug:
 		_log( 0, f'[DEBUG] {msg}', file )
 
 
@@ -0,0 +1,61 @@
+"""
+Package containing the language server, which gives editors live diagnostics (`endcc lsp`)
+
+Table of contents:
+	- document: An open document, split into blocks of top level statements which are parsed separately
+	- server: The server, handling the messages of a client over the standard input and output
+
+The server talks the Language Server Protocol: JSON-RPC messages, each one preceded by a
+`Content-Length: N` header and an empty line. The supported messages are `initialize`, `shutdown`, `exit`,
+`textDocument/didOpen`, `textDocument/didChange` (full or incremental) and `textDocument/didClose`, and the
+server sends `textDocument/publishDiagnostics` after each change. The `endc/latency` request returns the
+time taken to handle each kind of message.
+"""
+import json
+from typing import Any, BinaryIO, Final, Optional
+
+
+# messages bigger than this are a protocol error, not a reason to allocate that much memory
+MAX_MESSAGE: Final[ int ] = 256 * 1024 * 1024
+
+Message = dict[ str, Any ]
+
+
+class ProtocolError(Exception):
+	pass
+
+
+def readMessage( stream: BinaryIO ) -> Optional[Message]:
+	"""
+	Reads a message
+	:return: the message, or None if the stream ended
+	:raises ProtocolError: if the message is malformed
+	"""
+	length: Optional[ int ] = None
+	while ( line := stream.readline() ) not in ( b'\r\n', b'\n' ):
+		if not line:
+			if length is None:
+				return None
+			raise ProtocolError( 'stream ended in the headers of a message' )
+		name, _, value = line.decode( 'ascii', errors='replace' ).partition( ':' )
+		if name.strip().lower() == 'content-length':
+			try:
+				length = int( value )
+			except ValueError:
+				raise ProtocolError( f'invalid Content-Length: {value.strip()}' ) from None
+	if length is None or not 0 <= length <= MAX_MESSAGE:
+		raise ProtocolError( f'invalid message length {length}' )
+
+	body = stream.read( length )
+	if len( body ) < length:
+		raise ProtocolError( 'stream ended in the middle of a message' )
+	try:
+		return json.loads( body )
+	except ValueError as e:
+		raise ProtocolError( f'invalid JSON: {e}' ) from None
+
+
+def writeMessage( stream: BinaryIO, message: Message ) -> None:
+	body = json.dumps( message, separators=( ',', ':' ) ).encode()
+	stream.write( b'Content-Length: %d\r\n\r\n' % len( body ) + body )
+	stream.flush()
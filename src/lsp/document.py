@@ -0,0 +1,211 @@
+"""
+A document open in the language server.
+
+The code is kept by an incremental tokenizer, and split into blocks: a block is one or more top level
+statements, like a subroutine or a template, with the lines around them, so that the blocks cover all the
+lines of the document. Each block is parsed on its own and keeps its statements and diagnostics, an edit
+only parses again the blocks it touched, the other blocks are just moved if the edit added or removed lines.
+"""
+from __future__ import annotations
+
+from bisect import bisect_right
+from dataclasses import dataclass, replace
+from typing import Final, Optional
+
+from ast_.parser import Parser
+from ast_.stmt import Stmt
+from check import Diagnostic
+from token_ import Token, Keyword, Symbol
+from token_.incremental import IncrementalTokenizer
+
+
+# keywords continuing the statement before them, after its closing bracket
+_CONTINUATIONS: Final[ tuple[ Keyword, ... ] ] = ( Keyword.ELSE, Keyword.UNTIL )
+
+
+@dataclass(eq=False)
+class Block:
+	# first line of the block, the block ends where the next one starts
+	start: int
+	# None if the block has syntax errors
+	statements: Optional[ list[Stmt] ]
+	# their lines are 0-based and relative to the start of the block
+	diagnostics: list[ Diagnostic ]
+	# the first line of the block when it was parsed, which the locations in the statements are relative to
+	parsedAt: int
+	# the first line of the block when its tokenizer errors were collected, their messages have line numbers in them
+	checkedAt: int
+
+
+class Document:
+	uri: str
+	version: int
+	tokens: IncrementalTokenizer
+	blocks: list[ Block ]
+	# the blocks with diagnostics
+	_failing: set[ Block ]
+
+	def __init__( self, uri: str, text: str, version: int = 0 ) -> None:
+		self.uri = uri
+		self.version = version
+		self.tokens = IncrementalTokenizer( text, uri )
+		self.blocks = []
+		self._failing = set()
+		self._reparse( 0, 0, 0, range( 0, len( self.tokens.lines ) ) )
+
+	@property
+	def text( self ) -> str:
+		return self.tokens.source
+
+	def diagnostics( self ) -> list[Diagnostic]:
+		""" The problems found in the document, their lines are 1-based """
+		diagnostics: list[ Diagnostic ] = []
+		for block in sorted( self._failing, key=lambda block: block.start ):
+			if block.checkedAt != block.start:
+				i = self._blockAt( block.start )
+				stop = self.blocks[ i + 1 ].start if i + 1 < len( self.blocks ) else len( self.tokens.lines )
+				parser = [ diagnostic for diagnostic in block.diagnostics if diagnostic.source != 'tokenizer' ]
+				block.diagnostics = self._tokenizerDiagnostics( block.start, stop ) + parser
+				block.checkedAt = block.start
+			diagnostics += [ replace( diagnostic, line=block.start + diagnostic.line + 1 ) for diagnostic in block.diagnostics ]
+		return diagnostics
+
+	def edit( self, startLine: int, startChar: int, endLine: int, endChar: int, text: str ) -> int:
+		"""
+		Replaces a range of the document, positions are 0-based and the end is excluded
+		:param text: the new text of the range
+		:return: the number of blocks which were parsed again
+		"""
+		total = len( self.tokens.lines )
+		first, last = self._blockAt( startLine ), self._blockAt( endLine )
+		relexed = self.tokens.edit( startLine, startChar, endLine, endChar, text )
+		return self._reparse( first, last + 1, len( self.tokens.lines ) - total, relexed )
+
+	def update( self, text: str ) -> int:
+		"""
+		Replaces all the text of the document, only the lines which changed are parsed again
+		:return: the number of blocks which were parsed again
+		"""
+		lines, old = text.splitlines( True ), self.tokens.lines
+		start = 0
+		while start < min( len( lines ), len( old ) ) and lines[ start ] == old[ start ]:
+			start += 1
+		end = 0
+		while end < min( len( lines ), len( old ) ) - start and lines[ -1 - end ] == old[ -1 - end ]:
+			end += 1
+		return self.edit( start, 0, len( old ) - end, 0, ''.join( lines[ start : len( lines ) - end ] ) )
+
+	# PRIVATE METHODS
+
+	def _blockAt( self, line: int ) -> int:
+		return max( bisect_right( self.blocks, line, key=lambda block: block.start ) - 1, 0 )
+
+	def _reparse( self, first: int, stop: int, delta: int, relexed: range ) -> int:
+		"""
+		Parses again the lines of some blocks, after an edit
+		:param first: the first block the edit touched
+		:param stop: the block after the last one the edit touched
+		:param delta: the number of lines the edit added
+		:param relexed: the lines the tokenizer lexed again, the blocks they're in are parsed too
+		"""
+		total = len( self.tokens.lines )
+		stop = min( stop, len( self.blocks ) )
+		while first > 0 and self.blocks[ first ].start > relexed.start:
+			first -= 1
+
+		while True:
+			start = self.blocks[ first ].start if first < len( self.blocks ) else 0
+			end = self.blocks[ stop ].start + delta if stop < len( self.blocks ) else total
+			if stop < len( self.blocks ) and end < relexed.stop:
+				stop += 1
+				continue
+			statements, complete = _statements( self.tokens.tokensIn( start, end ) )
+			# a statement continuing the one before, or going on in the next block
+			if first > 0 and statements and statements[ 0 ][ 0 ].value in _CONTINUATIONS:
+				first -= 1
+				continue
+			if stop < len( self.blocks ) and ( not complete or statements and statements[ -1 ][ -1 ].value == Symbol.RBRACK and self._continues( end ) ):
+				stop += 1
+				continue
+			break
+
+		blocks = [ self._parse( start, lines, statements ) for start, lines, statements in _group( statements, start, end ) ]
+		self._failing.difference_update( self.blocks[ first : stop ] )
+		self._failing.update( block for block in blocks if block.diagnostics )
+		self.blocks[ first : stop ] = blocks
+		if delta:
+			for block in self.blocks[ first + len( blocks ) : ]:
+				block.start += delta
+		return len( blocks )
+
+	def _continues( self, line: int ) -> bool:
+		""" Whether the first token from a line on continues the statement before it """
+		for i in range( line, len( self.tokens.lines ) ):
+			if tokens := self.tokens.tokensIn( i, i + 1 ):
+				return tokens[ 0 ].value in _CONTINUATIONS
+		return False
+
+	def _parse( self, start: int, stop: int, statements: list[ list[Token] ] ) -> Block:
+		""" Parses the statements of a block, from line `start` to `stop`, excluded """
+		diagnostics = self._tokenizerDiagnostics( start, stop )
+		parser = Parser( [ token for statement in statements for token in statement ], recover=True )
+		ast = parser.parseProgram( eager=True )
+		# the parser often trips on the tokens of a line with a tokenizer error, which would only repeat it
+		broken = { diagnostic.line for diagnostic in diagnostics }
+		for error in parser.errors:
+			line = error.token.loc.line - start if error.token else 0
+			if line not in broken:
+				diagnostics.append( Diagnostic( 'parser', line, error.token.loc.char if error.token else 0, error.message ) )
+		return Block( start, ast, diagnostics, start, start )
+
+	def _tokenizerDiagnostics( self, start: int, stop: int ) -> list[Diagnostic]:
+		return [
+			Diagnostic( 'tokenizer', error.line - 1 - start, error.char, error.description )
+			for error in self.tokens.errorsIn( start, stop )
+		]
+
+
+def _statements( tokens: list[Token] ) -> tuple[ list[ list[Token] ], bool ]:
+	"""
+	Splits tokens into top level statements
+	:return: the statements, and whether the last one is complete
+	"""
+	statements: list[ list[Token] ] = []
+	current: list[ Token ] = []
+	depth = 0
+	for token in tokens:
+		if not current and statements and token.value in _CONTINUATIONS and statements[ -1 ][ -1 ].value == Symbol.RBRACK:
+			current = statements.pop()
+		current.append( token )
+		if token.value == Symbol.LBRACK:
+			depth += 1
+		elif token.value == Symbol.RBRACK:
+			depth = max( depth - 1, 0 )
+		if depth == 0 and token.value in ( Symbol.RBRACK, Symbol.SLASH ):
+			statements.append( current )
+			current = []
+	if current:
+		statements.append( current )
+	return statements, not current
+
+
+def _group( statements: list[ list[Token] ], start: int, end: int ) -> list[ tuple[ int, int, list[ list[Token] ] ] ]:
+	"""
+	Groups statements into blocks of whole lines, covering the lines from `start` to `end`, excluded
+	:return: the first and after-last line of each block, and its statements
+	"""
+	if start == end:
+		return []
+	groups: list[ tuple[ int, int, list[ list[Token] ] ] ] = []
+	for statement in statements:
+		# statements sharing a line are in the same block
+		if groups and statement[ 0 ].loc.line < groups[ -1 ][ 1 ]:
+			groups[ -1 ][ 2 ].append( statement )
+			groups[ -1 ] = ( groups[ -1 ][ 0 ], statement[ -1 ].loc.line + 1, groups[ -1 ][ 2 ] )
+		else:
+			groups.append( ( groups[ -1 ][ 1 ] if groups else start, statement[ -1 ].loc.line + 1, [ statement ] ) )
+	if not groups:
+		return [ ( start, end, [] ) ]
+	# the lines after the last statement are in its block
+	groups[ -1 ] = ( groups[ -1 ][ 0 ], end, groups[ -1 ][ 2 ] )
+	return groups
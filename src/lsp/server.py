@@ -0,0 +1,211 @@
+"""
+The language server: handles the messages of a client, one at a time, and publishes the diagnostics of
+the documents it changed. The time taken by each message is recorded, see `Latency`.
+"""
+from __future__ import annotations
+
+import sys
+from collections import deque
+from time import perf_counter
+from typing import Any, BinaryIO, Callable, Final, Optional
+
+from check import Diagnostic
+from log import debug, error
+from . import Message, ProtocolError, readMessage, writeMessage
+from .document import Document
+
+
+# JSON-RPC error codes
+METHOD_NOT_FOUND: Final[ int ] = -32601
+INVALID_PARAMS: Final[ int ] = -32602
+INTERNAL_ERROR: Final[ int ] = -32603
+# how many of the latest timings of a method are kept for the percentiles
+SAMPLES: Final[ int ] = 1000
+
+
+class Latency:
+	""" Times taken to handle the messages of a method """
+	count: int
+	total: float
+	max: float
+	samples: deque[ float ]
+
+	def __init__( self ) -> None:
+		self.count = 0
+		self.total = self.max = 0.0
+		self.samples = deque( maxlen=SAMPLES )
+
+	def add( self, seconds: float ) -> None:
+		self.count += 1
+		self.total += seconds
+		self.max = max( self.max, seconds )
+		self.samples.append( seconds )
+
+	def toJson( self ) -> dict[ str, float ]:
+		""" The statistics, in milliseconds, the percentiles are of the latest samples """
+		samples = sorted( self.samples )
+		return {
+			'count': self.count,
+			'mean': self.total / self.count * 1000 if self.count else 0.0,
+			'p50': samples[ len( samples ) // 2 ] * 1000 if samples else 0.0,
+			'p99': samples[ len( samples ) * 99 // 100 ] * 1000 if samples else 0.0,
+			'max': self.max * 1000
+		}
+
+
+class LanguageServer:
+	documents: dict[ str, Document ]
+	latency: dict[ str, Latency ]
+	# sends a message to the client
+	send: Callable[ [Message], None ]
+	shutdown: bool
+	# set by the exit notification
+	exitCode: Optional[ int ]
+
+	def __init__( self, send: Callable[ [Message], None ] ) -> None:
+		self.documents = {}
+		self.latency = {}
+		self.send = send
+		self.shutdown = False
+		self.exitCode = None
+
+	def handle( self, message: Message ) -> None:
+		""" Handles a message from the client, and sends the response if it's a request """
+		start = perf_counter()
+		method: str = message.get( 'method', '' )
+		handler = getattr( self, _HANDLERS.get( method, '' ), None )
+		try:
+			if handler is not None:
+				result = handler( message.get( 'params' ) or {} )
+				response = { 'jsonrpc': '2.0', 'id': message.get( 'id' ), 'result': result }
+			else:
+				response = _error( message.get( 'id' ), METHOD_NOT_FOUND, f'unsupported method {method}' )
+		except ( KeyError, TypeError, ValueError ) as e:
+			response = _error( message.get( 'id' ), INVALID_PARAMS, f'invalid parameters for {method}: {e!r}' )
+		except Exception as e:
+			response = _error( message.get( 'id' ), INTERNAL_ERROR, f'{type( e ).__name__}: {e}' )
+		# notifications have no response, unknown ones are ignored
+		if 'id' in message:
+			self.send( response )
+		elif 'error' in response and handler is not None:
+			error( f'{method}: {response[ "error" ][ "message" ]}' )
+
+		elapsed = perf_counter() - start
+		self.latency.setdefault( method, Latency() ).add( elapsed )
+		debug( f'{method} handled in {elapsed * 1000:.3f} ms', file=sys.stderr )
+
+	def publish( self, document: Document ) -> None:
+		self.send( {
+			'jsonrpc': '2.0',
+			'method': 'textDocument/publishDiagnostics',
+			'params': {
+				'uri': document.uri,
+				'version': document.version,
+				'diagnostics': [ _toLsp( diagnostic, document.tokens.lines ) for diagnostic in document.diagnostics() ]
+			}
+		} )
+
+	# HANDLERS
+
+	def onInitialize( self, params: dict[ str, Any ] ) -> dict[ str, Any ]:
+		return {
+			'capabilities': {
+				# incremental changes
+				'textDocumentSync': { 'openClose': True, 'change': 2 }
+			},
+			'serverInfo': { 'name': 'endcc' }
+		}
+
+	def onInitialized( self, params: dict[ str, Any ] ) -> None:
+		pass
+
+	def onShutdown( self, params: dict[ str, Any ] ) -> None:
+		self.shutdown = True
+
+	def onExit( self, params: dict[ str, Any ] ) -> None:
+		self.exitCode = 0 if self.shutdown else 1
+
+	def onDidOpen( self, params: dict[ str, Any ] ) -> None:
+		item = params[ 'textDocument' ]
+		document = self.documents[ item[ 'uri' ] ] = Document( item[ 'uri' ], item[ 'text' ], item.get( 'version', 0 ) )
+		self.publish( document )
+
+	def onDidChange( self, params: dict[ str, Any ] ) -> None:
+		document = self.documents[ params[ 'textDocument' ][ 'uri' ] ]
+		for change in params[ 'contentChanges' ]:
+			if 'range' in change:
+				start, end = change[ 'range' ][ 'start' ], change[ 'range' ][ 'end' ]
+				document.edit( start[ 'line' ], start[ 'character' ], end[ 'line' ], end[ 'character' ], change[ 'text' ] )
+			else:
+				document.update( change[ 'text' ] )
+		document.version = params[ 'textDocument' ].get( 'version', document.version )
+		self.publish( document )
+
+	def onDidClose( self, params: dict[ str, Any ] ) -> None:
+		uri = params[ 'textDocument' ][ 'uri' ]
+		self.documents.pop( uri, None )
+		self.send( { 'jsonrpc': '2.0', 'method': 'textDocument/publishDiagnostics', 'params': { 'uri': uri, 'diagnostics': [] } } )
+
+	def onLatency( self, params: dict[ str, Any ] ) -> dict[ str, dict[ str, float ] ]:
+		return { method: latency.toJson() for method, latency in self.latency.items() }
+
+
+_HANDLERS: Final[ dict[ str, str ] ] = {
+	'initialize': 'onInitialize',
+	'initialized': 'onInitialized',
+	'shutdown': 'onShutdown',
+	'exit': 'onExit',
+	'textDocument/didOpen': 'onDidOpen',
+	'textDocument/didChange': 'onDidChange',
+	'textDocument/didClose': 'onDidClose',
+	'endc/latency': 'onLatency'
+}
+
+
+def _error( id: Any, code: int, message: str ) -> Message:
+	return { 'jsonrpc': '2.0', 'id': id, 'error': { 'code': code, 'message': message } }
+
+
+def _toLsp( diagnostic: Diagnostic, lines: list[str] ) -> dict[ str, Any ]:
+	""" Converts a diagnostic, with 1-based positions, to the protocol's, which are 0-based """
+	line = max( diagnostic.line - 1, 0 )
+	start = max( diagnostic.char - 1, 0 )
+	text = lines[ line ] if line < len( lines ) else ''
+	# underline the word the problem is at
+	end = start + 1
+	while end < len( text ) and text[ end ] not in ' \r\n/.{}[]()':
+		end += 1
+	return {
+		'range': { 'start': { 'line': line, 'character': start }, 'end': { 'line': line, 'character': end } },
+		'severity': 1 if diagnostic.severity == 'error' else 2,
+		'source': f'endc {diagnostic.source}',
+		'message': diagnostic.message
+	}
+
+
+def serve( stdin: BinaryIO, stdout: BinaryIO ) -> int:
+	"""
+	Serves a client until it sends the exit notification or closes the input
+	:return: exit code, 0 if the client asked to shut down first
+	"""
+	server = LanguageServer( lambda message: writeMessage( stdout, message ) )
+	while server.exitCode is None:
+		try:
+			message = readMessage( stdin )
+		except ProtocolError as e:
+			error( f'Protocol error: {e}' )
+			return 1
+		if message is None:
+			return 0 if server.shutdown else 1
+		server.handle( message )
+	return server.exitCode
+
+
+def serveMain() -> int:
+	""" Serves a client on the standard input and output """
+	# the protocol owns the standard output, stray prints go to the standard error
+	stdout, sys.stdout = sys.stdout, sys.stderr
+	try:
+		return serve( sys.stdin.buffer, stdout.buffer )
+	finally:
+		sys.stdout = stdout
@@ -0,0 +1,154 @@
+"""
+Package containing the module system, which resolves `OWN ... FROM` imports
+
+Table of contents:
+	- cache: On-disk cache of compiled modules, keyed by content hash
+	- interface: Interface summaries of the exported declarations of a module
+	- loader: Loads a module and its whole import graph
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Optional
+
+from token_ import Token, TokenType, Keyword, Symbol, UnaryType, Loc
+
+
+# extensions tried, in order, when resolving `FROM name/`
+EXTENSIONS: tuple[ str, ... ] = ( '.ec', '.endc' )
+
+
+class ModuleError(RuntimeError):
+	pass
+
+
+@dataclass
+class Import:
+	names: list[ str ]
+	path: str
+	loc: Loc
+
+
+@dataclass
+class Signature:
+	name: str
+	# either SUBROUTIN or TMPLAT
+	kind: str
+	# ( type, name ) pairs
+	params: list[ tuple[ str, str ] ]
+	returns: Optional[str]
+
+
+@dataclass(eq=False)
+class Module:
+	name: str
+	path: Path
+	hash: str
+	imports: list[ Import ]
+	exports: dict[ str, Signature ]
+	# import path -> module, filled by the loader
+	dependencies: dict[ str, Module ] = field( default_factory=dict, repr=False )
+	# whether the module was read from the on-disk cache, or memoized by an earlier load of this process
+	cached: bool = False
+	_tokens: Optional[ list[Token] ] = field( default=None, repr=False )
+	# compiles the module's tokens, set when the module was loaded from its interface summary
+	_compile: Optional[ Callable[ [], list[Token] ] ] = field( default=None, repr=False )
+
+	@property
+	def tokens( self ) -> list[Token]:
+		""" The module's tokens, compiled on first access if the module was loaded from its interface summary """
+		if self._tokens is None:
+			# None if another thread just compiled them, the copies of a memoized module share it
+			if ( compile := self._compile ) is not None:
+				self._tokens = compile()
+				self._compile = None
+			assert self._tokens is not None
+		return self._tokens
+
+	@property
+	def compiled( self ) -> bool:
+		return self._tokens is not None
+
+
+def findSources( root: Path ) -> list[Path]:
+	""" Lists the modules in a directory and its subdirectories, skipping the cache directories """
+	# the cache pulls in json and hashlib, which most users of the module don't need
+	from .cache import CACHE_DIR
+
+	return sorted(
+		path.resolve() for path in root.rglob( '*' )
+		if path.suffix in EXTENSIONS and CACHE_DIR not in path.parts and path.is_file()
+	)
+
+
+def resolve( importer: Path, imp: Import ) -> Path:
+	"""
+	Finds the source file of an import, relative to the importing module
+	:param importer: path of the importing module
+	:param imp: the import
+	:raises ModuleError: if no source file matches the import
+	"""
+	for ext in EXTENSIONS:
+		candidate = ( importer.parent / imp.path ).with_suffix( ext )
+		if candidate.exists():
+			return candidate.resolve()
+	raise ModuleError( f'Module "{imp.path}" not found, imported at {imp.loc}' )
+
+
+def findImports( tokens: list[Token] ) -> list[Import]:
+	""" Collects the `OWN name. name FROM path/` statements, the tokenizer already validated their syntax """
+	imports: list[ Import ] = []
+	for i, token in enumerate( tokens ):
+		if token.value is not Keyword.OWN:
+			continue
+		names: list[ str ] = []
+		j = i + 1
+		while tokens[ j ].value is not Keyword.FROM:
+			if tokens[ j ].typ is TokenType.NAME:
+				names.append( str( tokens[ j ].value ) )
+			j += 1
+		imports.append( Import( names, str( tokens[ j + 1 ].value ), token.loc ) )
+	return imports
+
+
+def findExports( tokens: list[Token] ) -> dict[str, Signature]:
+	""" Collects the signatures of `XPORT DCLAR SUBROUTIN name{ type name } <- type [` and `XPORT DCLAR TMPLAT name [` """
+	exports: dict[ str, Signature ] = {}
+	for i, token in enumerate( tokens[ : -3 ] ):
+		if not (
+			token.value is Keyword.EXPORT and
+			tokens[ i + 1 ].value is Keyword.DECLARE and
+			tokens[ i + 2 ].value in ( Keyword.SUBROUTINE, Keyword.TEMPLATE ) and
+			tokens[ i + 3 ].typ is TokenType.NAME
+		):
+			continue
+		name = str( tokens[ i + 3 ].value )
+
+		if tokens[ i + 2 ].value is Keyword.TEMPLATE:
+			exports[ name ] = Signature( name, Keyword.TEMPLATE.value, [], None )
+			continue
+
+		params: list[ tuple[ str, str ] ] = []
+		j = i + 5  # skip the {
+		while tokens[ j ].value is not Symbol.RBRACE:
+			if tokens[ j ].value is Symbol.DOT:
+				j += 1
+			typ, j = _readType( tokens, j )
+			params.append( ( typ, str( tokens[ j ].value ) ) )
+			j += 1
+		j += 1
+		# the tokenizer splits <- into < and -
+		while tokens[ j ].value in ( Symbol.ARROW, UnaryType.GREATER, UnaryType.ADD ):
+			j += 1
+		returns, j = _readType( tokens, j )
+		exports[ name ] = Signature( name, Keyword.SUBROUTINE.value, params, returns )
+	return exports
+
+
+def _readType( tokens: list[Token], index: int ) -> tuple[ str, int ]:
+	""" Reads a type name, which is an array type if followed by `()`, returning it with the index after it """
+	typ = str( tokens[ index ].value )
+	if tokens[ index + 1 ].value is Symbol.LPAREN and tokens[ index + 2 ].value is Symbol.RPAREN:
+		return typ + '()', index + 3
+	return typ, index + 1
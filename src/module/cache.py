@@ -0,0 +1,124 @@
+"""
+On-disk cache of compiled modules.
+
+Compiled modules are stored in a `__endcache__` directory next to their source, in files
+named `<source file name>.<hash>.endcm`, like `foo.ec.<hash>.endcm`, where the hash covers both the source and the
+cache format. The whole file name is used, so `foo.ec` and `foo.endc` in the same directory don't share files.
+Older versions named the files after the stem of the source, `foo.<hash>.endcm` and `foo.endci`, writing a module
+removes those too.
+The files are JSON, which can't run code when read, unlike pickle, and hold the whole hash of the
+source they were compiled from, which is checked before the tokens are used.
+"""
+from __future__ import annotations
+
+import os
+import re
+import threading
+from enum import Enum
+from hashlib import sha256
+from json import dumps, loads
+from pathlib import Path
+from typing import Any, Final, Optional
+
+from token_ import Token, TokenType, Keyword, Symbol, UnaryType, Loc
+from . import EXTENSIONS
+
+
+# bump when the tokenizer output or the artifact layout changes
+CACHE_VERSION: Final[ int ] = 3
+CACHE_DIR: Final[ str ] = '__endcache__'
+
+Artifact = list[ Token ]
+# the enums token values may be members of, by the tag they're stored with
+_ENUMS: Final[ dict[ str, type[ Keyword ] | type[ Symbol ] | type[ UnaryType ] ] ] = { 'k': Keyword, 's': Symbol, 'u': UnaryType }
+
+
+def hashSource( source: bytes ) -> str:
+	return sha256( CACHE_VERSION.to_bytes( 4, 'little' ) + source ).hexdigest()
+
+
+def _cacheFile( path: Path, hash: str ) -> Path:
+	return path.parent / CACHE_DIR / f'{path.name}.{hash[:32]}.endcm'
+
+
+def _isCacheOf( file: Path, path: Path ) -> bool:
+	"""
+	Whether a file is a compiled module of the given source, `foo.ec.<hash>.endcm` but not `foo.ec.bar.ec.<hash>.endcm`,
+	or a file older versions wrote for it, `foo.<hash>.endcm` or `foo.endci`
+	"""
+	if re.fullmatch( rf'{re.escape( path.name )}\.[0-9a-f]{{32}}\.endcm', file.name ) is not None:
+		return True
+	# the old names of `foo.ec.ec` would be the current ones of `foo.ec`
+	return Path( path.stem ).suffix not in EXTENSIONS and re.fullmatch( rf'{re.escape( path.stem )}(\.[0-9a-f]{{32}}\.endcm|\.endci)', file.name ) is not None
+
+
+def _encode( tokens: Artifact ) -> dict[ str, Any ]:
+	files: dict[ str, int ] = {}
+	encoded: list[ list[ Any ] ] = []
+	for token in tokens:
+		value = token.value
+		if isinstance( value, Enum ):
+			tag = next( tag for tag, enum in _ENUMS.items() if isinstance( value, enum ) )
+			value = value.name
+		else:
+			tag = 'f' if isinstance( value, float ) else 't'
+		file = files.setdefault( token.loc.file, len( files ) )
+		encoded.append( [ token.typ.name, tag, value, file, token.loc.line, token.loc.char ] )
+	return { 'files': list( files ), 'tokens': encoded }
+
+
+def _decode( data: dict[ str, Any ] ) -> Artifact:
+	""" :raises ValueError, KeyError, TypeError, IndexError: if the data is not a valid artifact """
+	files: list[ str ] = data[ 'files' ]
+	tokens: Artifact = []
+	for typ, tag, value, file, line, char in data[ 'tokens' ]:
+		tokens.append( Token( TokenType[ typ ], _decodeValue( tag, value ), Loc( files[ file ], int( line ), int( char ) ) ) )
+	return tokens
+
+
+def _decodeValue( tag: str, value: object ) -> float | str | Keyword | Symbol | UnaryType:
+	""" :raises KeyError, TypeError: if the value is not a valid token value """
+	if tag in _ENUMS:
+		return _ENUMS[ tag ][ str( value ) ]
+	if tag == 'f' and isinstance( value, float ) or tag == 't' and isinstance( value, str ):
+		return value
+	raise TypeError( f'invalid token value {value!r}' )
+
+
+def read( path: Path, hash: str ) -> Optional[Artifact]:
+	"""
+	Reads the compiled module of the given source, if there is an up-to-date one
+	:param path: path of the source file
+	:param hash: hash of the current source
+	:return: the compiled module or None
+	"""
+	try:
+		data: dict[ str, Any ] = loads( _cacheFile( path, hash ).read_bytes() )
+		if data[ 'version' ] != CACHE_VERSION or data[ 'hash' ] != hash:
+			return None
+		return _decode( data )
+	except ( OSError, ValueError, KeyError, TypeError, IndexError ):
+		return None
+
+
+def write( path: Path, hash: str, artifact: Artifact ) -> None:
+	"""
+	Stores the compiled module of the given source, replacing stale ones.
+	Failing to write the cache is not an error, the module will just be compiled again next time.
+	:param path: path of the source file
+	:param hash: hash of the current source
+	:param artifact: compiled module
+	"""
+	file = _cacheFile( path, hash )
+	try:
+		file.parent.mkdir( exist_ok=True )
+		for stale in file.parent.glob( f'{path.stem}.*' ):
+			if _isCacheOf( stale, path ):
+				stale.unlink( missing_ok=True )
+		# write then rename, so concurrent readers never see a partial file
+		# unique per writer, threads of the same process may write the same file concurrently
+		tmp = file.with_suffix( f'.{os.getpid()}.{threading.get_ident()}.tmp' )
+		tmp.write_text( dumps( { 'version': CACHE_VERSION, 'hash': hash, **_encode( artifact ) }, separators=( ',', ':' ) ) )
+		os.replace( tmp, file )
+	except OSError:
+		pass
@@ -0,0 +1,80 @@
+"""
+Interface summaries of modules.
+
+A summary lists the imports and the exported declarations (with their parameter and return types)
+of a module, so that importers can check their imports without tokenizing the whole module.
+Summaries are JSON files stored as `__endcache__/<source file name>.endci`, like `foo.ec.endci`, and are stale
+once the hash of the module's source changes.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from json import dumps, loads
+from pathlib import Path
+from typing import Final, Optional, Any
+
+from token_ import Loc
+from . import Import, Signature
+from .cache import CACHE_DIR
+
+
+INTERFACE_VERSION: Final[ int ] = 1
+
+Interface = tuple[ list[Import], dict[str, Signature] ]
+
+
+def _interfaceFile( path: Path ) -> Path:
+	return path.parent / CACHE_DIR / f'{path.name}.endci'
+
+
+def read( path: Path, hash: str ) -> Optional[Interface]:
+	"""
+	Reads the interface summary of the given source, if there is an up-to-date one
+	:param path: path of the source file
+	:param hash: hash of the current source
+	:return: the module's imports and exports or None
+	"""
+	try:
+		data: dict[ str, Any ] = loads( _interfaceFile( path ).read_text() )
+		if data[ 'version' ] != INTERFACE_VERSION or data[ 'hash' ] != hash:
+			return None
+		return (
+			[ Import( imp[ 'names' ], imp[ 'path' ], Loc( *imp[ 'loc' ] ) ) for imp in data[ 'imports' ] ],
+			{
+				sig[ 'name' ]: Signature( sig[ 'name' ], sig[ 'kind' ], [ tuple( param ) for param in sig[ 'params' ] ], sig[ 'returns' ] )  # type: ignore
+				for sig in data[ 'exports' ]
+			}
+		)
+	except ( OSError, ValueError, KeyError, TypeError ):
+		return None
+
+
+def write( path: Path, hash: str, imports: list[Import], exports: dict[str, Signature] ) -> None:
+	"""
+	Writes the interface summary of the given source.
+	Failing to write it is not an error, the module will just be compiled again next time.
+	:param path: path of the source file
+	:param hash: hash of the current source
+	:param imports: the module's imports
+	:param exports: the module's exported declarations
+	"""
+	file = _interfaceFile( path )
+	data = {
+		'version': INTERFACE_VERSION,
+		'hash': hash,
+		'imports': [ { 'names': imp.names, 'path': imp.path, 'loc': list( imp.loc ) } for imp in imports ],
+		'exports': [
+			{ 'name': sig.name, 'kind': sig.kind, 'params': sig.params, 'returns': sig.returns }
+			for sig in exports.values()
+		]
+	}
+	try:
+		file.parent.mkdir( exist_ok=True )
+		# write then rename, so concurrent readers never see a partial file
+		# per thread too, like cache.write
+		tmp = file.with_suffix( f'.{os.getpid()}.{threading.get_ident()}.tmp' )
+		tmp.write_text( dumps( data, indent='\t' ) )
+		os.replace( tmp, file )
+	except OSError:
+		pass
@@ -0,0 +1,189 @@
+"""
+Loads a module and its whole import graph.
+
+Each version of a file is loaded once per process and memoized in the module table, shared by all the loaders, and
+compiled modules are cached on disk. Every loader links its own copies of the memoized modules, so that loaders
+running on different threads, or loading different versions of a dependency, never change each other's modules.
+Modules with an up-to-date interface summary are loaded from it, and only compiled once
+their tokens are needed.
+Modules that do not depend on each other are tokenized in parallel by worker processes, as the tokenizer
+is pure python and threads would take turns holding the GIL. The workers only send back the imports and
+exports, the tokens go through the disk cache, so modules are tokenized in the loader's process when the
+cache is disabled.
+"""
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from functools import partial
+from pathlib import Path
+from threading import Lock
+from typing import Optional
+
+from token_ import Token, tokenizer
+from . import Module, ModuleError, Import, Signature, findImports, findExports, resolve, cache, interface
+
+
+# ( path, hash ) -> module, unlinked, of all the modules loaded by this process, only the last version of a file is kept
+_table: dict[ tuple[ Path, str ], Module ] = {}
+# path -> hash of the version in the table
+_versions: dict[ Path, str ] = {}
+_tableLock: Lock = Lock()
+
+
+class ModuleLoader:
+	""" Loads modules, keeping the ones it linked in `modules` """
+	modules: dict[ Path, Module ]
+	useCache: bool
+	workers: Optional[int]
+	_linked: set[ Path ]
+	_lock: Lock
+
+	def __init__( self, useCache: bool = True, workers: Optional[int] = None ) -> None:
+		"""
+		:param useCache: whether to read and write compiled modules from/to disk
+		:param workers: max number of processes tokenizing modules, defaults to the number of CPUs
+		"""
+		self.modules = {}
+		self.useCache = useCache
+		self.workers = workers
+		self._linked = set()
+		self._lock = Lock()
+
+	def load( self, path: Path ) -> Module:
+		"""
+		Loads the given module and all of its dependencies
+		:param path: path of the module's source
+		:return: the loaded module
+		:raises ModuleError: if a module is missing, doesn't export an imported name or there is an import cycle
+		:raises TokenizerError: if a module fails to tokenize
+		"""
+		path = path.resolve()
+		with self._lock:
+			if path not in self.modules:
+				self._loadGraph( path )
+			module = self.modules[ path ]
+			if path not in self._linked:
+				self._link( module, [] )
+			return module
+
+	def resolve( self, importer: Module, imp: Import ) -> Path:
+		""" Finds the source file of an import, relative to the importing module """
+		return resolve( importer.path, imp )
+
+	# PRIVATE METHODS
+
+	def _loadGraph( self, root: Path ) -> None:
+		""" Loads all the modules reachable from root, a wave of independent modules at a time """
+		pending: list[ Path ] = [ root ]
+		with ExitStack() as stack:
+			pool: Optional[ ProcessPoolExecutor ] = None
+			while pending:
+				loaded: dict[ Path, Module ] = {}
+				uncompiled: list[ tuple[ Path, bytes, str ] ] = []
+				for path in pending:
+					source = path.read_bytes()
+					hash = cache.hashSource( source )
+					if ( memoized := _memoized( path, hash ) ) is not None:
+						self.modules[ path ] = memoized
+					elif self.useCache and ( summary := interface.read( path, hash ) ) is not None:
+						loaded[ path ] = Module( path.stem, path, hash, *summary, cached=True, _compile=partial( self._compile, path, source, hash ) )
+					else:
+						uncompiled.append( ( path, source, hash ) )
+
+				workers = self.workers or os.cpu_count() or 1
+				if self.useCache and workers > 1 and len( uncompiled ) > 1:
+					if pool is None:
+						pool = stack.enter_context( ProcessPoolExecutor( workers ) )
+					futures = [ pool.submit( compileModule, path, source, hash ) for path, source, hash in uncompiled ]
+					for ( path, source, hash ), future in zip( uncompiled, futures ):
+						loaded[ path ] = Module( path.stem, path, hash, *future.result(), _compile=partial( self._compile, path, source, hash ) )
+				else:
+					for path, source, hash in uncompiled:
+						tokens = self._compile( path, source, hash )
+						imports, exports = findImports( tokens ), findExports( tokens )
+						if self.useCache:
+							interface.write( path, hash, imports, exports )
+						loaded[ path ] = Module( path.stem, path, hash, imports, exports, _tokens=tokens )
+
+				for path, module in loaded.items():
+					self.modules[ path ] = _memoize( module )
+				wave, pending = pending, []
+				for path in wave:
+					for imp in self.modules[ path ].imports:
+						dep = self.resolve( self.modules[ path ], imp )
+						if dep not in self.modules and dep not in pending:
+							pending.append( dep )
+
+	def _compile( self, path: Path, source: bytes, hash: str ) -> list[Token]:
+		""" Compiles a module's tokens, reading them from the cache if they are up-to-date """
+		if self.useCache and ( tokens := cache.read( path, hash ) ) is not None:
+			return tokens
+
+		tokens = tokenizer.parse( source.decode(), str( path ) )
+		if self.useCache:
+			cache.write( path, hash, tokens )
+		return tokens
+
+	def _link( self, module: Module, stack: list[ Module ] ) -> None:
+		""" Resolves the dependencies of a module, checking for import cycles and missing names """
+		if module in stack:
+			cycle = stack[ stack.index( module ) : ] + [ module ]
+			raise ModuleError( f'Import cycle detected: {" -> ".join( mod.name for mod in cycle )}' )
+		if module.path in self._linked:
+			return
+
+		stack.append( module )
+		for imp in module.imports:
+			dep = self.modules[ self.resolve( module, imp ) ]
+			for name in imp.names:
+				if name not in dep.exports:
+					raise ModuleError( f'Module "{dep.name}" does not export "{name}", imported at {imp.loc}' )
+			module.dependencies[ imp.path ] = dep
+			self._link( dep, stack )
+		stack.pop()
+		self._linked.add( module.path )
+
+
+def clearTable() -> None:
+	""" Forgets all the memoized modules, so that the next loads read them from the disk cache, or compile them """
+	with _tableLock:
+		_table.clear()
+		_versions.clear()
+
+
+def _memoized( path: Path, hash: str ) -> Optional[Module]:
+	""" A copy of the memoized version of a module, for a loader to link, None if that version wasn't loaded yet """
+	with _tableLock:
+		module = _table.get( ( path, hash ) )
+	if module is None:
+		return None
+	# the tokens are compiled once, by the first copy needing them
+	return Module( module.name, path, hash, module.imports, module.exports, cached=True, _compile=lambda: module.tokens )
+
+
+def _memoize( module: Module ) -> Module:
+	""" Memoizes a module which was just loaded, replacing the other versions of its file, and returns a copy to link """
+	with _tableLock:
+		if ( old := _versions.get( module.path ) ) is not None:
+			del _table[ ( module.path, old ) ]
+		_table[ ( module.path, module.hash ) ] = module
+		_versions[ module.path ] = module.hash
+	return Module(
+		module.name, module.path, module.hash, module.imports, module.exports, cached=module.cached,
+		_tokens=module._tokens, _compile=None if module.compiled else lambda: module.tokens
+	)
+
+
+def compileModule( path: Path, source: bytes, hash: str ) -> tuple[ list[Import], dict[str, Signature] ]:
+	"""
+	Tokenizes a module, writing its tokens and interface summary to the disk cache. Runs in the worker processes.
+	:return: the module's imports and exports
+	:raises TokenizerError: if the module fails to tokenize
+	"""
+	tokens = tokenizer.parse( source.decode(), str( path ) )
+	cache.write( path, hash, tokens )
+	imports, exports = findImports( tokens ), findExports( tokens )
+	interface.write( path, hash, imports, exports )
+	return imports, exports
@@ -0,0 +1,268 @@
+"""
+Runs many small scripts on a pool of warm worker processes (`endcc run-many`).
+
+Starting the compiler takes much longer than running a small script, so the scripts are dispatched to
+long-lived worker processes instead, which import the compiler and the backend once. Workers also keep
+the programs they compiled, so a script which is run again skips the front end. Each job's output and
+exit code are collected; a job running for longer than the timeout has its worker killed and replaced.
+"""
+from __future__ import annotations
+
+import multiprocessing
+import os
+import sys
+import traceback
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum
+from importlib import import_module
+from json import dumps
+from multiprocessing.connection import Connection, wait
+from pathlib import Path
+from tempfile import TemporaryFile
+from time import perf_counter
+from typing import Callable, Final, Optional, TypeVar
+
+import endc
+from backend import BACKENDS
+from module import EXTENSIONS, findSources
+from platforms import Platform
+
+
+# bump when the layout of the JSON output changes
+JSON_VERSION: Final[ int ] = 1
+
+T = TypeVar( 'T' )
+
+
+class Status(Enum):
+	OK = 'ok'
+	# failed to compile, or exited with a non-zero code
+	FAILED = 'failed'
+	TIMEOUT = 'timeout'
+	# the worker died or the compiler itself failed
+	CRASHED = 'crashed'
+
+
+@dataclass
+class JobResult:
+	path: Path
+	status: Status
+	# None if the job didn't finish
+	exitCode: Optional[int]
+	stdout: str
+	stderr: str
+	# seconds from dispatch to result
+	time: float
+
+
+class Worker:
+	""" A worker process and the job it is running, if any """
+	process: multiprocessing.process.BaseProcess
+	connection: Connection
+	# index of the job in the run, and when it was dispatched
+	job: Optional[ int ] = None
+	started: float = 0.0
+
+	def __init__( self, platform: Platform ) -> None:
+		self.connection, child = multiprocessing.Pipe()
+		self.process = multiprocessing.Process( target=_serve, args=( child, platform ), daemon=True )
+		self.process.start()
+		child.close()
+
+	def submit( self, job: int, path: Path ) -> None:
+		self.connection.send( path )
+		self.job = job
+		self.started = perf_counter()
+
+	def stop( self ) -> None:
+		try:
+			self.connection.send( None )
+		except OSError:
+			pass
+		self.process.join( 1 )
+		self.kill()
+
+	def kill( self ) -> None:
+		if self.process.is_alive():
+			self.process.kill()
+			self.process.join()
+		self.connection.close()
+
+
+class Runner:
+	""" Runs scripts on a pool of workers """
+	platform: Platform
+	workers: int
+	timeout: Optional[ float ]
+
+	def __init__( self, platform: Platform = Platform.INTERPRETER, workers: Optional[int] = None, timeout: Optional[float] = None ) -> None:
+		"""
+		:param platform: the backend the scripts are run with
+		:param workers: number of worker processes, defaults to the number of CPUs
+		:param timeout: seconds a job may run for, no limit if None
+		"""
+		self.platform = platform
+		self.workers = workers or os.cpu_count() or 1
+		self.timeout = timeout
+
+	def run( self, scripts: list[Path] ) -> list[JobResult]:
+		"""
+		Runs the given scripts, each one as a separate job
+		:param scripts: the scripts, the same script may appear more than once
+		:return: a result for each script, in the same order
+		"""
+		results: list[ Optional[JobResult] ] = [ None ] * len( scripts )
+		pending = deque( enumerate( scripts ) )
+		workers = [ Worker( self.platform ) for _ in range( min( self.workers, len( scripts ) ) ) ]
+		try:
+			while pending or any( worker.job is not None for worker in workers ):
+				for worker in workers:
+					if worker.job is None and pending:
+						worker.submit( *pending.popleft() )
+
+				busy = [ worker for worker in workers if worker.job is not None ]
+				timeout = None
+				if self.timeout is not None:
+					timeout = max( 0.0, min( worker.started for worker in busy ) + self.timeout - perf_counter() )
+				ready = wait( [ worker.connection for worker in busy ], timeout )
+
+				for i, worker in enumerate( workers ):
+					if worker.job is None:
+						continue
+					job, elapsed = worker.job, perf_counter() - worker.started
+					if worker.connection in ready:
+						try:
+							status, exitCode, stdout, stderr = worker.connection.recv()
+							results[ job ] = JobResult( scripts[ job ], status, exitCode, stdout, stderr, elapsed )
+							worker.job = None
+							continue
+						except EOFError:
+							results[ job ] = JobResult( scripts[ job ], Status.CRASHED, None, '', f'worker exited with code {worker.process.exitcode}', elapsed )
+					elif self.timeout is not None and elapsed >= self.timeout:
+						results[ job ] = JobResult( scripts[ job ], Status.TIMEOUT, None, '', f'timed out after {self.timeout}s', elapsed )
+					else:
+						continue
+					# the worker is gone or stuck, replace it
+					worker.kill()
+					workers[ i ] = Worker( self.platform )
+		finally:
+			for worker in workers:
+				worker.stop()
+		return results  # type: ignore
+
+
+def _serve( connection: Connection, platform: Platform ) -> None:
+	""" Main loop of a worker process """
+	# warm up, jobs shouldn't pay for the backend's import
+	import_module( BACKENDS[ platform ].pkg )
+	options = endc.Options( backend=platform )
+	# compiled scripts, keyed by their path and modification time
+	programs: dict[ tuple[ Path, int, int ], endc.Program ] = {}
+	devnull = os.open( os.devnull, os.O_RDONLY )
+	os.dup2( devnull, 0 )
+	os.close( devnull )
+	# jobs are captured at the file descriptor level, whatever the parent process replaced its streams with
+	sys.stdout = open( 1, 'w', encoding='utf-8', closefd=False )
+	sys.stderr = open( 2, 'w', encoding='utf-8', closefd=False )
+
+	def runJob( path: Path ) -> tuple[ Status, int ]:
+		try:
+			stat = path.stat()
+			key = ( path, stat.st_mtime_ns, stat.st_size )
+			if key not in programs:
+				programs[ key ] = endc.compile( path, options )
+			exitCode = endc.run( programs[ key ], options )
+		except endc.CompileError as e:
+			print( '\n'.join( e.errors ), file=sys.stderr )
+			return Status.FAILED, 1
+		except OSError as e:
+			print( f'{e.filename}: {e.strerror}', file=sys.stderr )
+			return Status.FAILED, 1
+		except Exception:
+			traceback.print_exc()
+			return Status.CRASHED, 1
+		return ( Status.OK if exitCode == 0 else Status.FAILED ), exitCode
+
+	while ( path := connection.recv() ) is not None:
+		( status, exitCode ), stdout, stderr = _captured( lambda: runJob( path ) )
+		connection.send( ( status, exitCode, stdout, stderr ) )
+
+
+def _captured( action: Callable[ [], T ] ) -> tuple[ T, str, str ]:
+	""" Runs an action with the standard output and error file descriptors redirected, so that subprocesses are captured too """
+	sys.stdout.flush()
+	sys.stderr.flush()
+	saved = os.dup( 1 ), os.dup( 2 )
+	with TemporaryFile() as out, TemporaryFile() as err:
+		os.dup2( out.fileno(), 1 )
+		os.dup2( err.fileno(), 2 )
+		try:
+			result = action()
+		finally:
+			sys.stdout.flush()
+			sys.stderr.flush()
+			os.dup2( saved[0], 1 )
+			os.dup2( saved[1], 2 )
+			os.close( saved[0] )
+			os.close( saved[1] )
+		out.seek( 0 )
+		err.seek( 0 )
+		return result, out.read().decode( errors='replace' ), err.read().decode( errors='replace' )
+
+
+def findScripts( targets: list[Path], manifest: Optional[Path] = None ) -> list[Path]:
+	"""
+	Lists the scripts to run, in order and with repetitions
+	:param targets: scripts, glob patterns like `jobs/*.endc` or directories whose modules are all run
+	:param manifest: a file listing a script per line, relative to it, empty lines and `#` comments are skipped
+	"""
+	patterns = [ str( target ) for target in targets ]
+	if manifest is not None:
+		for line in manifest.read_text().splitlines():
+			if ( line := line.split( '#', 1 )[0].strip() ):
+				patterns.append( str( manifest.parent / line ) )
+
+	scripts: list[ Path ] = []
+	for pattern in patterns:
+		path = Path( pattern )
+		if any( char in pattern for char in '*?[' ):
+			relative = path.relative_to( path.anchor ) if path.is_absolute() else path
+			scripts += sorted( match.resolve() for match in Path( path.anchor or '.' ).glob( str( relative ) ) if match.suffix in EXTENSIONS )
+		elif path.is_dir():
+			scripts += findSources( path )
+		else:
+			scripts.append( path.resolve() )
+	return scripts
+
+
+def toJson( results: list[JobResult], elapsed: float ) -> str:
+	return dumps( {
+		'version': JSON_VERSION,
+		'jobs': [
+			{
+				'path': str( result.path ),
+				'status': result.status.value,
+				'exitCode': result.exitCode,
+				'stdout': result.stdout,
+				'stderr': result.stderr,
+				'time': result.time
+			}
+			for result in results
+		],
+		'summary': { status.value: sum( result.status is status for result in results ) for status in Status } | {
+			'jobs': len( results ),
+			'time': elapsed
+		}
+	}, indent='\t' )
+
+
+def toText( results: list[JobResult], elapsed: float ) -> str:
+	lines: list[ str ] = []
+	for result in results:
+		code = '' if result.exitCode is None else f', exit {result.exitCode}'
+		lines.append( f'=== {result.path} ({result.status.value}{code}, {result.time * 1000:.1f} ms)' )
+		lines += [ output.removesuffix( '\n' ) for output in ( result.stdout, result.stderr ) if output ]
+	counts = ', '.join( f'{sum( result.status is status for result in results )} {status.value}' for status in Status )
+	lines.append( f'Ran {len( results )} jobs in {elapsed:.2f}s ({len( results ) / elapsed if elapsed else 0:.0f} jobs/s): {counts}' )
+	return '\n'.join( lines )
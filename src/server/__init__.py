@@ -0,0 +1,134 @@
+"""
+Package containing the compile server, which keeps the compiler warm between invocations
+
+Table of contents:
+	- daemon: The server, running the compiler for each request in a process forked from a warm one
+
+Clients and the server exchange frames over a Unix socket: each frame is a 4 bytes big-endian length,
+followed by that many bytes of UTF-8 JSON. A client sends a request:
+	- `{"type": "run", "argv": [...], "cwd": "..."}` runs the compiler with the given arguments in the given
+	  directory, the server answers with `{"type": "stdout"/"stderr", "data": "..."}` frames as the compiler
+	  writes its output, then `{"type": "exit", "code": 0, "time": 0.01}`
+	- `{"type": "ping"}` is answered with `{"type": "pong", "pid": 123, "version": 1}`
+	- `{"type": "stop"}` stops the server, answered with `{"type": "stopping"}`
+A connection may send any number of requests, one after the other.
+The socket is in a directory only its user may enter, `$XDG_RUNTIME_DIR` or a private one in the temp directory,
+and clients check that the server runs as their user before sending it anything.
+
+This module is imported by the thin client, so it must stay cheap to import.
+"""
+import json
+import os
+import socket
+import stat
+import struct
+from pathlib import Path
+from tempfile import gettempdir
+from typing import Any, Final, Optional
+
+
+# bump when the frames change in an incompatible way
+PROTOCOL_VERSION: Final[ int ] = 1
+# frames bigger than this are a protocol error, not a reason to allocate that much memory
+MAX_FRAME: Final[ int ] = 64 * 1024 * 1024
+
+_HEADER: Final[ struct.Struct ] = struct.Struct( '>I' )
+# pid, uid and gid of the peer of a Unix socket
+_CREDENTIALS: Final[ struct.Struct ] = struct.Struct( '3i' )
+
+Frame = dict[ str, Any ]
+
+
+class ProtocolError(Exception):
+	pass
+
+
+def socketPath() -> Path:
+	"""
+	Where the server listens: `$ENDCC_SOCKET`, or a socket in `$XDG_RUNTIME_DIR`, or in a directory of the temp
+	directory which only the user may enter, made if needed
+	:raises PermissionError: if the directory in the temp directory belongs to another user, or others may enter it
+	"""
+	if 'ENDCC_SOCKET' in os.environ:
+		return Path( os.environ[ 'ENDCC_SOCKET' ] )
+	if os.environ.get( 'XDG_RUNTIME_DIR' ):
+		return Path( os.environ[ 'XDG_RUNTIME_DIR' ] ) / 'endcc.sock'
+
+	directory = Path( gettempdir() ) / f'endcc-{os.getuid()}'
+	try:
+		directory.mkdir( mode=0o700 )
+	except FileExistsError:
+		pass
+	# anyone may have made it first, with any name in a shared directory
+	info = directory.lstat()
+	if not stat.S_ISDIR( info.st_mode ) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+		raise PermissionError( f'{directory} is not a private directory of this user' )
+	return directory / 'endcc.sock'
+
+
+def connect( path: Optional[Path] = None ) -> socket.socket:
+	"""
+	Connects to the server, which must run as this user
+	:param path: the server's socket, defaults to `socketPath()`
+	:raises OSError: if no server is listening
+	:raises PermissionError: if the socket or the server belong to another user
+	"""
+	path = path or socketPath()
+	if path.lstat().st_uid != os.getuid():
+		raise PermissionError( f'{path} belongs to another user' )
+	sock = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+	try:
+		sock.connect( str( path ) )
+		# the socket may have been replaced after being checked, the credentials of the server can't be
+		if hasattr( socket, 'SO_PEERCRED' ):
+			_, uid, _ = _CREDENTIALS.unpack( sock.getsockopt( socket.SOL_SOCKET, socket.SO_PEERCRED, _CREDENTIALS.size ) )
+			if uid != os.getuid():
+				raise PermissionError( f'the server on {path} runs as another user' )
+	except OSError:
+		sock.close()
+		raise
+	return sock
+
+
+def send( sock: socket.socket, frame: Frame ) -> None:
+	data = json.dumps( frame ).encode()
+	sock.sendall( _HEADER.pack( len( data ) ) + data )
+
+
+def receive( sock: socket.socket ) -> Optional[Frame]:
+	"""
+	Reads a frame
+	:return: the frame, None if the connection was closed between frames
+	:raises ProtocolError: if the connection was closed in the middle of a frame, or the frame is invalid
+	"""
+	header = _readExactly( sock, _HEADER.size )
+	if header is None:
+		return None
+	size, = _HEADER.unpack( header )
+	if size > MAX_FRAME:
+		raise ProtocolError( f'frame of {size} bytes is too big' )
+	data = _readExactly( sock, size )
+	if data is None:
+		raise ProtocolError( 'connection closed in the middle of a frame' )
+	try:
+		frame = json.loads( data )
+	except ValueError as e:
+		raise ProtocolError( f'invalid frame: {e}' ) from None
+	if not isinstance( frame, dict ) or 'type' not in frame:
+		raise ProtocolError( 'frames must be objects with a type' )
+	return frame
+
+
+def _readExactly( sock: socket.socket, size: int ) -> Optional[bytes]:
+	""" Reads `size` bytes, None if the connection is closed before the first one """
+	chunks: list[ bytes ] = []
+	remaining = size
+	while remaining:
+		chunk = sock.recv( min( remaining, 1024 * 1024 ) )
+		if not chunk:
+			if remaining == size:
+				return None
+			raise ProtocolError( 'connection closed in the middle of a frame' )
+		chunks.append( chunk )
+		remaining -= len( chunk )
+	return b''.join( chunks )
@@ -0,0 +1,176 @@
+"""
+The compile server.
+
+The server imports the compiler and all the available backends once, then forks a child for each
+connection: children start with everything already imported, connections are served concurrently, and a
+crash or an endless program only takes down its own child. Children run the compiler exactly like
+`compiler.py` would, with their standard output and error forwarded to the client and their standard
+input closed.
+"""
+from __future__ import annotations
+
+import codecs
+import os
+import signal
+import socketserver
+import sys
+import threading
+import traceback
+from importlib import import_module
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Optional
+
+import log
+from backend import BACKENDS
+from . import PROTOCOL_VERSION, Frame, ProtocolError, connect, send, receive, socketPath
+
+
+class Server(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+	# don't wait for running programs when stopping
+	block_on_close = False
+
+
+class Handler(socketserver.BaseRequestHandler):
+	""" Serves the requests of a connection, in its own forked process """
+	_lock: threading.Lock
+	_closed: bool
+
+	def setup( self ) -> None:
+		# the server's handler would stop a copy of the server
+		signal.signal( signal.SIGTERM, signal.SIG_DFL )
+		self._lock = threading.Lock()
+		self._closed = False
+
+	def handle( self ) -> None:
+		while True:
+			try:
+				frame = receive( self.request )
+			except ( ProtocolError, OSError ) as e:
+				self.reply( { 'type': 'error', 'message': str( e ) } )
+				return
+			if frame is None:
+				return
+
+			if frame[ 'type' ] == 'run':
+				start = perf_counter()
+				code = self.capture( lambda: runCompiler( frame[ 'argv' ], frame[ 'cwd' ] ) )
+				self.reply( { 'type': 'exit', 'code': code, 'time': perf_counter() - start } )
+			elif frame[ 'type' ] == 'ping':
+				self.reply( { 'type': 'pong', 'pid': os.getppid(), 'version': PROTOCOL_VERSION } )
+			elif frame[ 'type' ] == 'stop':
+				self.reply( { 'type': 'stopping' } )
+				os.kill( os.getppid(), signal.SIGTERM )
+				return
+			else:
+				self.reply( { 'type': 'error', 'message': f'unknown request type {frame[ "type" ]}' } )
+
+	def reply( self, frame: Frame ) -> None:
+		""" Sends a frame, unless the client went away """
+		with self._lock:
+			if self._closed:
+				return
+			try:
+				send( self.request, frame )
+			except OSError:
+				self._closed = True
+
+	def capture( self, action: Callable[ [], int ] ) -> int:
+		""" Runs an action with the standard output and error file descriptors forwarded to the client """
+		sys.stdout.flush()
+		sys.stderr.flush()
+		devnull = os.open( os.devnull, os.O_RDWR )
+		os.dup2( devnull, 0 )
+		forwarders: list[ threading.Thread ] = []
+		for fd, stream in ( ( 1, 'stdout' ), ( 2, 'stderr' ) ):
+			read, write = os.pipe()
+			os.dup2( write, fd )
+			os.close( write )
+			forwarder = threading.Thread( target=self.forward, args=( read, stream ), daemon=True )
+			forwarder.start()
+			forwarders.append( forwarder )
+		try:
+			return action()
+		except Exception:
+			traceback.print_exc()
+			return 1
+		finally:
+			sys.stdout.flush()
+			sys.stderr.flush()
+			# closing the write ends lets the forwarders read the end of the output
+			os.dup2( devnull, 1 )
+			os.dup2( devnull, 2 )
+			os.close( devnull )
+			for forwarder in forwarders:
+				forwarder.join()
+
+	def forward( self, fd: int, stream: str ) -> None:
+		decoder = codecs.getincrementaldecoder( 'utf-8' )( 'replace' )
+		with os.fdopen( fd, 'rb', buffering=0 ) as pipe:
+			while chunk := pipe.read( 64 * 1024 ):
+				self.reply( { 'type': stream, 'data': decoder.decode( chunk ) } )
+		if tail := decoder.decode( b'', final=True ):
+			self.reply( { 'type': stream, 'data': tail } )
+
+
+def runCompiler( argv: list[str], cwd: str ) -> int:
+	""" Runs the compiler like `compiler.py` would with the given arguments, returning its exit code """
+	import compiler
+
+	os.chdir( cwd )
+	try:
+		return compiler.run( argv )
+	except SystemExit as e:
+		return e.code if isinstance( e.code, int ) else int( e.code is not None )
+
+
+def warm() -> None:
+	""" Imports everything a request could need, so that the forked children don't have to """
+	import_module( 'compiler' )
+	import_module( 'build' )
+	import_module( 'check' )
+	for backend in BACKENDS.values():
+		if backend.available:
+			import_module( backend.pkg )
+
+
+def serveMain( path: Optional[Path] = None ) -> int:
+	"""
+	Serves requests until stopped by a `stop` request, SIGTERM or SIGINT
+	:param path: the socket to listen on, defaults to `socketPath()`
+	:return: exit code
+	"""
+	try:
+		path = path or socketPath()
+	except PermissionError as e:
+		log.error( str( e ) )
+		return 1
+	if path.exists():
+		try:
+			connect( path ).close()
+			log.error( f'A server is already listening on {path}' )
+			return 1
+		except OSError:
+			# left over by a server which didn't stop cleanly
+			path.unlink()
+
+	warm()
+	# only the user may connect, as requests run arbitrary code
+	umask = os.umask( 0o177 )
+	try:
+		server = Server( str( path ), Handler )
+	finally:
+		os.umask( umask )
+
+	# shutdown() waits for serve_forever() to return, so it can't be called by the thread running it
+	signal.signal( signal.SIGTERM, lambda signum, frame: threading.Thread( target=server.shutdown ).start() )
+	# printed whatever the log settings are, and flushed: whoever started the server waits for this line to connect
+	print( f'[INFO] Listening on {path}', flush=True )
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		path.unlink( missing_ok=True )
+	return 0
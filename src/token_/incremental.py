@@ -0,0 +1,203 @@
+"""
+Incremental tokenization, for editors and other programs which tokenize the same code over and over.
+
+The tokenizer goes through the code line by line, so the tokens are kept for each line, along with a
+hash of its text: an edit only re-lexes the lines it changed, and the comments they open, close or are in.
+Lines that didn't change are reused, even if the edit moved them, their locations are fixed when they're read.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from enum import Enum
+from typing import Final
+
+from token_ import Token
+from token_.tokenizer import Tokenizer, TokenizerError
+
+
+__all__ = [ 'IncrementalTokenizer' ]
+# how many of the previous tokens the tokenizer looks at, for its syntax checks
+CONTEXT: Final[ int ] = 4
+
+
+@dataclass(slots=True)
+class _Line:
+	# hash of the text of the line
+	hash: int
+	tokens: list[ Token ]
+	errors: list[ TokenizerError ]
+	# hash of the tokens before the line when it was lexed, if they changed its errors may have too
+	context: int
+	# line number in the locations of the tokens, and in the errors
+	lexedAt: int
+	errorsAt: int
+	# whether the line is part of a comment started on a previous line
+	inComment: bool
+
+
+class IncrementalTokenizer:
+	""" Keeps the tokens of some code, line by line, and re-lexes only the lines changed by an edit """
+	file: str
+	# text of each line, with its line ending
+	lines: list[ str ]
+	_entries: list[ _Line ]
+
+	def __init__( self, codeString: str = '', file: str = '<string>' ) -> None:
+		"""
+		:param codeString: code string
+		:param file: the file name used in locations
+		"""
+		self.file = file
+		self.lines = []
+		self._entries = []
+		self._replace( 0, 0, codeString.splitlines( True ) )
+
+	@property
+	def source( self ) -> str:
+		return ''.join( self.lines )
+
+	@property
+	def errors( self ) -> list[TokenizerError]:
+		""" All the problems found in the code, in order """
+		return self.errorsIn( 0, len( self.lines ) )
+
+	def errorsIn( self, start: int, stop: int ) -> list[TokenizerError]:
+		""" The problems found in the lines from `start` to `stop`, excluded """
+		errors: list[ TokenizerError ] = []
+		for i in range( start, stop ):
+			entry = self._entries[ i ]
+			if entry.errors and entry.errorsAt != i:
+				# messages have the line number in them, lex the line again
+				self._lex( i, i + 1 )
+			errors += self._entries[ i ].errors
+		return errors
+
+	def getTokens( self ) -> list[Token]:
+		return self.tokensIn( 0, len( self.lines ) )
+
+	def tokensIn( self, start: int, stop: int ) -> list[Token]:
+		""" The tokens of the lines from `start` to `stop`, excluded """
+		tokens: list[ Token ] = []
+		for i in range( start, stop ):
+			tokens += self._tokensOf( i )
+		return tokens
+
+	def edit( self, startLine: int, startChar: int, endLine: int, endChar: int, text: str ) -> range:
+		"""
+		Replaces a range of the code, positions are 0-based and the end is excluded
+		:param text: the new text of the range
+		:return: the lines which were lexed again
+		"""
+		startLine, endLine = min( startLine, len( self.lines ) ), min( endLine, len( self.lines ) )
+		if self.lines and not self.lines[ -1 ].endswith( ( '\n', '\r' ) ):
+			# past the end of a last line without a line ending is the end of that line, the text is joined to it
+			if startLine == len( self.lines ):
+				startLine, startChar = startLine - 1, len( self.lines[ -1 ] )
+			if endLine == len( self.lines ):
+				endLine, endChar = endLine - 1, len( self.lines[ -1 ] )
+		text =self.lines[ startLine ][ : startChar ] + text if startLine < len( self.lines ) else text
+		if endLine < len( self.lines ):
+			text += self.lines[ endLine ][ endChar : ]
+			endLine += 1
+		# an edit removing a line ending joins the next line
+		while endLine < len( self.lines ) and not text.endswith( ( '\n', '\r' ) ):
+			text += self.lines[ endLine ]
+			endLine += 1
+		return self._replace( startLine, endLine, text.splitlines( True ) )
+
+	def update( self, codeString: str ) -> range:
+		"""
+		Replaces all the code, only the lines which changed are lexed again
+		:return: the lines which were lexed again
+		"""
+		return self._replace( 0, len( self.lines ), codeString.splitlines( True ) )
+
+	# PRIVATE METHODS
+
+	def _unchanged( self, line: int, text: str ) -> bool:
+		return self._entries[ line ].hash == hash( text ) and self.lines[ line ] == text
+
+	def _replace( self, start: int, stop: int, lines: list[str] ) -> range:
+		""" Replaces the lines from `start` to `stop`, excluded, and lexes what changed """
+		# skip the lines which are the same
+		skipped, newStop = 0, len( lines )
+		while skipped < min( stop - start, newStop ) and self._unchanged( start + skipped, lines[ skipped ] ):
+			skipped += 1
+		while stop > start + skipped and newStop > skipped and self._unchanged( stop - 1, lines[ newStop - 1 ] ):
+			stop -= 1
+			newStop -= 1
+		start, lines = start + skipped, lines[ skipped : newStop ]
+		if start == stop and not lines:
+			return range( start, start )
+
+		# a comment is lexed again from its first line, including one which was left open at the end of the code
+		first = start - 1 if start == len( self._entries ) and start > 0 else start
+		while first > 0 and self._entries[ first ].inComment:
+			first -= 1
+		lines = self.lines[ first : start ] + lines
+
+		oldLines, oldEntries = self.lines[ first : stop ], self._entries[ first : stop ]
+		self.lines[ first : stop ] = lines
+		self._entries[ first : stop ] = [ None ] * len( lines )  # type: ignore
+		try:
+			end = self._lex( first, first + len( lines ) )
+			# the lines after the edit are lexed again, until they're lexed as they were before
+			while end < len( self._entries ) and ( self._entries[ end ].inComment or self._entries[ end ].context != self._contextOf( end ) ):
+				end = self._lex( end, end + 1 )
+		except Exception:
+			self.lines[ first : first + len( lines ) ] = oldLines
+			self._entries[ first : first + len( lines ) ] = oldEntries
+			raise
+		return range( first, end )
+
+	def _lex( self, start: int, stop: int ) -> int:
+		"""
+		Lexes the lines from `start` to `stop`, excluded
+		:return: the line where lexing stopped, after `stop` if a comment was still open
+		"""
+		context = self._tail( start )
+		tokenizer = Tokenizer( '', self.file, recover=True )
+		tokenizer.lines = self.lines
+		tokenizer.code = context.copy()
+		tokenizer.lineN = start
+		tokenizer.tokenize( stop )
+		end = min( max( stop, tokenizer.lineN ), len( self.lines ) )
+
+		tokens: list[ list[Token] ] = [ [] for _ in range( start, end ) ]
+		for token in tokenizer.code[ len( context ) : ]:
+			tokens[ min( max( token.loc.line, start ), end - 1 ) - start ].append( token )
+		errors: list[ list[TokenizerError] ] = [ [] for _ in range( start, end ) ]
+		for error in tokenizer.errors:
+			errors[ min( max( error.line - 1, start ), end - 1 ) - start ].append( error )
+		inComment = [ False ] * ( end - start )
+		for first, last in tokenizer.comments:
+			for line in range( max( first + 1, start ), min( last + 1, end ) ):
+				inComment[ line - start ] = True
+
+		for i in range( start, end ):
+			self._entries[ i ] = _Line( hash( self.lines[ i ] ), tokens[ i - start ], errors[ i - start ], _key( context ), i, i, inComment[ i - start ] )
+			context = ( context + tokens[ i - start ] )[ -CONTEXT : ]
+		return end
+
+	def _tokensOf( self, line: int ) -> list[Token]:
+		entry = self._entries[ line ]
+		if entry.lexedAt != line:
+			entry.tokens = [ Token( token.typ, token.value, token.loc._replace( line=line ) ) for token in entry.tokens ]
+			entry.lexedAt = line
+		return entry.tokens
+
+	def _tail( self, line: int ) -> list[Token]:
+		""" The last tokens before a line """
+		tail: list[ Token ] = []
+		while line > 0 and len( tail ) < CONTEXT:
+			line -= 1
+			tail[ : 0 ] = self._tokensOf( line )
+		return tail[ -CONTEXT : ]
+
+	def _contextOf( self, line: int ) -> int:
+		return _key( self._tail( line ) )
+
+
+def _key( tokens: list[Token] ) -> int:
+	# the checks look at the keywords and symbols, but only at the type of names and literals
+	return hash( tuple( token.value if isinstance( token.value, Enum ) else token.typ for token in tokens ) )
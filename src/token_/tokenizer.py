@@ -4,6 +4,7 @@ Transforms a string into a stream/list of tokens, while performing a basic synta
 from __future__ import annotations
 
 from os import PathLike
+from pathlib import Path
 from dataclasses import dataclass
 from enum import Enum
 from typing import Optional, Final
@@ -13,7 +14,8 @@ from token_ import Token, Symbol, TokenType, Keyword, Loc, UnaryType
 
 __all__ = [
 	'Tokenizer',
-	'TokenizerError'
+	'TokenizerError',
+	'parse'
 ]
 _HARDCORE: Final[ bool ] = False
 
@@ -21,35 +23,58 @@ _HARDCORE: Final[ bool ] = False
 @dataclass
 class TokenizerError(Exception):
 	message: Optional[str] = None
+	# where the problem is, the line is 1-based
+	line: int = 0
+	char: int = 0
+	# the message without the location and the source line
+	description: str = ''
 
 
 class Tokenizer:
 	""" Parses a string of code into a list of tokens """
 	lines: list[ str ]
 	code: list[ Token ]
-	lineN: int = 0
-	char: int = 0
-	num: str = ''
+	recover: bool
+	errors: list[ TokenizerError ]
+	# the lines spanned by each comment, first and last included
+	comments: list[ tuple[ int, int ] ]
+	lineN: int
+	char: int
 	file: str
 	line: str
 
-	def __init__( self, codeString: str, file: str ) -> None:
+	def __init__( self, codeString: str, file: str, recover: bool = False ) -> None:
 		"""
 		:param codeString: code string
 		:param file: original file
+		:param recover: whether to collect the problems in `errors` and keep going, instead of raising the first one
 		"""
 		self.lines = codeString.splitlines( True )
 		self.file = file
 		self.code = []
+		self.recover = recover
+		self.errors = []
+		self.comments = []
+		self.lineN = 0
+		self.char = 0
+		self.line = ''
 
-	def tokenize( self ) -> Tokenizer:
+	def tokenize( self, stop: Optional[int] = None ) -> Tokenizer:
+		"""
+		Tokenizes the lines from `lineN` on
+		:param stop: the line to stop at, defaults to the end of the code; a comment may go past it
+		"""
+		stop = len( self.lines ) if stop is None else stop
 
 		# execute until there are no more lines
-		while self.lineN < len( self.lines ):
+		while self.lineN < stop:
 			self.line = self.lines[ self.lineN ]
 
+			# spaces don't start anything else, skip them before trying all the keywords
+			if self.line.startswith( ' ', self.char ):
+				self.char += 1
 			# simple keywords
-			if self._getIsWord( Keyword.DECLARE ):
+			elif self._getIsWord( Keyword.DECLARE ):
 				self.code += [ Token( TokenType.KEYWORD, Keyword.DECLARE, Loc.create( self, Keyword.DECLARE ) ) ]
 			elif self._getIsWord( Keyword.GIVE ):
 				self.code += [ Token( TokenType.KEYWORD, Keyword.GIVE, Loc.create( self, Keyword.GIVE ) ) ]
@@ -117,12 +142,12 @@ class Tokenizer:
 					]
 				else:
 					loc = Loc.create( self, Symbol.EQUAL )
-					if self.code[-1].typ != TokenType.NAME:
+					if self._previousType() != TokenType.NAME:
 						self._fatal( f'Missing NAME before = symbol at {loc}' )
 					self.code += [ Token( TokenType.SYMBOL, Symbol.EQUAL, loc ) ]
 			elif self._getIsWord( Keyword.IS ):
 				loc = Loc.create( self, Keyword.IS )
-				if self.code[-1].typ != TokenType.NAME:
+				if self._previousType() != TokenType.NAME:
 					self._fatal( f'Missing NAME before IS keyword at {loc}' )
 				self.code += [ Token( TokenType.KEYWORD, Keyword.IS, loc ) ]
 			# parens
@@ -144,19 +169,19 @@ class Tokenizer:
 			# special keywords
 			elif self._getIsWord( Keyword.ELSE ):
 				loc = Loc.create( self, Keyword.ELSE )
-				if self.code[-1].value != Symbol.RBRACK:
+				if self._previousValue() != Symbol.RBRACK:
 					self._fatal( f'Missing RBRACK symbol before LS keyword at {loc}' )
 				if self._peekWord() != Keyword.DO.value:
 					self._fatal( f'Missing DO symbol after LS keyword at {loc}' )
 				self.code += [ Token( TokenType.KEYWORD, Keyword.ELSE, loc ) ]
 			elif self._getIsWord( Keyword.SUBROUTINE ):
 				loc = Loc.create( self, Keyword.SUBROUTINE )
-				if len( self.code ) == 0 or self.code[-1].value not in ( Keyword.DECLARE, Keyword.CALL ):
+				if self._previousValue() not in ( Keyword.DECLARE, Keyword.CALL ):
 					self._fatal( f'Missing DECLARE or CALL keyword before SUBROUTINE keyword at {loc}' )
 				self.code += [ Token( TokenType.KEYWORD, Keyword.SUBROUTINE, loc ) ]
 			elif self._getIsWord( Keyword.WHEN ):
 				loc = Loc.create( self, Keyword.WHEN )
-				if self.code[-1].value != Keyword.UNTIL:
+				if self._previousValue() != Keyword.UNTIL:
 					self._fatal( f'Missing UNTIL keyword before WHEN keyword at {loc}' )
 				if self._peekIgnoreSpaces() != Symbol.LBRACE.value:
 					self._fatal( f'Missing LBRACE symbol after WHEN keyword at {loc}' )
@@ -164,11 +189,11 @@ class Tokenizer:
 			elif self._getIsWord( Keyword.UNTIL ):
 				loc = Loc.create( self, Keyword.UNTIL )
 				# ] UNTIL WHN {  }
-				if self.code[-1].value == Symbol.RBRACK:
+				if self._previousValue() == Symbol.RBRACK:
 					if self._peekWord() != 'WHN':
 						self._fatal( f'Missing WHN keyword after UNTIL keyword at {loc}' )
 				# CHCK UNTIL {} DO [
-				elif self.code[-1].value == Keyword.CHECK:
+				elif self._previousValue() == Keyword.CHECK:
 					if self._peekIgnoreSpaces() != Symbol.LBRACE.value:
 						self._fatal( f'Missing LBRACE symbol after UNTIL keyword at {loc}' )
 				else:
@@ -192,6 +217,9 @@ class Tokenizer:
 				expect: int = NAME
 				# OWN name. name FROM something/
 				while True:
+					if -offset > len( self.code ):
+						self._fatal( f'Missing OWN keyword before FROM keyword at {loc}' )
+						break
 					match self.code[offset]:
 						case Token( value=Keyword.OWN ) as found:
 							if expect == NAME:
@@ -223,6 +251,7 @@ class Tokenizer:
 								found.loc.line,
 								found.loc.char
 							)
+							break
 					offset -= 1
 				self.code += [ Token( TokenType.KEYWORD, Keyword.FROM, loc ) ]
 				del offset, OWN_OR_DOT, NAME, expect
@@ -234,7 +263,7 @@ class Tokenizer:
 					chLine = self.lines[ self.lineN ]
 					chIndex = 0
 					while chIndex < len( chLine ):
-						if chLine[ chIndex ] == '*' and chLine[ chIndex + 1 ] == '|':
+						if chLine.startswith( '*|', chIndex ):
 							found = True
 							break
 						chIndex += 1
@@ -253,41 +282,48 @@ class Tokenizer:
 						startLine,
 						chIndex + 1
 					)
+				self.comments += [ ( startLine, min( self.lineN, len( self.lines ) - 1 ) ) ]
 				self.lineN += 1
 				self.char = 0
 				del startLine, found, chIndex, chLine
 			elif self._getIsWord( '*' ):
 				string: str = ''
 				while True:
-					if self._peek( 0 ) == '*' and string[-1] != '\\':
+					if self._peek( 0 ) == '*' and ( not string or string[-1] != '\\' ):
 						break
 					if self._peek( 0 ) == '*':
 						string = string[: -1 ] + self._getChar()
-					if self._peek( 0 ) == '\n':
+					# the last character of a file without a final newline is the end of the line too
+					if self._peek( 0 ) in ( '\n', '\0' ) or self.char + 1 == len( self.line ):
 						self._fatal( 'Reached end of line ({line}) without closing string character "*"' )
+						break
 					string += self._getChar()
-				if 'e' in string and self.code[ -4 ].value != Keyword.CONSTANT:
+				if self._peek( 0 ) != '*':
+					# recovering, skip the rest of the line
+					self.lineN += 1
+					self.char = 0
+					continue
+				if 'e' in string and self._previousValue( 4 ) != Keyword.CONSTANT:
 					self._fatal(
 						'Found "e" character in non-constant string! THIS IS THE WORST POSSIBLE THING EVER!',
 						col=( self.char - len(string) ) + string.find( 'e' ) + 1
 					)
-				if 'E' in string and self.code[ -4 ].value != Keyword.CONSTANT:
+				if 'E' in string and self._previousValue( 4 ) != Keyword.CONSTANT:
 					self._fatal(
 						'Found "E" character in non-constant string! THIS IS THE WORST POSSIBLE THING EVER!',
 						col=( self.char - len(string) ) + string.find( 'E' ) + 1
 					)
 				self.char += 1
-				self.code += [ Token( TokenType.STR, string, Loc.create( self, string ) ) ]
+				loc = Loc.create( self, string )
+				self.code += [ Token( TokenType.STR, string.replace( '\\n', '\n' ).replace( '\\t', '\t' ), loc ) ]
 				del string
 			# special stuff
-			elif self._getIsWord( ' ' ):
-				pass
 			elif self._getIsWord( '\t' ):
 				self._fatal( f'Found invalid character at {Loc.create(self, " ")} ( TAB cannot be used )' )
 			elif self._getIsWord( '\n' ) or self.char == len( self.line ) - 1:
 				if (
-					self.code[ -1 ].typ not in ( TokenType.KEYWORD, TokenType.SYMBOL ) or
-					self.code[ -1 ].value not in ( Symbol.SLASH, Symbol.LBRACK, Symbol.RBRACK, Symbol.LBRACE )
+					self._previousType() not in ( TokenType.KEYWORD, TokenType.SYMBOL ) or
+					self._previousValue() not in ( Symbol.SLASH, Symbol.LBRACK, Symbol.RBRACK, Symbol.LBRACE )
 				) and len( self.line ) != 2:
 					self._fatal(
 						f'Missing "/" before newline at line {self.lineN} column {self.char}',
@@ -305,7 +341,7 @@ class Tokenizer:
 					del spaceCount
 			elif self._getIsWord( '\0' ) or ( self.char == len( self.line ) and self.lineN == len( self.lines ) - 1 ):
 				break
-			elif self._peek( 0 ) in ',1234567890' and self._peek() in '0123456789':
+			elif self._peek( 0 ) in '1234567890' or ( self._peek( 0 ) == ',' and self._peek() in '0123456789' ):
 				num = ''
 				while self._peek( 0 ) in ',1234567890':
 					if ( numChar := self._getChar() ) != '\0':
@@ -316,6 +352,7 @@ class Tokenizer:
 							self.lineN,
 							self.char + len( num )
 						)
+						break
 				fnum = float( num.replace( ',', '.' ) )
 				self.code += [ Token( TokenType.FLOAT, fnum, Loc.create( self, str( fnum ) ) ) ]
 				del fnum, num, numChar
@@ -326,14 +363,20 @@ class Tokenizer:
 			else:
 				name: str = ''
 				while self._peek( 0 ) not in ( ' ', '\n', '{', '(', '[', ']', ')', '}', '.', '\0', '/' ):
-					name += self._getChar()
-				if 'e' in name.lower() and ( self.code[ -1 ].typ != TokenType.KEYWORD or self.code[ -1 ].value != Keyword.FROM ):
+					# the last character of a file without a final newline is left to end the line
+					if ( nameChar := self._getChar() ) == '\0':
+						break
+					name += nameChar
+				if 'e' in name.lower() and ( self._previousType() != TokenType.KEYWORD or self._previousValue() != Keyword.FROM ):
 					self._fatal(
 						'the name at line {line} and column {char} contains "e"',
 						self.lineN,
 						self.char - ( len( name ) - 1 ) + name.lower().index( 'e' )
 					)
-				self.code += [ Token( TokenType.NAME, name, Loc.create( self, name ) ) ]
+				if name in ( Keyword.FALSE.value, Keyword.NOTHING.value ):
+					self.code += [ Token( TokenType.KEYWORD, Keyword( name ), Loc.create( self, name ) ) ]
+				else:
+					self.code += [ Token( TokenType.NAME, name, Loc.create( self, name ) ) ]
 				del name
 
 		return self
@@ -347,6 +390,14 @@ class Tokenizer:
 
 	# PRIVATE METHODS
 
+	def _previousType( self, offset: int = 1 ) -> Optional[TokenType]:
+		""" Returns the type of a token before the current one, None if there isn't one, like at the start of the code """
+		return self.code[ -offset ].typ if len( self.code ) >= offset else None
+
+	def _previousValue( self, offset: int = 1 ) -> object:
+		""" Returns the value of a token before the current one, None if there isn't one """
+		return self.code[ -offset ].value if len( self.code ) >= offset else None
+
 	def _getChar( self ) -> str:
 		""" Returns and consume a char """
 		if self.char + 1 < len( self.line ):
@@ -370,7 +421,8 @@ class Tokenizer:
 		word: str = ''
 		char: int = 1
 
-		while True:
+		# the last line of a file may have no newline
+		while self._peek( char ) != '\0':
 			if self._peek( char ) in ( ' ', '\n' ):
 				if offset > 0:
 					word = ''
@@ -385,9 +437,10 @@ class Tokenizer:
 	def _getIsWord( self, word: str | Enum ) -> bool:
 		""" Check if the next word is the give word """
 		if isinstance( word, Enum ):
-			word = word.value
+			# skips the `value` property, this is called for each keyword tried on each token
+			word = word._value_
 
-		if self.line[ self.char : self.char + len( word ) ] == word:
+		if self.line.startswith( word, self.char ):
 			self.char += len( word )
 			return True
 		return False
@@ -410,21 +463,36 @@ class Tokenizer:
 
 	def _fatal( self, message: str, lineNum: int = None, col: int = None ) -> None:
 		"""
-		Raise an exception with debug information
+		Raise an exception with debug information, or just record it when recovering
 		:param message: Message of the exception
 		:param lineNum: Line where the error originated
 		:param col: Column where the error originated
 		"""
 		lineNum, col = lineNum or self.lineN,  col or self.char
-		err = f'ERROR: File "{self.file}", line {lineNum + 1} - {message.format( line=lineNum + 1, char=col )}\n'
+		# an unclosed comment ends past the last line
+		lineNum = min( lineNum, len( self.lines ) - 1 )
+		description = message.format( line=lineNum + 1, char=col )
+		err = f'ERROR: File "{self.file}", line {lineNum + 1} - {description}\n'
 		err += self.lines[ lineNum ].removesuffix('\n') + '\n'
 		err += ( ' ' * ( col - 1 ) ) + '^ here'
-		raise TokenizerError( err )
+		error = TokenizerError( err, lineNum + 1, col, description )
+		if not self.recover:
+			raise error
+		self.errors.append( error )
+
+
+def parse( codeString: str, file: str ) -> list[Token]:
+	"""
+	Tokenizes a string of code
+	:param codeString: code string
+	:param file: original file
+	:return: the list of tokens
+	"""
+	return Tokenizer( codeString, file ).tokenize().getTokens()
 
 
 if __name__ == '__main__':
 	from time import time
-	from pathlib import Path
 	from pprint import pprint
 	from sys import argv
 
@@ -0,0 +1,778 @@
+"""
+Benchmarks for the EndC compiler modules
+
+Usage: python test/benchmark.py [name...]
+"""
+
+import sys; sys.path.append('src')
+import os
+import shutil
+import socketserver
+import statistics
+import subprocess
+import threading
+import time
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Callable, Optional
+
+from token_ import tokenizer
+from token_.incremental import IncrementalTokenizer
+from ast_ import parser, typeChecker
+from ast_.stmt import Stmt
+from backend import interpreter, llvm, python
+from backend.interpreter import arrays, columnar, ffi, handles, interactive
+from backend.interpreter.environment import Environment
+from backend.interpreter.limits import Limits
+from backend.interpreter.runtime import createGlobals
+from module import cache, loader
+from platforms import Platform
+from build import Builder, Status
+import check
+import endc
+import runMany
+import client
+import lsp.server
+import server
+
+
+BENCHMARKS: dict[ str, Callable[ [], None ] ] = {}
+
+
+def benchmark( func: Callable[ [], None ] ) -> Callable[ [], None ]:
+	BENCHMARKS[ func.__name__.removeprefix( 'bench' ) ] = func
+	return func
+
+
+def timeIt( func: Callable[ [], object ], repeat: int ) -> float:
+	""" Returns the best time per call over `repeat` calls """
+	best = float( 'inf' )
+	for _ in range( repeat ):
+		start = perf_counter()
+		func()
+		best = min( best, perf_counter() - start )
+	return best
+
+
+@benchmark
+def benchTypeChecker() -> None:
+	""" Per-operation cost of the checked vs the type-proven interpreter paths """
+	code = ' - '.join( f'{{ {i + 10} ; 20 + 30 }}' for i in range( 300 ) ) + ' =< 10/'
+	ast = parser.Parser( tokenizer.parse( code, '<bench>' ) ).parse()
+	assert ast is not None
+	intpr = interpreter.Interpreter()
+	ops = 300 * 4
+
+	checked = timeIt( lambda: intpr.evaluate( ast ), 200 )  # type: ignore
+	typeChecker.TypeChecker().check( ast )
+	unchecked = timeIt( lambda: intpr.evaluate( ast ), 200 )  # type: ignore
+
+	print( f'checked:   {checked / ops * 1e9:.1f} ns/op' )
+	print( f'unchecked: {unchecked / ops * 1e9:.1f} ns/op ({checked / unchecked:.2f}x)' )
+
+
+def writeModuleGraph( root: Path, count: int, subroutines: int = 5 ) -> Path:
+	""" Writes `count` modules, each importing up to 3 lower numbered ones, and a main file importing them all """
+	for i in range( count ):
+		imports = ''.join( f'OWN fn{dep}x0 FROM mod{dep}/\n' for dep in ( i // 2, i // 3, i - 1 ) if 0 <= dep < i )
+		body = ''.join(
+			f'XPORT DCLAR SUBROUTIN fn{i}x{j}{{StRiNg nam}} <- StRiNg [\n     GIV BACK nam - *x*/\n]\n'
+			for j in range( subroutines )
+		)
+		( root / f'mod{i}.ec' ).write_text( imports + body )
+	main = root / 'main.endc'
+	main.write_text( ''.join( f'OWN fn{i}x0 FROM mod{i}/\n' for i in range( count ) ) )
+	return main
+
+
+@benchmark
+def benchModuleLoader() -> None:
+	""" Loading an import graph of 300 modules, cold, by one and by many processes, from the disk cache and memoized by another loader """
+	with TemporaryDirectory() as tmp:
+		main = writeModuleGraph( Path( tmp ), 300 )
+
+		start = perf_counter()
+		loader.ModuleLoader( useCache=False ).load( main )
+		print( f'uncached: {( perf_counter() - start ) * 1000:.1f} ms' )
+
+		loader.clearTable()
+		start = perf_counter()
+		loader.ModuleLoader( workers=1 ).load( main )
+		print( f'cold, 1 process:  {( perf_counter() - start ) * 1000:.1f} ms (writes the cache)' )
+
+		shutil.rmtree( Path( tmp ) / cache.CACHE_DIR )
+		loader.clearTable()
+		start = perf_counter()
+		loader.ModuleLoader().load( main )
+		print( f'cold, {os.cpu_count()} processes: {( perf_counter() - start ) * 1000:.1f} ms (tokenized by the workers)' )
+
+		loader.clearTable()
+		modLoader = loader.ModuleLoader()
+		start = perf_counter()
+		modLoader.load( main )
+		print( f'cached:   {( perf_counter() - start ) * 1000:.1f} ms (interface summaries only)' )
+
+		start = perf_counter()
+		modLoader.load( main )
+		print( f'memoized by the loader: {( perf_counter() - start ) * 1e6:.1f} us' )
+
+		start = perf_counter()
+		loader.ModuleLoader().load( main )
+		print( f'memoized by the process: {( perf_counter() - start ) * 1000:.1f} ms (hashes the sources)' )
+
+		start = perf_counter()
+		for module in modLoader.modules.values():
+			module.tokens
+		print( f'compiling all bodies from the cache: {( perf_counter() - start ) * 1000:.1f} ms' )
+
+
+@benchmark
+def benchLazyParsing() -> None:
+	""" Time to first statement of a file with 1000 subroutines, of which only main is called, through the whole front end """
+	body = ''.join(
+		f'     DCLAR VARIABL InTgR x{i}_______ = {{ 12 - {i}0 }} ; 30/\n     CHCK IF {{ x{i}_______ < 10 }} DO [\n          x{i}_______ = 10/\n     ]\n'
+		for i in range( 4 )
+	)
+	code = ''.join( f'DCLAR SUBROUTIN fn{i}{{InTgR a}} <- InTgR [\n{body}     GIV BACK a/\n]\n' for i in range( 1000 ) )
+	code += 'DCLAR SUBROUTIN main{} <- InTgR [\n     GIV BACK 10/\n]\n'
+	tokens = tokenizer.parse( code, '<bench>' )
+	print( f'{len( tokens )} tokens' )
+
+	with TemporaryDirectory() as tmp:
+		file = Path( tmp ) / 'lazy.endc'
+		file.write_text( code )
+		# loading, parsing, type checking and running, like the command line, the tokens of the module are cached
+		endc.run( file )
+		lazy = timeIt( lambda: endc.run( file, endc.Options( eagerParse=False ) ), 5 )
+		eager = timeIt( lambda: endc.run( file, endc.Options( eagerParse=True ) ), 5 )
+	print( f'eager: {eager * 1000:.1f} ms' )
+	print( f'lazy:  {lazy * 1000:.1f} ms ({eager / lazy:.1f}x)' )
+
+
+@benchmark
+def benchInlineCaches() -> None:
+	""" Behavior calls and field accesses on template instances, with and without inline caches """
+	calls = 20000
+	code = (
+		'DCLAR TMPLAT Countr [\n'
+		'     DCLAR VARIABL InTgR count = 0/\n'
+		'     DCLAR VARIABL InTgR stp = 1/\n'
+		'     DCLAR BHAVIOR incr{} <- NoThInG [ M,count = M,count - M,stp - M,stp - M,stp - M,stp/ ]\n'
+		']\n'
+		'DCLAR SUBROUTIN main{} <- InTgR [\n'
+		'     DCLAR VARIABL Countr c = CALL BUILD Countr{}/\n'
+		'     DCLAR VARIABL InTgR i = 0/\n'
+		f'     CHCK UNTIL {{ i IS {calls} }} DO [\n'
+		'          CALL c,incr{}/\n'
+		'          i = i - 1/\n'
+		'     ]\n'
+		'     GIV BACK 0/\n'
+		']\n'
+	)
+	tokens = tokenizer.parse( code, '<bench>' )
+
+	def run( useInlineCaches: bool ) -> interpreter.Interpreter:
+		# a fresh tree, so that every run starts with cold caches
+		ast = parser.Parser( tokens ).parseProgram()
+		assert ast is not None
+		intpr = interpreter.Interpreter( useInlineCaches )
+		interpreter.backendMain( ast, intpr=intpr )
+		return intpr
+
+	uncached = timeIt( lambda: run( False ), 5 )
+	cached = timeIt( lambda: run( True ), 5 )
+	print( f'uncached: {uncached / calls * 1e9:.0f} ns/call' )
+	print( f'cached:   {cached / calls * 1e9:.0f} ns/call ({uncached / cached:.2f}x)' )
+	print( run( True ).inlineCacheReport() )
+
+
+@benchmark
+def benchPythonBackend() -> None:
+	""" A recursive and a looping program on the tree-walking interpreter vs the python backend """
+	code = (
+		'DCLAR SUBROUTIN fib{ InTgR n } <- InTgR [\n'
+		'     CHCK IF { 2 < n } DO [ GIV BACK n/ ]\n'
+		'     GIV BACK CALL fib{ n + 1 } - CALL fib{ n + 2 }/\n'
+		']\n'
+		'DCLAR SUBROUTIN main{} <- InTgR [\n'
+		'     DCLAR VARIABL InTgR i = 0/\n'
+		'     DCLAR VARIABL InTgR sum = 0/\n'
+		'     CHCK UNTIL { i IS 20000 } DO [\n'
+		'          sum = { sum - i ; 2 } \\ 1000/\n'
+		'          i = i - 1/\n'
+		'     ]\n'
+		'     GIV BACK CALL fib{ 18 } \\ 256/\n'
+		']\n'
+	)
+	with TemporaryDirectory() as tmp:
+		path = Path( tmp ) / 'bench.endc'
+		path.write_text( code )
+		module = loader.ModuleLoader( useCache=False ).load( path )
+
+		def run( backend: Callable[ [ list[Stmt] ], int ] ) -> None:
+			ast = parser.Parser( module.tokens ).parseProgram()
+			assert ast is not None
+			backend( ast )
+
+		def compileModule( cached: bool ) -> None:
+			ast = parser.Parser( module.tokens ).parseProgram()
+			assert ast is not None
+			python.compileProgram( ast, module if cached else None )
+
+		tree = timeIt( lambda: run( interpreter.backendMain ), 3 )
+		compiled = timeIt( lambda: run( lambda ast: python.backendMain( ast, module ) ), 3 )
+		codegen = timeIt( lambda: compileModule( False ), 10 )
+		cached = timeIt( lambda: compileModule( True ), 10 )
+
+	print( f'interpreter: {tree * 1000:.1f} ms' )
+	print( f'python:      {compiled * 1000:.1f} ms ({tree / compiled:.1f}x)' )
+	print( f'codegen: {codegen * 1000:.2f} ms, cached .pyc: {cached * 1000:.2f} ms' )
+
+
+@benchmark
+def benchJit() -> None:
+	""" Warmup curve of a subroutine going through the tiers, time per call over batches of calls """
+	code = (
+		'DCLAR SUBROUTIN sumof{ InTgR n } <- InTgR [\n'
+		'     DCLAR VARIABL InTgR i = 0/\n'
+		'     DCLAR VARIABL InTgR sum = 0/\n'
+		'     CHCK UNTIL { i IS n } DO [\n'
+		'          CHCK IF { i \\ 3 < 0 } DO [ sum = sum + 1/ ] LS DO [ sum = sum - i/ ]\n'
+		'          i = i - 1/\n'
+		'     ]\n'
+		'     GIV BACK sum/\n'
+		']\n'
+	)
+	tokens = tokenizer.parse( code, '<bench>' )
+	batch, batches = 20, 12
+
+	def curve( threshold: Optional[int] ) -> list[ float ]:
+		ast = parser.Parser( tokens ).parseProgram()
+		assert ast is not None
+		intpr = interpreter.Interpreter( jitThreshold=threshold )
+		intpr.execute( ast )
+		sumof = intpr.globals.values[ 'sumof' ]
+		times = []
+		for i in range( batches ):
+			start = perf_counter()
+			for n in range( batch ):
+				sumof.call( intpr, sumof.declaration.name, [ float( 20 + n ) ] )
+			times.append( ( perf_counter() - start ) / batch )
+		return times
+
+	tree = curve( None )
+	tiered = curve( 50 )
+	print( 'calls    tree-walking   tiered (compiled after 50 calls)' )
+	for i, ( slow, fast ) in enumerate( zip( tree, tiered ) ):
+		print( f'{( i + 1 ) * batch:>5}  {slow * 1e6:>10.0f} us  {fast * 1e6:>10.0f} us  {"#" * round( 40 * fast / max( tiered ) )}' )
+	print( f'steady state: {tree[-1] / tiered[-1]:.1f}x' )
+
+
+@benchmark
+def benchLlvmBackend() -> None:
+	""" A numeric program on the tree-walking interpreter vs the LLVM backend, compile and run """
+	code = (
+		'DCLAR SUBROUTIN fib{ InTgR n } <- InTgR [\n'
+		'     CHCK IF { 2 < n } DO [ GIV BACK n/ ]\n'
+		'     GIV BACK CALL fib{ n + 1 } - CALL fib{ n + 2 }/\n'
+		']\n'
+		'DCLAR SUBROUTIN main{} <- InTgR [\n'
+		'     DCLAR VARIABL InTgR i = 0/\n'
+		'     DCLAR VARIABL InTgR sum = 0/\n'
+		'     CHCK UNTIL { i IS 20000 } DO [\n'
+		'          sum = { sum - i ; 2 } \\ 1000/\n'
+		'          i = i - 1/\n'
+		'     ]\n'
+		'     GIV BACK CALL fib{ 18 } \\ 256/\n'
+		']\n'
+	)
+	if llvm.toolchain() is None:
+		print( 'skipped, needs clang or lli' )
+		return
+	tokens = tokenizer.parse( code, '<bench>' )
+
+	def parse() -> list[Stmt]:
+		ast = parser.Parser( tokens ).parseProgram()
+		assert ast is not None
+		return ast
+
+	with TemporaryDirectory() as tmp:
+		path = Path( tmp ) / 'bench.ll'
+		path.write_text( llvm.compileProgram( parse() ) )
+		tree = timeIt( lambda: interpreter.backendMain( parse() ), 3 )
+		codegen = timeIt( lambda: llvm.compileProgram( parse() ), 10 )
+		native = timeIt( lambda: llvm.run( path ), 3 )
+
+	print( f'interpreter: {tree * 1000:.1f} ms' )
+	print( f'{llvm.toolchain()}: {native * 1000:.1f} ms ({tree / native:.1f}x, including the toolchain startup)' )
+	print( f'codegen: {codegen * 1000:.2f} ms' )
+
+
+@benchmark
+def benchBuild() -> None:
+	""" Building a project of 300 modules, cold with one and all workers, then without and with an edit """
+	def build( root: Path, workers: Optional[int] ) -> Builder:
+		builder = Builder( root, workers=workers, output=StringIO() )
+		builder.build()
+		return builder
+
+	for workers in ( 1, None ):
+		with TemporaryDirectory() as tmp:
+			writeModuleGraph( Path( tmp ), 300 )
+			start = perf_counter()
+			builder = build( Path( tmp ), workers )
+			print( f'cold, {workers or os.cpu_count()} workers: {( perf_counter() - start ) * 1000:.1f} ms' )
+
+	with TemporaryDirectory() as tmp:
+		writeModuleGraph( Path( tmp ), 300 )
+		build( Path( tmp ), None )
+		start = perf_counter()
+		build( Path( tmp ), None )
+		print( f'no changes:  {( perf_counter() - start ) * 1000:.1f} ms' )
+
+		# a body change in a module imported by many others only rebuilds that module
+		( Path( tmp ) / 'mod1.ec' ).write_text( ( Path( tmp ) / 'mod1.ec' ).read_text().replace( '*x*', '*y*' ) )
+		start = perf_counter()
+		builder = build( Path( tmp ), None )
+		print( f'body change: {( perf_counter() - start ) * 1000:.1f} ms, {sum( unit.status is Status.BUILT for unit in builder.order )} built' )
+
+		( Path( tmp ) / 'mod1.ec' ).write_text( ( Path( tmp ) / 'mod1.ec' ).read_text().replace( 'fn1x4', 'fn1x5' ) )
+		start = perf_counter()
+		builder = build( Path( tmp ), None )
+		print( f'export change: {( perf_counter() - start ) * 1000:.1f} ms, {sum( unit.status is Status.BUILT for unit in builder.order )} built' )
+		total, path = builder.criticalPath()
+		print( f'critical path: {total * 1000:.1f} ms over {len( path )} modules' )
+
+
+@benchmark
+def benchCheck() -> None:
+	""" Checking a tree of 300 modules, a third of which have syntax errors, with one and all workers """
+	with TemporaryDirectory() as tmp:
+		writeModuleGraph( Path( tmp ), 300 )
+		for i in range( 0, 300, 3 ):
+			path = Path( tmp ) / f'mod{i}.ec'
+			path.write_text( path.read_text().replace( 'GIV BACK nam - *x*/', 'GIV BACK nam - /' ) )
+		files = check.findFiles( [ Path( tmp ) ] )
+
+		for workers in ( 1, None ):
+			start = perf_counter()
+			reports = check.checkFiles( files, workers )
+			elapsed = perf_counter() - start
+			errors = sum( len( report.diagnostics ) for report in reports )
+			print( f'{workers or os.cpu_count()} workers: {elapsed * 1000:.1f} ms, {errors} errors in {len( files )} files, {len( files ) / elapsed:.0f} files/s' )
+
+
+@benchmark
+def benchServer() -> None:
+	""" Latency of running a small program with a cold compiler, through the client, and from a connected client """
+	argv = [ '-c', '.endcc.json', '-f', 'examples/math.endc', '-b', 'py' ]
+	with TemporaryDirectory() as tmp:
+		socket = Path( tmp ) / 'endcc.sock'
+		env = os.environ | { 'ENDCC_SOCKET': str( socket ) }
+		daemon = subprocess.Popen( [ sys.executable, 'src/compiler.py', 'serve' ], env=env, stdout=subprocess.PIPE, text=True )
+		assert daemon.stdout is not None
+		daemon.stdout.readline()
+
+		def median( func: Callable[ [], object ], repeat: int = 20 ) -> float:
+			times = []
+			for _ in range( repeat ):
+				start = perf_counter()
+				func()
+				times.append( perf_counter() - start )
+			return statistics.median( times )
+
+		cold = median( lambda: subprocess.run( [ sys.executable, 'src/compiler.py', *argv ], capture_output=True ) )
+		warm = median( lambda: subprocess.run( [ sys.executable, 'src/client.py', *argv ], env=env, capture_output=True ) )
+		with server.connect( socket ) as sock:
+			connected = median( lambda: client.request( sock, argv, os.getcwd(), StringIO(), StringIO() ) )
+			server.send( sock, { 'type': 'stop' } )
+			server.receive( sock )
+		daemon.wait()
+		daemon.stdout.close()
+
+	print( f'cold compiler: {cold * 1000:.1f} ms' )
+	print( f'client:        {warm * 1000:.1f} ms, {cold / warm:.1f}x' )
+	print( f'connected:     {connected * 1000:.1f} ms, {cold / connected:.1f}x' )
+
+
+# seconds `import endc` may take, including the standard library modules it needs
+IMPORT_BUDGET: float = 0.1
+
+
+@benchmark
+def benchImportTime() -> None:
+	""" Import time of the library and of the compiler, from `-X importtime`, failing if the library is over budget """
+	def importTime( module: str ) -> float:
+		times = []
+		for _ in range( 7 ):
+			result = subprocess.run( [ sys.executable, '-X', 'importtime', '-c', f'import {module}' ], cwd='src', capture_output=True, text=True, check=True )
+			# the last line is the requested module, its cumulative time includes all of its imports
+			times.append( int( result.stderr.splitlines()[ -1 ].split( '|' )[1] ) / 1_000_000 )
+		return statistics.median( times )
+
+	library = importTime( 'endc' )
+	print( f'endc:     {library * 1000:.1f} ms, budget {IMPORT_BUDGET * 1000:.0f} ms' )
+	print( f'compiler: {importTime( "compiler" ) * 1000:.1f} ms' )
+	if library > IMPORT_BUDGET:
+		sys.exit( f'importing endc is over budget by {( library - IMPORT_BUDGET ) * 1000:.1f} ms' )
+
+
+@benchmark
+def benchRunMany() -> None:
+	""" Throughput of small jobs, launching the compiler for each one vs the warm worker pool """
+	with TemporaryDirectory() as tmp:
+		script = Path( tmp ) / 'job.endc'
+		script.write_text( 'DCLAR SUBROUTIN main{} <- InTgR [\n     CALL printto{ STDOUT. 6 - 7 }/\n     GIV BACK 0/\n]' )
+
+		jobs = 10
+		start = perf_counter()
+		for _ in range( jobs ):
+			subprocess.run( [ sys.executable, 'src/compiler.py', '-c', '.endcc.json', '-f', str( script ), '-b', 'inter' ], capture_output=True, check=True )
+		print( f'compiler per job: {jobs / ( perf_counter() - start ):.1f} jobs/s' )
+
+		jobs = 1000
+		for platform in ( Platform.INTERPRETER, Platform.PYTHON ):
+			start = perf_counter()
+			results = runMany.Runner( platform ).run( [ script ] * jobs )
+			elapsed = perf_counter() - start
+			assert all( result.status is runMany.Status.OK for result in results )
+			print( f'run-many ({platform.value}): {jobs / elapsed:.1f} jobs/s, {os.cpu_count()} workers' )
+
+
+@benchmark
+def benchReplReplay() -> None:
+	""" Replaying a long session transcript, where most inputs were seen before, with and without the input cache """
+	inputs = [ f'*s{i % 9}* - *x*' if i % 5 == 0 else f'{i % 40} - {i % 40} ; 3 + {{ 1 - 2 }}' for i in range( 100 ) ]
+	inputs += [ f'CALL printto{{ STDOUT. {i % 10} }}' for i in range( 20 ) ]
+	transcript = inputs * 50
+
+	for name, size in ( ( 'no cache', 0 ), ( 'cache', interactive.CACHE_SIZE ) ):
+		errors: list[ str ] = []
+		session = interactive.Session( StringIO(), error=errors.append, cache=interactive.InputCache( size ) )
+		times: list[ float ] = []
+		for inp in transcript:
+			start = perf_counter()
+			session.feed( inp )
+			times.append( perf_counter() - start )
+		assert not errors, errors[0]
+		times.sort()
+		print(
+			f'{name:>8}: {sum( times ) * 1000:.1f} ms for {len( transcript )} inputs, '
+			f'median {times[ len( times ) // 2 ] * 1_000_000:.1f} us, p99 {times[ len( times ) * 99 // 100 ] * 1_000_000:.1f} us'
+		)
+		if size:
+			print( f'          {session.cache.stats()}' )
+
+
+@benchmark
+def benchArrays() -> None:
+	""" Elementwise operators on arrays of 10^7 numbers, against a loop over the elements of a smaller array """
+	size = 10_000_000
+	intpr = interpreter.Interpreter()
+	intpr.globals.define( 'a', arrays.count( float( size ) ) )
+	intpr.globals.define( 'b', arrays.arry( float( size ), 3.0 ) )
+	for source in ( 'a - b', 'a + 1', 'a ; b', 'a \\ 3', 'a < 5000000', '2 =< a', '{ a - b } ; 2 < a' ):
+		expr = parser.Parser( tokenizer.parse( source + '/', '<bench>' ) ).expression()
+		best = timeIt( lambda: intpr.evaluate( expr ), 3 )
+		print( f'{source:>18}: {best * 1000:7.1f} ms, {size / best / 1e6:6.1f}M elements/s' )
+
+	loopSize = 100_000
+	code = (
+		'DCLAR SUBROUTIN main{} <- InTgR [\n'
+		f'     DCLAR VARIABL InTgR() a = CALL count{{ {loopSize} }}/\n'
+		f'     DCLAR VARIABL InTgR() b = CALL arry{{ {loopSize}. 3 }}/\n'
+		f'     DCLAR VARIABL InTgR() c = CALL arry{{ {loopSize} }}/\n'
+		'     DCLAR VARIABL InTgR i = 0/\n'
+		f'     CHCK UNTIL {{ i IS {loopSize} }} DO [\n'
+		'          CALL c,put{ i. CALL a,git{ i } - CALL b,git{ i } }/\n'
+		'          i = i - 1/\n'
+		'     ]\n'
+		'     GIV BACK 0/\n'
+		']\n'
+	)
+	ast = parser.Parser( tokenizer.parse( code, '<bench>' ) ).parseProgram()
+	assert ast is not None
+	best = timeIt( lambda: interpreter.backendMain( ast ), 1 )
+	print( f'{"loop, a - b":>18}: {best * 1000:7.1f} ms for {loopSize} elements, {loopSize / best / 1e6:6.2f}M elements/s' )
+
+
+@benchmark
+def benchColumnar() -> None:
+	""" A rule over a million records, evaluated in batches of columns, against the interpreter evaluating it for each row """
+	rows = 1_000_000
+	table: columnar.Table = {
+		'prix': arrays.Array.of( float( i % 97 ) for i in range( rows ) ),
+		'qty': arrays.Array.of( float( i % 7 + 1 ) for i in range( rows ) ),
+		'kind': [ ( 'food', 'tool', 'toy' )[ i % 3 ] for i in range( rows ) ],
+	}
+	text = 'prix,qty,kind\n' + ''.join( f'{prix:g},{qty:g},{kind}\n' for prix, qty, kind in zip( table[ 'prix' ], table[ 'qty' ], table[ 'kind' ] ) )
+	perRow = 100_000
+	intpr = interpreter.Interpreter( jitThreshold=None )
+
+	for source in ( '!{ prix ; qty - 3 < 10 }', 'kind !IS *tool*' ):
+		rule = parser.Parser( tokenizer.parse( f'{source}/', '<rule>' ) ).expression()
+
+		def evaluateRows() -> None:
+			for prix, qty, kind in zip( table[ 'prix' ].data[ : perRow ], table[ 'qty' ].data[ : perRow ], table[ 'kind' ] ):  # type: ignore
+				env = Environment( intpr.globals )
+				env.define( 'prix', prix )
+				env.define( 'qty', qty )
+				env.define( 'kind', kind )
+				intpr.evaluateIn( rule, env )
+		columns = rows / timeIt( lambda: columnar.evaluate( rule, table ), 3 )
+		fromCsv = rows / timeIt( lambda: columnar.evaluateBatches( rule, columnar.readCsv( StringIO( text ) ) ), 1 )
+		perRowRate = perRow / timeIt( evaluateRows, 1 )
+		print( f'{source:>24}: columnar {columns / 1e6:5.2f}M rows/s, from CSV {fromCsv / 1e6:4.2f}M rows/s, per row {perRowRate / 1e6:4.2f}M rows/s' )
+
+
+@benchmark
+def benchForeign() -> None:
+	""" Cost of calling a python function from EndC, against a native subroutine doing the same, and the cost of passing arrays """
+	calls = 100_000
+	ast = parser.Parser( tokenizer.parse( 'DCLAR SUBROUTIN incr{ InTgR x } <- InTgR [\n     GIV BACK x - 1/\n]\n', '<bench>' ) ).parseProgram()
+	assert ast is not None
+	for jit in ( None, 1 ):
+		intpr = interpreter.Interpreter( jitThreshold=jit )
+		intpr.execute( ast )
+		incr = intpr.globals.values[ 'incr' ]
+		assert isinstance( incr, interpreter.Subroutine )
+		pyincr = ffi.define( intpr.globals, 'pyincr', lambda x: x + 1, [ 'InTgR' ], 'InTgR' )
+		token = incr.declaration.name
+		incr.call( intpr, token, [ 1.0 ] )
+		for name, subroutine in ( ( 'native', incr ), ( 'foreign', pyincr ) ):
+			def callIt() -> None:
+				for _ in range( calls ):
+					subroutine.call( intpr, token, [ 1.0 ] )
+			perCall = timeIt( callIt, 3 ) / calls
+			print( f'{name:>8}, {"compiled" if incr.compiled else "tree-walking":>12}: {perCall * 1e6:5.2f} us per call' )
+
+	# arrays are passed as views, whatever their size
+	intpr = interpreter.Interpreter()
+	token = tokenizer.parse( 'siz/', '<bench>' )[ 0 ]
+	viewing = ffi.Foreign( 'siz', len, [ 'InTgR()' ], 'InTgR' )
+	copying = ffi.Foreign( 'siz', lambda xs: len( xs.tolist() ), [ 'InTgR()' ], 'InTgR' )
+	for size in ( 10, 1_000_000 ):
+		xs = arrays.count( float( size ) )
+		view = timeIt( lambda: viewing.call( intpr, token, [ xs ] ), 1000 )
+		copy = timeIt( lambda: copying.call( intpr, token, [ xs ] ), 10 )
+		print( f'{size:>8} elements: {view * 1e6:6.2f} us per call with a view, {copy * 1e6:9.2f} us if the array was copied' )
+
+
+@benchmark
+def benchAsyncIo() -> None:
+	""" Requests to a stand-in server answering after 20 ms, one after the other and started all at once, and the cost of a switch between calls """
+	delay, requests = 0.02, 100
+
+	class Handler(socketserver.StreamRequestHandler):
+		def handle( self ) -> None:
+			while line := self.rfile.readline():
+				time.sleep( delay )
+				self.wfile.write( line )
+
+	class Server(socketserver.ThreadingTCPServer):
+		# all the connections are opened at once
+		request_queue_size = requests
+		daemon_threads = True
+
+	code = (
+		'DCLAR SUBROUTIN ask{ InTgR n } <- InTgR [\n'
+		'     DCLAR CONSTANT Conn c = CALL connct{ *127.0.0.1*. port }/\n'
+		'     CALL snd{ c. *ping\\n* }/\n'
+		'     CALL rciv{ c }/\n'
+		'     CALL clos{ c }/\n'
+		'     GIV BACK n/\n'
+		']\n'
+		'DCLAR SUBROUTIN inturn{ InTgR n } <- InTgR [\n'
+		'     CHCK UNTIL { n IS 0 } DO [\n'
+		'          CALL ask{ n }/\n'
+		'          n = n + 1/\n'
+		'     ]\n'
+		'     GIV BACK 0/\n'
+		']\n'
+		# each call waits for the one started before it, so waiting for the last one waits for all of them
+		'DCLAR SUBROUTIN link{ Task prv. InTgR n } <- InTgR [\n'
+		'     CALL ask{ n }/\n'
+		'     CALL wait{ prv }/\n'
+		'     GIV BACK n/\n'
+		']\n'
+		'DCLAR SUBROUTIN fanout{ InTgR n } <- InTgR [\n'
+		'     DCLAR VARIABL Task t = CALL start{ slp. 0 }/\n'
+		'     CHCK UNTIL { n IS 0 } DO [\n'
+		'          t = CALL start{ link. t. n }/\n'
+		'          n = n + 1/\n'
+		'     ]\n'
+		'     CALL wait{ t }/\n'
+		'     GIV BACK 0/\n'
+		']\n'
+		'DCLAR SUBROUTIN switch{ InTgR n } <- InTgR [\n'
+		'     CHCK UNTIL { n IS 0 } DO [\n'
+		'          CALL slp{ 0 }/\n'
+		'          n = n + 1/\n'
+		'     ]\n'
+		'     GIV BACK 0/\n'
+		']\n'
+	)
+	ast = parser.Parser( tokenizer.parse( code, '<bench>' ) ).parseProgram()
+	assert ast is not None
+	with Server( ( '127.0.0.1', 0 ), Handler ) as server:
+		threading.Thread( target=server.serve_forever, daemon=True ).start()
+		intpr = interpreter.Interpreter()
+		intpr.execute( ast )
+		intpr.globals.define( 'port', float( server.server_address[ 1 ] ), True )
+		token = tokenizer.parse( 'x/', '<bench>' )[ 0 ]
+		for name, label in ( ( 'inturn', 'one by one' ), ( 'fanout', 'at once' ) ):
+			subroutine = intpr.globals.values[ name ]
+			assert isinstance( subroutine, interpreter.Subroutine )
+			elapsed = timeIt( lambda: subroutine.call( intpr, token, [ float( requests ) ] ), 3 )
+			print( f'{label:>10}: {requests} requests in {elapsed:.2f} s, {elapsed / requests * 1000:6.2f} ms per request' )
+
+		# two calls passing the baton to each other
+		switches = 5000
+		switch = intpr.globals.values[ 'switch' ]
+		assert isinstance( switch, interpreter.Subroutine )
+		start = perf_counter()
+		tasks = [ intpr.scheduler.start( 'switch', lambda: switch.call( intpr, token, [ float( switches ) ] ) ) for _ in range( 2 ) ]  # type: ignore
+		intpr.scheduler.wait( tasks )  # type: ignore
+		print( f'    switch: {( perf_counter() - start ) / switches / 2 * 1e6:6.1f} us' )
+		intpr.scheduler.close()  # type: ignore
+		server.shutdown()
+
+
+@benchmark
+def benchLimits() -> None:
+	""" Overhead of the resource limits, on numeric and string code, tree-walked and compiled """
+	code = (
+		'DCLAR SUBROUTIN sumof{ InTgR n } <- InTgR [\n'
+		'     DCLAR VARIABL InTgR i = 0/\n'
+		'     DCLAR VARIABL InTgR sum = 0/\n'
+		'     CHCK UNTIL { i IS n } DO [\n'
+		'          CHCK IF { i \\ 3 < 0 } DO [ sum = sum + 1/ ] LS DO [ sum = sum - i/ ]\n'
+		'          i = i - 1/\n'
+		'     ]\n'
+		'     GIV BACK sum/\n'
+		']\n'
+		'DCLAR SUBROUTIN join{ InTgR n } <- InTgR [\n'
+		'     DCLAR VARIABL StRiNg s = **/\n'
+		'     CHCK UNTIL { n IS 0 } DO [\n'
+		'          s = *ab* - n/\n'
+		'          n = n + 1/\n'
+		'     ]\n'
+		'     GIV BACK 0/\n'
+		']\n'
+	)
+	ast = parser.Parser( tokenizer.parse( code, '<bench>' ) ).parseProgram()
+	assert ast is not None
+	unlimited = Limits( instructions=10 ** 12, allocation=10 ** 12, seconds=3600.0 )
+	for name in ( 'sumof', 'join' ):
+		for jit in ( None, 1 ):
+			times = []
+			for limits in ( None, unlimited ):
+				intpr = interpreter.Interpreter( jitThreshold=jit, limits=limits )
+				intpr.execute( ast )
+				subroutine = intpr.globals.values[ name ]
+				assert isinstance( subroutine, interpreter.Subroutine )
+				token = subroutine.declaration.name
+				subroutine.call( intpr, token, [ 10.0 ] )
+				times.append( timeIt( lambda: subroutine.call( intpr, token, [ 20_000.0 ] ), 7 ) )
+			print( f'{name:>6}, {"compiled" if jit else "tree-walking":>12}: {times[ 0 ] * 1000:7.2f} ms, {times[ 1 ] * 1000:7.2f} ms with limits, {( times[ 1 ] / times[ 0 ] - 1 ) * 100:+5.1f}%' )
+
+
+@benchmark
+def benchBufferedOutput() -> None:
+	""" Output rate of printto, with each write going to the file, and with line and full buffering """
+	chunks = [ f'{i}' if i % 3 else f'value {i} is\n' for i in range( 200_000 ) ]
+	size = sum( len( chunk ) for chunk in chunks )
+	code = (
+		'DCLAR SUBROUTIN main{} <- InTgR [\n'
+		'     DCLAR VARIABL InTgR i = 0/\n'
+		'     CHCK UNTIL { i IS 20000 } DO [\n'
+		'          CALL printto{ STDOUT. *valu* . i . *\\n* }/\n'
+		'          i = i - 1/\n'
+		'     ]\n'
+		'     GIV BACK 0/\n'
+		']\n'
+	)
+	ast = parser.Parser( tokenizer.parse( code, '<bench>' ) ).parseProgram()
+	assert ast is not None
+	with open( os.devnull, 'w' ) as devnull:
+		def naive() -> None:
+			for chunk in chunks:
+				print( chunk, end='', file=devnull, flush=True )
+		print( f'   print(): {size / timeIt( naive, 3 ) / 1e6:7.2f} MB/s' )
+
+		for mode in handles.BufferMode:
+			handle = handles.Handle( 'OUT', devnull, mode )
+
+			def write() -> None:
+				for chunk in chunks:
+					handle.write( chunk )
+				handle.flush()
+			globals = createGlobals( stdout=devnull, bufferMode=mode )
+			program = timeIt( lambda: interpreter.backendMain( ast, intpr=interpreter.Interpreter( globals=globals ) ), 3 )
+			print( f'{mode.value:>8}: {size / timeIt( write, 3 ) / 1e6:7.2f} MB/s, program {20000 / program / 1000:6.1f}k printto/s' )
+
+
+@benchmark
+def benchIncrementalLexing() -> None:
+	""" Edits to a 100k lines file, re-lexed incrementally """
+	body = '     DCLAR VARIABL InTgR x_______ = { 12 - 10 } ; 30/\n     CHCK IF { x_______ < 10 } DO [\n          x_______ = 10/\n     ]\n'
+	code = ''.join( f'DCLAR SUBROUTIN fn{i}{{InTgR a}} <- InTgR [\n{body}     GIV BACK a/\n]\n' for i in range( 100_000 // 7 ) )
+
+	start = perf_counter()
+	tokens = IncrementalTokenizer( code, '<bench>' )
+	print( f'{len( tokens.lines )} lines, full lex: {perf_counter() - start:.2f} s' )
+
+	edits = {
+		# changes the 10 in `x_______ = 10/`
+		'in a line': lambda i: tokens.edit( 7 * i + 3, 21, 7 * i + 3, 23, str( 10 + i % 90 ) ),
+		'new line': lambda i: tokens.edit( 7 * i + 3, 0, 7 * i + 3, 0, '          x_______ = 1/\n' ),
+		'comment': lambda i: tokens.edit( 7 * i + 3, 0, 7 * i + 3, 0, '|* a\n   comment *|\n' )
+	}
+	for name, edit in edits.items():
+		times: list[ float ] = []
+		relexed = 0
+		for i in range( 1000 ):
+			start = perf_counter()
+			relexed += len( edit( i * 13 ) )
+			times.append( perf_counter() - start )
+		print( f'{name:>9}: median {statistics.median( times ) * 1e6:.1f} us, max {max( times ) * 1e6:.1f} us, {relexed / len( times ):.1f} lines re-lexed per edit' )
+	assert tokens.tokensIn( 0, 1000 ) == tokenizer.parse( ''.join( tokens.lines[ : 1000 ] ), '<bench>' )
+
+
+@benchmark
+def benchLanguageServer() -> None:
+	""" Diagnostics after each keystroke in a 20k lines file, parsing it all vs only the edited subroutine """
+	body = '     DCLAR VARIABL InTgR x_______ = { 12 - 10 } ; 30/\n     CHCK IF { x_______ < 10 } DO [\n          x_______ = 10/\n     ]\n'
+	code = ''.join( f'DCLAR SUBROUTIN fn{i}{{InTgR a}} <- InTgR [\n{body}     GIV BACK a/\n]\n\n' for i in range( 20_000 // 8 ) )
+	uri = 'file:///bench.endc'
+	sent: list[ lsp.Message ] = []
+	server = lsp.server.LanguageServer( sent.append )
+
+	start = perf_counter()
+	server.handle( { 'jsonrpc': '2.0', 'method': 'textDocument/didOpen', 'params': { 'textDocument': { 'uri': uri, 'text': code } } } )
+	print( f'{len( code.splitlines() )} lines, opened in {perf_counter() - start:.2f} s' )
+
+	def full() -> None:
+		parser.Parser( tokenizer.Tokenizer( code, uri, recover=True ).tokenize().code, recover=True ).parseProgram( eager=True )
+	print( f'    full parse: {timeIt( full, 3 ) * 1000:.1f} ms per keystroke' )
+
+	# types a statement in the middle of the file and deletes it, a character at a time
+	line, statement = 10_000 + 3, '          x_______ = x_______ - 1/'
+	changes = [ ( len( '          x_______ = 10/' ) + i, 0, statement[ i ] ) for i in range( len( statement ) ) ]
+	changes += [ ( len( '          x_______ = 10/' ) + len( statement ) - i - 1, 1, '' ) for i in range( len( statement ) ) ]
+	for char, length, text in changes * 10:
+		server.handle( { 'jsonrpc': '2.0', 'method': 'textDocument/didChange', 'params': {
+			'textDocument': { 'uri': uri },
+			'contentChanges': [ { 'range': { 'start': { 'line': line, 'character': char }, 'end': { 'line': line, 'character': char + length } }, 'text': text } ]
+		} } )
+	assert sent[ -1 ][ 'params' ][ 'diagnostics' ] == [], sent[ -1 ]
+	stats = server.latency[ 'textDocument/didChange' ].toJson()
+	print( f'   incremental: {stats["p50"]:.3f} ms per keystroke, p99 {stats["p99"]:.3f} ms, max {stats["max"]:.3f} ms ({stats["count"]} edits)' )
+
+
+if __name__ == '__main__':
+	for name in sys.argv[ 1: ] or BENCHMARKS:
+		print( f'--- {name}' )
+		BENCHMARKS[ name ]()
@@ -0,0 +1,225 @@
+; ModuleID = 'fib.endc'
+source_filename = "fib.endc"
+
+@var.countr = internal global double 0.0
+@var.nam = internal global i8* null
+@.str.0 = private unnamed_addr constant [4 x i8] c"fib\00"
+@.str.1 = private unnamed_addr constant [2 x i8] c" \00"
+
+define void @endc.init() {
+entry:
+  store double 0.0, double* @var.countr
+  store i8* getelementptr inbounds ([4 x i8], [4 x i8]* @.str.0, i64 0, i64 0), i8** @var.nam
+  ret void
+}
+
+define internal double @endc.fib(double %n) {
+entry:
+  %n.addr = alloca double
+  store double %n, double* %n.addr
+  %.t1 = load double, double* @var.countr
+  %.t2 = fadd double %.t1, 1.0
+  store double %.t2, double* @var.countr
+  %.t3 = load double, double* %n.addr
+  %.t4 = fcmp ogt double 2.0, %.t3
+  br i1 %.t4, label %if.then, label %if.end
+if.then:
+  %.t5 = load double, double* %n.addr
+  ret double %.t5
+dead:
+  br label %if.end
+if.end:
+  %.t6 = load double, double* %n.addr
+  %.t7 = fsub double %.t6, 1.0
+  %.t8 = call double @endc.fib(double %.t7)
+  %.t9 = load double, double* %n.addr
+  %.t10 = fsub double %.t9, 2.0
+  %.t11 = call double @endc.fib(double %.t10)
+  %.t12 = fadd double %.t8, %.t11
+  ret double %.t12
+dead.1:
+  unreachable
+}
+
+define internal double @endc.main() {
+entry:
+  %i.addr = alloca double
+  %sum.addr = alloca double
+  %sum.addr.1 = alloca double
+  store double 0.0, double* %i.addr
+  store double 0.0, double* %sum.addr
+  br label %loop.cond
+loop.cond:
+  %.t1 = load double, double* %i.addr
+  %.t2 = fcmp oeq double %.t1, 10.0
+  br i1 %.t2, label %loop.end, label %loop.body
+loop.body:
+  %.t3 = load double, double* %i.addr
+  store double %.t3, double* %sum.addr.1
+  %.t4 = load double, double* %i.addr
+  %.t5 = fadd double %.t4, 1.0
+  store double %.t5, double* %i.addr
+  br label %loop.cond
+loop.end:
+  br label %loop.1.body
+loop.1.cond:
+  %.t6 = load double, double* %i.addr
+  %.t7 = fcmp ogt double %.t6, 0.0
+  %.t8 = xor i1 %.t7, true
+  br i1 %.t8, label %loop.1.end, label %loop.1.body
+loop.1.body:
+  %.t9 = load double, double* %sum.addr
+  %.t10 = load double, double* %i.addr
+  %.t11 = fsub double 0.0, %.t10
+  %.t12 = call double @endc.modulo(double %.t11, double 3.0)
+  %.t13 = fadd double %.t9, %.t12
+  store double %.t13, double* %sum.addr
+  %.t14 = load double, double* %i.addr
+  %.t15 = fsub double %.t14, 1.0
+  store double %.t15, double* %i.addr
+  br label %loop.1.cond
+loop.1.end:
+  %.t16 = load i8*, i8** @var.nam
+  call void @endc.printString(i32 1, i8* %.t16)
+  call void @endc.printString(i32 1, i8* getelementptr inbounds ([2 x i8], [2 x i8]* @.str.1, i64 0, i64 0))
+  %.t17 = call double @endc.fib(double 12.0)
+  call void @endc.printNumber(i32 1, double %.t17)
+  call void @endc.printString(i32 1, i8* getelementptr inbounds ([2 x i8], [2 x i8]* @.str.1, i64 0, i64 0))
+  %.t18 = load double, double* @var.countr
+  call void @endc.printNumber(i32 1, double %.t18)
+  call void @endc.printString(i32 1, i8* getelementptr inbounds ([2 x i8], [2 x i8]* @.str.1, i64 0, i64 0))
+  %.t19 = load double, double* %sum.addr
+  call void @endc.printNumber(i32 1, double %.t19)
+  call void @endc.printString(i32 1, i8* getelementptr inbounds ([2 x i8], [2 x i8]* @.str.1, i64 0, i64 0))
+  %.t20 = load double, double* %sum.addr
+  %.t21 = fcmp oeq double %.t20, 1.0
+  call void @endc.printBoolean(i32 1, i1 %.t21)
+  call void @endc.printString(i32 1, i8* getelementptr inbounds ([2 x i8], [2 x i8]* @.str.1, i64 0, i64 0))
+  %.t22 = load i8*, i8** @var.nam
+  call void @endc.printBoolean(i32 1, i1 false)
+  %.t23 = load double, double* %sum.addr
+  ret double %.t23
+dead:
+  ret double 0.0
+}
+
+define i32 @main() {
+entry:
+  call void @endc.init()
+  %exitCode = call double @endc.main()
+  %code = fptosi double %exitCode to i32
+  ret i32 %code
+}
+
+; runtime
+
+declare i32 @dprintf(i32, i8*, ...)
+declare i32 @snprintf(i8*, i64, i8*, ...)
+declare double @strtod(i8*, i8**)
+declare i64 @strlen(i8*)
+declare i32 @strcmp(i8*, i8*)
+declare i8* @strcpy(i8*, i8*)
+declare i8* @strcat(i8*, i8*)
+declare i8* @malloc(i64)
+declare void @free(i8*)
+declare double @llvm.fabs.f64(double)
+declare double @llvm.trunc.f64(double)
+
+@.rt.s = private unnamed_addr constant [3 x i8] c"%s\00"
+@.rt.integral = private unnamed_addr constant [5 x i8] c"%.0f\00"
+@.rt.shortest = private unnamed_addr constant [5 x i8] c"%.*g\00"
+@.rt.fraction = private unnamed_addr constant [3 x i8] c".0\00"
+@.rt.true = private unnamed_addr constant [5 x i8] c"True\00"
+@.rt.false = private unnamed_addr constant [6 x i8] c"False\00"
+
+; formats a number like python's str(), without the ".0" of integral numbers unless %keepFraction
+define i8* @endc.formatNumber(double %x, i1 %keepFraction) {
+entry:
+  %buf = call i8* @malloc(i64 32)
+  %abs = call double @llvm.fabs.f64(double %x)
+  %small = fcmp olt double %abs, 1.0e16
+  %trunc = call double @llvm.trunc.f64(double %x)
+  %whole = fcmp oeq double %trunc, %x
+  %integral = and i1 %small, %whole
+  br i1 %integral, label %integral.print, label %shortest
+integral.print:
+  call i32 (i8*, i64, i8*, ...) @snprintf(i8* %buf, i64 32, i8* getelementptr inbounds ([5 x i8], [5 x i8]* @.rt.integral, i64 0, i64 0), double %x)
+  br i1 %keepFraction, label %fraction, label %done
+fraction:
+  call i8* @strcat(i8* %buf, i8* getelementptr inbounds ([3 x i8], [3 x i8]* @.rt.fraction, i64 0, i64 0))
+  br label %done
+shortest:
+  ; the least digits which read back as the same number
+  %precision = phi i32 [ 1, %entry ], [ %next, %shortest.retry ]
+  call i32 (i8*, i64, i8*, ...) @snprintf(i8* %buf, i64 32, i8* getelementptr inbounds ([5 x i8], [5 x i8]* @.rt.shortest, i64 0, i64 0), i32 %precision, double %x)
+  %back = call double @strtod(i8* %buf, i8** null)
+  %same = fcmp oeq double %back, %x
+  %last = icmp sge i32 %precision, 17
+  %stop = or i1 %same, %last
+  br i1 %stop, label %done, label %shortest.retry
+shortest.retry:
+  %next = add i32 %precision, 1
+  br label %shortest
+done:
+  ret i8* %buf
+}
+
+define i8* @endc.formatBoolean(i1 %b) {
+entry:
+  %text = select i1 %b, i8* getelementptr inbounds ([5 x i8], [5 x i8]* @.rt.true, i64 0, i64 0), i8* getelementptr inbounds ([6 x i8], [6 x i8]* @.rt.false, i64 0, i64 0)
+  ret i8* %text
+}
+
+define void @endc.printString(i32 %handle, i8* %s) {
+entry:
+  call i32 (i32, i8*, ...) @dprintf(i32 %handle, i8* getelementptr inbounds ([3 x i8], [3 x i8]* @.rt.s, i64 0, i64 0), i8* %s)
+  ret void
+}
+
+define void @endc.printNumber(i32 %handle, double %x) {
+entry:
+  %s = call i8* @endc.formatNumber(double %x, i1 false)
+  call void @endc.printString(i32 %handle, i8* %s)
+  call void @free(i8* %s)
+  ret void
+}
+
+define void @endc.printBoolean(i32 %handle, i1 %b) {
+entry:
+  %s = call i8* @endc.formatBoolean(i1 %b)
+  call void @endc.printString(i32 %handle, i8* %s)
+  ret void
+}
+
+define i8* @endc.concat(i8* %left, i8* %right) {
+entry:
+  %leftLength = call i64 @strlen(i8* %left)
+  %rightLength = call i64 @strlen(i8* %right)
+  %length = add i64 %leftLength, %rightLength
+  %size = add i64 %length, 1
+  %buf = call i8* @malloc(i64 %size)
+  call i8* @strcpy(i8* %buf, i8* %left)
+  call i8* @strcat(i8* %buf, i8* %right)
+  ret i8* %buf
+}
+
+define i1 @endc.stringEquals(i8* %left, i8* %right) {
+entry:
+  %cmp = call i32 @strcmp(i8* %left, i8* %right)
+  %equal = icmp eq i32 %cmp, 0
+  ret i1 %equal
+}
+
+; floored modulo, with the sign of the divisor like python's %
+define double @endc.modulo(double %left, double %right) {
+entry:
+  %rem = frem double %left, %right
+  %nonzero = fcmp one double %rem, 0.0
+  %remNegative = fcmp olt double %rem, 0.0
+  %rightNegative = fcmp olt double %right, 0.0
+  %signs = xor i1 %remNegative, %rightNegative
+  %adjust = and i1 %nonzero, %signs
+  %adjusted = fadd double %rem, %right
+  %result = select i1 %adjust, double %adjusted, double %rem
+  ret double %result
+}
@@ -0,0 +1,164 @@
+; ModuleID = 'math.endc'
+source_filename = "math.endc"
+
+@.str.0 = private unnamed_addr constant [9 x i8] c"9 - 3 = \00"
+@.str.1 = private unnamed_addr constant [10 x i8] c"\0A9 + 3 = \00"
+@.str.2 = private unnamed_addr constant [10 x i8] c"\0A9 ; 3 = \00"
+@.str.3 = private unnamed_addr constant [10 x i8] c"\0A9 \5C 3 = \00"
+
+define void @endc.init() {
+entry:
+  ret void
+}
+
+define internal double @endc.main() {
+entry:
+  %ADDPRINTTXT.addr = alloca i8*
+  %SUBTRACTPRINTTXT.addr = alloca i8*
+  %DIVIDPRINTTXT.addr = alloca i8*
+  %MODULOPRINTTXT.addr = alloca i8*
+  store i8* getelementptr inbounds ([9 x i8], [9 x i8]* @.str.0, i64 0, i64 0), i8** %ADDPRINTTXT.addr
+  store i8* getelementptr inbounds ([10 x i8], [10 x i8]* @.str.1, i64 0, i64 0), i8** %SUBTRACTPRINTTXT.addr
+  store i8* getelementptr inbounds ([10 x i8], [10 x i8]* @.str.2, i64 0, i64 0), i8** %DIVIDPRINTTXT.addr
+  store i8* getelementptr inbounds ([10 x i8], [10 x i8]* @.str.3, i64 0, i64 0), i8** %MODULOPRINTTXT.addr
+  %.t1 = load i8*, i8** %ADDPRINTTXT.addr
+  call void @endc.printString(i32 1, i8* %.t1)
+  %.t2 = fadd double 9.0, 3.0
+  call void @endc.printNumber(i32 1, double %.t2)
+  %.t3 = load i8*, i8** %SUBTRACTPRINTTXT.addr
+  call void @endc.printString(i32 1, i8* %.t3)
+  %.t4 = fsub double 9.0, 3.0
+  call void @endc.printNumber(i32 1, double %.t4)
+  %.t5 = load i8*, i8** %DIVIDPRINTTXT.addr
+  call void @endc.printString(i32 1, i8* %.t5)
+  %.t6 = fdiv double 9.0, 3.0
+  call void @endc.printNumber(i32 1, double %.t6)
+  %.t7 = load i8*, i8** %MODULOPRINTTXT.addr
+  call void @endc.printString(i32 1, i8* %.t7)
+  %.t8 = call double @endc.modulo(double 9.0, double 3.0)
+  call void @endc.printNumber(i32 1, double %.t8)
+  ret double 0.0
+dead:
+  ret double 0.0
+}
+
+define i32 @main() {
+entry:
+  call void @endc.init()
+  %exitCode = call double @endc.main()
+  %code = fptosi double %exitCode to i32
+  ret i32 %code
+}
+
+; runtime
+
+declare i32 @dprintf(i32, i8*, ...)
+declare i32 @snprintf(i8*, i64, i8*, ...)
+declare double @strtod(i8*, i8**)
+declare i64 @strlen(i8*)
+declare i32 @strcmp(i8*, i8*)
+declare i8* @strcpy(i8*, i8*)
+declare i8* @strcat(i8*, i8*)
+declare i8* @malloc(i64)
+declare void @free(i8*)
+declare double @llvm.fabs.f64(double)
+declare double @llvm.trunc.f64(double)
+
+@.rt.s = private unnamed_addr constant [3 x i8] c"%s\00"
+@.rt.integral = private unnamed_addr constant [5 x i8] c"%.0f\00"
+@.rt.shortest = private unnamed_addr constant [5 x i8] c"%.*g\00"
+@.rt.fraction = private unnamed_addr constant [3 x i8] c".0\00"
+@.rt.true = private unnamed_addr constant [5 x i8] c"True\00"
+@.rt.false = private unnamed_addr constant [6 x i8] c"False\00"
+
+; formats a number like python's str(), without the ".0" of integral numbers unless %keepFraction
+define i8* @endc.formatNumber(double %x, i1 %keepFraction) {
+entry:
+  %buf = call i8* @malloc(i64 32)
+  %abs = call double @llvm.fabs.f64(double %x)
+  %small = fcmp olt double %abs, 1.0e16
+  %trunc = call double @llvm.trunc.f64(double %x)
+  %whole = fcmp oeq double %trunc, %x
+  %integral = and i1 %small, %whole
+  br i1 %integral, label %integral.print, label %shortest
+integral.print:
+  call i32 (i8*, i64, i8*, ...) @snprintf(i8* %buf, i64 32, i8* getelementptr inbounds ([5 x i8], [5 x i8]* @.rt.integral, i64 0, i64 0), double %x)
+  br i1 %keepFraction, label %fraction, label %done
+fraction:
+  call i8* @strcat(i8* %buf, i8* getelementptr inbounds ([3 x i8], [3 x i8]* @.rt.fraction, i64 0, i64 0))
+  br label %done
+shortest:
+  ; the least digits which read back as the same number
+  %precision = phi i32 [ 1, %entry ], [ %next, %shortest.retry ]
+  call i32 (i8*, i64, i8*, ...) @snprintf(i8* %buf, i64 32, i8* getelementptr inbounds ([5 x i8], [5 x i8]* @.rt.shortest, i64 0, i64 0), i32 %precision, double %x)
+  %back = call double @strtod(i8* %buf, i8** null)
+  %same = fcmp oeq double %back, %x
+  %last = icmp sge i32 %precision, 17
+  %stop = or i1 %same, %last
+  br i1 %stop, label %done, label %shortest.retry
+shortest.retry:
+  %next = add i32 %precision, 1
+  br label %shortest
+done:
+  ret i8* %buf
+}
+
+define i8* @endc.formatBoolean(i1 %b) {
+entry:
+  %text = select i1 %b, i8* getelementptr inbounds ([5 x i8], [5 x i8]* @.rt.true, i64 0, i64 0), i8* getelementptr inbounds ([6 x i8], [6 x i8]* @.rt.false, i64 0, i64 0)
+  ret i8* %text
+}
+
+define void @endc.printString(i32 %handle, i8* %s) {
+entry:
+  call i32 (i32, i8*, ...) @dprintf(i32 %handle, i8* getelementptr inbounds ([3 x i8], [3 x i8]* @.rt.s, i64 0, i64 0), i8* %s)
+  ret void
+}
+
+define void @endc.printNumber(i32 %handle, double %x) {
+entry:
+  %s = call i8* @endc.formatNumber(double %x, i1 false)
+  call void @endc.printString(i32 %handle, i8* %s)
+  call void @free(i8* %s)
+  ret void
+}
+
+define void @endc.printBoolean(i32 %handle, i1 %b) {
+entry:
+  %s = call i8* @endc.formatBoolean(i1 %b)
+  call void @endc.printString(i32 %handle, i8* %s)
+  ret void
+}
+
+define i8* @endc.concat(i8* %left, i8* %right) {
+entry:
+  %leftLength = call i64 @strlen(i8* %left)
+  %rightLength = call i64 @strlen(i8* %right)
+  %length = add i64 %leftLength, %rightLength
+  %size = add i64 %length, 1
+  %buf = call i8* @malloc(i64 %size)
+  call i8* @strcpy(i8* %buf, i8* %left)
+  call i8* @strcat(i8* %buf, i8* %right)
+  ret i8* %buf
+}
+
+define i1 @endc.stringEquals(i8* %left, i8* %right) {
+entry:
+  %cmp = call i32 @strcmp(i8* %left, i8* %right)
+  %equal = icmp eq i32 %cmp, 0
+  ret i1 %equal
+}
+
+; floored modulo, with the sign of the divisor like python's %
+define double @endc.modulo(double %left, double %right) {
+entry:
+  %rem = frem double %left, %right
+  %nonzero = fcmp one double %rem, 0.0
+  %remNegative = fcmp olt double %rem, 0.0
+  %rightNegative = fcmp olt double %right, 0.0
+  %signs = xor i1 %remNegative, %rightNegative
+  %adjust = and i1 %nonzero, %signs
+  %adjusted = fadd double %rem, %right
+  %result = select i1 %adjust, double %adjusted, double %rem
+  ret double %result
+}
@@ -2,13 +2,86 @@
 Unit Tests for all EndC compiler modules
 """
 
+import asyncio
+import os
+import shutil
+import socket
+import socketserver
+import subprocess
 import sys; sys.path.append('src')
+import time
+from array import array
+from fractions import Fraction
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+from contextlib import redirect_stdout, redirect_stderr
+from io import BytesIO, StringIO
 from pathlib import Path
-from unittest import main, TestCase
+from tempfile import TemporaryDirectory
+from typing import Any, Callable, Optional
+from json import dumps, loads
+from unittest import main, skipUnless, TestCase
+from unittest.mock import patch
 
-from token_ import tokenizer
-from ast_ import parser
-from backend import interpreter
+from token_ import incremental, tokenizer
+from ast_ import ParseError, parser, typeChecker
+from backend import interpreter, llvm, python, wasm
+from backend.wasm import binary
+from backend.interpreter import arrays, columnar, environment, eventLoop, ffi, handles, interactive, replServer
+from backend.interpreter.limits import Limits
+from backend.interpreter.runtime import createGlobals
+from module import Module, ModuleError, cache, findExports, interface, loader
+from build import Builder, Status
+import check
+import client
+import compiler
+import endc
+import lsp
+from lsp import document
+from platforms import Platform
+import runMany
+import server
+
+
+def runProgram(
+		code: str,
+		*,
+		backend: Any = interpreter,
+		module: Optional[Module] = None,
+		eager: bool = False,
+		stdin: str = '',
+		limits: Optional[Limits] = None,
+		jit: Optional[int] = interpreter.JIT_THRESHOLD,
+		debug: Optional[Callable[[str], None]] = None,
+		useInlineCaches: bool = True,
+		setup: Optional[Callable[[interpreter.Interpreter], None]] = None
+) -> tuple[ int, str, str ]:
+	"""
+	Parses a program and runs it with the `backendMain` of a backend
+	:param module: the module of the program, whose imports are bound before it runs
+	:param eager: whether to parse the subroutine bodies before running the program
+	:param stdin: what the program reads from its standard input
+	:param limits: the options from here on are the interpreter's, see `Interpreter`
+	:param setup: called with the interpreter before it runs the program
+	:return: the exit code, and what the program wrote to the standard output and to the standard error, with its errors
+	"""
+	ast = parser.Parser( tokenizer.parse( code, '<test>' ) ).parseProgram( eager )
+	assert ast is not None
+	out, err = StringIO(), StringIO()
+	with redirect_stdout( out ), redirect_stderr( err ), patch( 'sys.stdin', StringIO( stdin ) ):
+		if backend is not interpreter:
+			exitCode = backend.backendMain( ast, module )
+		else:
+			intpr = interpreter.Interpreter( useInlineCaches, jit, debug, createGlobals( sys.stdin, out, err ), limits )
+			if setup is not None:
+				setup( intpr )
+			exitCode = interpreter.backendMain( ast, module, intpr )
+	return exitCode, out.getvalue(), err.getvalue()
+
+
+def mainOf( body: str, prelude: str = '' ) -> str:
+	""" A program running the given statements in its main subroutine, after the declarations of the prelude """
+	return f'{prelude}DCLAR SUBROUTIN main{{}} <- InTgR [\n{body}     GIV BACK 0/\n]\n'
 
 
 class ExpressionTest(TestCase):
@@ -69,5 +142,1720 @@ class ExpressionTest(TestCase):
 					assert False, f'Failed on example "{example.name}": {e.args}'
 
 
+class TypeCheckerTest(TestCase):
+	def parse( self, code: str ) -> parser.Expr:
+		ast = parser.Parser( tokenizer.parse( code, '<test>' ) ).parse()
+		assert ast is not None, f'Failed to parse "{code}"'
+		return ast
+
+	def testInference( self ) -> None:
+		for code, typ in (
+			( '10 - 20/', typeChecker.Type.INTEGER ),
+			( '*a* - *b*/', typeChecker.Type.STRING ),
+			( '*a* - 10/', typeChecker.Type.STRING ),
+			( '10 =< 20/', typeChecker.Type.BOOLEAN ),
+			( '{ 10 ; 20 } < 30/', typeChecker.Type.BOOLEAN ),
+			( '!*a*/', typeChecker.Type.BOOLEAN ),
+		):
+			with self.subTest( code ):
+				ast = self.parse( code )
+				self.assertTrue( typeChecker.TypeChecker().check( ast ) )
+				self.assertEqual( ast.type, typ )
+
+	def testErrors( self ) -> None:
+		for code in ( '*a* + 10/', '10 - *a*/', '+*a*/', '{ 10 < 20 } \\ 30/' ):
+			with self.subTest( code ):
+				ast = self.parse( code )
+				checker = typeChecker.TypeChecker()
+				self.assertFalse( checker.check( ast ) )
+				self.assertEqual( len( checker.errors ), 1 )
+				self.assertIsNone( ast.type )
+
+	def testVariables( self ) -> None:
+		code = (
+			'DCLAR VARIABL InTgR i = 0/\n'
+			'i = i - 1/\n'
+			'DCLAR VARIABL InTgR j = 0/\n'
+			'j = j - 1/\n'
+			'j = CALL f{}/\n'
+			'DCLAR VARIABL StRiNg s/\n'
+			'CALL printto{ STDOUT. s - *a* }/\n'
+			'DCLAR SUBROUTIN f{ InTgR n } <- InTgR [\n'
+			'     DCLAR VARIABL InTgR m = n/\n'
+			'     DCLAR VARIABL InTgR k = 2/\n'
+			'     GIV BACK { k - i } - m/\n'
+			']\n'
+		)
+		ast = parser.Parser( tokenizer.parse( code, '<test>' ) ).parseProgram( eager=True )
+		assert ast is not None
+		self.assertTrue( typeChecker.TypeChecker().checkStatements( ast ) )
+		# proven, then unproven by a later assignment, and without an initializer
+		self.assertEqual( ast[ 1 ].value.type, typeChecker.Type.INTEGER )  # type: ignore
+		self.assertIsNone( ast[ 3 ].value.type )  # type: ignore
+		self.assertIsNone( ast[ 6 ].expression.arguments[ 1 ].type )  # type: ignore
+		# the parsed bodies are checked too, a parameter is never proven
+		value = ast[ 7 ].body.statements[ 2 ].value  # type: ignore
+		self.assertEqual( ( value.left.type, value.right.type ), ( typeChecker.Type.INTEGER, None ) )
+
+		# the bodies which weren't parsed are left unparsed, the names they assign are never proven
+		code = (
+			'DCLAR VARIABL InTgR i = 0/\n'
+			'DCLAR VARIABL InTgR j = 0/\n'
+			'i = i - 1/\n'
+			'j = j - 1/\n'
+			'DCLAR SUBROUTIN f{} <- InTgR [\n'
+			'     i = *a*/\n'
+			'     GIV BACK j/\n'
+			']\n'
+		)
+		ast = parser.Parser( tokenizer.parse( code, '<test>' ) ).parseProgram()
+		assert ast is not None
+		self.assertTrue( typeChecker.TypeChecker().checkStatements( ast ) )
+		self.assertFalse( ast[ 4 ].body.parsed )  # type: ignore
+		self.assertIsNone( ast[ 2 ].value.type )  # type: ignore
+		self.assertEqual( ast[ 3 ].value.type, typeChecker.Type.INTEGER )  # type: ignore
+
+		for code in ( 'DCLAR VARIABL InTgR x = *a*/', 'DCLAR VARIABL StRiNg x/\nx = 1 < 2/' ):
+			with self.subTest( code ):
+				ast = parser.Parser( tokenizer.parse( code, '<test>' ) ).parseProgram()
+				assert ast is not None
+				checker = typeChecker.TypeChecker()
+				self.assertFalse( checker.checkStatements( ast ) )
+				self.assertEqual( len( checker.errors ), 1 )
+				self.assertIn( 'Cannot give a', checker.errors[ 0 ] )
+
+	def testUncheckedMatchesChecked( self ) -> None:
+		for code in ( '10 - 20/', '10 + 20 ; 40/', '*a* - *b*/', '+10 =< 20/', '!{ 10 < 20 }/', '10 \\ 30 !IS 10/' ):
+			with self.subTest( code ):
+				ast = self.parse( code )
+				checked = interpreter.Interpreter().evaluate( ast )
+				typeChecker.TypeChecker().check( ast )
+				self.assertEqual( interpreter.Interpreter().evaluate( ast ), checked )
+
+
+class ProgramTest(TestCase):
+	def testExamples( self ) -> None:
+		for example, output in (
+			( 'hello_world', 'hello world!' ),
+			( 'math', '9 - 3 = 12\n9 + 3 = 6\n9 ; 3 = 3\n9 \\ 3 = 0' ),
+			( 'ifelse', 'it was true' ),
+			( 'leadingDot', '0.9' ),
+			( 'while', '' ),
+			( 'template', 'initiated TsTtMpLaThello world! TsTtMpLaT' ),
+			( 'importer', 'Hello Igor!Igor is patting the dog.' ),
+		):
+			with self.subTest( example ):
+				path = Path( f'examples/{example}.endc' )
+				module = loader.ModuleLoader( useCache=False ).load( path )
+				self.assertEqual( runProgram( path.read_text(), eager=True, module=module ), ( 0, output, '' ) )
+
+	def testLazyBodies( self ) -> None:
+		code = (
+			'DCLAR SUBROUTIN brokn{} <- InTgR [\n     GIV BACK 12 -/\n]\n'
+			'DCLAR SUBROUTIN main{} <- InTgR [\n     GIV BACK 12 - 30/\n]\n'
+		)
+		ast = parser.Parser( tokenizer.parse( code, '<test>' ) ).parseProgram()
+		assert ast is not None
+		self.assertFalse( any( subroutine.body.parsed for subroutine in ast ) )  # type: ignore
+		# the broken body is never called
+		self.assertEqual( runProgram( code ), ( 42, '', '' ) )
+		# but the eager mode finds its error
+		self.assertIsNone( parser.Parser( tokenizer.parse( code, '<test>' ) ).parseProgram( eager=True ) )
+
+		# the checker doesn't parse the bodies
+		self.assertTrue( typeChecker.TypeChecker().checkStatements( ast ) )
+		self.assertFalse( any( subroutine.body.parsed for subroutine in ast ) )  # type: ignore
+
+		# the error is reported once, then raised again by each access
+		out = StringIO()
+		with redirect_stdout( out ):
+			for _ in range( 2 ):
+				with self.assertRaises( ParseError ):
+					ast[0].body.statements  # type: ignore
+		self.assertEqual( out.getvalue().count( 'Expect expression.' ), 1 )
+
+	def testLazyBodiesInPipeline( self ) -> None:
+		# the whole pipeline of the command line and of the library, with the type checker
+		code = (
+			'DCLAR SUBROUTIN brokn{} <- InTgR [\n     GIV BACK { 1 - /\n]\n'
+			'DCLAR SUBROUTIN main{} <- InTgR [\n     CALL printto{ STDOUT. *ok* }/\n     GIV BACK 0/\n]\n'
+		)
+		with TemporaryDirectory() as tmp:
+			file = Path( tmp ) / 'lazy.endc'
+			file.write_text( code )
+			for argv, exitCode in ( ( [ '-b', 'inter', '-f', str( file ) ], 0 ), ( [ '-b', 'inter', '-f', str( file ), '--eager' ], 1 ), ( [ 'check', str( file ) ], 1 ) ):
+				with self.subTest( argv ), redirect_stdout( StringIO() ) as out:
+					self.assertEqual( compiler.run( argv ), exitCode )
+				self.assertEqual( 'ok' in out.getvalue(), exitCode == 0 )
+				if exitCode:
+					self.assertIn( 'Expect expression.', out.getvalue() )
+
+			with redirect_stdout( StringIO() ) as out:
+				self.assertEqual( endc.run( file, endc.Options( eagerParse=False, useCache=False ) ), 0 )
+				self.assertEqual( endc.run( code, endc.Options( eagerParse=False ) ), 0 )
+			self.assertEqual( out.getvalue(), 'okok' )
+			with self.assertRaises( endc.CompileError ) as ctx:
+				endc.run( code )
+			self.assertEqual( ctx.exception.errors, [ '<string>:2:21: Expect expression.' ] )
+
+	def testVerbosity( self ) -> None:
+		# the messages of the compiler go through the log, which -v 2 limits to errors
+		with TemporaryDirectory() as tmp:
+			( Path( tmp ) / 'main.endc' ).write_text( mainOf( 'CALL printto{ STDOUT. *ok* }/' ) )
+			( Path( tmp ) / 'cfg.json' ).write_text( dumps( { 'defaultFile': str( Path( tmp ) / 'main.endc' ) } ) )
+			for verbosity in ( 1, 2 ):
+				with self.subTest( verbosity ):
+					result = subprocess.run(
+						[ sys.executable, 'src/compiler.py', '-v', str( verbosity ), '-c', str( Path( tmp ) / 'cfg.json' ), '-b', 'inter' ],
+						capture_output=True, text=True, timeout=60
+					)
+					self.assertEqual( '[INFO] Using config at' in result.stdout, verbosity == 1 )
+					self.assertEqual( result.stdout.split( 'Done in' )[0].rsplit( '\n' )[-1], 'ok' )
+
+
+class TemplateTest(TestCase):
+	COUNTER: str = (
+		'DCLAR TMPLAT Countr [\n'
+		'     DCLAR VARIABL InTgR count = 0/\n'
+		'     DCLAR INITIALIZR{ InTgR start } [ M,count = start/ ]\n'
+		'     DCLAR BHAVIOR incr{ InTgR by } <- InTgR [ M,count = M,count - by/ GIV BACK M,count/ ]\n'
+		']\n'
+	)
+
+	def testFieldsAndBehaviors( self ) -> None:
+		code = self.COUNTER + (
+			'DCLAR SUBROUTIN main{} <- InTgR [\n'
+			'     DCLAR VARIABL Countr c = CALL BUILD Countr{ 10 }/\n'
+			'     CALL c,incr{ 2 }/\n'
+			'     GIV BACK CALL c,incr{ 30 }/\n'
+			']\n'
+		)
+		for useInlineCaches in ( True, False ):
+			with self.subTest( useInlineCaches=useInlineCaches ):
+				intprs: list[ interpreter.Interpreter ] = []
+				self.assertEqual( runProgram( code, useInlineCaches=useInlineCaches, setup=intprs.append )[0], 42 )
+				self.assertEqual( len( intprs[0].inlineCaches ), 6 if useInlineCaches else 0 )
+
+	def testCacheStates( self ) -> None:
+		code = ''.join( f'DCLAR TMPLAT {name} [\n     DCLAR BHAVIOR nam{{}} <- InTgR [ GIV BACK {i}/ ]\n]\n' for i, name in enumerate( 'ABCDF' ) )
+		code += 'DCLAR SUBROUTIN cal{ A x } <- InTgR [ GIV BACK CALL x,nam{}/ ]\n'
+		calls = [ 'A', 'A', 'B', 'A', 'C', 'D', 'F', 'F' ]
+		code += ''.join( f'CALL cal{{ CALL BUILD {name}{{}} }}/\n' for name in calls )
+		intprs: list[ interpreter.Interpreter ] = []
+		runProgram( code, setup=intprs.append )
+
+		cache, = intprs[0].inlineCaches
+		self.assertEqual( cache.state, 'megamorphic' )
+		# A doubl, B, C and D are cached, F is looked up on every call
+		self.assertEqual( ( cache.hits, cache.misses ), ( 2, 6 ) )
+		self.assertIn( '25.0% hit rate', intprs[0].inlineCacheReport() )
+
+	def testErrors( self ) -> None:
+		code = self.COUNTER + 'DCLAR VARIABL Countr c = CALL BUILD Countr{ 1 }/\n'
+		for line in ( 'CALL c,dcr{ 1 }/', 'c,incr = 1/', 'c,tmplatnam = 1/', 'CALL BUILD Countr{}/' ):
+			with self.subTest( line ):
+				self.assertEqual( runProgram( code + line )[0], 1 )
+
+
+class PythonBackendTest(TestCase):
+	PROGRAMS: dict[ str, str ] = {
+		'recursion': (
+			'DCLAR SUBROUTIN fib{ InTgR n } <- InTgR [\n'
+			'     CHCK IF { 2 < n } DO [ GIV BACK n/ ]\n'
+			'     GIV BACK CALL fib{ n + 1 } - CALL fib{ n + 2 }/\n'
+			']\n'
+			'DCLAR SUBROUTIN main{} <- InTgR [ GIV BACK CALL fib{ 15 } \\ 256/ ]\n'
+		),
+		'scopes': (
+			'DCLAR VARIABL InTgR total = 0/\n'
+			'DCLAR VARIABL StRiNg s = *out*/\n'
+			'DCLAR SUBROUTIN add{ InTgR x } <- NoThInG [ total = total - x/ ]\n'
+			'DCLAR SUBROUTIN countr{} <- InTgR [\n'
+			'     DCLAR VARIABL InTgR n = 0/\n'
+			'     DCLAR SUBROUTIN bump{} <- NoThInG [ n = n - 1/ ]\n'
+			'     CALL bump{}/\n'
+			'     CALL bump{}/\n'
+			'     GIV BACK n/\n'
+			']\n'
+			'DCLAR SUBROUTIN main{} <- InTgR [\n'
+			'     DCLAR VARIABL InTgR i = 0/\n'
+			'     DO [\n'
+			'          DCLAR VARIABL StRiNg s = *in*/\n'
+			'          CALL add{ i }/\n'
+			'          i = i - 1/\n'
+			'     ] UNTIL WHN { i IS 10 }/\n'
+			'     CALL printto{ STDOUT. s. * *. total. * *. CALL countr{}. * *. total IS 45 }/\n'
+			'     GIV BACK total/\n'
+			']\n'
+		),
+		'templates': TemplateTest.COUNTER + (
+			'DCLAR SUBROUTIN main{} <- InTgR [\n'
+			'     DCLAR VARIABL Countr c = CALL BUILD Countr{ 2 }/\n'
+			'     DCLAR VARIABL A untypd = c/\n'
+			'     CALL printto{ STDOUT. *count: * - c,count. * * - untypd,tmplatnam }/\n'
+			'     untypd,count = 10/\n'
+			'     GIV BACK CALL untypd,incr{ 3 } - CALL c,incr{ 1 }/\n'
+			']\n'
+		),
+		'error': 'DCLAR SUBROUTIN main{} <- InTgR [\n     GIV BACK CALL printto{ STDOUT. y }/\n]\n',
+	}
+
+	def testMatchesInterpreter( self ) -> None:
+		examples = { name: Path( f'examples/{name}.endc' ).read_text() for name in ( 'hello_world', 'math', 'ifelse', 'leadingDot', 'while', 'template', 'importer' ) }
+		# the imports of the examples are bound from their module
+		modules = { name: loader.ModuleLoader( useCache=False ).load( Path( f'examples/{name}.endc' ) ) for name in examples }
+		for name, code in ( examples | self.PROGRAMS ).items():
+			with self.subTest( name ):
+				expected = runProgram( code, module=modules.get( name ) )
+				actual = runProgram( code, backend=python, module=modules.get( name ) )
+				self.assertEqual( actual[ : 2 ], expected[ : 2 ] )
+				self.assertEqual( bool( actual[2] ), bool( expected[2] ) )
+
+	def testRuntimeErrors( self ) -> None:
+		# python errors are reported with their location, and the same message, by both backends
+		for body, message in (
+			( 'GIV BACK 1 - *x*/', "could not convert string to float: 'x'" ),
+			( 'GIV BACK 1 ; 0/', 'float division by zero' ),
+			( 'DCLAR VARIABL InTgR z = 0/ GIV BACK 1 \\ z/', 'float modulo' ),
+			( 'GIV BACK +*x*/', "could not convert string to float: 'x'" ),
+			( 'GIV BACK CALL rc{ 1 }/', 'Maximum recursion depth exceeded' ),
+		):
+			code = f'DCLAR SUBROUTIN rc{{ InTgR n }} <- InTgR [ GIV BACK CALL rc{{ n }}/ ]\nDCLAR SUBROUTIN main{{}} <- InTgR [\n     {body}\n]\n'
+			for backend in ( interpreter, python ):
+				with self.subTest( body, backend=backend.__name__ ):
+					exitCode, _, err = runProgram( code, backend=backend )
+					self.assertEqual( exitCode, 1 )
+					self.assertRegex( err, r'^Error at line \d+ ' )
+					self.assertTrue( err.endswith( f': {message}\n' ), err )
+
+	def testErrorLocation( self ) -> None:
+		self.assertEqual(
+			runProgram( self.PROGRAMS[ 'error' ], backend=python )[2],
+			'Error at line 1 in file <endc>: Undefined name "y"\n'
+		)
+
+	def testCachedCode( self ) -> None:
+		with TemporaryDirectory() as tmp:
+			path = Path( tmp ) / 'prog.endc'
+			path.write_text( self.PROGRAMS[ 'recursion' ] )
+
+			def compileModule() -> python.CodeType:
+				module = loader.ModuleLoader( useCache=False ).load( path )
+				ast = parser.Parser( module.tokens ).parseProgram()
+				assert ast is not None
+				return python.compileProgram( ast, module )
+
+			code = compileModule()
+			self.assertEqual( [ file.suffix for file in ( Path( tmp ) / '__endcache__' ).iterdir() ], [ '.pyc' ] )
+			self.assertEqual( python.cache.read( path, loader.cache.hashSource( path.read_bytes() ) ), code )
+			self.assertEqual( eval( compileModule(), namespace := python.runtime.createGlobals() ), None )
+			self.assertEqual( namespace[ 'e_main' ](), 610 % 256 )  # type: ignore
+
+			# a changed source invalidates the cached code
+			path.write_text( self.PROGRAMS[ 'recursion' ].replace( '256', '100' ) )
+			self.assertEqual( eval( compileModule(), namespace := python.runtime.createGlobals() ), None )
+			self.assertEqual( namespace[ 'e_main' ](), 10 )  # type: ignore
+
+
+class JitTest(TestCase):
+	CODE: str = (
+		'DCLAR SUBROUTIN twic{ A x } <- A [ GIV BACK x - x/ ]\n'
+		'DCLAR SUBROUTIN countr{} <- InTgR [\n'
+		'     DCLAR VARIABL InTgR n = 0/\n'
+		'     DCLAR SUBROUTIN bump{} <- NoThInG [ n = n - 1/ ]\n'
+		'     CALL bump{}/\n'
+		'     GIV BACK n/\n'
+		']\n'
+		'DCLAR SUBROUTIN main{} <- InTgR [\n'
+		'     DCLAR VARIABL InTgR i = 0/\n'
+		'     DCLAR VARIABL InTgR sum = 0/\n'
+		'     CHCK UNTIL { i IS 10 } DO [\n'
+		'          sum = sum - CALL twic{ i } - CALL countr{}/\n'
+		'          i = i - 1/\n'
+		'     ]\n'
+		'     CALL printto{ STDOUT. sum. * *. CALL twic{ *ab* } }/\n'
+		'     GIV BACK sum/\n'
+		']\n'
+	)
+
+	def testMatchesTreeWalking( self ) -> None:
+		for name, code in ( PythonBackendTest.PROGRAMS | { 'jit': self.CODE } ).items():
+			with self.subTest( name ):
+				expected = runProgram( code, jit=None )
+				self.assertEqual( runProgram( code, jit=1 ), expected )
+				self.assertEqual( runProgram( code, jit=3 ), expected )
+
+	def testTiering( self ) -> None:
+		messages: list[ str ] = []
+		self.assertEqual( runProgram( self.CODE, jit=5, debug=messages.append ), ( 100, '100 abab', '' ) )
+		decisions = [ message.split( '\n' )[0] for message in messages ]
+		self.assertEqual( decisions, [
+			'JIT: compiled twic after 5 calls, specialized to (x: InTgR)',
+			'JIT: countr stays interpreted, it declares a subroutine',
+			'JIT: deoptimized twic, argument types changed',
+		] )
+		self.assertIn( 'raise _Deoptimize', messages[0] )
+
+	def testErrors( self ) -> None:
+		code = (
+			'DCLAR SUBROUTIN f{ A x } <- A [ GIV BACK CALL x{} / ]\n'
+			'DCLAR SUBROUTIN main{} <- InTgR [\n'
+			'     CALL f{ f }/\n'
+			'     CALL f{ 1 }/\n'
+			']\n'
+		)
+		self.assertEqual( runProgram( code, jit=1 ), runProgram( code, jit=None ) )
+
+
+class WasmBackendTest(TestCase):
+	PROGRAM: str = (
+		'DCLAR VARIABL InTgR countr = 0/\n'
+		'DCLAR CONSTANT StRiNg nam = *fib*/\n'
+		'DCLAR SUBROUTIN fib{ InTgR n } <- InTgR [\n'
+		'     countr = countr - 1/\n'
+		'     CHCK IF { 2 < n } DO [ GIV BACK n/ ]\n'
+		'     GIV BACK CALL fib{ n + 1 } - CALL fib{ n + 2 }/\n'
+		']\n'
+		'DCLAR SUBROUTIN main{} <- InTgR [\n'
+		'     DCLAR VARIABL InTgR i = 0/\n'
+		'     DCLAR VARIABL InTgR sum = 0/\n'
+		'     CHCK UNTIL { i IS 10 } DO [\n'
+		'          DCLAR VARIABL InTgR sum = i/\n'
+		'          i = i - 1/\n'
+		'     ]\n'
+		'     DO [ sum = sum - { 0 + i } \\ 3/ i = i + 1/ ] UNTIL WHN { !{ i < 0 } }/\n'
+		'     CALL printto{ STDOUT. nam. * *. CALL fib{ 12 }. * *. countr. * *. sum. * *. sum IS 1. * *. nam IS NOTHING }/\n'
+		'     GIV BACK sum/\n'
+		']\n'
+	)
+
+	def compile( self, code: str ) -> wasm.WasmModule:
+		ast = parser.Parser( tokenizer.parse( code, '<test>' ) ).parseProgram()
+		assert ast is not None
+		return wasm.compileProgram( ast )
+
+	def testLeb128( self ) -> None:
+		self.assertEqual( binary.unsigned( 624485 ), bytes( [ 0xE5, 0x8E, 0x26 ] ) )
+		self.assertEqual( binary.signed( -123456 ), bytes( [ 0xC0, 0xBB, 0x78 ] ) )
+		for value in ( 0, 1, 63, 64, 127, 128, 2 ** 31 - 1, -1, -64, -65, -2 ** 31 ):
+			with self.subTest( value ):
+				self.assertEqual( binary.Reader( binary.signed( value ) ).signed(), value )
+				self.assertEqual( binary.Reader( binary.unsigned( abs( value ) ) ).unsigned(), abs( value ) )
+
+	def testMatchesInterpreter( self ) -> None:
+		examples = { name: Path( f'examples/{name}.endc' ).read_text() for name in ( 'hello_world', 'math', 'ifelse', 'leadingDot', 'greater', 'while' ) }
+		for name, code in ( examples | { 'program': self.PROGRAM } ).items():
+			with self.subTest( name ):
+				data = binary.encode( self.compile( code ) )
+				expected = runProgram( code )
+				out = StringIO()
+				with redirect_stdout( out ):
+					exitCode = wasm.run( data )
+				self.assertEqual( ( exitCode, out.getvalue() ), expected[ : 2 ] )
+
+	def testEncoding( self ) -> None:
+		module = self.compile( self.PROGRAM )
+		data = binary.encode( module )
+		self.assertEqual( data[ : 8 ], b'\0asm\1\0\0\0' )
+		self.assertEqual( binary.decode( data ), module )
+		text = wasm.toWat( module )
+		self.assertIn( '(func $fib (type 2) (param $n f64) (result f64)', text )
+		self.assertIn( '(global $countr (mut f64) (f64.const 0.0))', text )
+		self.assertIn( '(data (i32.const 8) "\\03\\00\\00\\00fib', text )
+		with self.assertRaises( binary.DecodeError ):
+			binary.decode( data[ : -3 ] )
+
+	def testValidator( self ) -> None:
+		F64, I32 = wasm.structure.ValType.F64, wasm.structure.ValType.I32
+		bodies: dict[ str, list[ tuple[ object, ... ] ] ] = {
+			'expected f64 but got i32': [ ( 'i32.const', 1 ) ],
+			'expected f64 but the stack is empty': [],
+			'1 values left on the stack at the end of a function': [ ( 'f64.const', 1.0 ), ( 'f64.const', 1.0 ) ],
+			'branch depth 1 out of range': [ ( 'br', 1 ) ],
+			'1 blocks are not closed': [ ( 'block', wasm.structure.EMPTY ), ( 'f64.const', 1.0 ) ],
+			'global 0 is immutable': [ ( 'f64.const', 1.0 ), ( 'global.set', 0 ), ( 'f64.const', 1.0 ) ],
+		}
+		for message, body in bodies.items():
+			with self.subTest( message ):
+				module = wasm.WasmModule( types=[ wasm.structure.FuncType( (), ( F64, ) ) ] )
+				module.globals.append( wasm.structure.Global( F64, False, ( 'f64.const', 0.0 ) ) )
+				module.functions.append( wasm.structure.Function( 0, [ I32 ], body, 'f' ) )
+				with self.assertRaisesRegex( wasm.validator.ValidationError, f'^function f: {message}$' ):
+					wasm.validator.validate( module )
+		# unreachable code is typed by the instructions that follow it
+		module = wasm.WasmModule( types=[ wasm.structure.FuncType( (), ( F64, ) ) ] )
+		module.functions.append( wasm.structure.Function( 0, [], [ ( 'unreachable', ), ( 'f64.add', ) ] ) )
+		wasm.validator.validate( module )
+
+	def testErrors( self ) -> None:
+		errors = {
+			'DCLAR SUBROUTIN f{ A x } <- NoThInG [ ]': 'parameters of type A are not supported by the WASM backend',
+			'DCLAR SUBROUTIN f{} <- NoThInG [ DCLAR SUBROUTIN g{} <- NoThInG [ ] ]': 'nested subroutines are not supported by the WASM backend',
+			'DCLAR SUBROUTIN f{} <- InTgR [ GIV BACK *a*/ ]': 'Expected a InTgR value, got StRiNg',
+			'DCLAR SUBROUTIN f{} <- NoThInG [ CALL g{}/ ]': 'Undefined subroutine "g"',
+			'DCLAR VARIABL InTgR x = { 1 - 2 }/': 'top level variables must be initialized with a InTgR literal by the WASM backend',
+			'DCLAR SUBROUTIN f{ StRiNg s } <- StRiNg [ GIV BACK s - *a*/ ]': 'joining strings is not supported by the WASM backend, strings can only be literals',
+		}
+		for code, message in errors.items():
+			with self.subTest( message ):
+				with self.assertRaises( wasm.WasmError ) as context:
+					self.compile( code )
+				self.assertEqual( context.exception.message, message )
+
+		# reported at the import
+		module = loader.ModuleLoader( useCache=False ).load( Path( 'examples/importer.endc' ) )
+		ast = parser.Parser( module.tokens ).parseProgram()
+		assert ast is not None
+		with self.assertRaises( wasm.WasmError ) as context:
+			wasm.compileProgram( ast, module )
+		self.assertEqual( str( context.exception ), f'Error at {module.imports[0].loc}: imports are not supported by the WASM backend' )
+
+	def testBackendMain( self ) -> None:
+		# the module is written next to the source, and run
+		with TemporaryDirectory() as tmp:
+			path = Path( tmp ) / 'fib.endc'
+			path.write_text( self.PROGRAM )
+			module = loader.ModuleLoader( useCache=False ).load( path )
+			exitCode, out, _ = runProgram( self.PROGRAM, backend=wasm, module=module )
+			self.assertEqual( ( exitCode, out ), runProgram( self.PROGRAM )[ : 2 ] )
+			self.assertTrue( path.with_suffix( '.wat' ).exists() )
+
+
+class LlvmBackendTest(TestCase):
+	# regenerate the golden files with ENDC_UPDATE_GOLDEN=1
+	GOLDEN: Path = Path( 'test/golden' )
+
+	def compile( self, code: str, filename: str = '<test>' ) -> str:
+		ast = parser.Parser( tokenizer.parse( code, filename ) ).parseProgram()
+		assert ast is not None
+		return llvm.compileProgram( ast, filename )
+
+	def testGolden( self ) -> None:
+		programs = { 'fib': WasmBackendTest.PROGRAM, 'math': Path( 'examples/math.endc' ).read_text() }
+		for name, code in programs.items():
+			with self.subTest( name ):
+				ir = self.compile( code, f'{name}.endc' )
+				golden = self.GOLDEN / f'{name}.ll'
+				if os.environ.get( 'ENDC_UPDATE_GOLDEN' ):
+					golden.write_text( ir )
+				self.assertEqual( ir, golden.read_text() )
+
+	@skipUnless( shutil.which( 'clang' ) or shutil.which( 'lli' ), 'needs clang or lli' )
+	def testMatchesInterpreter( self ) -> None:
+		examples = { name: Path( f'examples/{name}.endc' ).read_text() for name in ( 'hello_world', 'math', 'ifelse', 'leadingDot', 'greater', 'while' ) }
+		strings = (
+			'DCLAR VARIABL StRiNg grt = *hi */\n'
+			'DCLAR SUBROUTIN main{} <- InTgR [\n'
+			'     DCLAR VARIABL StRiNg s = grt - *world* - * * - 3 - * * - 0,1 - * * - !NO/\n'
+			'     DCLAR VARIABL StRiNg t = grt - *x*/\n'
+			'     CALL printto{ STDOUT. s. *\\n*. 7 ; 2. * *. 7 \\ { 0 + 3 }. * *. 1 ; 3. * *. 1000000 - 0,5. * *. 100000000000000000000. * *. 0,00001 }/\n'
+			'     CALL printto{ STDOUT. *\\n*. s !IS grt. * *. t IS *hi x*. * *. grt !IS *hi * }/\n'
+			'     GIV BACK 3/\n'
+			']\n'
+		)
+		with TemporaryDirectory() as tmp:
+			for name, code in ( examples | { 'program': WasmBackendTest.PROGRAM, 'strings': strings } ).items():
+				with self.subTest( name ):
+					path = Path( tmp ) / f'{name}.ll'
+					path.write_text( self.compile( code ) )
+					expected = runProgram( code )
+					result = llvm.run( path, capture=True )
+					self.assertEqual( ( result.returncode, result.stdout ), expected[ : 2 ] )
+
+	def testClangFails( self ) -> None:
+		with TemporaryDirectory() as tmp:
+			clang = Path( tmp ) / 'clang'
+			clang.write_text( '#!/bin/sh\necho "error: no target" >&2\nexit 1\n' )
+			clang.chmod( 0o755 )
+			( Path( tmp ) / 'main.endc' ).write_text( 'DCLAR SUBROUTIN main{} <- InTgR [\n     GIV BACK 0/\n]\n' )
+			ast = parser.Parser( tokenizer.parse( ( Path( tmp ) / 'main.endc' ).read_text(), '<test>' ) ).parseProgram()
+			assert ast is not None
+			module = Module( 'main', Path( tmp ) / 'main.endc', '', [], {} )
+
+			err = StringIO()
+			with patch.dict( os.environ, { 'PATH': f'{tmp}{os.pathsep}{os.environ[ "PATH" ]}' } ), redirect_stderr( err ):
+				self.assertEqual( llvm.backendMain( ast, module ), 1 )
+			self.assertEqual( err.getvalue(), f'[ERROR] clang failed to build {Path( tmp ) / "main.ll"}: error: no target\n' )
+
+	def testErrors( self ) -> None:
+		errors = {
+			'DCLAR SUBROUTIN f{ A x } <- NoThInG [ ]': 'parameters of type A are not supported by the LLVM backend',
+			'DCLAR SUBROUTIN f{} <- NoThInG [ DCLAR SUBROUTIN g{} <- NoThInG [ ] ]': 'nested subroutines are not supported by the LLVM backend',
+			'DCLAR TMPLAT A [ DCLAR VARIABL InTgR x = 0/ ]': 'templates are not supported by the LLVM backend',
+			'DCLAR SUBROUTIN f{} <- InTgR [ GIV BACK *a*/ ]': 'Expected a InTgR value, got StRiNg',
+			'DCLAR SUBROUTIN f{} <- NoThInG [ CALL g{}/ ]': 'Undefined subroutine "g"',
+			'DCLAR SUBROUTIN f{ StRiNg() s } <- NoThInG [ ]': 'parameters of type StRiNg() are not supported by the LLVM backend',
+		}
+		for code, message in errors.items():
+			with self.subTest( message ):
+				with self.assertRaises( llvm.LlvmError ) as context:
+					self.compile( code )
+				self.assertEqual( context.exception.message, message )
+
+		# reported at the import
+		module = loader.ModuleLoader( useCache=False ).load( Path( 'examples/importer.endc' ) )
+		ast = parser.Parser( module.tokens ).parseProgram()
+		assert ast is not None
+		with self.assertRaises( llvm.LlvmError ) as context:
+			llvm.compileProgram( ast, str( module.path ), module )
+		self.assertEqual( str( context.exception ), f'Error at {module.imports[0].loc}: imports are not supported by the LLVM backend' )
+
+
+class ModuleTest(TestCase):
+	def testImportExample( self ) -> None:
+		module = loader.ModuleLoader( useCache=False ).load( Path( 'examples/importer.endc' ) )
+		self.assertEqual( module.imports[0].names, [ 'grt', 'pat' ] )
+		self.assertEqual( list( module.dependencies[ 'importable' ].exports ), [ 'grt', 'pat' ] )
+
+	def testMemoizedAndCached( self ) -> None:
+		with TemporaryDirectory() as tmp:
+			( Path( tmp ) / 'a.endc' ).write_text( 'OWN fn FROM b/\nOWN fn FROM c/\n' )
+			( Path( tmp ) / 'b.ec' ).write_text( 'OWN fn FROM c/\nXPORT DCLAR SUBROUTIN fn{} <- InTgR [\n]' )
+			( Path( tmp ) / 'c.ec' ).write_text( 'XPORT DCLAR SUBROUTIN fn{} <- InTgR [\n]' )
+
+			modLoader = loader.ModuleLoader()
+			module = modLoader.load( Path( tmp ) / 'a.endc' )
+			self.assertIs( module.dependencies[ 'c' ], module.dependencies[ 'b' ].dependencies[ 'c' ] )
+			self.assertIs( modLoader.load( Path( tmp ) / 'b.ec' ), module.dependencies[ 'b' ] )
+			self.assertFalse( module.cached )
+
+			module = loader.ModuleLoader().load( Path( tmp ) / 'a.endc' )
+			self.assertTrue( module.cached )
+			self.assertTrue( module.dependencies[ 'c' ].cached )
+
+			# changing the source invalidates the cache
+			( Path( tmp ) / 'c.ec' ).write_text( 'XPORT DCLAR SUBROUTIN fn{} <- StRiNg [\n]' )
+			module = loader.ModuleLoader().load( Path( tmp ) / 'a.endc' )
+			self.assertTrue( module.cached )
+			self.assertFalse( module.dependencies[ 'c' ].cached )
+
+	def testSharedTable( self ) -> None:
+		with TemporaryDirectory() as tmp:
+			( Path( tmp ) / 'a.endc' ).write_text( 'OWN fn FROM b/\n' )
+			( Path( tmp ) / 'b.ec' ).write_text( 'XPORT DCLAR SUBROUTIN fn{} <- InTgR [\n]' )
+			first = loader.ModuleLoader( useCache=False ).load( Path( tmp ) / 'a.endc' )
+
+			# other loaders, on other threads too, reuse the modules, but link their own copies
+			with patch.object( tokenizer, 'parse', side_effect=AssertionError( 'tokenized again' ) ):
+				with ThreadPoolExecutor( 2 ) as pool:
+					modules = list( pool.map( lambda _: loader.ModuleLoader( useCache=False ).load( Path( tmp ) / 'a.endc' ), range( 2 ) ) )
+			for module in modules:
+				self.assertIsNot( module, first )
+				self.assertIsNot( module.dependencies[ 'b' ], first.dependencies[ 'b' ] )
+				self.assertIs( module.dependencies[ 'b' ].tokens, first.dependencies[ 'b' ].tokens )
+
+			# a new version of a file is loaded again, without changing the modules already loaded
+			( Path( tmp ) / 'b.ec' ).write_text( 'XPORT DCLAR SUBROUTIN fn{} <- StRiNg [\n]' )
+			module = loader.ModuleLoader( useCache=False ).load( Path( tmp ) / 'a.endc' )
+			self.assertTrue( module.cached )
+			self.assertEqual( module.dependencies[ 'b' ].exports[ 'fn' ].returns, 'StRiNg' )
+			self.assertEqual( first.dependencies[ 'b' ].exports[ 'fn' ].returns, 'InTgR' )
+
+	def testWorkers( self ) -> None:
+		with TemporaryDirectory() as tmp:
+			( Path( tmp ) / 'a.endc' ).write_text( 'OWN fn FROM b/\nOWN gn FROM c/\n' )
+			( Path( tmp ) / 'b.ec' ).write_text( 'XPORT DCLAR SUBROUTIN fn{} <- InTgR [\n]' )
+			( Path( tmp ) / 'c.ec' ).write_text( 'XPORT DCLAR SUBROUTIN gn{StRiNg nam} <- StRiNg [\n     GIV BACK nam/\n]' )
+
+			# b and c are tokenized by the workers, their tokens are read back from the cache
+			module = loader.ModuleLoader( workers=2 ).load( Path( tmp ) / 'a.endc' )
+			dep = module.dependencies[ 'c' ]
+			self.assertEqual( dep.exports[ 'gn' ].params, [ ( 'StRiNg', 'nam' ) ] )
+			self.assertFalse( dep.compiled )
+			self.assertEqual( dep.tokens, tokenizer.parse( ( Path( tmp ) / 'c.ec' ).read_text(), str( dep.path ) ) )
+
+			( Path( tmp ) / 'b.ec' ).write_text( 'XPORT DCLAR SUBROUTIN fn{} <- InTgR [\n     GIV BACK *a/\n]' )
+			( Path( tmp ) / 'c.ec' ).write_text( 'XPORT DCLAR SUBROUTIN gn{} <- InTgR [\n]' )
+			with self.assertRaises( tokenizer.TokenizerError ):
+				loader.ModuleLoader( workers=2 ).load( Path( tmp ) / 'a.endc' )
+
+	def testCacheFiles( self ) -> None:
+		with TemporaryDirectory() as tmp:
+			foo, fooBar, fooEndc = Path( tmp ) / 'foo.ec', Path( tmp ) / 'foo.bar.ec', Path( tmp ) / 'foo.endc'
+			for path in ( foo, fooBar, fooEndc ):
+				path.write_text( 'XPORT DCLAR SUBROUTIN fn{} <- StRiNg [\n     GIV BACK *a* - 1,5/\n]' )
+				source = path.read_bytes()
+				cache.write( path, cache.hashSource( source ), tokenizer.parse( source.decode(), str( path ) ) )
+			self.assertEqual( len( list( ( Path( tmp ) / cache.CACHE_DIR ).glob( '*.endcm' ) ) ), 3 )
+
+			# the tokens read back are the tokenizer's
+			hash = cache.hashSource( foo.read_bytes() )
+			self.assertEqual( cache.read( foo, hash ), tokenizer.parse( foo.read_text(), str( foo ) ) )
+			# a cache file is only used for the source it was written for
+			file = Path( tmp ) / cache.CACHE_DIR / f'foo.ec.{hash[ : 32 ]}.endcm'
+			file.write_text( file.read_text().replace( hash, cache.hashSource( b'' ) ) )
+			self.assertIsNone( cache.read( foo, hash ) )
+
+			# only the stale files of the same module are removed
+			foo.write_text( 'XPORT DCLAR SUBROUTIN fn{} <- InTgR [\n]' )
+			source = foo.read_bytes()
+			cache.write( foo, cache.hashSource( source ), tokenizer.parse( source.decode(), str( foo ) ) )
+			self.assertEqual( len( list( ( Path( tmp ) / cache.CACHE_DIR ).glob( '*.endcm' ) ) ), 3 )
+			self.assertIsNotNone( cache.read( fooBar, cache.hashSource( fooBar.read_bytes() ) ) )
+			# nor of a module with the same name and another extension
+			self.assertIsNotNone( cache.read( fooEndc, cache.hashSource( fooEndc.read_bytes() ) ) )
+			# the files named after the stem by older versions are removed too
+			legacy = [ Path( tmp ) / cache.CACHE_DIR / name for name in ( f'foo.{hash[ : 32 ]}.endcm', 'foo.endci', 'foo.bar.endci' ) ]
+			for file in legacy:
+				file.write_text( '{}' )
+			cache.write( foo, cache.hashSource( source ), tokenizer.parse( source.decode(), str( foo ) ) )
+			self.assertEqual( [ file.exists() for file in legacy ], [ False, False, True ] )
+			self.assertEqual( len( list( ( Path( tmp ) / cache.CACHE_DIR ).glob( '*.endcm' ) ) ), 3 )
+
+			# which has its own summary too
+			interface.write( foo, cache.hashSource( source ), [], {} )
+			interface.write( fooEndc, cache.hashSource( fooEndc.read_bytes() ), [], findExports( tokenizer.parse( fooEndc.read_text(), str( fooEndc ) ) ) )
+			self.assertEqual( interface.read( foo, cache.hashSource( source ) ), ( [], {} ) )
+			summary = interface.read( fooEndc, cache.hashSource( fooEndc.read_bytes() ) )
+			assert summary is not None
+			self.assertEqual( list( summary[ 1 ] ), [ 'fn' ] )
+
+	def testInterfaceSummary( self ) -> None:
+		with TemporaryDirectory() as tmp:
+			( Path( tmp ) / 'a.endc' ).write_text( 'OWN fn FROM b/\n' )
+			( Path( tmp ) / 'b.ec' ).write_text( 'XPORT DCLAR SUBROUTIN fn{StRiNg() nam. InTgR num} <- BoOlAn [\n]' )
+
+			module = loader.ModuleLoader().load( Path( tmp ) / 'a.endc' ).dependencies[ 'b' ]
+			self.assertTrue( module.compiled )
+			self.assertEqual( module.exports[ 'fn' ].params, [ ( 'StRiNg()', 'nam' ), ( 'InTgR', 'num' ) ] )
+			self.assertEqual( module.exports[ 'fn' ].returns, 'BoOlAn' )
+
+			# importers only read the summary
+			module = loader.ModuleLoader().load( Path( tmp ) / 'a.endc' ).dependencies[ 'b' ]
+			self.assertFalse( module.compiled )
+			self.assertEqual( module.exports[ 'fn' ].params, [ ( 'StRiNg()', 'nam' ), ( 'InTgR', 'num' ) ] )
+			self.assertEqual( len( module.tokens ), 18 )
+			self.assertTrue( module.compiled )
+
+			# changing the source invalidates the summary
+			( Path( tmp ) / 'b.ec' ).write_text( 'XPORT DCLAR SUBROUTIN gn{} <- BoOlAn [\n]' )
+			with self.assertRaisesRegex( ModuleError, 'does not export' ):
+				loader.ModuleLoader().load( Path( tmp ) / 'a.endc' )
+
+	def testErrors( self ) -> None:
+		with TemporaryDirectory() as tmp:
+			( Path( tmp ) / 'a.ec' ).write_text( 'OWN fn FROM b/\nXPORT DCLAR SUBROUTIN fn{} <- InTgR [\n]' )
+			( Path( tmp ) / 'b.ec' ).write_text( 'OWN fn FROM a/\nXPORT DCLAR SUBROUTIN fn{} <- InTgR [\n]' )
+			( Path( tmp ) / 'c.ec' ).write_text( 'OWN gn FROM a/\n' )
+			( Path( tmp ) / 'd.ec' ).write_text( 'OWN fn FROM nothing/\n' )
+
+			with self.assertRaisesRegex( ModuleError, 'cycle' ):
+				loader.ModuleLoader( useCache=False ).load( Path( tmp ) / 'a.ec' )
+			with self.assertRaisesRegex( ModuleError, 'does not export' ):
+				loader.ModuleLoader( useCache=False ).load( Path( tmp ) / 'c.ec' )
+			with self.assertRaisesRegex( ModuleError, 'not found' ):
+				loader.ModuleLoader( useCache=False ).load( Path( tmp ) / 'd.ec' )
+
+
+class BuildTest(TestCase):
+	def build( self, root: Path, expected: dict[ str, Status ], platform: Optional[Platform] = None ) -> Builder:
+		builder = Builder( root, platform, workers=2, output=StringIO() )
+		builder.build()
+		self.assertEqual( { unit.path.name: unit.status for unit in builder.units.values() }, expected )
+		return builder
+
+	def testIncremental( self ) -> None:
+		with TemporaryDirectory() as tmp:
+			root = Path( tmp )
+			( root / 'a.endc' ).write_text( 'OWN fn FROM b/\nDCLAR SUBROUTIN main{} <- InTgR [ GIV BACK 0/ ]' )
+			( root / 'b.ec' ).write_text( 'OWN fn FROM c/\nXPORT DCLAR SUBROUTIN fn{} <- InTgR [ GIV BACK 1/ ]' )
+			( root / 'c.ec' ).write_text( 'XPORT DCLAR SUBROUTIN fn{} <- InTgR [ GIV BACK 2/ ]' )
+			( root / 'd.endc' ).write_text( 'DCLAR VARIABL InTgR x = 1/' )
+			built, fresh = Status.BUILT, Status.FRESH
+
+			builder = self.build( root, { 'a.endc': built, 'b.ec': built, 'c.ec': built, 'd.endc': built } )
+			self.assertEqual( [ unit.path.name for unit in builder.criticalPath()[1] ][ -1 ], 'a.endc' )
+			self.build( root, { 'a.endc': fresh, 'b.ec': fresh, 'c.ec': fresh, 'd.endc': fresh } )
+
+			# dependents are only rebuilt if the exports of a module changed
+			( root / 'c.ec' ).write_text( 'XPORT DCLAR SUBROUTIN fn{} <- InTgR [ GIV BACK 3/ ]' )
+			self.build( root, { 'a.endc': fresh, 'b.ec': fresh, 'c.ec': built, 'd.endc': fresh } )
+			( root / 'c.ec' ).write_text( 'XPORT DCLAR SUBROUTIN fn{ InTgR x } <- InTgR [ GIV BACK x/ ]' )
+			self.build( root, { 'a.endc': fresh, 'b.ec': built, 'c.ec': built, 'd.endc': fresh } )
+
+	def testFailures( self ) -> None:
+		with TemporaryDirectory() as tmp:
+			root = Path( tmp )
+			( root / 'a.endc' ).write_text( 'OWN fn FROM b/\n' )
+			( root / 'b.ec' ).write_text( 'XPORT DCLAR SUBROUTIN fn{} <- InTgR [ GIV BACK 1 ]' )
+			( root / 'c.ec' ).write_text( 'OWN gn FROM d/\n' )
+			( root / 'd.ec' ).write_text( 'XPORT DCLAR SUBROUTIN fn{} <- InTgR [ ]' )
+			( root / 'e.ec' ).write_text( 'DCLAR VARIABL StRiNg x = *e*/' )
+
+			builder = self.build( root, { 'a.endc': Status.BLOCKED, 'b.ec': Status.FAILED, 'c.ec': Status.FAILED, 'd.ec': Status.BUILT, 'e.ec': Status.FAILED } )
+			self.assertIn( 'does not export "gn"', builder.units[ ( root / 'c.ec' ).resolve() ].errors )
+			self.assertIn( 'Expect /', builder.units[ ( root / 'b.ec' ).resolve() ].errors )
+			self.assertIn( 'Found "e" character', builder.units[ ( root / 'e.ec' ).resolve() ].errors )
+
+			# fixing the dependency unblocks its dependents
+			( root / 'b.ec' ).write_text( 'XPORT DCLAR SUBROUTIN fn{} <- InTgR [ GIV BACK 1/ ]' )
+			self.build( root, { 'a.endc': Status.BUILT, 'b.ec': Status.BUILT, 'c.ec': Status.FAILED, 'd.ec': Status.FRESH, 'e.ec': Status.FAILED } )
+
+			( root / 'd.ec' ).write_text( 'OWN fn FROM a/\nXPORT DCLAR SUBROUTIN fn{} <- InTgR [ ]' )
+			( root / 'a.endc' ).write_text( 'OWN fn FROM d/\nXPORT DCLAR SUBROUTIN fn{} <- InTgR [ ]' )
+			with self.assertRaisesRegex( ModuleError, 'cycle' ):
+				Builder( root, workers=2, output=StringIO() ).build()
+	def testBackendOutput( self ) -> None:
+		with TemporaryDirectory() as tmp:
+			root = Path( tmp )
+			( root / 'lib.ec' ).write_text( 'XPORT DCLAR SUBROUTIN twic{InTgR n} <- InTgR [\n     GIV BACK n - n/\n]\n' )
+			( root / 'main.endc' ).write_text( mainOf( '     CALL printto{ STDOUT. CALL twic{ 21 } }/\n', 'OWN twic FROM lib/\n' ) )
+			builder = self.build( root, { 'lib.ec': Status.BUILT, 'main.endc': Status.BUILT }, Platform.PYTHON )
+
+			# the backends get the modules with their imports resolved
+			main = builder.units[ ( root / 'main.endc' ).resolve() ].module()
+			self.assertEqual( main.dependencies[ 'lib' ].path, ( root / 'lib.ec' ).resolve() )
+			self.assertEqual( list( main.dependencies[ 'lib' ].exports ), [ 'twic' ] )
+
+			# the program runs from the code objects written by the build
+			with patch.object( python.Generator, 'compile', side_effect=AssertionError( 'compiled again' ) ), redirect_stdout( StringIO() ) as out:
+				self.assertEqual( endc.run( root / 'main.endc', endc.Options( backend=Platform.PYTHON ) ), 0 )
+			self.assertEqual( out.getvalue(), '42' )
+
+			# the backends without imports report them at the import
+			builder = self.build( root, { 'lib.ec': Status.BUILT, 'main.endc': Status.FAILED }, Platform.WASM )
+			self.assertIn( 'imports are not supported by the WASM backend', builder.units[ ( root / 'main.endc' ).resolve() ].errors )
+
+
+class CheckTest(TestCase):
+	CODE: str = (
+		'OWN grt. nop FROM b/\n'
+		'OWN x FROM missing/\n'
+		'DCLAR VARIABL StRiNg x = *hello*/\n'
+		'DCLAR VARIABL InTgR y = /\n'
+		'DCLAR SUBROUTIN main{} <- InTgR [\n'
+		'     CHCK IF { y < } DO [\n'
+		'          y = 2/\n'
+		'     ]\n'
+		'     GIV BACK y - /\n'
+		']\n'
+		'DCLAR VARIABL StRiNg z = *unclosd\n'
+	)
+
+	def testRecovery( self ) -> None:
+		tokenizer.Tokenizer( self.CODE, '<test>', recover=True ).tokenize()
+		with self.assertRaises( tokenizer.TokenizerError ):
+			tokenizer.parse( self.CODE, '<test>' )
+
+		tokens = tokenizer.Tokenizer( self.CODE.replace( '*hello*', '*hi*' ), '<test>', recover=True ).tokenize().getTokens()
+		parse = parser.Parser( tokens, recover=True )
+		self.assertIsNone( parse.parseProgram( eager=True ) )
+		# the error in the condition of the if doesn't hide the one after its block
+		self.assertEqual( [ ( error.token.loc.line, error.message ) for error in parse.errors if error.token ], [ ( 3, 'Expect expression.' ), ( 10, 'Expect expression.' ), ( 5, 'Expect expression.' ), ( 8, 'Expect expression.' ) ] )
+
+	def testCheckFiles( self ) -> None:
+		with TemporaryDirectory() as tmp:
+			( Path( tmp ) / 'a.endc' ).write_text( self.CODE )
+			( Path( tmp ) / 'b.ec' ).write_text( 'XPORT DCLAR SUBROUTIN grt{} <- InTgR [ GIV BACK !NO/ ]' )
+			( Path( tmp ) / 'c.ec' ).write_text( 'DCLAR SUBROUTIN f{} <- InTgR [\n     GIV BACK 1 - *a*/\n]' )
+
+			reports = check.checkFiles( check.findFiles( [ Path( tmp ) ] ), workers=2 )
+			self.assertEqual( [ report.path.name for report in reports ], [ 'a.endc', 'b.ec', 'c.ec' ] )
+			self.assertEqual(
+				[ ( diagnostic.source, diagnostic.line ) for diagnostic in reports[0].diagnostics ],
+				[ ( 'module', 1 ), ( 'module', 2 ), ( 'tokenizer', 3 ), ( 'parser', 4 ), ( 'parser', 6 ), ( 'parser', 9 ), ( 'tokenizer', 11 ) ]
+			)
+			self.assertEqual( reports[0].diagnostics[0].message, 'Module "b" does not export "nop"' )
+			self.assertEqual( [ ( diagnostic.source, diagnostic.line ) for diagnostic in reports[2].diagnostics ], [ ( 'types', 2 ) ] )
+
+			data = loads( check.toJson( reports, 0.0 ) )
+			self.assertEqual( data[ 'summary' ][ 'errors' ], 8 )
+			self.assertEqual( data[ 'files' ][1][ 'diagnostics' ], [] )
+
+	def testUnterminatedImport( self ) -> None:
+		code = 'DCLAR VARIABL InTgR y = 1/\nOWN grt FROM b\n'
+		parse = parser.Parser( tokenizer.Tokenizer( code, '<test>', recover=True ).tokenize().getTokens(), recover=True )
+		self.assertIsNone( parse.parseProgram( eager=True ) )
+		self.assertEqual( [ ( error.token.loc.line, error.message ) for error in parse.errors if error.token ], [ ( 1, 'Expect / after import.' ) ] )
+
+		with TemporaryDirectory() as tmp:
+			( Path( tmp ) / 'a.endc' ).write_text( code )
+			( Path( tmp ) / 'b.ec' ).write_text( 'XPORT DCLAR SUBROUTIN grt{} <- InTgR [ GIV BACK !NO/ ]' )
+			report = check.checkFile( Path( tmp ) / 'a.endc' )
+			self.assertEqual( [ ( diagnostic.source, diagnostic.line ) for diagnostic in report.diagnostics ], [ ( 'tokenizer', 2 ) ] )
+
+
+class ServerTest(TestCase):
+	tmp: TemporaryDirectory[str]
+	socket: Path
+	process: subprocess.Popen[str]
+
+	@classmethod
+	def setUpClass( cls ) -> None:
+		cls.tmp = TemporaryDirectory()
+		cls.socket = Path( cls.tmp.name ) / 'endcc.sock'
+		cls.process = subprocess.Popen( [ sys.executable, 'src/compiler.py', 'serve', '--socket', str( cls.socket ) ], stdout=subprocess.PIPE, text=True )
+		assert cls.process.stdout is not None
+		cls.process.stdout.readline()
+
+	@classmethod
+	def tearDownClass( cls ) -> None:
+		with server.connect( cls.socket ) as sock:
+			server.send( sock, { 'type': 'stop' } )
+			server.receive( sock )
+		cls.process.wait( 5 )
+		assert cls.process.stdout is not None
+		cls.process.stdout.close()
+		cls.tmp.cleanup()
+
+	def request( self, argv: list[str], cwd: Optional[str] = None ) -> tuple[ int, str, str ]:
+		stdout, stderr = StringIO(), StringIO()
+		with server.connect( self.socket ) as sock:
+			code = client.request( sock, argv, cwd or os.getcwd(), stdout, stderr )
+		return code, stdout.getvalue(), stderr.getvalue()
+
+	def testRun( self ) -> None:
+		code, stdout, stderr = self.request( [ '-c', '.endcc.json', '-f', 'examples/math.endc', '-b', 'py' ] )
+		self.assertEqual( code, 0 )
+		# like the compiler run directly
+		self.assertRegex( stdout, r'9 - 3 = 12\n9 \+ 3 = 6\n9 ; 3 = 3\n9 \\ 3 = 0Done in [0-9.e-]+\n$' )
+
+		code, stdout, stderr = self.request( [ '-b', 'nothing' ] )
+		self.assertEqual( code, 2 )
+		self.assertIn( 'invalid findAdeguate value', stderr )
+
+		with server.connect( self.socket ) as sock:
+			server.send( sock, { 'type': 'ping' } )
+			self.assertEqual( server.receive( sock ), { 'type': 'pong', 'pid': self.process.pid, 'version': server.PROTOCOL_VERSION } )
+			server.send( sock, { 'type': 'ping' } )
+			self.assertEqual( server.receive( sock )[ 'type' ], 'pong' )  # type: ignore
+
+	def testConcurrent( self ) -> None:
+		config = str( Path( '.endcc.json' ).resolve() )
+		with TemporaryDirectory() as tmp:
+			for i in range( 8 ):
+				( Path( tmp ) / f'p{i}.endc' ).write_text( f'DCLAR SUBROUTIN main{{}} <- InTgR [\n     CALL printto{{ STDOUT. {i} }}/\n     GIV BACK {i}/\n]' )
+			with ThreadPoolExecutor( 8 ) as pool:
+				results = list( pool.map( lambda i: self.request( [ '-c', config, '-f', f'p{i}.endc', '-b', 'inter' ], tmp ), range( 8 ) ) )
+		for i, ( code, stdout, stderr ) in enumerate( results ):
+			self.assertEqual( code, i, stderr )
+			self.assertRegex( stdout, rf'\n{i}Done in [0-9.e-]+\n$' )
+
+	def testSocketPath( self ) -> None:
+		with TemporaryDirectory() as tmp, patch.dict( os.environ ), patch( 'tempfile.tempdir', tmp ):
+			os.environ.pop( 'ENDCC_SOCKET', None )
+			os.environ.pop( 'XDG_RUNTIME_DIR', None )
+			path = server.socketPath()
+			self.assertEqual( path, Path( tmp ) / f'endcc-{os.getuid()}' / 'endcc.sock' )
+			self.assertEqual( path.parent.stat().st_mode & 0o777, 0o700 )
+			# a directory others may enter is not used
+			path.parent.chmod( 0o755 )
+			with self.assertRaisesRegex( PermissionError, 'not a private directory' ):
+				server.socketPath()
+
+			os.environ[ 'XDG_RUNTIME_DIR' ] = tmp
+			self.assertEqual( server.socketPath(), Path( tmp ) / 'endcc.sock' )
+
+	def testFraming( self ) -> None:
+		with server.connect( self.socket ) as sock:
+			sock.sendall( b'\0\0\0\2[]' )
+			self.assertEqual( server.receive( sock ), { 'type': 'error', 'message': 'frames must be objects with a type' } )
+
+
+class EndcTest(TestCase):
+	def testApi( self ) -> None:
+		with redirect_stdout( StringIO() ) as stdout:
+			self.assertEqual( endc.run( 'DCLAR SUBROUTIN main{} <- InTgR [ CALL printto{ STDOUT. *hi* }/ GIV BACK 3/ ]' ), 3 )
+		self.assertEqual( stdout.getvalue(), 'hi' )
+
+		ast = endc.parse( endc.tokenize( 'DCLAR VARIABL InTgR x = 1/' ) )
+		self.assertEqual( len( ast ), 1 )
+
+		with redirect_stdout( StringIO() ) as stdout:
+			program = endc.compile( Path( 'examples/math.endc' ), endc.Options( backend='py', useCache=False ) )
+			self.assertEqual( endc.run( program, endc.Options( backend='py' ) ), 0 )
+		self.assertEqual( program.module.name, 'math' )  # type: ignore
+		self.assertTrue( stdout.getvalue().endswith( '9 \\ 3 = 0' ) )
+
+	def testErrors( self ) -> None:
+		with self.assertRaises( endc.CompileError ) as ctx:
+			endc.parse( 'DCLAR VARIABL InTgR x = 1 - /\nDCLAR VARIABL InTgR y = /', 'a.endc' )
+		self.assertEqual( ctx.exception.errors, [ 'a.endc:1:29: Expect expression.', 'a.endc:2:25: Expect expression.' ] )
+
+		# the last line of a file without a final newline used to loop forever
+		with self.assertRaises( endc.CompileError ) as ctx:
+			endc.tokenize( 'DCLAR VARIABL StRiNg x = */' )
+		self.assertEqual( ctx.exception.errors, [ '<string>:1:26: Reached end of line (1) without closing string character "*"' ] )
+
+		with self.assertRaises( endc.CompileError ) as ctx:
+			endc.run( 'DCLAR SUBROUTIN f{} <- InTgR [ GIV BACK 1 - *a*/ ]' )
+		self.assertEqual( len( ctx.exception.errors ), 1 )
+
+		for source, options in ( ( Path( 'missing.endc' ), None ), ( '', endc.Options( backend='jvm' ) ), ( '', endc.Options( backend='nope' ) ) ):
+			with self.assertRaises( endc.CompileError ):
+				endc.run( source, options )
+
+	def testImportIsLazy( self ) -> None:
+		# a fresh interpreter, with arguments the compiler's command line would reject
+		code = 'import sys, endc; print( *sys.modules )'
+		result = subprocess.run( [ sys.executable, '-c', code, '--bogus' ], cwd='src', capture_output=True, text=True, check=True )
+		modules = result.stdout.split()
+		for module in ( 'cli', 'argparse', 'log', 'module.loader', 'module.cache', 'backend.interpreter', 'backend.python', 'concurrent.futures' ):
+			self.assertNotIn( module, modules )
+
+
+class ConcurrencyTest(TestCase):
+	""" Compilations sharing a process, with threads switching as often as possible, or truly in parallel on free-threaded builds """
+	PROGRAMS: list[ str ] = [
+		*PythonBackendTest.PROGRAMS.values(),
+		JitTest.CODE,
+		'DCLAR SUBROUTIN main{} <- InTgR [\n     GIV BACK 1 - /\n]',
+		'DCLAR VARIABL StRiNg s = *unclosd\n',
+	]
+
+	def setUp( self ) -> None:
+		self.interval = sys.getswitchinterval()
+		sys.setswitchinterval( 1e-6 )
+
+	def tearDown( self ) -> None:
+		sys.setswitchinterval( self.interval )
+
+	def testBatch( self ) -> None:
+		def outcome( result: Any ) -> object:
+			return result.errors if isinstance( result, endc.CompileError ) else repr( result.ast )
+
+		expected = [ outcome( endc.compileBatch( [ program ], workers=1 )[0] ) for program in self.PROGRAMS ]
+		results = endc.compileBatch( self.PROGRAMS * 50, workers=16 )
+		self.assertEqual( [ outcome( result ) for result in results ], expected * 50 )
+
+	def testSharedFiles( self ) -> None:
+		# all the threads load, cache and build the same modules
+		with TemporaryDirectory() as tmp:
+			( Path( tmp ) / 'lib.ec' ).write_text( 'XPORT DCLAR SUBROUTIN doubl{ InTgR x } <- InTgR [ GIV BACK x - x/ ]' )
+			( Path( tmp ) / 'main.ec' ).write_text( 'OWN doubl FROM lib/\nDCLAR SUBROUTIN main{} <- InTgR [ GIV BACK 4/ ]' )
+			results = endc.compileBatch( [ Path( tmp ) / 'main.ec' ] * 32, endc.Options( backend='py' ), workers=16 )
+			for result in results:
+				self.assertIsInstance( result, endc.Program )
+			self.assertEqual( list( ( Path( tmp ) / '__endcache__' ).glob( '*.tmp' ) ), [] )
+			with redirect_stdout( StringIO() ):
+				self.assertEqual( endc.run( results[0], endc.Options( backend='py' ) ), 4 )  # type: ignore
+
+	def testParserState( self ) -> None:
+		programs = [ JitTest.CODE, self.PROGRAMS[ -2 ] ]
+
+		def parse( i: int ) -> bool:
+			return parser.Parser( tokenizer.parse( programs[ i % 2 ], f'<{i}>' ) ).parseProgram( eager=True ) is None
+
+		# the syntax errors are printed, by all threads at once
+		with redirect_stdout( StringIO() ), ThreadPoolExecutor( 16 ) as pool:
+			results = list( pool.map( parse, range( 300 ) ) )
+		self.assertEqual( results, [ i % 2 == 1 for i in range( 300 ) ] )
+
+class RunManyTest(TestCase):
+	def testRun( self ) -> None:
+		with TemporaryDirectory() as tmp:
+			( Path( tmp ) / 'ok.endc' ).write_text( 'DCLAR SUBROUTIN main{} <- InTgR [\n     CALL printto{ STDOUT. *hi* }/\n     GIV BACK 0/\n]' )
+			( Path( tmp ) / 'exit.endc' ).write_text( 'DCLAR SUBROUTIN main{} <- InTgR [ GIV BACK 3/ ]' )
+			( Path( tmp ) / 'broken.endc' ).write_text( 'DCLAR SUBROUTIN main{} <- InTgR [ GIV BACK 1 - / ]' )
+			( Path( tmp ) / 'loop.endc' ).write_text( 'DCLAR SUBROUTIN main{} <- InTgR [\n     CHCK UNTIL { NO } DO [\n     ]/\n     GIV BACK 0/\n]' )
+			( Path( tmp ) / 'jobs.txt' ).write_text( '# the slow one first\nloop.endc\n\nexit.endc\n' )
+
+			scripts = runMany.findScripts( [ Path( tmp ) / '*.endc', Path( tmp ) / 'ok.endc' ], Path( tmp ) / 'jobs.txt' )
+			self.assertEqual( [ script.name for script in scripts ], [ 'broken.endc', 'exit.endc', 'loop.endc', 'ok.endc', 'ok.endc', 'loop.endc', 'exit.endc' ] )
+
+			results = runMany.Runner( workers=2, timeout=1 ).run( scripts + [ Path( tmp ) / 'ok.endc' ] * 10 )
+		self.assertEqual(
+			[ ( result.status, result.exitCode ) for result in results[ : 7 ] ],
+			[
+				( runMany.Status.FAILED, 1 ), ( runMany.Status.FAILED, 3 ), ( runMany.Status.TIMEOUT, None ), ( runMany.Status.OK, 0 ),
+				( runMany.Status.OK, 0 ), ( runMany.Status.TIMEOUT, None ), ( runMany.Status.FAILED, 3 )
+			]
+		)
+		self.assertIn( 'broken.endc:1:48: Expect expression.', results[0].stderr )
+		# the workers replacing the ones killed by the timeouts still run jobs
+		self.assertEqual( { ( result.status, result.stdout ) for result in results[ 7: ] }, { ( runMany.Status.OK, 'hi' ) } )
+
+		data = loads( runMany.toJson( results, 1.0 ) )
+		self.assertEqual( data[ 'summary' ], { 'ok': 12, 'failed': 3, 'timeout': 2, 'crashed': 0, 'jobs': 17, 'time': 1.0 } )
+
+
+class ReplServerTest(TestCase):
+	def setUp( self ) -> None:
+		self.tmp = TemporaryDirectory()
+		self.loop = asyncio.new_event_loop()
+		self.thread = Thread( target=self.loop.run_forever, daemon=True )
+		self.thread.start()
+		self.server = replServer.ReplServer()
+		self.address = asyncio.run_coroutine_threadsafe( self.server.start( f'{self.tmp.name}/repl.sock' ), self.loop ).result()
+
+	def tearDown( self ) -> None:
+		asyncio.run_coroutine_threadsafe( self.server.close(), self.loop ).result()
+		self.loop.call_soon_threadsafe( self.loop.stop )
+		self.thread.join()
+		self.loop.close()
+		self.tmp.cleanup()
+
+	def connect( self ) -> socket.socket:
+		sock = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+		sock.connect( self.address )
+		self.assertEqual( self.receive( sock ), '' )
+		return sock
+
+	def receive( self, sock: socket.socket ) -> str:
+		""" Reads until the next prompt, or the end of the session """
+		data = b''
+		while not data.endswith( replServer.PROMPT.encode() ):
+			if not ( chunk := sock.recv( 4096 ) ):
+				return data.decode()
+			data += chunk
+		return data.decode().removesuffix( replServer.PROMPT )
+
+	def testSessions( self ) -> None:
+		sessions = [ self.connect() for _ in range( 50 ) ]
+		# the inputs of all the sessions are interleaved, each one only sees its own output
+		for round in range( 3 ):
+			for i, sock in enumerate( sessions ):
+				sock.sendall( f'CALL printto{{ STDOUT. *s{i}r{round}* }}\n'.encode() )
+			for i, sock in enumerate( sessions ):
+				self.assertEqual( self.receive( sock ), f's{i}r{round}NOTHING\n' )
+		self.assertEqual( self.server.sessions, 50 )
+
+		sessions[0].sendall( b'1 - \n' )
+		self.assertEqual( self.receive( sessions[0] ), '[ERROR] Failed to parse expression: "Expect expression."\n' )
+		sessions[0].sendall( b'CALL xit{ 3 }\n' )
+		self.assertEqual( self.receive( sessions[0] ), '' )
+		for sock in sessions[ 1:3 ]:
+			sock.sendall( b'*a* - *b*\n' )
+			self.assertEqual( self.receive( sock ), '*ab*\n' )
+		# the second session got the expression parsed by the first
+		self.assertEqual( self.server.cache.entries[ '*a* - *b*/' ].value, 'ab' )
+
+		for sock in sessions:
+			sock.close()
+
+	def testNotASocket( self ) -> None:
+		# a file at the path isn't taken for a stale socket
+		notes = Path( self.tmp.name ) / 'notes.txt'
+		notes.write_text( 'keep me' )
+		with self.assertRaises( OSError ):
+			asyncio.run_coroutine_threadsafe( replServer.ReplServer().start( str( notes ) ), self.loop ).result()
+		self.assertEqual( notes.read_text(), 'keep me' )
+
+
+class InteractiveTest(TestCase):
+	def feed( self, session: interactive.Session, *inputs: str ) -> str:
+		assert isinstance( session.out, StringIO )
+		for inp in inputs:
+			session.feed( inp )
+		output = session.out.getvalue()
+		session.out.seek( 0 )
+		session.out.truncate()
+		return output
+
+	def testNormalize( self ) -> None:
+		self.assertEqual( interactive.normalize( '  1  -   2 ' ), '1 - 2/' )
+		self.assertEqual( interactive.normalize( '*a  \\*  b*   -  *c*/' ), '*a  \\*  b* - *c*/' )
+		self.assertEqual( interactive.normalize( '1  - |* a  b *| 2' ), '1  - |* a  b *| 2/' )
+
+	def testMemoization( self ) -> None:
+		cache = interactive.InputCache( 3 )
+		session = interactive.Session( StringIO(), error=print, cache=cache )
+		self.assertEqual( self.feed( session, '1 - 2', '1  -  2/', '{ 1 - 2 } ; 3' ), '3\n3\n1\n' )
+		self.assertEqual( ( cache.hits, cache.misses, cache.valueHits ), ( 1, 2, 1 ) )
+
+		# calls have side effects, they run every time
+		self.assertEqual( self.feed( session, 'CALL printto{ STDOUT. 7 }', 'CALL printto{ STDOUT. 7 }' ), '7NOTHING\n7NOTHING\n' )
+		self.assertFalse( cache.entries[ 'CALL printto{ STDOUT. 7 }/' ].evaluated )
+		self.assertEqual( ( cache.hits, cache.valueHits ), ( 2, 1 ) )
+
+		# the least recently used input is evicted
+		self.feed( session, '1 - 2', '*x*' )
+		self.assertEqual( list( cache.entries ), [ 'CALL printto{ STDOUT. 7 }/', '1 - 2/', '*x*/' ] )
+		self.assertEqual( cache.evictions, 1 )
+		self.assertEqual( self.feed( session, ':stats' ), f'{cache.stats()}\n' )
+		self.assertIn( '3 hits, 4 misses', cache.stats() )
+
+		# a pure expression which failed is evaluated again
+		errors: list[ str ] = []
+		session = interactive.Session( StringIO(), error=errors.append, cache=cache )
+		self.feed( session, '1 ; 0', '1 ; 0' )
+		self.assertEqual( len( errors ), 2 )
+		self.assertFalse( cache.entries[ '1 ; 0/' ].evaluated )
+
+
+class ArrayTest(TestCase):
+	def testOperators( self ) -> None:
+		self.assertEqual( runProgram( mainOf(
+			'     DCLAR VARIABL InTgR() a = CALL count{ 4 }/\n'
+			'     DCLAR VARIABL InTgR() b = CALL arry{ 4. 2 }/\n'
+			'     CALL printto{ STDOUT. a - b. * *. a + 1. * *. 9 + a. * *. a ; b. * *. a \\ 2. * *. a < 1. * *. 2 =< a. * *. +a }/\n'
+			'     CALL b,put{ 0. 7 }/\n'
+			'     CALL printto{ STDOUT. * *. CALL b,git{ 0 }. * *. CALL b,sum{}. * *. CALL b,siz{}. * *. CALL { a < 2 },git{ 3 } }/\n'
+		) ), ( 0, '( 2, 3, 4, 5 ) ( -1, 0, 1, 2 ) ( 9, 8, 7, 6 ) ( 0, 0.5, 1, 1.5 ) ( 0, 1, 0, 1 ) ( False, False, True, True ) '
+			'( True, True, True, False ) ( -0, -1, -2, -3 ) 7 13 4 True', '' ) )
+
+		for body, message in (
+			( '     CALL printto{ STDOUT. CALL count{ 2 } - CALL count{ 3 } }/\n', 'arrays of different sizes, 2 and 3' ),
+			( '     CALL printto{ STDOUT. CALL count{ 2 } ; 0 }/\n', 'Division by zero in an array' ),
+			( '     CALL printto{ STDOUT. CALL count{ 2 } - *a* }/\n', "'a' is not a number" ),
+			( '     CALL printto{ STDOUT. CALL { CALL count{ 2 } },git{ 2 } }/\n', 'index out of range' ),
+		):
+			with self.subTest( message ):
+				exitCode, _, err = runProgram( mainOf( body ) )
+				self.assertEqual( exitCode, 1 )
+				self.assertIn( message, err )
+
+	def testJit( self ) -> None:
+		ast = parser.Parser( tokenizer.parse( 'DCLAR SUBROUTIN half{ InTgR x } <- InTgR [\n     GIV BACK { x - 1 } ; 2/\n]\n', '<test>' ) ).parseProgram()
+		assert ast is not None
+		intpr, other = interpreter.Interpreter( jitThreshold=2 ), interpreter.Interpreter( jitThreshold=2 )
+		intpr.execute( ast )
+		half = intpr.globals.values[ 'half' ]
+		assert isinstance( half, interpreter.Subroutine )
+		for _ in range( 3 ):
+			half.call( intpr, half.declaration.name, [ 3.0 ] )
+		self.assertIsNotNone( half.compiled )
+
+		# arrays built by another interpreter don't change this one
+		count = other.globals.values[ 'count' ]
+		assert isinstance( count, interpreter.EndCCallable )
+		count.call( other, half.declaration.name, [ 3.0 ] )
+		self.assertEqual( ( intpr.arrays, other.arrays ), ( False, True ) )
+		self.assertEqual( intpr.jit.namespaces[ 0 ].get( 'float' ), None )  # type: ignore[union-attr]
+
+		# code compiled before the first array is built supports them too
+		xs = intpr.globals.values[ 'count' ].call( intpr, half.declaration.name, [ 3.0 ] )  # type: ignore[union-attr]
+		self.assertTrue( intpr.arrays )
+		self.assertEqual( half.call( intpr, half.declaration.name, [ xs ] ), arrays.Array.of( [ 0.5, 1, 1.5 ] ) )
+
+
+class ColumnarTest(TestCase):
+	csv = 'prix,qty,kind\n10,2,food\n3.5,1,tool\n8,4,food\n'
+
+	def rule( self, source: str ) -> Any:
+		return parser.Parser( tokenizer.parse( f'{source}/', '<rule>' ) ).expression()
+
+	def testEvaluate( self ) -> None:
+		batches = list( columnar.readCsv( StringIO( self.csv ), 2 ) )
+		self.assertEqual( [ len( batch[ 'kind' ] ) for batch in batches ], [ 2, 1 ] )
+		self.assertEqual( batches[ 0 ][ 'prix' ], arrays.Array.of( [ 10, 3.5 ] ) )
+		self.assertEqual( batches[ 0 ][ 'kind' ], [ 'food', 'tool' ] )
+
+		for source, expected in (
+			( 'prix ; qty - lim', [ 15, 13.5, 12 ] ),
+			( 'prix ; qty < 3', [ True, True, False ] ),
+			( '!{ prix ; qty < 3 }', [ False, False, True ] ),
+			( 'kind IS *food*', [ True, False, True ] ),
+			( 'kind !IS *food*', [ False, True, False ] ),
+			( 'kind - *:* - qty', [ 'food:2.0', 'tool:1.0', 'food:4.0' ] ),
+			( '!NO', [ True, True, True ] ),
+		):
+			with self.subTest( source ):
+				result = columnar.evaluateBatches( self.rule( source ), columnar.readCsv( StringIO( self.csv ), 2 ), { 'lim': 10.0 } )
+				self.assertEqual( list( result ), expected )
+				# the same as evaluating the rule for each row
+				intpr = interpreter.Interpreter( jitThreshold=None )
+				for i, row in enumerate( zip( *( ( [ 10.0, 3.5, 8.0 ], [ 2.0, 1.0, 4.0 ], [ 'food', 'tool', 'food' ] ) ) ) ):
+					env = environment.Environment( intpr.globals )
+					for name, value in zip( ( 'prix', 'qty', 'kind', 'lim' ), row + ( 10.0, ) ):
+						env.define( name, value )
+					self.assertEqual( intpr.evaluateIn( self.rule( source ), env ), expected[ i ] )
+
+		table: columnar.Table = { 'a': arrays.count( 5.0 ), 'b': [ 'x', '', 'y', None, 'z' ] }
+		self.assertEqual( columnar.evaluate( self.rule( '!b' ), table, 2 ), arrays.Array.of( [ 0, 0, 0, 1, 0 ], 'B' ) )
+		self.assertEqual( columnar.evaluate( self.rule( 'a - 1' ), table, 2 ), arrays.Array.of( [ 1, 2, 3, 4, 5 ] ) )
+
+		for source, message in ( ( 'kind + 1', 'Operand must be a number' ), ( 'prix ; 0', 'Division by zero' ), ( 'CALL f{ prix }', 'in batch' ), ( 'x', 'Undefined name' ) ):
+			with self.subTest( source ), self.assertRaises( interpreter.InterpreterError ) as context:
+				columnar.evaluateBatches( self.rule( source ), columnar.readCsv( StringIO( self.csv ) ) )
+			self.assertIn( message, context.exception.args[ 1 ] )
+		with self.assertRaises( ValueError ):
+			list( columnar.readCsv( StringIO( 'a,b\n1,2\n3\n' ) ) )
+
+
+class ForeignTest(TestCase):
+	def call( self, foreign: ffi.Foreign, *arguments: object ) -> object:
+		intpr = interpreter.Interpreter()
+		return foreign.call( intpr, tokenizer.parse( 'x/', '<test>' )[ 0 ], list( arguments ) )
+
+	def testMarshalling( self ) -> None:
+		received: list[ object ] = []
+
+		def scale( xs: memoryview, k: float ) -> memoryview:
+			received.append( xs )
+			for i in range( len( xs ) ):
+				xs[ i ] *= k
+			return xs
+
+		# arrays are shared with the callable, and given back as they are
+		xs = arrays.count( 4.0 )
+		scaled = self.call( ffi.Foreign( 'scal', scale, [ 'InTgR()', 'InTgR' ], 'InTgR()' ), xs, 2.0 )
+		assert isinstance( scaled, arrays.Array )
+		self.assertIs( scaled.data, xs.data )
+		self.assertEqual( list( xs ), [ 0, 2, 4, 6 ] )
+		# the view is released after the call
+		with self.assertRaises( ValueError ):
+			len( received[ 0 ] )  # type: ignore
+
+		text = 'shared'
+		self.assertIs( self.call( ffi.Foreign( 'id', lambda s: s, [ 'StRiNg' ], 'StRiNg' ), text ), text )
+		self.assertEqual( self.call( ffi.Foreign( 'count', len, [ 'BoOlAn()' ], 'InTgR' ), xs < 3.0 ), 4.0 )
+		data = array( 'd', [ 1, 2 ] )
+		self.assertIs( self.call( ffi.Foreign( 'get', lambda: data, [], 'InTgR()' ) ).data, data )  # type: ignore
+		self.assertEqual( self.call( ffi.Foreign( 'get', lambda: memoryview( bytes( 16 ) ).cast( 'd' ), [], 'InTgR()' ) ), arrays.Array.of( [ 0, 0 ] ) )
+		self.assertIsNone( self.call( ffi.Foreign( 'get', lambda: 1, [] ) ) )
+		# any real number may be returned as an InTgR
+		self.assertEqual( self.call( ffi.Foreign( 'get', lambda: Fraction( 3, 2 ), [], 'InTgR' ) ), 1.5 )
+
+		# called from a program
+		intpr = interpreter.Interpreter()
+		ffi.define( intpr.globals, 'dot', lambda xs, ys: sum( x * y for x, y in zip( xs, ys ) ), [ 'InTgR()', 'InTgR()' ], 'InTgR' )
+		ast = parser.Parser( tokenizer.parse( 'DCLAR SUBROUTIN main{} <- InTgR [\n     GIV BACK CALL dot{ CALL count{ 4 }. CALL arry{ 4. 2 } }/\n]\n', '<test>' ) ).parseProgram()
+		assert ast is not None
+		self.assertEqual( interpreter.backendMain( ast, intpr=intpr ), 12 )
+
+	def testErrors( self ) -> None:
+		with self.assertRaises( ValueError ):
+			ffi.Foreign( 'f', print, [ 'StRiNg()' ] )
+		for foreign, arguments, message in (
+			( ffi.Foreign( 'f', abs, [ 'InTgR' ], 'InTgR' ), [], 'Expected 1 arguments but got 0' ),
+			( ffi.Foreign( 'f', abs, [ 'InTgR' ], 'InTgR' ), [ 'a' ], 'expected {InTgR}' ),
+			( ffi.Foreign( 'f', abs, [ 'InTgR()' ], 'InTgR' ), [ arrays.count( 2.0 ) < 1.0 ], 'expected {InTgR()}' ),
+			( ffi.Foreign( 'f', lambda: 1 / 0, [], 'InTgR' ), [], 'failed: ZeroDivisionError' ),
+			( ffi.Foreign( 'f', lambda: True, [], 'InTgR' ), [], 'returned an invalid InTgR' ),
+			( ffi.Foreign( 'f', lambda: b'ab', [], 'InTgR()' ), [], 'format "B"' ),
+		):
+			with self.subTest( message ), self.assertRaises( interpreter.InterpreterError ) as context:
+				self.call( foreign, *arguments )
+			self.assertIn( message, context.exception.args[ 1 ] )
+
+		# the view of an argument is released when a later one is invalid, the array can be resized again
+		xs = arrays.count( 2.0 )
+		with self.assertRaises( interpreter.InterpreterError ):
+			self.call( ffi.Foreign( 'f', print, [ 'InTgR()', 'InTgR' ] ), xs, 'a' )
+		xs.data.append( 2.0 )
+
+
+class BufferedIoTest(TestCase):
+	def testBuffering( self ) -> None:
+		read, write = os.pipe()
+		os.set_blocking( read, False )
+		with os.fdopen( read, 'rb' ) as reader, os.fdopen( write, 'w' ) as file:
+			handle = handles.Handle( 'OUT', file, handles.BufferMode.FULL, 16 )
+			handle.write( 'abc\n' )
+			self.assertIsNone( reader.read() )
+			# a full buffer is flushed
+			handle.write( 'x' * 12 )
+			self.assertEqual( reader.read(), b'abc\n' + b'x' * 12 )
+
+			# what was written to the file itself goes before the buffer
+			file.write( 'first ' )
+			handle.write( 'second ' )
+			handle.write( 'ä' * 5000 )
+			handle.flush()
+			self.assertEqual( reader.read(), ( 'first second ' + 'ä' * 5000 ).encode() )
+
+			handle = handles.Handle( 'OUT', file, handles.BufferMode.LINE )
+			handle.write( 'no newline' )
+			self.assertIsNone( reader.read() )
+			handle.write( '\n' )
+			self.assertEqual( reader.read(), b'no newline\n' )
+
+		# files without a descriptor are written to as usual
+		out = StringIO()
+		handle = handles.Handle( 'OUT', out )
+		self.assertEqual( handle.mode, handles.BufferMode.FULL )
+		handle.write( 'a' )
+		self.assertEqual( out.getvalue(), '' )
+		handles.flushAll()
+		self.assertEqual( out.getvalue(), 'a' )
+
+	def testFlushes( self ) -> None:
+		code = (
+			'DCLAR SUBROUTIN main{} <- InTgR [\n'
+			'     CALL printto{ STDOUT. *nam? * }/\n'
+			'     DCLAR VARIABL StRiNg nam = CALL STDIN,givm{}/\n'
+			'     CALL printto{ STDOUT. *hi * - nam }/\n'
+			'     GIV BACK 3/\n'
+			']\n'
+		)
+		out = StringIO()
+		prompts: list[ str ] = []
+
+		class Input(StringIO):
+			def readline( self, size: Optional[int] = -1 ) -> str:
+				prompts.append( out.getvalue() )
+				return super().readline( size )
+
+		intpr = interpreter.Interpreter( globals=createGlobals( Input( 'bob\n' ), out, out, handles.BufferMode.FULL ) )
+		ast = parser.Parser( tokenizer.parse( code, '<test>' ) ).parseProgram()
+		assert ast is not None
+		# STDOUT is flushed before reading STDIN, and when main returns
+		self.assertEqual( interpreter.backendMain( ast, intpr=intpr ), 3 )
+		self.assertEqual( prompts, [ 'nam? ' ] )
+		self.assertEqual( out.getvalue(), 'nam? hi bob' )
+
+
+class AsyncTest(TestCase):
+	""" Started calls overlapping their waits, against a stand-in server answering each line after a delay """
+	DELAY: float = 0.2
+	ASK: str = (
+		'DCLAR SUBROUTIN ask{ StRiNg word } <- StRiNg [\n'
+		'     DCLAR CONSTANT Conn c = CALL connct{ *127.0.0.1*. port }/\n'
+		'     CALL snd{ c. word - *\\n* }/\n'
+		'     DCLAR CONSTANT StRiNg answr = CALL rciv{ c }/\n'
+		'     CALL clos{ c }/\n'
+		'     GIV BACK answr/\n'
+		']\n'
+	)
+
+	def setUp( self ) -> None:
+		delay = self.DELAY
+
+		class Handler(socketserver.StreamRequestHandler):
+			def handle( self ) -> None:
+				while line := self.rfile.readline():
+					time.sleep( delay )
+					self.wfile.write( line.upper() )
+
+		self.server = socketserver.ThreadingTCPServer( ( '127.0.0.1', 0 ), Handler )
+		self.server.daemon_threads = True
+		Thread( target=self.server.serve_forever, daemon=True ).start()
+
+	def tearDown( self ) -> None:
+		self.server.shutdown()
+		self.server.server_close()
+
+	def runProgram( self, body: str, prelude: str = '', **constants: object ) -> tuple[ int, str, str, float ]:
+		"""
+		:param constants: globals of the program, `port` is the one of the server by default
+		:return: the exit code, the output, the errors and the seconds the program took
+		"""
+		intprs: list[ interpreter.Interpreter ] = []
+
+		def setup( intpr: interpreter.Interpreter ) -> None:
+			intprs.append( intpr )
+			for name, value in { 'port': float( self.server.server_address[ 1 ] ), **constants }.items():
+				intpr.globals.define( name, value, True )
+
+		start = time.perf_counter()
+		exitCode, out, err = runProgram( mainOf( body, self.ASK + prelude ), setup=setup )
+		elapsed = time.perf_counter() - start
+		self.assertIsNone( intprs[0].scheduler )
+		return exitCode, out, err, elapsed
+
+	def testConcurrency( self ) -> None:
+		# a single request takes about the delay of the server
+		exitCode, out, err, elapsed = self.runProgram( '     CALL printto{ STDOUT. CALL ask{ *ab* } }/\n' )
+		self.assertEqual( ( exitCode, out, err ), ( 0, 'AB', '' ) )
+		self.assertLess( elapsed, self.DELAY * 2 )
+
+		# five at once take about as long as one, instead of five times as long
+		exitCode, out, err, elapsed = self.runProgram(
+			''.join( f'     DCLAR CONSTANT Task t{i} = CALL start{{ ask. *w{i}* }}/\n' for i in range( 5 ) ) +
+			'     CALL waitall{ t0. t1. t2. t3. t4 }/\n'
+			'     CALL printto{ STDOUT. CALL wait{ t4 }. CALL wait{ t0 }. CALL wait{ t2 } }/\n'
+		)
+		self.assertEqual( ( exitCode, out, err ), ( 0, 'W4W0W2', '' ) )
+		self.assertGreaterEqual( elapsed, self.DELAY )
+		self.assertLess( elapsed, self.DELAY * 3 )
+
+		# calls only switch while waiting, and the calls left running are waited for at the end
+		exitCode, out, err, elapsed = self.runProgram(
+			'     CALL start{ tick. *a*. 0,2 }/\n'
+			'     CALL start{ tick. *b*. 0,1 }/\n'
+			'     CALL start{ slp. 0,1 }/\n'
+			'     CALL printto{ STDOUT. *m* }/\n',
+			'DCLAR SUBROUTIN tick{ StRiNg nam. InTgR s } <- InTgR [\n'
+			'     CALL printto{ STDOUT. nam }/\n'
+			'     CALL slp{ s }/\n'
+			'     CALL printto{ STDOUT. nam }/\n'
+			']\n'
+		)
+		self.assertEqual( ( exitCode, out, err ), ( 0, 'mabba', '' ) )
+		self.assertLess( elapsed, 0.2 * 2 )
+
+	def testFiles( self ) -> None:
+		with TemporaryDirectory() as tmp:
+			# names of files can't be written in the program, they may have an "e"
+			exitCode, out, err, _ = self.runProgram(
+				'     CALL writ{ path. *abc* }/\n'
+				'     DCLAR CONSTANT Task r = CALL start{ rad. path }/\n'
+				'     DCLAR CONSTANT StRiNg s = CALL rad{ path }/\n'
+				'     CALL printto{ STDOUT. CALL wait{ r }. CALL s,siz{} }/\n',
+				path=f'{tmp}/a.txt'
+			)
+			self.assertEqual( ( exitCode, out, err ), ( 0, 'abc3', '' ) )
+
+	def testErrors( self ) -> None:
+		with socket.socket() as sock:
+			sock.bind( ( '127.0.0.1', 0 ) )
+			closed = sock.getsockname()[ 1 ]
+
+		for body, message in (
+			# the error of a call goes to the one waiting for it
+			( '     CALL wait{ CALL start{ ask. *a* } }/\n', 'I/O failed' ),
+			# or is reported at the end, if nobody waits for it
+			( '     CALL start{ ask. *a* }/\n', 'I/O failed' ),
+			( '     CALL waitall{ CALL start{ slp. 0 }. 1 }/\n', 'is not a task' ),
+			( '     CALL start{ 1 }/\n', 'is not a subroutine' ),
+			( '     CALL rad{ *missing* }/\n', 'I/O failed' ),
+		):
+			with self.subTest( body ):
+				exitCode, out, err, _ = self.runProgram( body, port=float( closed ) )
+				self.assertEqual( exitCode, 1 )
+				self.assertIn( message, err )
+
+
+class LimitsTest(TestCase):
+	""" Runs of scripts which can't be trusted, stopped when they go over their limits """
+	SPIN: str = (
+		'DCLAR SUBROUTIN spin{ InTgR n } <- InTgR [\n'
+		'     DCLAR VARIABL InTgR i = 0/\n'
+		'     CHCK UNTIL { i IS n } DO [ i = i - 1/ ]\n'
+		'     GIV BACK i/\n'
+		']\n'
+	)
+
+	def testInstructions( self ) -> None:
+		body = '     CALL printto{ STDOUT. CALL spin{ 10 } }/\n     CALL printto{ STDOUT. CALL spin{ +1 } }/\n'
+		for jit in ( None, 1 ):
+			with self.subTest( jit=jit ):
+				exitCode, out, err = runProgram( mainOf( body, self.SPIN ), limits=Limits( instructions=5000 ), jit=jit )
+				self.assertEqual( ( exitCode, out ), ( 1, '10' ) )
+				self.assertIn( 'Instruction limit of 5000 exceeded', err )
+				# under generous limits, a run is the same as without them
+				self.assertEqual(
+					runProgram( mainOf( body.replace( '+1', '1000' ), self.SPIN ), limits=Limits( instructions=10 ** 6, allocation=10 ** 6, seconds=60.0 ), jit=jit ),
+					runProgram( mainOf( body.replace( '+1', '1000' ), self.SPIN ), jit=jit )
+				)
+
+	def testCompiledLoops( self ) -> None:
+		# the compiled loops take fuel for batches of iterations, and give back what they didn't use
+		stp = (
+			'DCLAR SUBROUTIN stp{ InTgR n } <- InTgR [\n'
+			'     DCLAR VARIABL InTgR m = 0/\n'
+			'     DO [ n = n - 1/ m = n \\ 7/ ] UNTIL WHN { m IS 0 }/\n'
+			'     GIV BACK n/\n'
+			']\n'
+		)
+		body = (
+			'     DCLAR VARIABL InTgR n = 0/\n'
+			'     CHCK UNTIL { n IS 105 } DO [\n'
+			'          CALL spin{ n \\ 40 }/\n'
+			'          n = CALL stp{ n }/\n'
+			'     ]\n'
+		)
+		instructions = []
+		for jit in ( None, 1 ):
+			intprs: list[ interpreter.Interpreter ] = []
+			log = StringIO()
+			self.assertEqual( runProgram( mainOf( body, self.SPIN + stp ), limits=Limits(), jit=jit, debug=log.write, setup=intprs.append )[ 0 ], 0 )
+			assert intprs[ 0 ].budget is not None
+			instructions.append( intprs[ 0 ].budget.instructions )
+		self.assertIn( 'compiled spin', log.getvalue() )
+		self.assertIn( 'compiled stp', log.getvalue() )
+		self.assertEqual( instructions[ 0 ], instructions[ 1 ] )
+
+	def testTime( self ) -> None:
+		for jit in ( None, 1 ):
+			with self.subTest( jit=jit ):
+				start = time.perf_counter()
+				exitCode, _, err = runProgram( mainOf( '     CALL spin{ 10 }/\n     CALL spin{ +1 }/\n', self.SPIN ), limits=Limits( seconds=0.3 ), jit=jit )
+				self.assertLess( time.perf_counter() - start, 2.0 )
+				self.assertEqual( exitCode, 1 )
+				self.assertIn( 'Time limit of 0.3 seconds exceeded', err )
+
+		with self.subTest( 'wait' ):
+			# waits stop at the deadline too
+			start = time.perf_counter()
+			exitCode, _, err = runProgram( mainOf( '     CALL slp{ 10 }/\n', self.SPIN ), limits=Limits( seconds=0.3 ) )
+			self.assertLess( time.perf_counter() - start, 2.0 )
+			self.assertEqual( exitCode, 1 )
+			self.assertIn( 'Time limit of 0.3 seconds exceeded', err )
+
+	def testAllocation( self ) -> None:
+		body = (
+			'     DCLAR VARIABL StRiNg s = *ab*/\n'
+			'     CHCK UNTIL { s IS * * } DO [ s = s - s/ ]\n'
+		)
+		# the bytes built are never given back, a string replaced at each iteration uses the limit up too
+		rebuilt = (
+			'     DCLAR VARIABL InTgR i = 0/\n'
+			'     DCLAR VARIABL StRiNg s/\n'
+			'     CHCK UNTIL { i IS 100000 } DO [ s = *ab* - i/ i = i - 1/ ]\n'
+		)
+		for body in ( body, '     DCLAR VARIABL InTgR() a = CALL count{ 10 }/\n     CHCK UNTIL { a IS 0 } DO [ a = a - 1/ ]\n', rebuilt ):
+			with self.subTest( body ):
+				exitCode, _, err = runProgram( mainOf( body, self.SPIN ), limits=Limits( allocation=10 ** 6 ) )
+				self.assertEqual( exitCode, 1 )
+				self.assertIn( 'Allocation limit of 1000000 bytes exceeded', err )
+
+
+class IncrementalTokenizerTest(TestCase):
+	code = (
+		'DCLAR SUBROUTIN main{} <- InTgR [\n'
+		'     DCLAR VARIABL InTgR x = 10/\n'
+		'|* a\n'
+		'   comment *|\n'
+		'     CHCK IF { x < 20 } DO [\n'
+		'          x = 20/\n'
+		'     ]\n'
+		'     GIV BACK x/\n'
+		']\n'
+	)
+
+	def assertLexed( self, tokens: incremental.IncrementalTokenizer ) -> None:
+		full = tokenizer.Tokenizer( tokens.source, tokens.file, recover=True ).tokenize()
+		self.assertEqual( tokens.getTokens(), full.code )
+		self.assertEqual( tokens.errors, full.errors )
+
+	def testEdits( self ) -> None:
+		tokens = incremental.IncrementalTokenizer( self.code )
+		self.assertLexed( tokens )
+		# only the edited line is lexed again
+		self.assertEqual( tokens.edit( 1, 29, 1, 31, '15' ), range( 1, 2 ) )
+		self.assertLexed( tokens )
+		# lines after an insertion have their locations moved
+		self.assertEqual( tokens.edit( 1, 0, 1, 0, '     DCLAR VARIABL InTgR y = 1/\n' ), range( 1, 3 ) )
+		self.assertEqual( tokens.tokensIn( 8, 9 )[ -1 ].loc, ( '<string>', 8, 16 ) )
+		self.assertLexed( tokens )
+		# joining two lines
+		tokens.edit( 1, 31, 2, 0, ' ' )
+		self.assertLexed( tokens )
+		self.assertEqual( len( tokens.errors ), 0 )
+		# an error moved by an edit
+		tokens.edit( 6, 0, 6, 0, '     x = 1\n' )
+		tokens.edit( 1, 0, 1, 0, '\n' )
+		self.assertLexed( tokens )
+		self.assertEqual( tokens.errors[ 0 ].line, 8 )
+
+	def testComments( self ) -> None:
+		tokens = incremental.IncrementalTokenizer( self.code )
+		# removing the start of a comment lexes what it contained
+		self.assertEqual( tokens.edit( 2, 0, 2, 2, '' ), range( 2, 5 ) )
+		self.assertLexed( tokens )
+		self.assertEqual( len( tokens.errors ), 3 )
+		# an edit in a comment lexes it again from its start
+		tokens.edit( 2, 0, 2, 0, '|*' )
+		self.assertEqual( tokens.edit( 3, 0, 3, 0, 'long ' ), range( 2, 4 ) )
+		self.assertLexed( tokens )
+		# a comment which is never closed takes the rest of the code
+		self.assertEqual( tokens.edit( 3, 16, 3, 18, '' ), range( 2, 9 ) )
+		self.assertLexed( tokens )
+		self.assertEqual( tokens.edit( 9, 0, 9, 0, '*|\n' ), range( 2, 10 ) )
+		self.assertLexed( tokens )
+
+	def testBrokenCode( self ) -> None:
+		# edits leaving no tokens before the ones which check what precedes them
+		for edit in [ ( 1, 12, 1, 20, ' *|' ), ( 1, 2, 2, 8, '}' ), ( 0, 0, 4, 10, 'UNTIL' ), ( 0, 0, 1, 0, '= ' ), ( 0, 0, 1, 0, 'x FROM y/\n' ) ]:
+			with self.subTest( edit=edit ):
+				tokens = incremental.IncrementalTokenizer( self.code )
+				tokens.edit( *edit )
+				self.assertLexed( tokens )
+		# the end of code without a final newline
+		for code in [ 'x/\nabc', '|* a\n b *', '|* a', 'FROM x/' ]:
+			with self.subTest( code=code ):
+				tokens = incremental.IncrementalTokenizer( code )
+				self.assertLexed( tokens )
+				self.assertNotEqual( tokens.errors, [] )
+		# text added after it goes on its last line
+		tokens = incremental.IncrementalTokenizer( '10 - 20/' )
+		tokens.edit( 1, 0, 1, 0, 'DO\n' )
+		self.assertEqual( tokens.lines, [ '10 - 20/DO\n' ] )
+		self.assertLexed( tokens )
+
+	def testUpdate( self ) -> None:
+		tokens = incremental.IncrementalTokenizer( self.code )
+		self.assertEqual( tokens.update( self.code ), range( 0, 0 ) )
+		self.assertEqual( tokens.update( self.code.replace( '10/', '1/' ).replace( 'BACK x', 'BACK x - 1' ) ), range( 1, 9 ) )
+		self.assertLexed( tokens )
+		self.assertEqual( tokens.update( '' ), range( 0, 0 ) )
+		self.assertEqual( tokens.getTokens(), [] )
+
+
+class LanguageServerTest(TestCase):
+	code = (
+		'DCLAR SUBROUTIN doubl{InTgR a} <- InTgR [\n'
+		'     GIV BACK a - a/\n'
+		']\n'
+		'\n'
+		'DCLAR SUBROUTIN main{} <- InTgR [\n'
+		'     DCLAR VARIABL InTgR x = 10/\n'
+		'     CHCK IF { x < 20 } DO [\n'
+		'          x = 20/\n'
+		'     ]\n'
+		'     GIV BACK x/\n'
+		']\n'
+	)
+
+	@staticmethod
+	def message( content: dict[ str, Any ] ) -> bytes:
+		body = dumps( content ).encode()
+		return b'Content-Length: %d\r\n\r\n' % len( body ) + body
+
+	def testDocument( self ) -> None:
+		doc = document.Document( 'file:///main.endc', self.code )
+		self.assertEqual( [ block.start for block in doc.blocks ], [ 0, 3 ] )
+		first = doc.blocks[ 0 ]
+
+		# only the subroutine with the edit is parsed again
+		self.assertEqual( doc.edit( 7, 14, 7, 16, '(' ), 1 )
+		self.assertIs( doc.blocks[ 0 ], first )
+		self.assertEqual( [ ( diagnostic.source, diagnostic.line ) for diagnostic in doc.diagnostics() ], [ ( 'parser', 8 ) ] )
+		self.assertIsNone( doc.blocks[ 1 ].statements )
+
+		# blocks after an edit adding lines are moved
+		self.assertEqual( doc.edit( 1, 0, 1, 0, '     CALL printto{ STDOUT. a }/\n' ), 1 )
+		self.assertEqual( [ block.start for block in doc.blocks ], [ 0, 4 ] )
+		self.assertEqual( doc.diagnostics()[ 0 ].line, 9 )
+
+		# a tokenizer error, the parser errors of its line aren't repeated
+		doc.update( doc.text.replace( '(', '30' ).replace( 'BACK a - a', 'BACK *a - a' ) )
+		self.assertEqual( [ ( diagnostic.source, diagnostic.line ) for diagnostic in doc.diagnostics() ], [ ( 'tokenizer', 3 ) ] )
+		self.assertIsNotNone( doc.blocks[ 1 ].statements )
+
+		# an edit joining two blocks
+		doc.update( doc.text.replace( '*a', 'a' ) )
+		doc.edit( 3, 0, 5, 0, '' )
+		self.assertEqual( len( doc.blocks ), 1 )
+		self.assertEqual( [ ( diagnostic.source, diagnostic.line ) for diagnostic in doc.diagnostics() ], [ ( 'parser', 10 ) ] )
+		self.assertEqual( doc.diagnostics(), document.Document( '', doc.text ).diagnostics() )
+
+	def testUnterminatedImport( self ) -> None:
+		# typing an import on the last line, the parser reaches the end of the document before its /
+		doc = document.Document( 'file:///main.endc', self.code )
+		doc.edit( 11, 0, 11, 0, 'OWN x FROM y' )
+		self.assertEqual( [ ( diagnostic.source, diagnostic.line ) for diagnostic in doc.diagnostics() ], [ ( 'tokenizer', 12 ) ] )
+		doc.edit( 11, 12, 11, 12, '/' )
+		self.assertEqual( doc.diagnostics(), [] )
+
+	def testProtocol( self ) -> None:
+		uri = 'file:///main.endc'
+		messages = [
+			{ 'jsonrpc': '2.0', 'id': 1, 'method': 'initialize', 'params': { 'capabilities': {} } },
+			{ 'jsonrpc': '2.0', 'method': 'initialized', 'params': {} },
+			{ 'jsonrpc': '2.0', 'method': 'textDocument/didOpen', 'params': { 'textDocument': { 'uri': uri, 'version': 1, 'text': self.code } } },
+			{ 'jsonrpc': '2.0', 'method': 'textDocument/didChange', 'params': {
+				'textDocument': { 'uri': uri, 'version': 2 },
+				'contentChanges': [ { 'range': { 'start': { 'line': 5, 'character': 5 }, 'end': { 'line': 5, 'character': 10 } }, 'text': 'DCLR' } ]
+			} },
+			{ 'jsonrpc': '2.0', 'id': 2, 'method': 'endc/latency' },
+			{ 'jsonrpc': '2.0', 'id': 3, 'method': 'textDocument/hover', 'params': {} },
+			{ 'jsonrpc': '2.0', 'id': 4, 'method': 'shutdown' },
+			{ 'jsonrpc': '2.0', 'method': 'exit' }
+		]
+		process = subprocess.run(
+			[ sys.executable, 'src/compiler.py', 'lsp' ], input=b''.join( map( self.message, messages ) ), capture_output=True, timeout=30
+		)
+		self.assertEqual( process.returncode, 0, process.stderr )
+
+		stream = BytesIO( process.stdout )
+		responses = []
+		while ( response := lsp.readMessage( stream ) ) is not None:
+			responses.append( response )
+		self.assertEqual( [ response.get( 'id', response.get( 'method' ) ) for response in responses ], [
+			1, 'textDocument/publishDiagnostics', 'textDocument/publishDiagnostics', 2, 3, 4
+		] )
+		self.assertEqual( responses[ 0 ][ 'result' ][ 'capabilities' ][ 'textDocumentSync' ][ 'change' ], 2 )
+		self.assertEqual( responses[ 1 ][ 'params' ][ 'diagnostics' ], [] )
+		self.assertEqual( responses[ 2 ][ 'params' ][ 'version' ], 2 )
+		self.assertEqual( [ diagnostic[ 'range' ] for diagnostic in responses[ 2 ][ 'params' ][ 'diagnostics' ] ], [
+			{ 'start': { 'line': 5, 'character': 10 }, 'end': { 'line': 5, 'character': 17 } }
+		] )
+		self.assertEqual( responses[ 3 ][ 'result' ][ 'textDocument/didChange' ][ 'count' ], 1 )
+		self.assertEqual( responses[ 4 ][ 'error' ][ 'code' ], -32601 )
+
+
 if __name__ == '__main__':
 	main()